@@ -0,0 +1,179 @@
+from api.cache import TTLCache
+import json
+import os
+import threading
+
+ACCOUNT_CACHE_ENABLED = os.getenv("ACCOUNT_CACHE_ENABLED", "1") == "1"
+ACCOUNT_CACHE_TTL = float(os.getenv("ACCOUNT_CACHE_TTL", "30"))
+ACCOUNT_CACHE_SIZE = int(os.getenv("ACCOUNT_CACHE_SIZE", "10000"))
+# Workers do servidor (WEB_CONCURRENCY, como no uvicorn/gunicorn). Com mais de
+# um, o LocalBackend fica desligado: a invalidação após suspender ou trocar a
+# senha só alcançaria o worker que atendeu a requisição.
+ACCOUNT_CACHE_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+class CacheBackend:
+    # Interface mínima: qualquer armazenamento chave/valor com TTL serve.
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def peek(self, key):
+        return self.get(key)
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class LocalBackend(CacheBackend):
+
+    def __init__(self, maxsize=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def peek(self, key):
+        return self._cache.peek(key)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl)
+
+    def delete(self, *keys):
+        for key in keys:
+            self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class SharedBackend(CacheBackend):
+    # Adapta um cliente compartilhado entre workers com API get/set(ex=)/delete
+    # (ex.: redis.Redis). Valores trafegam como JSON.
+
+    def __init__(self, client, prefix="javer:conta:"):
+        self._client = client
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "errors": 0}
+
+    def _incr(self, campo):
+        with self._lock:
+            self._stats[campo] += 1
+
+    def get(self, key):
+        try:
+            bruto = self._client.get(self._prefix + key)
+        except Exception:
+            self._incr("errors")
+            return None
+        self._incr("hits" if bruto is not None else "misses")
+        return json.loads(bruto) if bruto is not None else None
+
+    def peek(self, key):
+        try:
+            bruto = self._client.get(self._prefix + key)
+        except Exception:
+            return None
+        return json.loads(bruto) if bruto is not None else None
+
+    def set(self, key, value, ttl):
+        try:
+            self._client.set(self._prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+        except Exception:
+            self._incr("errors")
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self._client.delete(*(self._prefix + key for key in keys))
+        except Exception:
+            self._incr("errors")
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+_backend = LocalBackend()
+
+
+def configurar_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def _ativo():
+    if not ACCOUNT_CACHE_ENABLED:
+        return False
+    return ACCOUNT_CACHE_WORKERS <= 1 or not isinstance(_backend, LocalBackend)
+
+
+def _chave_email(email):
+    return f"email:{email.strip().lower()}"
+
+
+def _chave_id(user_id):
+    return f"id:{int(user_id)}"
+
+
+def get_por_email(email):
+    if not _ativo():
+        return None
+    return _backend.get(_chave_email(email))
+
+
+def get_por_id(user_id):
+    if not _ativo():
+        return None
+    return _backend.get(_chave_id(user_id))
+
+
+def guardar(email, conta):
+    # `conta` precisa ter ao menos "id"; fica indexada por e-mail e por id.
+    if not _ativo():
+        return
+    conta = {**conta, "email": email.strip().lower()}
+    _backend.set(_chave_email(email), conta, ACCOUNT_CACHE_TTL)
+    _backend.set(_chave_id(conta["id"]), conta, ACCOUNT_CACHE_TTL)
+
+
+def invalidar(email=None, user_id=None):
+    # Remove as duas entradas da conta, mesmo conhecendo só uma das chaves.
+    chaves = set()
+    if email:
+        chaves.add(_chave_email(email))
+        conta = _backend.peek(_chave_email(email))
+        if conta:
+            chaves.add(_chave_id(conta["id"]))
+    if user_id is not None:
+        chaves.add(_chave_id(user_id))
+        conta = _backend.peek(_chave_id(user_id))
+        if conta:
+            chaves.add(_chave_email(conta["email"]))
+    if chaves:
+        _backend.delete(*chaves)
+
+
+def limpar():
+    _backend.clear()
+
+
+def account_cache_stats():
+    return {"habilitado": _ativo(), **_backend.stats()}
@@ -0,0 +1,277 @@
+from api import insercao
+from api.connection import get_connection
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+# off: sem auditoria; sync: linha gravada na própria transação da operação;
+# async: fila em memória drenada em lote por um thread (group commit).
+AUDIT_MODE = os.getenv("AUDIT_MODE", "off")
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.2"))
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "50000"))
+AUDIT_MAX_RETRIES = int(os.getenv("AUDIT_MAX_RETRIES", "3"))
+AUDIT_SHUTDOWN_TIMEOUT = float(os.getenv("AUDIT_SHUTDOWN_TIMEOUT", "10"))
+# Eventos que nunca saem da transação da operação nos modos sync e async
+AUDIT_DURABLE_EVENTS = {e.strip() for e in os.getenv("AUDIT_DURABLE_EVENTS", "").split(",") if e.strip()}
+
+logger = logging.getLogger("api.audit")
+
+AUDIT_INSERT = insercao.insert_sql(
+    "auditoria",
+    ("evento", "email_origin", "email_destination", "valor", "mensagem", "metadados")
+)
+
+
+# ----------------------------
+# Registros
+# ----------------------------
+
+def metadados(request, idempotency_key=None):
+    meta = {
+        "ip": request.client.host if request.client else None,
+        "user_agent": request.headers.get("user-agent"),
+    }
+    if idempotency_key:
+        meta["idempotency_key"] = idempotency_key
+    return meta
+
+
+def registro(evento, email_origin, email_destination, valor, mensagem=None, meta=None):
+    # O horário é o da operação, não o da gravação (que no modo async vem depois)
+    return insercao.linha(
+        evento,
+        email_origin,
+        email_destination,
+        valor,
+        mensagem,
+        json.dumps(meta, default=str) if meta else None
+    )
+
+
+def registrar(cursor, registros, duravel=False):
+    # Chamado antes do commit da operação. Grava na transação (sync ou
+    # `duravel`) ou devolve as linhas a publicar depois do commit (async).
+    if not registros or (AUDIT_MODE == "off" and not duravel):
+        return []
+    if duravel or AUDIT_MODE == "sync":
+        agora, depois = list(registros), []
+    else:
+        agora = [r for r in registros if r[0] in AUDIT_DURABLE_EVENTS]
+        depois = [r for r in registros if r[0] not in AUDIT_DURABLE_EVENTS] if AUDIT_MODE == "async" else []
+
+    if agora:
+        insercao.gravar(cursor, AUDIT_INSERT, agora)
+    return depois
+
+
+def publicar(conn, pendentes):
+    # Chamado depois do commit. Com a fila cheia, grava na hora pela própria
+    # conexão: a auditoria atrasa a requisição, mas não se perde.
+    if not pendentes:
+        return
+    recusados = get_audit_writer().enfileirar(pendentes)
+    if recusados:
+        cursor = conn.cursor()
+        try:
+            insercao.gravar(cursor, AUDIT_INSERT, recusados)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error("Falha ao gravar %d linhas de auditoria: %s", len(recusados), e)
+        finally:
+            cursor.close()
+
+
+# ----------------------------
+# Writer assíncrono
+# ----------------------------
+
+class AuditWriter:
+
+    def __init__(
+        self,
+        conectar=None,
+        batch_size=AUDIT_BATCH_SIZE,
+        intervalo=AUDIT_FLUSH_INTERVAL,
+        max_fila=AUDIT_QUEUE_MAX,
+        tentativas=AUDIT_MAX_RETRIES
+    ):
+        self._conectar = conectar or get_connection
+        self.batch_size = batch_size
+        self.intervalo = intervalo
+        self.tentativas = tentativas
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._ocioso = threading.Condition(self._lock)
+        self._pendentes = 0
+        self._stats = {
+            "enfileirados": 0,
+            "recusados": 0,
+            "gravados": 0,
+            "lotes": 0,
+            "falhas": 0,
+            "descartados": 0,
+        }
+        self._thread = threading.Thread(target=self._loop, name="javer_audit", daemon=True)
+        self._thread.start()
+
+    def enfileirar(self, registros):
+        # Retorna as linhas que não couberam na fila
+        if self._parar.is_set():
+            return list(registros)
+        for i, linha in enumerate(registros):
+            with self._lock:
+                self._pendentes += 1
+            try:
+                self._fila.put_nowait(linha)
+            except queue.Full:
+                recusados = list(registros[i:])
+                with self._lock:
+                    self._pendentes -= 1
+                    self._stats["enfileirados"] += i
+                    self._stats["recusados"] += len(recusados)
+                    self._ocioso.notify_all()
+                return recusados
+        with self._lock:
+            self._stats["enfileirados"] += len(registros)
+        return []
+
+    def _coletar(self):
+        try:
+            lote = [self._fila.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        # Junta o que chegar até encher o lote ou vencer o intervalo
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.batch_size:
+            restante = 0 if self._parar.is_set() else limite - time.monotonic()
+            try:
+                if restante <= 0:
+                    lote.append(self._fila.get_nowait())
+                else:
+                    lote.append(self._fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _loop(self):
+        while True:
+            lote = self._coletar()
+            if lote:
+                self._gravar(lote)
+            elif self._parar.is_set():
+                return
+
+    def _gravar(self, lote):
+        espera = 0.05
+        for tentativa in range(1, self.tentativas + 1):
+            conn = cursor = None
+            try:
+                conn = self._conectar()
+                cursor = conn.cursor()
+                insercao.gravar(cursor, AUDIT_INSERT, lote)
+                conn.commit()
+                self._concluir(lote, gravados=len(lote))
+                return
+            except Exception as e:
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                with self._lock:
+                    self._stats["falhas"] += 1
+                logger.warning("Lote de auditoria falhou (tentativa %d/%d): %s", tentativa, self.tentativas, e)
+                if tentativa < self.tentativas and not self._parar.is_set():
+                    time.sleep(espera)
+                    espera *= 2
+            finally:
+                if cursor is not None:
+                    cursor.close()
+                if conn is not None:
+                    conn.close()
+
+        logger.error("%d linhas de auditoria descartadas após %d tentativas", len(lote), self.tentativas)
+        self._concluir(lote, descartados=len(lote))
+
+    def _concluir(self, lote, gravados=0, descartados=0):
+        with self._lock:
+            self._pendentes -= len(lote)
+            self._stats["gravados"] += gravados
+            self._stats["descartados"] += descartados
+            self._stats["lotes"] += 1 if gravados else 0
+            self._ocioso.notify_all()
+
+    def flush(self, timeout=None):
+        # Aguarda a fila e o lote em andamento chegarem ao banco
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._pendentes:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._ocioso.wait(restante)
+        return True
+
+    def fechar(self, timeout=AUDIT_SHUTDOWN_TIMEOUT):
+        # Recusa novas linhas e grava o que ficou na fila antes de sair
+        self._parar.set()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            # Linhas que entraram na corrida com o fim do thread
+            sobra = []
+            while True:
+                try:
+                    sobra.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            if sobra:
+                self._gravar(sobra)
+        with self._lock:
+            restantes = self._pendentes
+        if restantes:
+            logger.error("Desligamento com %d linhas de auditoria não gravadas", restantes)
+        return restantes == 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "fila": self._fila.qsize(),
+                "pendentes": self._pendentes,
+            }
+
+
+_lock = threading.Lock()
+_writer = None
+
+
+def get_audit_writer():
+    global _writer
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                _writer = AuditWriter()
+    return _writer
+
+
+def close_audit_writer(timeout=AUDIT_SHUTDOWN_TIMEOUT):
+    global _writer
+    with _lock:
+        anterior, _writer = _writer, None
+    if anterior is not None:
+        return anterior.fechar(timeout)
+    return True
+
+
+def audit_stats():
+    stats = {"modo": AUDIT_MODE}
+    if _writer is not None:
+        stats.update(_writer.stats())
+    return stats
@@ -1,7 +1,16 @@
 import mysql.connector
-from mysql.connector import errorcode, pooling, Error
+from mysql.connector import errorcode, Error
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from api.pool import ConnectionPool
+from api.replicas import Replica, Roteador
+from api import metrics, prepared, sharding
+import asyncio
+import contextvars
+import functools
 import os
+import threading
+import time
 
 load_dotenv()
 
@@ -11,22 +20,264 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = 3306
 DB_NAME = os.getenv("DB_NAME")
 
-try:
-    connection_pool = pooling.MySQLConnectionPool(
-        pool_name="javer_pool",
-        pool_size=5,  
-        host=DB_HOST,
+# auto: extensão C do driver quando instalada; c: exige a extensão; pure: protocolo em Python
+DB_DRIVER_MODE = os.getenv("DB_DRIVER_MODE", "auto")
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+DB_POOL_MAX_WAITERS = int(os.getenv("DB_POOL_MAX_WAITERS", "100"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+DB_POOL_DRAIN_TIMEOUT = float(os.getenv("DB_POOL_DRAIN_TIMEOUT", "10"))
+
+# Réplicas de leitura: "host[:porta]" separados por vírgula. Vazio = tudo no primário.
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+DB_REPLICA_POOL_MAX_SIZE = int(os.getenv("DB_REPLICA_POOL_MAX_SIZE", str(DB_POOL_MAX_SIZE)))
+# Réplica ocupada não segura a leitura: depois disso ela vai para o primário
+DB_REPLICA_ACQUIRE_TIMEOUT = float(os.getenv("DB_REPLICA_ACQUIRE_TIMEOUT", "0.5"))
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "2"))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "1"))
+# Depois de uma escrita, as leituras do mesmo usuário ficam no primário por esse tempo
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+# Threads dedicados ao driver bloqueante; limitado ao tamanho do pool para que
+# requisições excedentes esperem na fila do executor e não no event loop.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_MAX_SIZE)))
+
+# Pool e executor são criados sob demanda, uma vez por processo: nada é
+# conectado no import e cada worker do uvicorn abre as próprias conexões.
+_lock = threading.Lock()
+_pool = None
+_roteador = None
+_shards = {}
+_executor = None
+_owner_pid = None
+
+def driver_usa_pure(modo=None):
+    modo = modo or DB_DRIVER_MODE
+    if modo not in ("auto", "c", "pure"):
+        raise ValueError(f"DB_DRIVER_MODE inválido: {modo}")
+    if modo == "pure":
+        return True
+    if mysql.connector.HAVE_CEXT:
+        return False
+    if modo == "c":
+        raise RuntimeError("DB_DRIVER_MODE=c, mas a extensão C do mysql-connector não está disponível")
+    return True
+
+def _connect(modo=None, host=None, port=None, database=None):
+    return mysql.connector.connect(
+        host=host or DB_HOST,
         user=DB_USER,
         password=DB_PASSWORD,
-        database=DB_NAME,
-        port=DB_PORT,
-        use_pure=True
+        database=database or DB_NAME,
+        port=port or DB_PORT,
+        use_pure=driver_usa_pure(modo)
+    )
+
+def _replica(endereco):
+    host, _, porta = endereco.partition(":")
+    pool = ConnectionPool(
+        lambda: _connect(host=host, port=int(porta) if porta else None),
+        min_size=0,
+        max_size=DB_REPLICA_POOL_MAX_SIZE,
+        acquire_timeout=DB_REPLICA_ACQUIRE_TIMEOUT,
+        max_waiters=DB_POOL_MAX_WAITERS,
+        max_idle=DB_POOL_MAX_IDLE,
+        ping_after=DB_POOL_PING_AFTER,
+        name=f"javer_replica_{endereco}"
+    )
+    return Replica(endereco, pool, intervalo=DB_REPLICA_LAG_CHECK_INTERVAL)
+
+def _shard_pool(shard):
+    host, porta, banco = sharding.endereco(shard)
+    return ConnectionPool(
+        lambda: _connect(host=host, port=porta, database=banco),
+        min_size=0,
+        max_size=DB_POOL_MAX_SIZE,
+        acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+        max_waiters=DB_POOL_MAX_WAITERS,
+        max_idle=DB_POOL_MAX_IDLE,
+        ping_after=DB_POOL_PING_AFTER,
+        name=f"javer_shard_{shard}"
     )
-    print("Conexão com o banco de dados estabelecida com sucesso.")
 
-except Error as e:
-    print(f"Erro ao conectar ao banco de dados: {e}")
-    raise
+def _reset_after_fork():
+    # O filho herda sockets do pai: apenas esquece as referências, sem fechá-las.
+    global _lock, _pool, _roteador, _shards, _executor, _owner_pid
+    _lock = threading.Lock()
+    _pool = None
+    _roteador = None
+    _shards = {}
+    _executor = None
+    _owner_pid = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _ensure_process():
+    global _pool, _roteador, _shards, _executor, _owner_pid
+    if _owner_pid == os.getpid():
+        return
+    with _lock:
+        if _owner_pid == os.getpid():
+            return
+        _pool = ConnectionPool(
+            _connect,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+            max_waiters=DB_POOL_MAX_WAITERS,
+            max_idle=DB_POOL_MAX_IDLE,
+            ping_after=DB_POOL_PING_AFTER,
+            name="javer_pool"
+        )
+        _roteador = Roteador(
+            [_replica(endereco) for endereco in DB_REPLICA_HOSTS],
+            max_lag=DB_REPLICA_MAX_LAG,
+            janela=DB_READ_YOUR_WRITES_SECONDS
+        ) if DB_REPLICA_HOSTS else None
+        # Shard 0 é o próprio _pool
+        _shards = {shard: _shard_pool(shard) for shard in range(1, sharding.total())}
+        _executor = ThreadPoolExecutor(
+            max_workers=DB_EXECUTOR_WORKERS,
+            thread_name_prefix="javer_db"
+        )
+        _owner_pid = os.getpid()
+
+def get_pool():
+    _ensure_process()
+    return _pool
+
+def get_executor():
+    _ensure_process()
+    return _executor
+
+def init_pool():
+    # Chamado no startup (lifespan): abre as conexões mínimas do processo.
+    try:
+        get_pool().open()
+        print("Conexão com o banco de dados estabelecida com sucesso.")
+    except Error as e:
+        print(f"Erro ao conectar ao banco de dados: {e}")
+        raise
+
+def close_pool(timeout=None):
+    # Chamado no shutdown (lifespan): drena conexões em uso e encerra o executor.
+    global _pool, _roteador, _shards, _executor, _owner_pid
+    with _lock:
+        pool, roteador, shards, executor = _pool, _roteador, _shards, _executor
+        _pool = _roteador = _executor = _owner_pid = None
+        _shards = {}
+
+    timeout = DB_POOL_DRAIN_TIMEOUT if timeout is None else timeout
+    if pool is not None:
+        pool.close(timeout)
+    if roteador is not None:
+        roteador.fechar(timeout)
+    for shard_pool in shards.values():
+        shard_pool.close(timeout)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def _chaves_usuario(email=None, user_id=None):
+    chaves = []
+    if email:
+        chaves.append(f"email:{email.strip().lower()}")
+    if user_id is not None:
+        chaves.append(f"id:{int(user_id)}")
+    return chaves
+
+def localizar_shard(email=None, user_id=None, fresco=False):
+    # Shard da conta pelo diretório (shard 0), com cache. Conta fora do
+    # diretório fica no shard 0, onde estão as contas anteriores ao sharding.
+    if not sharding.ativo():
+        return 0
+    shard = None if fresco else sharding.em_cache(email, user_id)
+    if shard is None:
+        conn = get_pool().get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            shard = sharding.localizar(cursor, email, user_id)
+        finally:
+            cursor.close()
+            conn.close()
+        if shard is None:
+            shard = 0
+    if not fresco:
+        sharding.anotar(email, user_id, shard)
+    return shard
+
+def no_diretorio(func, *args):
+    # func(cursor, *args) numa transação curta no shard 0, onde fica o diretório
+    conn = get_pool().get_connection()
+    conn.autocommit = False
+    cursor = conn.cursor(dictionary=True)
+    try:
+        resultado = func(cursor, *args)
+        conn.commit()
+        return resultado
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_connection(somente_leitura=False, email=None, user_id=None, shard=None):
+    # `email`/`user_id` identificam a conta: escolhem o shard e, nas leituras,
+    # valem para a leitura após escrita. Réplicas só atendem o shard 0.
+    inicio = time.perf_counter()
+    conn = None
+    if shard is None and sharding.ativo() and (email or user_id is not None):
+        shard = localizar_shard(email, user_id)
+    if shard:
+        _ensure_process()
+        conn = _shards[shard].get_connection()
+    elif somente_leitura:
+        _ensure_process()
+        if _roteador is not None:
+            conn = _roteador.conectar(_chaves_usuario(email, user_id))
+    if conn is None:
+        conn = get_pool().get_connection()
+    metrics.registrar_espera_pool(time.perf_counter() - inicio)
+    return metrics.instrumentar(conn)
+
+def usa_replicas():
+    return bool(DB_REPLICA_HOSTS)
+
+def marcar_escrita(email=None, user_id=None):
+    # Chamado depois do commit de uma escrita do usuário
+    _ensure_process()
+    if _roteador is not None:
+        _roteador.marcar_escrita(_chaves_usuario(email, user_id))
+
+def shard_stats():
+    stats = sharding.sharding_stats()
+    if sharding.ativo():
+        _ensure_process()
+        stats["pools"] = {shard: pool.stats() for shard, pool in _shards.items()}
+    return stats
+
+def replica_stats():
+    _ensure_process()
+    if _roteador is None:
+        return {"replicas": []}
+    return _roteador.stats()
+
+def pool_stats():
+    return get_pool().stats()
+
+def driver_stats():
+    return {
+        "modo": DB_DRIVER_MODE,
+        "extensao_c": mysql.connector.HAVE_CEXT,
+        "prepared": prepared.prepared_stats()
+    }
 
-def get_connection():
-    return connection_pool.get_connection()
\ No newline at end of file
+async def run_db(func, *args, **kwargs):
+    # Executa código de banco (síncrono) fora do event loop, preservando o contexto.
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
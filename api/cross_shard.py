@@ -0,0 +1,205 @@
+from fastapi import HTTPException
+from api import account_cache
+from api import audit
+from api import hot_accounts
+from api import idempotency
+from api import outbox
+from api import transfers
+from api import xa
+from api.connection import get_connection, localizar_shard, marcar_escrita
+from api.transfers import LEDGER_INSERT, RETRYABLE_ERRNOS
+import mysql.connector
+import random
+import time
+
+# Transferência entre contas de shards diferentes: um ramo XA por shard. A
+# linha do ledger é gravada nos dois, para o extrato e a conciliação de cada
+# conta continuarem locais ao shard dela.
+
+
+class _Repetida(Exception):
+
+    def __init__(self, resposta):
+        self.resposta = resposta
+
+
+def _debitar(cursor, payload, chave, hash_req, meta):
+    if chave:
+        anterior = idempotency.buscar(cursor, "transacoes", chave, hash_req)
+        if anterior is not None:
+            raise _Repetida(anterior)
+
+    origem = transfers.lock_accounts(cursor, (payload.user_origin_id,)).get(payload.user_origin_id)
+    if not origem:
+        raise HTTPException(status_code=404, detail="Usuário origem não encontrado")
+    if origem["email"].lower() != payload.email_origin.lower():
+        raise HTTPException(status_code=400, detail="E-mail de origem não confere")
+    if hot_accounts.e_quente(origem["email"]):
+        origem["saldo_cc"] += hot_accounts.consolidar(cursor, origem["id"])
+    if origem["saldo_cc"] < payload.valor:
+        raise HTTPException(status_code=400, detail="Saldo insuficiente")
+
+    cursor.execute(
+        "UPDATE usuarios SET saldo_cc = saldo_cc - %s WHERE id = %s",
+        (payload.valor, origem["id"])
+    )
+    cursor.execute(LEDGER_INSERT, (payload.email_origin, payload.email_destination, payload.valor, payload.mensagem))
+
+    auditoria = audit.registrar(cursor, [
+        audit.registro(
+            "transferencia", payload.email_origin, payload.email_destination,
+            payload.valor, payload.mensagem, meta
+        )
+    ])
+    # Um evento só, no outbox do shard da origem
+    outbox.registrar(cursor, [
+        outbox.evento("transferencia", payload.email_origin, payload.email_destination, payload.valor)
+    ])
+    if chave:
+        idempotency.registrar(cursor, "transacoes", chave, hash_req, {"status": "ok"})
+    return auditoria
+
+
+def _creditar(cursor, payload):
+    quente = hot_accounts.e_quente(payload.email_destination)
+    cursor.execute(
+        "SELECT id FROM usuarios WHERE email = %s" if quente
+        else "SELECT id FROM usuarios WHERE email = %s FOR UPDATE",
+        (payload.email_destination,)
+    )
+    destino = cursor.fetchone()
+    if not destino:
+        raise HTTPException(status_code=404, detail="Usuário destino não encontrado")
+
+    if quente:
+        hot_accounts.creditar(cursor, destino["id"], payload.valor)
+    else:
+        cursor.execute(
+            "UPDATE usuarios SET saldo_cc = saldo_cc + %s WHERE id = %s",
+            (payload.valor, destino["id"])
+        )
+    cursor.execute(LEDGER_INSERT, (payload.email_origin, payload.email_destination, payload.valor, payload.mensagem))
+
+
+def _transferir(payload, origem, destino, chave, hash_req, meta):
+    dados = {
+        "origem": payload.user_origin_id,
+        "destino": payload.email_destination,
+        "valor": payload.valor,
+        "shards": [origem, destino],
+    }
+    with xa.Transacao("transferencia", dados) as tx:
+        # Ramos em ordem de shard, como os locks em lock_accounts: transferências
+        # em sentidos opostos não esperam uma pela outra entre servidores
+        auditoria = []
+        for shard in sorted((origem, destino)):
+            if shard == origem:
+                auditoria = _debitar(tx.ramo(shard), payload, chave, hash_req, meta)
+            else:
+                _creditar(tx.ramo(shard), payload)
+        tx.confirmar()
+    return auditoria
+
+
+def _buscar_resposta(shard, chave, hash_req):
+    conn = get_connection(shard=shard)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        return idempotency.buscar(cursor, "transacoes", chave, hash_req)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def transferir(payload, origem, destino, idempotency_key=None, response=None, meta=None):
+    # Mesma resposta e mesmos efeitos de executar_transferencia; a chave de
+    # idempotência fica no shard da origem
+    hash_req = idempotency.hash_requisicao(payload) if idempotency_key else None
+    if idempotency_key:
+        # Repetição comum resolvida sem abrir transação XA
+        anterior = _buscar_resposta(origem, idempotency_key, hash_req)
+        if anterior is not None:
+            idempotency.marcar_replay(response)
+            return anterior
+
+    tentativa = 0
+    while True:
+        try:
+            auditoria = _transferir(payload, origem, destino, idempotency_key, hash_req, meta)
+            break
+        except _Repetida as e:
+            idempotency.marcar_replay(response)
+            return e.resposta
+        except mysql.connector.Error as err:
+            if idempotency_key and idempotency.is_duplicate(err):
+                # Requisição repetida concorrente já gravou a chave
+                resposta = _buscar_resposta(origem, idempotency_key, hash_req)
+                if resposta is None:
+                    raise
+                idempotency.marcar_replay(response)
+                return resposta
+            if err.errno not in RETRYABLE_ERRNOS or tentativa >= transfers.TRANSFER_MAX_RETRIES:
+                raise
+            tentativa += 1
+            transfers._incr("retries")
+            espera = transfers.TRANSFER_BACKOFF_BASE * (2 ** (tentativa - 1))
+            time.sleep(espera + random.uniform(0, transfers.TRANSFER_BACKOFF_BASE))
+
+    resposta = {"status": "ok"}
+    transfers._incr("executadas")
+    if auditoria:
+        conn = get_connection(shard=origem)
+        try:
+            audit.publicar(conn, auditoria)
+        finally:
+            conn.close()
+    account_cache.invalidar(email=payload.email_origin, user_id=payload.user_origin_id)
+    marcar_escrita(email=payload.email_origin, user_id=payload.user_origin_id)
+    account_cache.invalidar(email=payload.email_destination)
+    marcar_escrita(email=payload.email_destination)
+    if idempotency_key:
+        idempotency.lembrar("transacoes", idempotency_key, hash_req, resposta)
+    return resposta
+
+
+def executar_lote(payloads, chunk_size=None, meta=None):
+    # Itens com origem e destino no mesmo shard seguem o caminho em lote de
+    # api/transfers.py, um lote por shard; os demais viram transferências XA.
+    grupos = {}
+    cruzadas = []
+    for indice, p in enumerate(payloads):
+        origem = localizar_shard(user_id=p.user_origin_id)
+        destino = localizar_shard(email=p.email_destination)
+        if origem == destino:
+            grupos.setdefault(origem, []).append((indice, p))
+        else:
+            cruzadas.append((indice, p, origem, destino))
+
+    resultados = []
+    for shard, itens in sorted(grupos.items()):
+        conn = get_connection(shard=shard)
+        conn.autocommit = False
+        try:
+            parcial = transfers.executar_lote(conn, [p for _, p in itens], chunk_size, meta)
+        finally:
+            conn.close()
+        resultados.extend({**r, "indice": itens[r["indice"]][0]} for r in parcial["resultados"])
+
+    for indice, p, origem, destino in cruzadas:
+        try:
+            if p.valor <= 0:
+                raise HTTPException(status_code=400, detail="Valor inválido")
+            transferir(p, origem, destino, meta=meta)
+            resultados.append({"indice": indice, "status": "ok"})
+        except HTTPException as e:
+            resultados.append({"indice": indice, "status": "erro", "detail": e.detail})
+        except mysql.connector.Error as err:
+            resultados.append({"indice": indice, "status": "erro", "detail": f"Erro no banco: {err}"})
+
+    resultados.sort(key=lambda r: r["indice"])
+    ok = sum(1 for r in resultados if r["status"] == "ok")
+    return {
+        "ok": ok,
+        "erros": len(resultados) - ok,
+        "resultados": resultados
+    }
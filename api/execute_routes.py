@@ -1,8 +1,31 @@
-from fastapi import APIRouter, Body, HTTPException, Depends, Header
-from api.connection import get_connection
+from fastapi import APIRouter, Body, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import EmailStr
+from typing import List, Literal, Optional
+from api.connection import get_connection, run_db, pool_stats, driver_stats, replica_stats, shard_stats, usa_replicas, marcar_escrita, localizar_shard, no_diretorio
+from api import prepared
+from api import audit
+from api import outbox
+from api import idempotency
+from api import account_cache
+from api import hashing
+from api.quotes import get_quote_service, quote_stats
+from api import valuation
+from api import reconciliation
+from api import hot_accounts
+from api import sharding
+from api import cross_shard
+from api import xa
+from api.responses import json_response, model_response
+from api.metrics import exportar_prometheus
+from api import query_log
+from api.statement import decode_cursor, pagina_extrato, statement_query, ndjson_lines, csv_lines, EXTRATO_PAGE_MAX, EXTRATO_EXPORT_BATCH
 from schemas.schemas import CriarConta, LoginSchema, UpdateUserSchema, TransacaoDataPayload, DepositoDBRequest, DepositoDBResponse, ReativarSchema, SaqueDBRequest, SaqueDBResponse, TransactionCreateSchema
-from api.jwt import create_access_token, get_current_user_id
+from api.jwt import create_access_token, get_current_user_id, jwt_stats
+from api.transfers import executar_transferencia, executar_lote, transfer_stats, TRANSFER_BATCH_MAX_ITEMS, LEDGER_INSERT
+import asyncio
 import mysql.connector
+from decimal import Decimal
 from jose import jwt, JWTError
 
 criar_router = APIRouter(prefix="/usuarios", tags=["usuarios"])
@@ -12,35 +35,82 @@ transacoes_router = APIRouter(prefix="/transacoesUsuarios", tags=["transacoes"])
 deposit_router = APIRouter(prefix="/deposito", tags=["deposito"])
 saque_router = APIRouter(prefix="/saque", tags=["saque"])
 invest_router = APIRouter(prefix="/invest", tags=["invest"])
+extrato_router = APIRouter(prefix="/extrato", tags=["extrato"])
+internal_router = APIRouter(prefix="/internal", tags=["internal"])
+metrics_router = APIRouter(tags=["metrics"])
 
 DATA_API_URL = "http://127.0.0.1:8001"
 API_CORE_VALIDATE_URL = "http://127.0.0.1:8000/transacoes/transacoes/"
 INTERNAL_KEY = "INTERNAL_SECRET"
 
+# Consultas quentes com texto fixo: executadas como statements preparados,
+# cada conexão do pool guarda o próprio handle (api/prepared.py).
+LOGIN_SQL = "SELECT id, senha, correntista FROM usuarios WHERE email = %s"
+DEPOSITO_SALDO_SQL = "UPDATE usuarios SET saldo_cc = saldo_cc + %s WHERE email = %s"
+SAQUE_SALDO_SQL = "UPDATE usuarios SET saldo_cc = saldo_cc - %s WHERE email = %s AND saldo_cc >= %s"
+
+# Demais consultas das rotas que dependem de índice (tests/test_explain_indices.py)
+USUARIO_EXISTE_SQL = "SELECT id FROM usuarios WHERE id = %s"
+SUSPENDER_SQL = "UPDATE usuarios SET correntista = 0 WHERE id = %s"
+REATIVAR_SQL = "UPDATE usuarios SET correntista = 1 WHERE email_normalizado = %s"
+DEPOSITO_LOCK_SQL = "SELECT saldo_cc FROM usuarios WHERE email = %s FOR UPDATE"
+DEPOSITO_QUENTE_SQL = "SELECT id, saldo_cc FROM usuarios WHERE email = %s"
+SAQUE_LOCK_SQL = "SELECT id, saldo_cc FROM usuarios WHERE email = %s FOR UPDATE"
+PATRIMONIO_SQL = "UPDATE invest_client SET patrimonio_total = patrimonio_total + %s WHERE client_id = %s"
+
 
 # BLOCO DE CRIAR CONTA
 @criar_router.post("")
 async def insert_usuario(data: CriarConta):
+    senha_hash = await hashing.gerar_hash(data.senha)
+    return await run_db(_insert_usuario, data, senha_hash)
+
+def _insert_usuario(data: CriarConta, senha_hash: str):
     conn = None
     cursor = None
+    user_id = None
     try:
-        conn = get_connection()
+        if sharding.ativo():
+            # O id nasce no diretório; a conta vai para o shard do seu e-mail
+            shard = sharding.shard_padrao(data.email)
+            user_id = no_diretorio(sharding.registrar_conta, data.email, shard)
+            conn = get_connection(shard=shard)
+        else:
+            conn = get_connection()
         cursor = conn.cursor()
 
-        cursor.execute(
-            """
-            INSERT INTO usuarios (nome, email, telefone, senha)
-            VALUES (%s, %s, %s, %s)
-            """,
-            (
-                data.nome,
-                data.email,
-                data.telefone,
-                data.senha
+        if user_id is None:
+            cursor.execute(
+                """
+                INSERT INTO usuarios (nome, email, telefone, senha)
+                VALUES (%s, %s, %s, %s)
+                """,
+                (
+                    data.nome,
+                    data.email,
+                    data.telefone,
+                    senha_hash
+                )
+            )
+        else:
+            cursor.execute(
+                """
+                INSERT INTO usuarios (id, nome, email, telefone, senha)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                (
+                    user_id,
+                    data.nome,
+                    data.email,
+                    data.telefone,
+                    senha_hash
+                )
             )
-        )
 
         conn.commit()
+        user_id = None
+        account_cache.invalidar(email=data.email)
+        marcar_escrita(email=data.email)
 
         return {
             "status": "success",
@@ -67,6 +137,9 @@ async def insert_usuario(data: CriarConta):
             cursor.close()
         if conn:
             conn.close()
+        if user_id is not None:
+            # Conta não criada no shard: libera o e-mail no diretório
+            no_diretorio(sharding.remover_conta, user_id)
 
 # BLOCO DE LOGIN
 @login_router.post("")
@@ -78,17 +151,41 @@ async def login_usuario(
     if x_internal_key != INTERNAL_KEY:
         raise HTTPException(status_code=403, detail="Acesso negado")
 
-    conn = get_connection()
+    user = await run_db(_login_usuario, data)
+
+    # bcrypt roda no pool de hashing, sem segurar conexão nem thread do banco
+    confere, novo_hash = await hashing.verificar(data.senha, user["senha"])
+    if not confere:
+        raise HTTPException(status_code=401, detail="Senha inválida")
+
+    if novo_hash:
+        await run_db(_atualizar_hash, user["id"], data.email, user["senha"], novo_hash)
+
+    return {"id": user["id"], "senha": novo_hash or user["senha"]}
+
+def _buscar_login(conn, email: str):
     cursor = conn.cursor(dictionary=True)
+    try:
+        return prepared.executar(conn, cursor, LOGIN_SQL, (email,), dictionary=True).fetchone()
+    finally:
+        cursor.close()
+        conn.close()
 
-    cursor.execute(
-        "SELECT id, senha, correntista FROM usuarios WHERE email = %s",
-        (data.email,)
-    )
-    user = cursor.fetchone()
+@sharding.reroteia
+def _login_usuario(data: LoginSchema):
+    user = account_cache.get_por_email(data.email)
 
-    cursor.close()
-    conn.close()
+    if user is None:
+        user = _buscar_login(get_connection(somente_leitura=True, email=data.email), data.email)
+        # Linha lida da réplica pode estar atrasada: não vai para o cache
+        do_primario = not usa_replicas()
+        if user is None and usa_replicas():
+            # Conta recém-criada pode ainda não ter chegado à réplica
+            user = _buscar_login(get_connection(email=data.email), data.email)
+            do_primario = True
+
+        if user and do_primario:
+            account_cache.guardar(data.email, user)
 
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
@@ -96,65 +193,114 @@ async def login_usuario(
     if user["correntista"] == 0:
         raise HTTPException(status_code=403, detail="CONTA_INATIVA")
 
-    return {"id": user["id"], "senha": user["senha"]}
+    return user
+
+def _atualizar_hash(user_id: int, email: str, anterior: str, novo_hash: str):
+    # Só troca se a senha não mudou desde a leitura
+    conn = get_connection(user_id=user_id)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE usuarios SET senha = %s WHERE id = %s AND senha = %s",
+            (novo_hash, user_id, anterior)
+        )
+        conn.commit()
+        account_cache.invalidar(email=email, user_id=user_id)
+        marcar_escrita(email=email, user_id=user_id)
+    finally:
+        cursor.close()
+        conn.close()
             
 # BLOCO DE UPDATE USUÁRIO         
 @update_router.put("/{user_id}")
 async def update_usuario(user_id: int, data: UpdateUserSchema):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+    senha_hash = await hashing.gerar_hash(data.senha) if data.senha is not None else None
+    return await run_db(_update_usuario, user_id, data, senha_hash)
 
+def _usuario_existe(conn, user_id: int):
+    cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute(
-            "SELECT id FROM usuarios WHERE id = %s",
-            (user_id,)
-        )
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=404,
-                detail="Usuário não encontrado"
-            )
+        cursor.execute(USUARIO_EXISTE_SQL, (user_id,))
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+        conn.close()
 
-        fields = []
-        values = []
+@sharding.reroteia
+def _update_usuario(user_id: int, data: UpdateUserSchema, senha_hash: Optional[str] = None):
+    existe = account_cache.get_por_id(user_id) is not None
+    if not existe:
+        existe = _usuario_existe(get_connection(somente_leitura=True, user_id=user_id), user_id)
+        if not existe and usa_replicas():
+            existe = _usuario_existe(get_connection(user_id=user_id), user_id)
+    if not existe:
+        raise HTTPException(
+            status_code=404,
+            detail="Usuário não encontrado"
+        )
 
-        if data.nome is not None:
-            fields.append("nome=%s")
-            values.append(data.nome)
+    fields = []
+    values = []
 
-        if data.email is not None:
-            fields.append("email=%s")
-            values.append(data.email)
+    if data.nome is not None:
+        fields.append("nome=%s")
+        values.append(data.nome)
 
-        if data.telefone is not None:
-            fields.append("telefone=%s")
-            values.append(data.telefone)
+    if data.email is not None:
+        fields.append("email=%s")
+        values.append(data.email)
 
-        if data.senha is not None:
-            fields.append("senha=%s")
-            values.append(data.senha)
+    if data.telefone is not None:
+        fields.append("telefone=%s")
+        values.append(data.telefone)
 
-        if not fields:
-            raise HTTPException(
-                status_code=400,
-                detail="Nenhum dado para atualizar"
-            )
+    if senha_hash is not None:
+        fields.append("senha=%s")
+        values.append(senha_hash)
 
-        query = f"""
-            UPDATE usuarios
-            SET {", ".join(fields)}
-            WHERE id=%s
-        """
+    if not fields:
+        raise HTTPException(
+            status_code=400,
+            detail="Nenhum dado para atualizar"
+        )
 
-        values.append(user_id)
-        cursor.execute(query, tuple(values))
-        conn.commit()
+    query = f"""
+        UPDATE usuarios
+        SET {", ".join(fields)}
+        WHERE id=%s
+    """
+    values.append(user_id)
 
-        return {"message": "Dados atualizados com sucesso"}
+    # Com shards, o e-mail novo é reservado antes no diretório, cuja chave
+    # única vale entre os shards; se a escrita no shard falhar, volta o antigo
+    anterior = None
+    if data.email is not None and sharding.ativo():
+        anterior = no_diretorio(sharding.trocar_email, user_id, data.email)
 
+    confirmado = False
+    try:
+        conn = get_connection(user_id=user_id)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, tuple(values))
+            conn.commit()
+            confirmado = True
+        finally:
+            cursor.close()
+            conn.close()
     finally:
-        cursor.close()
-        conn.close()
+        if not confirmado and anterior is not None:
+            no_diretorio(sharding.trocar_email, user_id, anterior)
+
+    if anterior is not None:
+        # O e-mail antigo deixa de valer no cache do diretório e no de contas
+        sharding.esquecer(email=anterior)
+        account_cache.invalidar(email=anterior)
+        marcar_escrita(email=anterior)
+    account_cache.invalidar(email=data.email, user_id=user_id)
+    marcar_escrita(email=data.email, user_id=user_id)
+
+    return {"message": "Dados atualizados com sucesso"}
 
 # BLOCO DE SUSPENDER CONTA
 @update_router.put("/suspender/{user_id}")
@@ -165,11 +311,25 @@ async def suspender_conta(
     if x_internal_key != INTERNAL_KEY:
         raise HTTPException(status_code=403, detail="Acesso negado")
 
-    conn = get_connection()
-    cursor = conn.cursor()
+    return await run_db(_suspender_conta, user_id)
+
+@sharding.reroteia
+def _suspender_conta(user_id: int):
+    conn = get_connection(user_id=user_id)
+    cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("UPDATE usuarios SET correntista = 0 WHERE id = %s", (user_id,))
+        # O e-mail marca a escrita também para o login, que lê a réplica por e-mail
+        cursor.execute("SELECT email FROM usuarios WHERE id = %s FOR UPDATE", (user_id,))
+        conta = cursor.fetchone()
+        if conta is None and sharding.ativo():
+            # Conta movida de shard: o 404 leva a rota ao shard atual
+            conn.rollback()
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        cursor.execute(SUSPENDER_SQL, (user_id,))
         conn.commit()
+        email = conta["email"] if conta else None
+        account_cache.invalidar(email=email, user_id=user_id)
+        marcar_escrita(email=email, user_id=user_id)
         return {"message": "Conta suspensa com sucesso"}
     finally:
         cursor.close()
@@ -186,14 +346,17 @@ async def reativar_conta_por_email(
 
     email = data.email.strip().lower()
 
-    conn = get_connection()
+    return await run_db(_reativar_conta_por_email, email)
+
+@sharding.reroteia
+def _reativar_conta_por_email(email: str):
+    conn = get_connection(email=email)
     cursor = conn.cursor()
     try:
-        cursor.execute(
-            "UPDATE usuarios SET correntista = 1 WHERE LOWER(email) = %s",
-            (email,)
-        )
+        cursor.execute(REATIVAR_SQL, (email,))
         conn.commit()
+        account_cache.invalidar(email=email)
+        marcar_escrita(email=email)
 
         if cursor.rowcount == 0:
             raise HTTPException(
@@ -214,25 +377,48 @@ async def reativar_conta_por_email(
 )
 async def realizar_deposito(
     data: DepositoDBRequest,
-    x_internal_key: str = Header(..., alias="X-Internal-Key")
+    request: Request,
+    response: Response,
+    x_internal_key: str = Header(..., alias="X-Internal-Key"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
 
     if x_internal_key != INTERNAL_KEY:
         raise HTTPException(status_code=403, detail="Acesso negado")
 
-    conn = get_connection()
+    if data.valor <= 0:
+        raise HTTPException(status_code=400, detail="Valor inválido")
+
+    if idempotency_key:
+        anterior = idempotency.em_cache("deposito", idempotency_key, idempotency.hash_requisicao(data))
+        if anterior is not None:
+            idempotency.marcar_replay(response)
+            return model_response(DepositoDBResponse(**anterior), response)
+
+    meta = audit.metadados(request, idempotency_key)
+    return model_response(await run_db(_realizar_deposito, data, idempotency_key, response, meta), response)
+
+@sharding.reroteia
+def _realizar_deposito(data: DepositoDBRequest, idempotency_key=None, response=None, meta=None):
+    conn = get_connection(email=data.email)
     conn.autocommit = False
     cursor = conn.cursor(dictionary=True)
+    hash_req = idempotency.hash_requisicao(data) if idempotency_key else None
 
     try:
-        if data.valor <= 0:
-            raise HTTPException(status_code=400, detail="Valor inválido")
-
-
-        cursor.execute(
-            "SELECT id, saldo_cc FROM usuarios WHERE email = %s",
-            (data.email,)
-        )
+        if idempotency_key:
+            anterior = idempotency.buscar(cursor, "deposito", idempotency_key, hash_req)
+            if anterior is not None:
+                idempotency.marcar_replay(response)
+                return DepositoDBResponse(**anterior)
+
+        valor = data.valor
+        quente = hot_accounts.e_quente(data.email)
+
+        # Leitura com lock: confirma a conta e traz o saldo base, dispensando
+        # o SELECT final para devolver o saldo atualizado. Conta quente não
+        # bloqueia a linha: o crédito vai para um shard.
+        cursor.execute(DEPOSITO_QUENTE_SQL if quente else DEPOSITO_LOCK_SQL, (data.email,))
         user = cursor.fetchone()
 
         if not user:
@@ -241,48 +427,69 @@ async def realizar_deposito(
                 detail="Usuário não encontrado"
             )
 
-        cursor.execute(
-            """
-            UPDATE usuarios
-            SET saldo_cc = saldo_cc + %s
-            WHERE email = %s
-            """,
-            (data.valor, data.email)
-        )
+        if quente:
+            hot_accounts.creditar(cursor, user["id"], valor)
+            saldo_atual = user["saldo_cc"] + hot_accounts.saldo_shards(cursor, user["id"])
+        else:
+            prepared.executar(conn, cursor, DEPOSITO_SALDO_SQL, (valor, data.email))
+            saldo_atual = user["saldo_cc"] + valor
 
-        cursor.execute(
-            """
-            INSERT INTO transacoes
-                (email_origin, email_destination, valor, mensagem, create_time)
-            VALUES (%s, %s, %s, %s, NOW())
-            """,
+        prepared.executar(
+            conn, cursor, LEDGER_INSERT,
             (
                 "DEPOSITO",
                 data.email,
-                data.valor,
+                valor,
                 "Depósito em conta"
             )
         )
+        auditoria = audit.registrar(cursor, [
+            audit.registro("deposito", "DEPOSITO", data.email, valor, "Depósito em conta", meta)
+        ])
+        outbox.registrar(cursor, [outbox.evento("deposito", "DEPOSITO", data.email, valor)])
 
-        cursor.execute(
-            "SELECT saldo_cc FROM usuarios WHERE email = %s",
-            (data.email,)
+        # Saldo e valor já são Decimal de 2 casas: dispensa a validação
+        resposta = DepositoDBResponse.model_construct(
+            saldo_atual=saldo_atual
         )
-        saldo_atual = cursor.fetchone()["saldo_cc"]
+
+        if idempotency_key:
+            idempotency.registrar(cursor, "deposito", idempotency_key, hash_req, resposta.model_dump())
 
         conn.commit()
+        audit.publicar(conn, auditoria)
+        account_cache.invalidar(email=data.email)
+        marcar_escrita(email=data.email)
 
-        return DepositoDBResponse(
-            saldo_atual=saldo_atual
-        )
+        if idempotency_key:
+            idempotency.lembrar("deposito", idempotency_key, hash_req, resposta.model_dump())
+
+        return resposta
+
+    except HTTPException:
+        conn.rollback()
+        raise
 
     except mysql.connector.Error as err:
         conn.rollback()
+        if idempotency_key and idempotency.is_duplicate(err):
+            # Requisição repetida concorrente venceu a corrida: devolve a resposta dela
+            anterior = idempotency.buscar(cursor, "deposito", idempotency_key, hash_req)
+            if anterior is not None:
+                idempotency.marcar_replay(response)
+                return DepositoDBResponse(**anterior)
         raise HTTPException(
             status_code=500,
             detail=f"Erro no banco de dados: {err.msg}"
         )
 
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro interno: {str(e)}"
+        )
+
     finally:
         cursor.close()
         conn.close()
@@ -291,57 +498,102 @@ async def realizar_deposito(
 @transacoes_router.post("")
 async def executar_transacao_data(
     payload: TransacaoDataPayload,
-    x_internal_key: str = Header(..., alias="X-Internal-Key")
+    request: Request,
+    response: Response,
+    x_internal_key: str = Header(..., alias="X-Internal-Key"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     if x_internal_key != INTERNAL_KEY:
         raise HTTPException(status_code=403, detail="Acesso negado")
 
-    conn = get_connection()
+    if payload.valor <= 0:
+        raise HTTPException(status_code=400, detail="Valor inválido")
+
+    if idempotency_key:
+        anterior = idempotency.em_cache("transacoes", idempotency_key, idempotency.hash_requisicao(payload))
+        if anterior is not None:
+            idempotency.marcar_replay(response)
+            return anterior
+
+    meta = audit.metadados(request, idempotency_key)
+    return await run_db(_executar_transacao_data, payload, idempotency_key, response, meta)
+
+@sharding.reroteia
+def _executar_transacao_data(payload: TransacaoDataPayload, idempotency_key=None, response=None, meta=None):
+    origem = localizar_shard(user_id=payload.user_origin_id)
+    destino = localizar_shard(email=payload.email_destination)
+    if origem != destino:
+        try:
+            return cross_shard.transferir(payload, origem, destino, idempotency_key, response, meta)
+        except mysql.connector.Error as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Erro no banco: {str(e)}"
+            )
+
+    conn = get_connection(shard=origem)
     conn.autocommit = False
-    cursor = conn.cursor(dictionary=True)
 
     try:
-        # 🔹 Registro da transação
-        cursor.execute(
-            """
-            INSERT INTO transacoes
-                (email_origin, email_destination, valor, mensagem, create_time)
-            VALUES (%s, %s, %s, %s, NOW())
-            """,
-            (
-                payload.email_origin,
-                payload.email_destination,
-                payload.valor,
-                payload.mensagem
-            )
-        )
+        return executar_transferencia(conn, payload, idempotency_key, response, meta)
 
-        # 🔹 Debita usuário origem
-        cursor.execute(
-            "UPDATE usuarios SET saldo_cc = saldo_cc - %s WHERE id = %s",
-            (payload.valor, payload.user_origin_id)
+    except mysql.connector.Error as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro no banco: {str(e)}"
         )
 
-        # 🔹 Credita usuário destino
-        cursor.execute(
-            "UPDATE usuarios SET saldo_cc = saldo_cc + %s WHERE email = %s",
-            (payload.valor, payload.email_destination)
+    finally:
+        conn.close()
+        
+# BLOCO DE TRANSAÇÕES EM LOTE
+@transacoes_router.post("/lote")
+async def executar_transacoes_lote(
+    payloads: List[TransacaoDataPayload],
+    request: Request,
+    chunk_size: Optional[int] = Query(None, ge=1, le=TRANSFER_BATCH_MAX_ITEMS),
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    if not payloads:
+        raise HTTPException(status_code=400, detail="Lote vazio")
+
+    if len(payloads) > TRANSFER_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Lote excede o limite de {TRANSFER_BATCH_MAX_ITEMS} itens"
         )
 
-        conn.commit()
-        return {"status": "ok"}
+    meta = audit.metadados(request)
+    return await run_db(_executar_transacoes_lote, payloads, chunk_size, meta)
+
+def _executar_transacoes_lote(payloads, chunk_size, meta=None):
+    if sharding.ativo():
+        try:
+            return cross_shard.executar_lote(payloads, chunk_size, meta)
+        except mysql.connector.Error as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Erro no banco: {str(e)}"
+            )
+
+    conn = get_connection()
+    conn.autocommit = False
+
+    try:
+        return executar_lote(conn, payloads, chunk_size, meta)
 
     except mysql.connector.Error as e:
-        conn.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Erro no banco: {str(e)}"
         )
 
     finally:
-        cursor.close()
         conn.close()
-        
+
 # BLOCO DE REALIZAR SAQUE
 @saque_router.post(
     "",
@@ -349,25 +601,44 @@ async def executar_transacao_data(
 )
 async def realizar_saque(
     data: SaqueDBRequest,
-    x_internal_key: str = Header(..., alias="X-Internal-Key")
+    request: Request,
+    response: Response,
+    x_internal_key: str = Header(..., alias="X-Internal-Key"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
 
     if x_internal_key != INTERNAL_KEY:
         raise HTTPException(status_code=403, detail="Acesso negado")
 
-    conn = get_connection()
+    if data.valor <= 0:
+        raise HTTPException(status_code=400, detail="Valor inválido")
+
+    if idempotency_key:
+        anterior = idempotency.em_cache("saque", idempotency_key, idempotency.hash_requisicao(data))
+        if anterior is not None:
+            idempotency.marcar_replay(response)
+            return model_response(SaqueDBResponse(**anterior), response)
+
+    meta = audit.metadados(request, idempotency_key)
+    return model_response(await run_db(_realizar_saque, data, idempotency_key, response, meta), response)
+
+@sharding.reroteia
+def _realizar_saque(data: SaqueDBRequest, idempotency_key=None, response=None, meta=None):
+    conn = get_connection(email=data.email)
     conn.autocommit = False
     cursor = conn.cursor(dictionary=True)
+    hash_req = idempotency.hash_requisicao(data) if idempotency_key else None
 
     try:
-        if data.valor <= 0:
-            raise HTTPException(status_code=400, detail="Valor inválido")
+        if idempotency_key:
+            anterior = idempotency.buscar(cursor, "saque", idempotency_key, hash_req)
+            if anterior is not None:
+                idempotency.marcar_replay(response)
+                return SaqueDBResponse(**anterior)
 
+        valor = data.valor
 
-        cursor.execute(
-            "SELECT id, saldo_cc FROM usuarios WHERE email = %s",
-            (data.email,)
-        )
+        cursor.execute(SAQUE_LOCK_SQL, (data.email,))
         user = cursor.fetchone()
 
         if not user:
@@ -375,63 +646,99 @@ async def realizar_saque(
                 status_code=404,
                 detail="Usuário não encontrado"
             )
-        if data.valor > user["saldo_cc"]:
+        if hot_accounts.e_quente(data.email):
+            # Débito precisa do saldo inteiro: traz os shards para o saldo_cc
+            user["saldo_cc"] += hot_accounts.consolidar(cursor, user["id"])
+        if valor > user["saldo_cc"]:
             raise HTTPException(status_code=400, detail="Saldo insuficiente")
 
+        # UPDATE condicional: nunca deixa o saldo negativo, mesmo sob concorrência.
+        debito = prepared.executar(conn, cursor, SAQUE_SALDO_SQL, (valor, data.email, valor))
+        if debito.rowcount == 0:
+            raise HTTPException(status_code=400, detail="Saldo insuficiente")
 
-        cursor.execute(
-            """
-            UPDATE usuarios
-            SET saldo_cc = saldo_cc - %s
-            WHERE email = %s
-            """,
-            (data.valor, data.email)
-        )
-
-        cursor.execute(
-            """
-            INSERT INTO transacoes
-                (email_origin, email_destination, valor, mensagem, create_time)
-            VALUES (%s, %s, %s, %s, NOW())
-            """,
+        prepared.executar(
+            conn, cursor, LEDGER_INSERT,
             (
                 data.email,
                 "SAQUE",
-                data.valor,
+                valor,
                 "Saque efetuado"
             )
         )
+        auditoria = audit.registrar(cursor, [
+            audit.registro("saque", data.email, "SAQUE", valor, "Saque efetuado", meta)
+        ])
+        outbox.registrar(cursor, [outbox.evento("saque", data.email, "SAQUE", valor)])
 
-        cursor.execute(
-            "SELECT saldo_cc FROM usuarios WHERE email = %s",
-            (data.email,)
+        resposta = SaqueDBResponse.model_construct(
+            saldo_atual=user["saldo_cc"] - valor
         )
-        saldo_atual = cursor.fetchone()["saldo_cc"]
+
+        if idempotency_key:
+            idempotency.registrar(cursor, "saque", idempotency_key, hash_req, resposta.model_dump())
 
         conn.commit()
+        audit.publicar(conn, auditoria)
+        account_cache.invalidar(email=data.email)
+        marcar_escrita(email=data.email)
 
-        return SaqueDBResponse(
-            saldo_atual=saldo_atual
-        )
+        if idempotency_key:
+            idempotency.lembrar("saque", idempotency_key, hash_req, resposta.model_dump())
+
+        return resposta
+
+    except HTTPException:
+        conn.rollback()
+        raise
 
     except mysql.connector.Error as err:
         conn.rollback()
+        if idempotency_key and idempotency.is_duplicate(err):
+            # Requisição repetida concorrente venceu a corrida: devolve a resposta dela
+            anterior = idempotency.buscar(cursor, "saque", idempotency_key, hash_req)
+            if anterior is not None:
+                idempotency.marcar_replay(response)
+                return SaqueDBResponse(**anterior)
         raise HTTPException(
             status_code=500,
             detail=f"Erro no banco de dados: {err.msg}"
         )
 
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro interno: {str(e)}"
+        )
+
     finally:
         cursor.close()
         conn.close()
 
 @invest_router.post("/create", status_code=201)
 async def criar_transacao(data: TransactionCreateSchema):
+    # Só memória: cotação ausente ou vencida é renovada em segundo plano
+    preco, estado = get_quote_service().cotacao(data.ticker)
+    return json_response(await run_db(_criar_transacao, data, preco, estado), status_code=201)
+
+def _avaliar(data: TransactionCreateSchema, preco: Optional[Decimal]):
+    # Sem cotação em cache, vale o que o cliente enviou
+    if preco is None:
+        return data.valor_atual, data.rentabilidade
+
+    valor_atual = (data.quantidade * preco).quantize(Decimal("0.0001"))
+    if not data.valor_investido:
+        return valor_atual, Decimal("0")
+    rentabilidade = (valor_atual - data.valor_investido) / data.valor_investido * 100
+    return valor_atual, rentabilidade.quantize(Decimal("0.0001"))
+
+def _criar_transacao(data: TransactionCreateSchema, preco: Optional[Decimal] = None, estado: Optional[str] = None):
     conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        print("PAYLOAD RECEBIDO:", data.dict())
+        valor_atual, rentabilidade = _avaliar(data, preco)
 
         cursor.execute("""
                     INSERT INTO financial_transactions (
@@ -451,28 +758,268 @@ async def criar_transacao(data: TransactionCreateSchema):
             data.ticker,
             data.nome_ativo,
             data.tipo_ativo,
-            float(data.quantidade),
-            float(data.valor_investido),
-            float(data.valor_atual),
-            float(data.rentabilidade)
-        ))
-
-        cursor.execute("""
-            UPDATE invest_client
-            SET patrimonio_total = patrimonio_total + %s
-            WHERE client_id = %s
-        """, (
+            data.quantidade,
             data.valor_investido,
-            data.client_id
+            valor_atual,
+            rentabilidade
         ))
 
+        cursor.execute(PATRIMONIO_SQL, (data.valor_investido, data.client_id))
+        outbox.registrar(cursor, [
+            outbox.evento(
+                "investimento", data.email, data.ticker, data.valor_investido,
+                client_id=data.client_id, quantidade=data.quantidade
+            )
+        ])
+
         conn.commit()
 
-        return {"message": "Transação registrada"}
+        return {
+            "message": "Transação registrada",
+            "valor_atual": valor_atual,
+            "rentabilidade": rentabilidade,
+            "cotacao": estado or "cliente"
+        }
 
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+@invest_router.get("/cotacoes")
+async def consultar_cotacoes(
+    tickers: str = Query(..., description="Tickers separados por vírgula"),
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    lista = [t for t in tickers.split(",") if t.strip()]
+    if not lista:
+        raise HTTPException(status_code=400, detail="Informe ao menos um ticker")
+
+    # Uma única chamada ao provedor para todos os tickers faltantes
+    cotacoes = await asyncio.to_thread(get_quote_service().aguardar, lista)
+    return json_response({
+        ticker: {"preco": preco, "estado": estado}
+        for ticker, (preco, estado) in cotacoes.items()
+    })
+
+@invest_router.post("/reavaliar")
+async def reavaliar_carteiras(
+    client_id: Optional[int] = None,
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    # Conexão só nas etapas de banco; cotações e cálculo rodam fora dela
+    posicoes = await run_db(_carregar_posicoes, client_id)
+    cotacoes = await asyncio.to_thread(get_quote_service().aguardar, valuation.tickers_de(posicoes))
+    precos = {ticker: preco for ticker, (preco, _) in cotacoes.items()}
+    avaliacao = await asyncio.to_thread(valuation.avaliar, posicoes, precos)
+    clientes = await run_db(_gravar_patrimonio, avaliacao)
+
+    resposta = {
+        "clientes": clientes,
+        "posicoes": avaliacao["posicoes"],
+        "sem_cotacao": avaliacao["sem_cotacao"]
+    }
+    if client_id is not None:
+        totais = valuation.totais_decimais(avaliacao)
+        resposta["patrimonio_total"] = totais[0][1] if totais else Decimal("0.00")
+    return json_response(resposta)
+
+def _carregar_posicoes(client_id: Optional[int]):
+    conn = get_connection()
+    try:
+        return valuation.carregar_posicoes(conn, client_id)
+    finally:
+        conn.close()
+
+def _gravar_patrimonio(avaliacao):
+    conn = get_connection()
+    try:
+        return valuation.gravar_patrimonio(conn, avaliacao)
+    finally:
+        conn.close()
+
+# BLOCO DE CONCILIAÇÃO
+@internal_router.post("/conciliacao")
+async def conciliar_saldos(
+    completa: bool = False,
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    return json_response(await run_db(_conciliar_saldos, completa))
+
+def _conciliar_saldos(completa: bool):
+    if sharding.ativo():
+        # Cada shard concilia as próprias contas contra o próprio ledger
+        return {"shards": {shard: _conciliar_saldos_shard(shard, completa) for shard in range(sharding.total())}}
+    return _conciliar_saldos_shard(0, completa)
+
+def _conciliar_saldos_shard(shard: int, completa: bool):
+    conn = get_connection(shard=shard)
+    try:
+        return reconciliation.conciliar(conn, completa=completa)
+
+    except reconciliation.ConciliacaoConcorrente as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    except mysql.connector.Error as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro no banco: {str(e)}"
+        )
+
+    finally:
+        conn.close()
+
+# BLOCO DE EXTRATO
+@extrato_router.get("/{email}")
+async def consultar_extrato(
+    email: EmailStr,
+    limit: int = Query(50, ge=1, le=EXTRATO_PAGE_MAX),
+    cursor: Optional[str] = None,
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    apos = decode_cursor(cursor) if cursor else None
+    return json_response(await run_db(_consultar_extrato, email.lower(), limit, apos))
+
+def _consultar_extrato(email: str, limit: int, apos):
+    conn = get_connection(somente_leitura=True, email=email)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        return pagina_extrato(cursor, email, limit, apos)
+
+    except mysql.connector.Error as err:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro no banco de dados: {err.msg}"
+        )
+
+    finally:
+        cursor.close()
+        conn.close()
+
+@extrato_router.get("/{email}/exportar")
+async def exportar_extrato(
+    email: EmailStr,
+    formato: Literal["ndjson", "csv"] = "ndjson",
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    email = email.lower()
+    conn, cursor = await run_db(_abrir_exportacao, email)
+
+    if formato == "csv":
+        return StreamingResponse(
+            _stream_extrato(conn, cursor, email, formato),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="extrato.csv"'}
+        )
+    return StreamingResponse(
+        _stream_extrato(conn, cursor, email, formato),
+        media_type="application/x-ndjson"
+    )
+
+def _abrir_exportacao(email: str):
+    # Cursor não bufferizado: as linhas vêm do socket sob demanda, em lotes,
+    # e a memória fica constante independentemente do tamanho do histórico.
+    conn = get_connection(somente_leitura=True, email=email)
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    try:
+        sql, params = statement_query(email, descendente=False)
+        cursor.execute(sql, params)
+        return conn, cursor
+
+    except mysql.connector.Error as err:
+        _fechar_exportacao(conn, cursor)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro no banco de dados: {err.msg}"
+        )
+
+def _fechar_exportacao(conn, cursor):
+    try:
+        cursor.close()
+    except mysql.connector.Error:
+        pass
+    conn.close()
+
+async def _stream_extrato(conn, cursor, email, formato):
+    try:
+        primeiro = True
+        while True:
+            rows = await run_db(cursor.fetchmany, EXTRATO_EXPORT_BATCH)
+            if formato == "csv":
+                if rows or primeiro:
+                    yield csv_lines(rows, email, cabecalho=primeiro)
+            elif rows:
+                yield ndjson_lines(rows, email)
+            if not rows:
+                break
+            primeiro = False
+    finally:
+        await run_db(_fechar_exportacao, conn, cursor)
+
+# BLOCO DE MÉTRICAS INTERNAS
+@internal_router.get("/stats")
+async def internal_stats(
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    return {
+        "pool": pool_stats(),
+        "transferencias": transfer_stats(),
+        "idempotencia": idempotency.idempotency_stats(),
+        "contas": account_cache.account_cache_stats(),
+        "jwt": jwt_stats(),
+        "hashing": hashing.hashing_stats(),
+        "cotacoes": quote_stats(),
+        "driver": driver_stats(),
+        "replicas": replica_stats(),
+        "auditoria": audit.audit_stats(),
+        "contas_quentes": hot_accounts.hot_accounts_stats(),
+        "sharding": {**shard_stats(), "xa": xa.xa_stats()},
+        "outbox": outbox.outbox_stats()
+    }
+
+@internal_router.get("/queries")
+async def internal_queries(
+    top: int = Query(20, ge=1, le=500),
+    ordem: Literal["total", "p95", "count", "max"] = "total",
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    return {
+        "limite_lenta_ms": query_log.SLOW_QUERY_MS,
+        "queries": query_log.top(top, ordem)
+    }
+
+# BLOCO DE MÉTRICAS PROMETHEUS
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def metricas_prometheus(
+    x_internal_key: str = Header(..., alias="X-Internal-Key")
+):
+    if x_internal_key != INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+    return PlainTextResponse(
+        exportar_prometheus(pool_stats()),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+import asyncio
+import bcrypt
+import hmac
+import os
+import threading
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processos dedicados ao bcrypt: o custo de CPU fica fora do event loop e
+# fora dos threads do driver MySQL. 0 usa threads (ambientes sem fork).
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Máximo de hashes aguardando ou executando; acima disso a rota responde 503
+# em vez de enfileirar e segurar conexões de quem movimenta saldo.
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(max(1, HASH_WORKERS) * 8)))
+
+BCRYPT_MAX_BYTES = 72
+_PREFIXOS_BCRYPT = ("$2a$", "$2b$", "$2y$")
+
+_lock = threading.Lock()
+_executor = None
+_owner_pid = None
+_pendentes = 0
+_stats = {"hashes": 0, "verificacoes": 0, "falhas": 0, "rehashes": 0, "legados": 0, "rejeitadas": 0}
+
+
+def _reset_after_fork():
+    global _lock, _executor, _owner_pid, _pendentes
+    _lock = threading.Lock()
+    _executor = None
+    _owner_pid = None
+    _pendentes = 0
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ----------------------------
+# Trabalho executado nos workers
+# ----------------------------
+
+def _gerar(senha, rounds):
+    return bcrypt.hashpw(senha.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+
+
+def _conferir(senha, armazenada):
+    return bcrypt.checkpw(senha.encode(), armazenada.encode())
+
+
+# ----------------------------
+# Executor e contrapressão
+# ----------------------------
+
+def get_hash_executor():
+    global _executor, _owner_pid
+    with _lock:
+        if _executor is None or _owner_pid != os.getpid():
+            if HASH_WORKERS > 0:
+                _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hash")
+            _owner_pid = os.getpid()
+        return _executor
+
+
+def close_hash_executor():
+    global _executor, _owner_pid
+    with _lock:
+        executor, _executor, _owner_pid = _executor, None, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _incr(campo, n=1):
+    with _lock:
+        _stats[campo] += n
+
+
+def _reservar():
+    global _pendentes
+    with _lock:
+        if _pendentes >= HASH_MAX_PENDING:
+            _stats["rejeitadas"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Serviço de senhas sobrecarregado, tente novamente",
+                headers={"Retry-After": "1"}
+            )
+        _pendentes += 1
+
+
+def _liberar():
+    global _pendentes
+    with _lock:
+        _pendentes -= 1
+
+
+async def _executar(func, *args):
+    _reservar()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_hash_executor(), func, *args)
+    finally:
+        _liberar()
+
+
+# ----------------------------
+# API
+# ----------------------------
+
+def is_bcrypt(armazenada):
+    return isinstance(armazenada, str) and armazenada.startswith(_PREFIXOS_BCRYPT)
+
+
+def custo(armazenada):
+    return int(armazenada[4:6])
+
+
+def precisa_rehash(armazenada):
+    # Senhas legadas em texto puro ou com custo diferente do configurado
+    return not is_bcrypt(armazenada) or custo(armazenada) != BCRYPT_ROUNDS
+
+
+def validar_tamanho(senha):
+    if len(senha.encode()) > BCRYPT_MAX_BYTES:
+        raise HTTPException(status_code=400, detail="Senha excede 72 bytes")
+
+
+async def gerar_hash(senha):
+    validar_tamanho(senha)
+    resultado = await _executar(_gerar, senha, BCRYPT_ROUNDS)
+    _incr("hashes")
+    return resultado
+
+
+async def verificar(senha, armazenada):
+    # Retorna (confere, novo_hash); novo_hash só quando a senha deve ser regravada.
+    _incr("verificacoes")
+    if not armazenada:
+        _incr("falhas")
+        return False, None
+
+    if is_bcrypt(armazenada):
+        if len(senha.encode()) > BCRYPT_MAX_BYTES:
+            confere = False
+        else:
+            confere = await _executar(_conferir, senha, armazenada)
+    else:
+        # Linha anterior ao hashing: compara em tempo constante e migra
+        confere = hmac.compare_digest(senha.encode(), armazenada.encode())
+        if confere:
+            _incr("legados")
+
+    if not confere:
+        _incr("falhas")
+        return False, None
+
+    if precisa_rehash(armazenada) and len(senha.encode()) <= BCRYPT_MAX_BYTES:
+        try:
+            novo_hash = await gerar_hash(senha)
+        except HTTPException:
+            # Sob carga o login segue; a migração fica para o próximo acesso
+            return True, None
+        _incr("rehashes")
+        return True, novo_hash
+    return True, None
+
+
+def hashing_stats():
+    with _lock:
+        return {
+            **_stats,
+            "rounds": BCRYPT_ROUNDS,
+            "workers": HASH_WORKERS,
+            "pendentes": _pendentes,
+            "max_pendentes": HASH_MAX_PENDING
+        }
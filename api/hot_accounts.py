@@ -0,0 +1,198 @@
+from decimal import Decimal
+from api import sharding
+from api.connection import get_connection
+import functools
+import logging
+import os
+import random
+import sys
+import threading
+
+# Contas quentes (lojistas com milhares de créditos por minuto): o crédito
+# vai para uma de N linhas de saldo_shards em vez da linha de usuarios, e um
+# job periódico consolida os shards de volta no saldo_cc.
+HOT_ACCOUNTS = {e.strip().lower() for e in os.getenv("HOT_ACCOUNTS", "").split(",") if e.strip()}
+HOT_ACCOUNT_SHARDS = int(os.getenv("HOT_ACCOUNT_SHARDS", "16"))
+HOT_ACCOUNT_FOLD_INTERVAL = float(os.getenv("HOT_ACCOUNT_FOLD_INTERVAL", "5"))
+
+logger = logging.getLogger("api.hot_accounts")
+
+SHARD_CREDITO_SQL = """
+    INSERT INTO saldo_shards (usuario_id, shard, saldo)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE saldo = saldo + VALUES(saldo)
+"""
+SHARD_SOMA_SQL = "SELECT COALESCE(SUM(saldo), 0) AS soma FROM saldo_shards WHERE usuario_id = %s"
+
+_stats_lock = threading.Lock()
+_stats = {
+    "creditos": 0,
+    "consolidacoes": 0,
+    "contas_consolidadas": 0,
+    "valor_consolidado": Decimal("0.00"),
+    "falhas": 0,
+}
+
+
+def _incr(campo, qtd=1):
+    with _stats_lock:
+        _stats[campo] += qtd
+
+
+def e_quente(email):
+    return bool(HOT_ACCOUNTS) and email.lower() in HOT_ACCOUNTS
+
+
+# ----------------------------
+# Operações na transação do chamador (cursor dictionary=True)
+# ----------------------------
+
+def creditar(cursor, usuario_id, valor):
+    # Só o shard sorteado fica bloqueado até o commit: créditos simultâneos
+    # na mesma conta caem, em geral, em linhas diferentes.
+    cursor.execute(SHARD_CREDITO_SQL, (usuario_id, random.randrange(HOT_ACCOUNT_SHARDS), valor))
+    _incr("creditos")
+
+
+def saldo_shards(cursor, usuario_id):
+    # Leitura sem lock: soma o que ainda não foi consolidado
+    cursor.execute(SHARD_SOMA_SQL, (usuario_id,))
+    return cursor.fetchone()["soma"]
+
+
+def consolidar(cursor, usuario_id):
+    # Move a soma dos shards para o saldo_cc. Bloqueia a conta e depois os
+    # shards, sempre nessa ordem; quem já tem o lock da conta (débitos) pode
+    # chamar para enxergar o saldo inteiro. Retorna o valor movido.
+    cursor.execute("SELECT id FROM usuarios WHERE id = %s FOR UPDATE", (usuario_id,))
+    cursor.fetchall()
+    cursor.execute(SHARD_SOMA_SQL + " FOR UPDATE", (usuario_id,))
+    soma = cursor.fetchone()["soma"]
+    if soma:
+        cursor.execute("UPDATE usuarios SET saldo_cc = saldo_cc + %s WHERE id = %s", (soma, usuario_id))
+        # As linhas ficam zeradas, não apagadas: o próximo crédito é um UPDATE
+        cursor.execute("UPDATE saldo_shards SET saldo = 0 WHERE usuario_id = %s AND saldo <> 0", (usuario_id,))
+    return soma
+
+
+# ----------------------------
+# Job de consolidação
+# ----------------------------
+
+def consolidar_todas(conn):
+    # Uma transação por conta: o lock dos shards dura só a consolidação dela
+    cursor = conn.cursor(dictionary=True)
+    contas = 0
+    total = Decimal("0.00")
+    try:
+        cursor.execute("SELECT DISTINCT usuario_id FROM saldo_shards WHERE saldo <> 0")
+        ids = [row["usuario_id"] for row in cursor.fetchall()]
+        conn.commit()
+
+        for usuario_id in ids:
+            try:
+                soma = consolidar(cursor, usuario_id)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                _incr("falhas")
+                logger.warning("Falha ao consolidar shards da conta %s: %s", usuario_id, e)
+                continue
+            if soma:
+                contas += 1
+                total += soma
+    finally:
+        cursor.close()
+
+    with _stats_lock:
+        _stats["consolidacoes"] += 1
+        _stats["contas_consolidadas"] += contas
+        _stats["valor_consolidado"] += total
+    return {"contas": contas, "valor": total}
+
+
+class Consolidador:
+
+    def __init__(self, conectar=None, intervalo=HOT_ACCOUNT_FOLD_INTERVAL):
+        # Sem `conectar`, consolida todos os shards de DB_SHARD_HOSTS
+        self._conectores = [conectar] if conectar else [
+            functools.partial(get_connection, shard=shard) for shard in range(sharding.total())
+        ]
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="javer_hot_accounts", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            self.executar()
+
+    def executar(self):
+        resultado = {"contas": 0, "valor": Decimal("0.00")}
+        for conectar in self._conectores:
+            conn = None
+            try:
+                conn = conectar()
+                parcial = consolidar_todas(conn)
+                resultado["contas"] += parcial["contas"]
+                resultado["valor"] += parcial["valor"]
+            except Exception as e:
+                _incr("falhas")
+                logger.warning("Consolidação de contas quentes falhou: %s", e)
+            finally:
+                if conn is not None:
+                    conn.close()
+        return resultado
+
+    def fechar(self, timeout=10):
+        # Uma última passada: o saldo_cc volta a refletir tudo no desligamento
+        self._parar.set()
+        self._thread.join(timeout)
+        self.executar()
+
+
+_lock = threading.Lock()
+_consolidador = None
+
+
+def iniciar_consolidador():
+    global _consolidador
+    if not HOT_ACCOUNTS or HOT_ACCOUNT_FOLD_INTERVAL <= 0:
+        return None
+    with _lock:
+        if _consolidador is None:
+            _consolidador = Consolidador()
+    return _consolidador
+
+
+def parar_consolidador():
+    global _consolidador
+    with _lock:
+        anterior, _consolidador = _consolidador, None
+    if anterior is not None:
+        anterior.fechar()
+
+
+def hot_accounts_stats():
+    with _stats_lock:
+        return {
+            **_stats,
+            "contas": len(HOT_ACCOUNTS),
+            "shards": HOT_ACCOUNT_SHARDS,
+            "intervalo": HOT_ACCOUNT_FOLD_INTERVAL,
+            "consolidador_ativo": _consolidador is not None,
+        }
+
+
+if __name__ == "__main__":
+    from api.connection import _connect
+
+    conn = _connect()
+    try:
+        resultado = consolidar_todas(conn)
+        print(f"Shards consolidados: {resultado['contas']} contas, {resultado['valor']} movidos para saldo_cc")
+    except Exception as e:
+        print(f"Erro na consolidação: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
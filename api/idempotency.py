@@ -0,0 +1,177 @@
+from fastapi import HTTPException
+from mysql.connector import errorcode
+from api import sharding
+from api.cache import TTLCache
+from api.connection import get_connection
+import functools
+import hashlib
+import json
+import logging
+import mysql.connector
+import os
+import threading
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+REPLAY_HEADER = "Idempotency-Replayed"
+
+logger = logging.getLogger("api.idempotency")
+
+# Uma leitura pela chave primária (rota, chave)
+BUSCAR_SQL = """
+    SELECT hash_requisicao, resposta
+    FROM idempotency_keys
+    WHERE rota = %s AND chave = %s
+      AND create_time >= NOW() - INTERVAL %s SECOND
+"""
+
+_cache = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL)
+
+
+def hash_requisicao(model):
+    return hashlib.sha256(model.model_dump_json().encode()).hexdigest()
+
+
+def _conferir(registro, hash_req):
+    if registro["hash_requisicao"] != hash_req:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key já utilizada com outro payload"
+        )
+    return registro["resposta"]
+
+
+def em_cache(rota, chave, hash_req):
+    # Caminho sem banco: chaves vistas recentemente por este processo.
+    registro = _cache.get((rota, chave))
+    return _conferir(registro, hash_req) if registro else None
+
+
+def buscar(cursor, rota, chave, hash_req):
+    cursor.execute(BUSCAR_SQL, (rota, chave, IDEMPOTENCY_TTL))
+    row = cursor.fetchone()
+    if not row:
+        return None
+
+    resposta = row["resposta"]
+    registro = {
+        "hash_requisicao": row["hash_requisicao"],
+        "resposta": json.loads(resposta) if isinstance(resposta, (str, bytes)) else resposta
+    }
+    _cache.set((rota, chave), registro)
+    return _conferir(registro, hash_req)
+
+
+def registrar(cursor, rota, chave, hash_req, resposta):
+    # Gravado na mesma transação da operação: ou os dois persistem, ou nenhum.
+    params = (rota, chave, hash_req, json.dumps(resposta, default=str))
+    sql = """
+        INSERT INTO idempotency_keys (rota, chave, hash_requisicao, resposta, create_time)
+        VALUES (%s, %s, %s, %s, NOW())
+    """
+    try:
+        cursor.execute(sql, params)
+    except mysql.connector.Error as err:
+        if not is_duplicate(err):
+            raise
+        # Chave vencida ainda ocupa a chave primária: cede o lugar. Se a
+        # existente está no prazo, é repetição concorrente e o erro segue.
+        cursor.execute(
+            """
+            DELETE FROM idempotency_keys
+            WHERE rota = %s AND chave = %s
+              AND create_time < NOW() - INTERVAL %s SECOND
+            """,
+            (rota, chave, IDEMPOTENCY_TTL)
+        )
+        if cursor.rowcount != 1:
+            raise
+        cursor.execute(sql, params)
+
+
+def lembrar(rota, chave, hash_req, resposta):
+    _cache.set((rota, chave), {"hash_requisicao": hash_req, "resposta": resposta})
+
+
+def is_duplicate(err):
+    return getattr(err, "errno", None) == errorcode.ER_DUP_ENTRY
+
+
+def marcar_replay(response):
+    if response is not None:
+        response.headers[REPLAY_HEADER] = "true"
+
+
+def purgar_expiradas(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM idempotency_keys WHERE create_time < NOW() - INTERVAL %s SECOND",
+            (IDEMPOTENCY_TTL,)
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+class Purgador:
+
+    def __init__(self, conectar=None, intervalo=IDEMPOTENCY_PURGE_INTERVAL):
+        # Sem `conectar`, purga todos os shards de DB_SHARD_HOSTS
+        self._conectores = [conectar] if conectar else [
+            functools.partial(get_connection, shard=shard) for shard in range(sharding.total())
+        ]
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="javer_idempotency_purge", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            self.executar()
+
+    def executar(self):
+        removidas = 0
+        for conectar in self._conectores:
+            conn = None
+            try:
+                conn = conectar()
+                removidas += purgar_expiradas(conn)
+            except Exception as e:
+                logger.warning("Purga de chaves de idempotência falhou: %s", e)
+            finally:
+                if conn is not None:
+                    conn.close()
+        return removidas
+
+    def fechar(self, timeout=10):
+        self._parar.set()
+        self._thread.join(timeout)
+
+
+_lock = threading.Lock()
+_purgador = None
+
+
+def iniciar_purgador():
+    global _purgador
+    if IDEMPOTENCY_PURGE_INTERVAL <= 0:
+        return None
+    with _lock:
+        if _purgador is None:
+            _purgador = Purgador()
+    return _purgador
+
+
+def parar_purgador():
+    global _purgador
+    with _lock:
+        anterior, _purgador = _purgador, None
+    if anterior is not None:
+        anterior.fechar()
+
+
+def idempotency_stats():
+    return {**_cache.stats(), "purgador_ativo": _purgador is not None}
@@ -0,0 +1,27 @@
+import time
+
+# Linhas de auditoria e do outbox gravadas em lote. O create_time vem do
+# relógio do banco, o mesmo do ledger: a linha guarda só o instante monotônico
+# da operação, e a gravação desconta o tempo decorrido até ela (no modo async
+# da auditoria, a gravação acontece depois do commit).
+
+
+def insert_sql(tabela, colunas):
+    # executemany de um INSERT ... VALUES vira um único INSERT multi-linha no driver
+    marcadores = ", ".join(["%s"] * len(colunas))
+    return f"""
+    INSERT INTO {tabela}
+        ({", ".join(colunas)}, create_time)
+    VALUES ({marcadores}, NOW(6) - INTERVAL %s MICROSECOND)
+"""
+
+
+def linha(*valores):
+    return (*valores, time.monotonic())
+
+
+def gravar(cursor, sql, linhas):
+    agora = time.monotonic()
+    cursor.executemany(sql, [
+        (*l[:-1], max(0, int((agora - l[-1]) * 1_000_000))) for l in linhas
+    ])
@@ -1,34 +1,259 @@
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
+from jose import jwt, jwk, JWTError
 from fastapi import HTTPException, Depends
+from pathlib import Path
+from api.cache import TTLCache
+import hashlib
 import os
+import threading
+import time
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-def create_access_token(data: dict):
-    if not SECRET_KEY:
-        raise RuntimeError("SECRET_KEY não carregada. Verifique o main.py")
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose")
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+
+
+# ----------------------------
+# Backends JOSE
+# ----------------------------
+
+class JoseBackend:
+    nome = "jose"
+    erros = (JWTError,)
+
+    def preparar_chave(self, material, algoritmo):
+        # Objeto Key pronto: o jose não refaz o parse do PEM a cada token.
+        return jwk.construct(material, algoritmo)
+
+    def encode(self, claims, chave, algoritmo, headers=None):
+        return jwt.encode(claims, chave, algorithm=algoritmo, headers=headers)
+
+    def decode(self, token, chave, algoritmo):
+        return jwt.decode(token, chave, algorithms=[algoritmo])
+
+    def header(self, token):
+        return jwt.get_unverified_header(token)
+
+
+class PyJWTBackend:
+    # PyJWT assina/verifica direto no `cryptography`, sem a camada JWK do jose.
+    nome = "pyjwt"
+
+    def __init__(self):
+        import jwt as pyjwt
+
+        self._jwt = pyjwt
+        self.erros = (pyjwt.PyJWTError, ValueError)
+
+    def preparar_chave(self, material, algoritmo):
+        return self._jwt.algorithms.get_default_algorithms()[algoritmo].prepare_key(material)
+
+    def encode(self, claims, chave, algoritmo, headers=None):
+        return self._jwt.encode(claims, chave, algorithm=algoritmo, headers=headers)
+
+    def decode(self, token, chave, algoritmo):
+        return self._jwt.decode(token, chave, algorithms=[algoritmo])
+
+    def header(self, token):
+        return self._jwt.get_unverified_header(token)
+
+
+def _criar_backend(nome):
+    if nome == "pyjwt":
+        return PyJWTBackend()
+    if nome == "jose":
+        return JoseBackend()
+    raise ValueError(f"JWT_BACKEND desconhecido: {nome}")
+
+
+# ----------------------------
+# Conjunto de chaves (algoritmos assimétricos)
+# ----------------------------
+
+class KeySet:
+    # Chaves públicas por `kid` ficam carregadas e prontas para verificação.
+    # Na rotação a chave nova passa a assinar e as antigas seguem verificando
+    # até serem aposentadas.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._publicas = {}
+        self._privadas = {}
+        self._preparadas = {}
+        self.kid_ativo = None
+        self.versao = 0
+
+    def adicionar(self, kid, publica, privada=None, ativar=False):
+        with self._lock:
+            self._publicas[kid] = publica
+            if privada is not None:
+                self._privadas[kid] = privada
+            if ativar or self.kid_ativo is None and privada is not None:
+                self.kid_ativo = kid
+
+    def rotacionar(self, kid, privada, publica):
+        self.adicionar(kid, publica, privada, ativar=True)
+
+    def aposentar(self, kid):
+        with self._lock:
+            self._publicas.pop(kid, None)
+            self._privadas.pop(kid, None)
+            self._preparadas = {k: v for k, v in self._preparadas.items() if k[1] != kid}
+            if self.kid_ativo == kid:
+                self.kid_ativo = None
+            # Tokens desta chave já verificados deixam de valer no cache
+            self.versao += 1
+
+    def _preparar(self, tipo, kid, material, backend, algoritmo):
+        chave_cache = (tipo, kid, backend.nome, algoritmo)
+        with self._lock:
+            chave = self._preparadas.get(chave_cache)
+        if chave is None:
+            chave = backend.preparar_chave(material, algoritmo)
+            with self._lock:
+                self._preparadas[chave_cache] = chave
+        return chave
+
+    def verificacao(self, kid, backend, algoritmo):
+        material = self._publicas.get(kid)
+        if material is None:
+            return None
+        return self._preparar("pub", kid, material, backend, algoritmo)
+
+    def assinatura(self, backend, algoritmo):
+        kid = self.kid_ativo
+        material = self._privadas.get(kid)
+        if material is None:
+            return None, None
+        return kid, self._preparar("priv", kid, material, backend, algoritmo)
 
+    def kids(self):
+        return sorted(self._publicas)
+
+    def carregar_diretorio(self, diretorio, kid_ativo=None):
+        # <kid>.pub.pem verifica; <kid>.pem (opcional) assina.
+        for arquivo in sorted(Path(diretorio).glob("*.pub.pem")):
+            kid = arquivo.name[:-len(".pub.pem")]
+            privada = arquivo.with_name(f"{kid}.pem")
+            self.adicionar(
+                kid,
+                arquivo.read_text(),
+                privada.read_text() if privada.exists() else None,
+                ativar=kid == kid_ativo
+            )
+
+
+_backend = _criar_backend(JWT_BACKEND)
+KEYSET = KeySet()
+if JWT_KEYS_DIR:
+    KEYSET.carregar_diretorio(JWT_KEYS_DIR, JWT_ACTIVE_KID)
+
+# sha256(token) -> user_id, válido até o `exp` do próprio token
+_cache = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+_hmac = {}
+
+
+def configurar_backend(nome):
+    global _backend
+    _backend = _criar_backend(nome)
+    _cache.clear()
+
+
+def _simetrico():
+    return ALGORITHM.startswith("HS")
+
+
+def _digest_segredo():
+    # O segredo em si não entra em chave de cache, só o hash dele
+    return hashlib.sha256(SECRET_KEY.encode()).digest() if SECRET_KEY else None
+
+
+def _chave_hmac():
+    # SECRET_KEY é lido a cada chamada (pode ser trocado em tempo de execução).
+    chave_cache = (_backend.nome, ALGORITHM, _digest_segredo())
+    chave = _hmac.get(chave_cache)
+    if chave is None:
+        chave = _backend.preparar_chave(SECRET_KEY, ALGORITHM)
+        _hmac.clear()
+        _hmac[chave_cache] = chave
+    return chave
+
+
+def _chave_cache(token):
+    # A origem da verificação entra na chave: trocar o segredo, o algoritmo
+    # ou aposentar uma chave pública invalida o que já foi verificado.
+    origem = _digest_segredo() if _simetrico() else KEYSET.versao
+    return (hashlib.sha256(token.encode()).digest(), ALGORITHM, origem)
+
+
+def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
 
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    if _simetrico():
+        if not SECRET_KEY:
+            raise RuntimeError("SECRET_KEY não carregada. Verifique o main.py")
+        return _backend.encode(to_encode, _chave_hmac(), ALGORITHM)
+
+    kid, chave = KEYSET.assinatura(_backend, ALGORITHM)
+    if chave is None:
+        raise RuntimeError("Chave privada de assinatura não carregada. Verifique JWT_KEYS_DIR")
+    return _backend.encode(to_encode, chave, ALGORITHM, headers={"kid": kid})
+
+
+def _decodificar(token):
+    if _simetrico():
+        if not SECRET_KEY:
+            raise HTTPException(status_code=401, detail="Token inválido")
+        chave = _chave_hmac()
+    else:
+        chave = KEYSET.verificacao(_backend.header(token).get("kid"), _backend, ALGORITHM)
+        if chave is None:
+            raise HTTPException(status_code=401, detail="Token inválido")
+    return _backend.decode(token, chave, ALGORITHM)
+
 
 def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    chave_cache = _chave_cache(token)
+    user_id = _cache.get(chave_cache)
+    if user_id is not None:
+        return user_id
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decodificar(token)
         user_id = payload.get("sub")
 
         if user_id is None:
             raise HTTPException(status_code=401, detail="Token inválido")
 
-        return int(user_id)
+        # `sub` não numérico em token bem assinado: 401 nos dois backends
+        user_id = int(user_id)
 
-    except JWTError:
+    except (*_backend.erros, ValueError, TypeError):
         raise HTTPException(status_code=401, detail="Token inválido")
+
+    # Só tokens válidos e com `exp` entram no cache, e saem quando expiram
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        _cache.set(chave_cache, user_id, ttl=exp - time.time())
+
+    return user_id
+
+
+def jwt_stats():
+    return {
+        "backend": _backend.nome,
+        "algoritmo": ALGORITHM,
+        "kids": KEYSET.kids(),
+        "kid_ativo": KEYSET.kid_ativo,
+        "cache": _cache.stats()
+    }
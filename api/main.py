@@ -5,7 +5,19 @@ from fastapi.middleware.cors import CORSMiddleware
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv(BASE_DIR / ".env")
 
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from api.connection import init_pool, close_pool, run_db
+from api.hashing import close_hash_executor
+from api.quotes import close_quote_service
+from api.audit import close_audit_writer
+from api.idempotency import iniciar_purgador, parar_purgador
+from api.hot_accounts import iniciar_consolidador, parar_consolidador
+from api.xa import iniciar_recuperador, parar_recuperador
+from api.outbox import iniciar_relay, parar_relay
+from api.responses import FastJSONResponse
+from api.metrics import MetricsMiddleware
 from api.execute_routes import criar_router
 from api.execute_routes import login_router
 from api.execute_routes import update_router
@@ -13,8 +25,32 @@ from api.execute_routes import transacoes_router
 from api.execute_routes import deposit_router
 from api.execute_routes import saque_router
 from api.execute_routes import invest_router
+from api.execute_routes import extrato_router
+from api.execute_routes import internal_router
+from api.execute_routes import metrics_router
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # O pool nasce em cada worker, depois do fork, e é drenado no desligamento.
+    await run_db(init_pool)
+    iniciar_consolidador()
+    iniciar_purgador()
+    # Com shards: resolve transações XA deixadas por um processo anterior
+    iniciar_recuperador()
+    iniciar_relay()
+    yield
+    # Última passada do relay antes de o pool fechar
+    await asyncio.to_thread(parar_relay)
+    await asyncio.to_thread(parar_recuperador)
+    await asyncio.to_thread(parar_consolidador)
+    await asyncio.to_thread(parar_purgador)
+    # A fila de auditoria precisa do pool para o último group commit
+    await asyncio.to_thread(close_audit_writer)
+    await asyncio.to_thread(close_pool)
+    await asyncio.to_thread(close_hash_executor)
+    close_quote_service()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +60,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latência por rota, queries e espera do pool por requisição + Server-Timing
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(criar_router)
 app.include_router(login_router)
 app.include_router(update_router)
@@ -31,3 +70,6 @@ app.include_router(transacoes_router)
 app.include_router(deposit_router)
 app.include_router(saque_router)
 app.include_router(invest_router)
+app.include_router(extrato_router)
+app.include_router(internal_router)
+app.include_router(metrics_router)
@@ -0,0 +1,314 @@
+from contextvars import ContextVar
+from starlette.datastructures import MutableHeaders
+from api import prepared, query_log
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCIA_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+CONTAGEM_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Estado da requisição corrente. run_db copia o contexto para o thread do
+# banco, então as queries somam no mesmo dicionário.
+_atual = ContextVar("metricas_requisicao", default=None)
+
+
+# ----------------------------
+# Primitivas
+# ----------------------------
+
+class Histogram:
+
+    def __init__(self, nome, ajuda, buckets, labels=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observar(self, valor, *labels):
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                serie = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            else:
+                serie[0][-1] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = {k: ([*v[0]], v[1], v[2]) for k, v in self._series.items()}
+        for valores, (contagens, soma, total) in sorted(series.items()):
+            base = _labels(self.labels, valores)
+            acumulado = 0
+            for limite, qtd in zip(self.buckets + ("+Inf",), contagens):
+                acumulado += qtd
+                linhas.append(f"{self.nome}_bucket{_labels(self.labels + ('le',), valores + (str(limite),))} {acumulado}")
+            linhas.append(f"{self.nome}_sum{base} {soma}")
+            linhas.append(f"{self.nome}_count{base} {total}")
+        return linhas
+
+
+class Counter:
+
+    def __init__(self, nome, ajuda, labels=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def incrementar(self, *labels, n=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + n
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for valores, total in sorted(series.items()):
+            linhas.append(f"{self.nome}{_labels(self.labels, valores)} {total}")
+        return linhas
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(nomes, valores):
+    if not nomes:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)) + "}"
+
+
+def _gauge(nome, ajuda, valor):
+    return [f"# HELP {nome} {ajuda}", f"# TYPE {nome} gauge", f"{nome} {valor}"]
+
+
+# ----------------------------
+# Registro
+# ----------------------------
+
+requisicoes = Counter("http_requests_total", "Requisições atendidas", ("method", "rota", "status"))
+latencia = Histogram("http_request_duration_seconds", "Latência por rota", LATENCIA_BUCKETS, ("method", "rota"))
+queries_por_requisicao = Histogram("db_queries_per_request", "Queries por requisição", CONTAGEM_BUCKETS, ("rota",))
+tempo_db_por_requisicao = Histogram("db_time_per_request_seconds", "Tempo de banco por requisição", LATENCIA_BUCKETS, ("rota",))
+duracao_query = Histogram("db_query_duration_seconds", "Duração de cada query", QUERY_BUCKETS)
+espera_pool = Histogram("db_pool_acquire_wait_seconds", "Espera para obter conexão do pool", QUERY_BUCKETS)
+
+_em_voo_lock = threading.Lock()
+_em_voo = 0
+
+
+def _ajustar_em_voo(delta):
+    global _em_voo
+    with _em_voo_lock:
+        _em_voo += delta
+
+
+def registrar_query(segundos, contar=True):
+    duracao_query.observar(segundos)
+    req = _atual.get()
+    if req is not None:
+        req["db"] += segundos
+        if contar:
+            req["queries"] += 1
+
+
+def registrar_espera_pool(segundos):
+    espera_pool.observar(segundos)
+    req = _atual.get()
+    if req is not None:
+        req["pool"] += segundos
+
+
+# ----------------------------
+# Conexão e cursor instrumentados
+# ----------------------------
+
+class InstrumentedCursor:
+
+    def __init__(self, cursor, conexao=None):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_conexao", conexao)
+
+    def __getattr__(self, name):
+        return getattr(object.__getattribute__(self, "_cursor"), name)
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, "_cursor"), name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _medir(self, metodo, *args, contar=False, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return getattr(self._cursor, metodo)(*args, **kwargs)
+        finally:
+            registrar_query(time.perf_counter() - inicio, contar=contar)
+
+    def _executar(self, metodo, sql, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return getattr(self._cursor, metodo)(sql, *args, **kwargs)
+        finally:
+            segundos = time.perf_counter() - inicio
+            registrar_query(segundos)
+            linhas = getattr(self._cursor, "rowcount", 0)
+            fp = query_log.registrar(sql, segundos, linhas if isinstance(linhas, int) else 0)
+            if fp and metodo == "execute" and self._conexao is not None:
+                params = args[0] if args else kwargs.get("params")
+                self._conexao._explicar_depois(fp, sql, params)
+
+    def execute(self, sql, *args, **kwargs):
+        return self._executar("execute", sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        return self._executar("executemany", sql, *args, **kwargs)
+
+    # Cursores não bufferizados fazem I/O na leitura
+    def fetchone(self):
+        return self._medir("fetchone")
+
+    def fetchmany(self, *args, **kwargs):
+        return self._medir("fetchmany", *args, **kwargs)
+
+    def fetchall(self):
+        return self._medir("fetchall")
+
+
+class InstrumentedConnection:
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_pendentes_explain", [])
+
+    def __getattr__(self, name):
+        return getattr(object.__getattribute__(self, "_conn"), name)
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, "_conn"), name, value)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self)
+
+    def preparar(self, sql, dictionary=False):
+        cursor = prepared.preparar(self._conn, sql, dictionary)
+        return InstrumentedCursor(cursor, self) if cursor is not None else None
+
+    def _explicar_depois(self, fp, sql, params):
+        # EXPLAIN logo após a query colidiria com resultados não lidos de
+        # cursores não bufferizados; fica para a devolução da conexão.
+        self._pendentes_explain.append((fp, sql, params))
+
+    def close(self):
+        pendentes = self._pendentes_explain
+        object.__setattr__(self, "_pendentes_explain", [])
+        for fp, sql, params in pendentes:
+            query_log.explicar(self._conn, fp, sql, params)
+        return self._conn.close()
+
+    def commit(self):
+        inicio = time.perf_counter()
+        try:
+            return self._conn.commit()
+        finally:
+            registrar_query(time.perf_counter() - inicio)
+
+    def rollback(self):
+        inicio = time.perf_counter()
+        try:
+            return self._conn.rollback()
+        finally:
+            registrar_query(time.perf_counter() - inicio)
+
+
+def instrumentar(conn):
+    return InstrumentedConnection(conn) if METRICS_ENABLED else conn
+
+
+# ----------------------------
+# Middleware
+# ----------------------------
+
+def server_timing(req, total):
+    return (
+        f'db;dur={req["db"] * 1000:.2f};desc="{req["queries"]} queries", '
+        f'pool;dur={req["pool"] * 1000:.2f}, '
+        f'app;dur={total * 1000:.2f}'
+    )
+
+
+class MetricsMiddleware:
+    # ASGI puro: sem o custo do BaseHTTPMiddleware e sem bufferizar streaming.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        req = {"queries": 0, "db": 0.0, "pool": 0.0}
+        status = 500
+        token = _atual.set(req)
+        _ajustar_em_voo(1)
+
+        async def send_com_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", server_timing(req, time.perf_counter() - inicio)
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_timing)
+        finally:
+            decorrido = time.perf_counter() - inicio
+            _ajustar_em_voo(-1)
+            _atual.reset(token)
+
+            # Template da rota (ex.: /extrato/{email}) para não explodir a cardinalidade
+            rota = getattr(scope.get("route"), "path", "desconhecida")
+            requisicoes.incrementar(scope["method"], rota, str(status))
+            latencia.observar(decorrido, scope["method"], rota)
+            queries_por_requisicao.observar(req["queries"], rota)
+            tempo_db_por_requisicao.observar(req["db"], rota)
+
+
+# ----------------------------
+# Exposição
+# ----------------------------
+
+def exportar_prometheus(pool=None):
+    linhas = []
+    for metrica in (requisicoes, latencia, queries_por_requisicao, tempo_db_por_requisicao, duracao_query, espera_pool):
+        linhas += metrica.exportar()
+    with _em_voo_lock:
+        linhas += _gauge("http_requests_in_flight", "Requisições em andamento", _em_voo)
+
+    if pool:
+        linhas += _gauge("db_pool_size", "Conexões abertas no pool", pool["size"])
+        linhas += _gauge("db_pool_in_use", "Conexões emprestadas", pool["in_use"])
+        linhas += _gauge("db_pool_idle", "Conexões ociosas", pool["idle"])
+        linhas += _gauge("db_pool_waiting", "Threads aguardando conexão", pool["waiting"])
+        for campo in ("timeouts", "queue_full", "acquire_failures"):
+            nome = f"db_pool_{campo}_total"
+            linhas += [f"# HELP {nome} Contador do pool: {campo}", f"# TYPE {nome} counter", f"{nome} {pool[campo]}"]
+
+    return "\n".join(linhas) + "\n"
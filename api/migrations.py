@@ -0,0 +1,110 @@
+from pathlib import Path
+import re
+import sys
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+_NOME_ARQUIVO = re.compile(r"^(\d{4})_([\w]+)\.sql$")
+# Linha "-- shards: 0" limita a migração a esses shards (sem ela, vale para todos)
+_SHARDS = re.compile(r"^--\s*shards:\s*(\d+(?:\s*,\s*\d+)*)\s*$", re.MULTILINE)
+
+
+def carregar_migracoes(diretorio=MIGRATIONS_DIR):
+    migracoes = []
+    for arquivo in sorted(Path(diretorio).glob("*.sql")):
+        match = _NOME_ARQUIVO.match(arquivo.name)
+        if not match:
+            raise ValueError(f"Nome de migração inválido: {arquivo.name}")
+        migracoes.append((int(match.group(1)), match.group(2), arquivo.read_text(encoding="utf-8")))
+
+    versoes = [versao for versao, _, _ in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise ValueError("Versões de migração duplicadas")
+    return migracoes
+
+
+def separar_comandos(sql):
+    # Comandos terminam em ";" no fim da linha; linhas "--" são comentários.
+    linhas = [l for l in sql.splitlines() if not l.strip().startswith("--")]
+    comandos = re.split(r";\s*$", "\n".join(linhas), flags=re.MULTILINE)
+    return [c.strip() for c in comandos if c.strip()]
+
+
+def shards_da_migracao(sql):
+    match = _SHARDS.search(sql)
+    if match is None:
+        return None
+    return {int(s) for s in match.group(1).split(",")}
+
+
+def versoes_aplicadas(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versao INT NOT NULL,
+            nome VARCHAR(255) NOT NULL,
+            aplicada_em DATETIME NOT NULL,
+            PRIMARY KEY (versao)
+        )
+        """
+    )
+    cursor.execute("SELECT versao FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def aplicar_migracoes(conn, diretorio=MIGRATIONS_DIR, ate=None, shard=0):
+    cursor = conn.cursor()
+    aplicadas = []
+    try:
+        feitas = versoes_aplicadas(cursor)
+
+        for versao, nome, sql in carregar_migracoes(diretorio):
+            if versao in feitas or (ate is not None and versao > ate):
+                continue
+
+            # Migração de outro shard é só registrada, para a versão andar igual em todos
+            shards = shards_da_migracao(sql)
+            executar = shards is None or shard in shards
+
+            # DDL no MySQL faz commit implícito: cada migração é registrada logo
+            # após seus comandos, para que uma falha pare exatamente nela.
+            if executar:
+                for comando in separar_comandos(sql):
+                    cursor.execute(comando)
+            cursor.execute(
+                "INSERT INTO schema_migrations (versao, nome, aplicada_em) VALUES (%s, %s, NOW())",
+                (versao, nome)
+            )
+            conn.commit()
+            aplicadas.append(versao)
+            if executar:
+                print(f"Migração {versao:04d}_{nome} aplicada.")
+            else:
+                print(f"Migração {versao:04d}_{nome} registrada (não se aplica ao shard {shard}).")
+
+        return aplicadas
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    from api.connection import _connect
+    from api import sharding
+
+    # Todos os shards têm o mesmo esquema de contas; diretório e log XA só no shard 0
+    for shard in range(sharding.total()):
+        if shard:
+            host, porta, banco = sharding.endereco(shard)
+            print(f"Shard {shard} ({host}):")
+            conn = _connect(host=host, port=porta, database=banco)
+        else:
+            conn = _connect()
+        try:
+            aplicadas = aplicar_migracoes(conn, shard=shard)
+            if not aplicadas:
+                print("Nenhuma migração pendente.")
+        except Exception as e:
+            print(f"Erro ao aplicar migrações: {e}")
+            sys.exit(1)
+        finally:
+            conn.close()
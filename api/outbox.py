@@ -0,0 +1,424 @@
+from api import insercao, sharding
+from api.connection import get_connection
+from datetime import datetime
+import functools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+# Outbox das movimentações: cada depósito, saque, transferência e aporte grava
+# um evento em `outbox` na mesma transação da operação. Um relay publica os
+# eventos em lote para cada consumidor, que tem o próprio cursor no banco
+# (outbox_cursores): entrega ao menos uma vez, em ordem de id por shard.
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "0") == "1"
+# Consumidores "nome=destino" separados por vírgula; destino file:<caminho> ou queue
+OUTBOX_CONSUMERS = os.getenv("OUTBOX_CONSUMERS", "")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_RELAY_INTERVAL = float(os.getenv("OUTBOX_RELAY_INTERVAL", "1"))
+# Eventos depois de um buraco na sequência de ids esperam este tempo pela
+# transação que ficou com o id do buraco; depois seguem, e o id do buraco
+# fica pendente no cursor até aparecer (fora de ordem) ou ser descartado
+OUTBOX_SETTLE_SECONDS = int(os.getenv("OUTBOX_SETTLE_SECONDS", "10"))
+OUTBOX_RETENTION_SECONDS = int(os.getenv("OUTBOX_RETENTION_SECONDS", "604800"))
+# Intervalo da purga dos eventos entregues, feita pelo próprio relay (0 desliga)
+OUTBOX_PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", "3600"))
+
+logger = logging.getLogger("api.outbox")
+
+# create_time pelo relógio do banco, o mesmo do `assentado` no relay
+OUTBOX_INSERT = insercao.insert_sql(
+    "outbox", ("evento", "email_origin", "email_destination", "valor", "dados")
+)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "registrados": 0,
+    "publicados": 0,
+    "lotes": 0,
+    "falhas": 0,
+    "purgados": 0,
+    "atrasados": 0,
+    "abandonados": 0,
+}
+
+
+def _incr(campo, qtd=1):
+    with _stats_lock:
+        _stats[campo] += qtd
+
+
+# ----------------------------
+# Escrita (na transação da operação)
+# ----------------------------
+
+def evento(tipo, email_origin, email_destination, valor, **dados):
+    return insercao.linha(
+        tipo,
+        email_origin,
+        email_destination,
+        valor,
+        json.dumps(dados, default=str) if dados else None
+    )
+
+
+def registrar(cursor, eventos):
+    # Chamado antes do commit: o evento existe se, e só se, a operação existe
+    if not OUTBOX_ENABLED or not eventos:
+        return
+    insercao.gravar(cursor, OUTBOX_INSERT, eventos)
+    _incr("registrados", len(eventos))
+
+
+# ----------------------------
+# Destinos
+# ----------------------------
+
+class ArquivoSink:
+    # NDJSON, um evento por linha. O fsync vem antes de o cursor andar.
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def publicar(self, eventos):
+        with open(self.caminho, "a", encoding="utf-8") as arquivo:
+            arquivo.write("".join(json.dumps(e, default=str) + "\n" for e in eventos))
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+
+
+class FilaSink:
+    # Fila em memória no lugar de um broker (testes, ambiente local)
+
+    def __init__(self, fila=None):
+        self.fila = fila if fila is not None else queue.Queue()
+
+    def publicar(self, eventos):
+        for e in eventos:
+            self.fila.put_nowait(e)
+
+
+def criar_sink(destino):
+    tipo, _, caminho = destino.partition(":")
+    if tipo == "file" and caminho:
+        return ArquivoSink(caminho)
+    if tipo == "queue":
+        return FilaSink()
+    raise ValueError(f"Destino de outbox inválido: {destino}")
+
+
+def consumidores_configurados(especificacao=None):
+    especificacao = OUTBOX_CONSUMERS if especificacao is None else especificacao
+    consumidores = {}
+    for item in especificacao.split(","):
+        if not item.strip():
+            continue
+        nome, _, destino = item.strip().partition("=")
+        consumidores[nome] = criar_sink(destino)
+    return consumidores
+
+
+# ----------------------------
+# Relay
+# ----------------------------
+
+def _evento_publicado(row, shard):
+    dados = row["dados"]
+    return {
+        "id": row["id"],
+        "shard": shard,
+        "evento": row["evento"],
+        "email_origin": row["email_origin"],
+        "email_destination": row["email_destination"],
+        "valor": row["valor"],
+        "dados": json.loads(dados) if isinstance(dados, (str, bytes)) else dados,
+        "create_time": row["create_time"],
+    }
+
+
+def _ler_pendentes(valor):
+    # {id: visto_em}; o JSON guarda as chaves como texto
+    if isinstance(valor, (bytes, bytearray)):
+        valor = valor.decode()
+    dados = json.loads(valor) if isinstance(valor, str) else (valor or {})
+    return {int(id_): datetime.fromisoformat(visto) for id_, visto in dados.items()}
+
+
+def _gravar_pendentes(pendentes):
+    if not pendentes:
+        return None
+    return json.dumps({str(id_): visto.isoformat() for id_, visto in sorted(pendentes.items())})
+
+
+def _encerradas_desde(cursor):
+    # Devolve um teste "toda transação aberta no instante X já terminou?".
+    # Vem antes da primeira leitura do outbox, que fixa o snapshot: o que
+    # terminou com commit até aqui aparece na leitura seguinte. Ramo XA
+    # preparado segura tudo (após um restart ele volta com início novo).
+    cursor.execute("XA RECOVER")
+    if cursor.fetchall():
+        return lambda visto: False
+    cursor.execute(
+        "SELECT MIN(trx_started) AS inicio FROM information_schema.innodb_trx "
+        "WHERE trx_mysql_thread_id <> CONNECTION_ID()"
+    )
+    inicio = cursor.fetchone()["inicio"]
+    return lambda visto: inicio is None or inicio > visto
+
+
+def _conferir_pendentes(cursor, pendentes, shard):
+    # Ids pulados antes: publica os que apareceram e descarta os que não têm
+    # mais transação que possa confirmá-los (rollback)
+    encerradas = _encerradas_desde(cursor)
+    marcadores = ", ".join(["%s"] * len(pendentes))
+    cursor.execute(
+        f"""
+        SELECT id, evento, email_origin, email_destination, valor, dados, create_time
+        FROM outbox
+        WHERE id IN ({marcadores})
+        ORDER BY id
+        """,
+        tuple(sorted(pendentes))
+    )
+    eventos = [_evento_publicado(row, shard) for row in cursor.fetchall()]
+    restantes = dict(pendentes)
+    for e in eventos:
+        del restantes[e["id"]]
+    abandonados = [id_ for id_, visto in restantes.items() if encerradas(visto)]
+    for id_ in abandonados:
+        del restantes[id_]
+    if abandonados:
+        logger.info("Outbox: ids %s sem transação aberta, descartados", abandonados)
+        _incr("abandonados", len(abandonados))
+    return eventos, restantes
+
+
+def publicar_lote(conn, consumidor, sink, shard=0, limite=None, settle_seconds=None):
+    # Publica os próximos eventos do consumidor e avança o cursor dele. O lock
+    # na linha do cursor deixa um relay por vez por consumidor; se o commit do
+    # cursor falhar depois da publicação, o lote é entregue de novo.
+    limite = limite or OUTBOX_BATCH_SIZE
+    settle_seconds = OUTBOX_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "INSERT IGNORE INTO outbox_cursores (consumidor, ultimo_id, atualizado_em) VALUES (%s, 0, NOW())",
+            (consumidor,)
+        )
+        cursor.execute(
+            "SELECT ultimo_id, pendentes, NOW(6) AS agora FROM outbox_cursores WHERE consumidor = %s FOR UPDATE",
+            (consumidor,)
+        )
+        row = cursor.fetchone()
+        ultimo_id, agora = row["ultimo_id"], row["agora"]
+        anteriores = _ler_pendentes(row["pendentes"])
+
+        atrasados, pendentes = [], dict(anteriores)
+        if anteriores:
+            atrasados, pendentes = _conferir_pendentes(cursor, anteriores, shard)
+
+        cursor.execute(
+            """
+            SELECT id, evento, email_origin, email_destination, valor, dados, create_time,
+                   create_time < NOW(6) - INTERVAL %s SECOND AS assentado
+            FROM outbox
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (settle_seconds, ultimo_id, limite)
+        )
+        eventos = []
+        esperado = ultimo_id + 1
+        for row in cursor.fetchall():
+            # Id fora de sequência pode ser de transação ainda aberta
+            if row["id"] != esperado:
+                if not row["assentado"]:
+                    break
+                pendentes.update((id_, agora) for id_ in range(esperado, row["id"]))
+            eventos.append(_evento_publicado(row, shard))
+            esperado = row["id"] + 1
+
+        if atrasados or eventos:
+            sink.publicar(atrasados + eventos)
+        if eventos or pendentes != anteriores:
+            cursor.execute(
+                "UPDATE outbox_cursores SET ultimo_id = %s, pendentes = %s, atualizado_em = NOW() "
+                "WHERE consumidor = %s",
+                (eventos[-1]["id"] if eventos else ultimo_id, _gravar_pendentes(pendentes), consumidor)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    publicados = len(atrasados) + len(eventos)
+    if publicados:
+        _incr("publicados", publicados)
+        _incr("atrasados", len(atrasados))
+        _incr("lotes")
+    return publicados
+
+
+def purgar_publicados(conn, retencao=None):
+    # Apaga eventos já entregues a todos os consumidores e mais antigos que a
+    # retenção; um id pendente em algum cursor segura a purga abaixo dele
+    retencao = OUTBOX_RETENTION_SECONDS if retencao is None else retencao
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT ultimo_id, pendentes FROM outbox_cursores")
+        limite = None
+        for row in cursor.fetchall():
+            pendentes = _ler_pendentes(row["pendentes"])
+            entregue = min([row["ultimo_id"], *(id_ - 1 for id_ in pendentes)])
+            limite = entregue if limite is None else min(limite, entregue)
+
+        cursor.execute(
+            "DELETE FROM outbox WHERE id <= %s AND create_time < NOW(6) - INTERVAL %s SECOND",
+            (limite or 0, retencao)
+        )
+        conn.commit()
+        _incr("purgados", cursor.rowcount)
+        return cursor.rowcount
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class Relay:
+
+    def __init__(
+        self,
+        consumidores,
+        conectar=None,
+        intervalo=OUTBOX_RELAY_INTERVAL,
+        batch_size=None,
+        intervalo_purga=OUTBOX_PURGE_INTERVAL
+    ):
+        self.consumidores = consumidores
+        # Sem `conectar`, lê o outbox de todos os shards de DB_SHARD_HOSTS
+        self._conectores = [(0, conectar)] if conectar else [
+            (shard, functools.partial(get_connection, shard=shard)) for shard in range(sharding.total())
+        ]
+        self.intervalo = intervalo
+        self.batch_size = batch_size or OUTBOX_BATCH_SIZE
+        self.intervalo_purga = intervalo_purga
+        self._proxima_purga = time.monotonic() + intervalo_purga
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="javer_outbox", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            self.executar()
+            if self.intervalo_purga > 0 and time.monotonic() >= self._proxima_purga:
+                self.purgar()
+                self._proxima_purga = time.monotonic() + self.intervalo_purga
+
+    def executar(self):
+        # Drena cada consumidor; um consumidor com falha não atrasa os outros
+        publicados = 0
+        for shard, conectar in self._conectores:
+            for nome, sink in self.consumidores.items():
+                conn = None
+                try:
+                    conn = conectar()
+                    conn.autocommit = False
+                    while True:
+                        qtd = publicar_lote(conn, nome, sink, shard, self.batch_size)
+                        publicados += qtd
+                        if qtd < self.batch_size or self._parar.is_set():
+                            break
+                except Exception as e:
+                    _incr("falhas")
+                    logger.warning("Relay do outbox falhou para %s (shard %s): %s", nome, shard, e)
+                finally:
+                    if conn is not None:
+                        conn.close()
+        return publicados
+
+    def purgar(self):
+        purgados = 0
+        for shard, conectar in self._conectores:
+            conn = None
+            try:
+                conn = conectar()
+                conn.autocommit = False
+                purgados += purgar_publicados(conn)
+            except Exception as e:
+                _incr("falhas")
+                logger.warning("Purga do outbox falhou (shard %s): %s", shard, e)
+            finally:
+                if conn is not None:
+                    conn.close()
+        return purgados
+
+    def fechar(self, timeout=10):
+        # Uma última passada: publica o que já foi confirmado
+        self._parar.set()
+        self._thread.join(timeout)
+        self._parar.clear()
+        self.executar()
+
+
+_lock = threading.Lock()
+_relay = None
+
+
+def iniciar_relay():
+    global _relay
+    if not OUTBOX_ENABLED or OUTBOX_RELAY_INTERVAL <= 0:
+        return None
+    consumidores = consumidores_configurados()
+    if not consumidores:
+        return None
+    with _lock:
+        if _relay is None:
+            _relay = Relay(consumidores)
+    return _relay
+
+
+def parar_relay():
+    global _relay
+    with _lock:
+        anterior, _relay = _relay, None
+    if anterior is not None:
+        anterior.fechar()
+
+
+def outbox_stats():
+    with _stats_lock:
+        return {
+            **_stats,
+            "habilitado": OUTBOX_ENABLED,
+            "consumidores": [] if _relay is None else sorted(_relay.consumidores),
+            "relay_ativo": _relay is not None,
+        }
+
+
+if __name__ == "__main__":
+    from api.connection import _connect
+
+    conn = _connect()
+    try:
+        for nome, sink in consumidores_configurados().items():
+            total = 0
+            while True:
+                qtd = publicar_lote(conn, nome, sink)
+                total += qtd
+                if qtd < OUTBOX_BATCH_SIZE:
+                    break
+            print(f"Outbox: {total} eventos publicados para {nome}")
+        print(f"Outbox: {purgar_publicados(conn)} eventos purgados")
+    except Exception as e:
+        print(f"Erro no outbox: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,303 @@
+import threading
+import time
+from mysql.connector.errors import PoolError
+from api import prepared
+
+# Limites (em segundos) do histograma de espera por conexão.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PoolTimeoutError(PoolError):
+    pass
+
+
+class PoolQueueFullError(PoolError):
+    pass
+
+
+class PooledConnection:
+    # Proxy devolvido pelo pool: close() devolve a conexão em vez de fechá-la.
+
+    def __init__(self, pool, cnx):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_cnx", cnx)
+
+    def __getattr__(self, name):
+        cnx = object.__getattribute__(self, "_cnx")
+        if cnx is None:
+            raise PoolError("Conexão já devolvida ao pool")
+        return getattr(cnx, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cnx, name, value)
+
+    def preparar(self, sql, dictionary=False):
+        return prepared.preparar(self._cnx, sql, dictionary)
+
+    def close(self):
+        if self._cnx is None:
+            return
+        cnx, self._cnx = self._cnx, None
+        self._pool._release(cnx)
+
+    def descartar(self):
+        # Fecha a conexão física em vez de devolvê-la (estado de sessão incerto)
+        if self._cnx is None:
+            return
+        cnx, self._cnx = self._cnx, None
+        self._pool._discard(cnx)
+
+
+class ConnectionPool:
+
+    def __init__(
+        self,
+        factory,
+        min_size=1,
+        max_size=10,
+        acquire_timeout=5.0,
+        max_waiters=100,
+        max_idle=300.0,
+        ping_after=30.0,
+        name="javer_pool"
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Configuração de pool inválida")
+
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_waiters = max_waiters
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+
+        self._factory = factory
+        self._cond = threading.Condition()
+        self._idle = []  # (conexão, último uso); o fim da lista é a mais recente
+        self._total = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._counters = {
+            "acquired": 0,
+            "acquire_failures": 0,
+            "timeouts": 0,
+            "queue_full": 0,
+            "created": 0,
+            "closed": 0,
+            "reaped": 0,
+            "health_check_failures": 0,
+        }
+        self._wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self._wait_sum = 0.0
+        self._wait_count = 0
+
+    # ----------------------------
+    # Ciclo de vida
+    # ----------------------------
+
+    def open(self):
+        for _ in range(self.min_size - self._total):
+            cnx = self._factory()
+            with self._cond:
+                self._total += 1
+                self._counters["created"] += 1
+                self._idle.append((cnx, time.monotonic()))
+
+    def close(self, timeout=0):
+        # Recusa novos checkouts e aguarda até `timeout` pelas conexões em uso.
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            while self._in_use:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for cnx, _ in idle:
+            self._close_raw(cnx)
+        return self._in_use == 0
+
+    # ----------------------------
+    # Checkout / devolução
+    # ----------------------------
+
+    def get_connection(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        deadline = inicio + timeout
+
+        while True:
+            cnx, idle_since = self._checkout(deadline)
+
+            if cnx is None:
+                try:
+                    cnx = self._factory()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._in_use -= 1
+                        self._counters["acquire_failures"] += 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._counters["created"] += 1
+
+            elif time.monotonic() - idle_since >= self.ping_after and not self._healthy(cnx):
+                self._discard(cnx, counter="health_check_failures")
+                continue
+
+            self._observe_wait(time.monotonic() - inicio)
+            return PooledConnection(self, cnx)
+
+    def _checkout(self, deadline):
+        # Retorna (conexão ociosa, desde) ou (None, None) com uma vaga reservada.
+        with self._cond:
+            if self._closed:
+                raise PoolError(f"Pool {self.name} encerrado")
+
+            if not self._idle and self._total >= self.max_size and self._waiting >= self.max_waiters:
+                self._counters["acquire_failures"] += 1
+                self._counters["queue_full"] += 1
+                raise PoolQueueFullError(f"Fila do pool {self.name} cheia")
+
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        cnx, idle_since = self._idle.pop()
+                        self._in_use += 1
+                        return cnx, idle_since
+
+                    if self._total < self.max_size:
+                        self._total += 1
+                        self._in_use += 1
+                        return None, None
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        self._counters["acquire_failures"] += 1
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Tempo esgotado aguardando conexão do pool {self.name}"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+    def _release(self, cnx):
+        try:
+            if cnx.in_transaction:
+                cnx.rollback()
+        except Exception:
+            self._discard(cnx)
+            return
+
+        with self._cond:
+            self._in_use -= 1
+            if self._closed:
+                self._total -= 1
+                descartar = True
+            else:
+                self._idle.append((cnx, time.monotonic()))
+                descartar = False
+            self._cond.notify_all() if self._closed else self._cond.notify()
+
+        if descartar:
+            self._close_raw(cnx)
+        else:
+            self.reap_idle()
+
+    def _discard(self, cnx, counter=None):
+        with self._cond:
+            self._total -= 1
+            self._in_use -= 1
+            if counter:
+                self._counters[counter] += 1
+            self._cond.notify()
+        self._close_raw(cnx)
+
+    # ----------------------------
+    # Manutenção
+    # ----------------------------
+
+    def reap_idle(self):
+        # Fecha conexões ociosas há mais de max_idle, preservando min_size.
+        limite = time.monotonic() - self.max_idle
+        reaped = []
+        with self._cond:
+            while (
+                self._idle
+                and self._idle[0][1] < limite
+                and self._total > self.min_size
+            ):
+                cnx, _ = self._idle.pop(0)
+                self._total -= 1
+                self._counters["reaped"] += 1
+                reaped.append(cnx)
+        for cnx in reaped:
+            self._close_raw(cnx)
+        return len(reaped)
+
+    def _healthy(self, cnx):
+        try:
+            cnx.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _close_raw(self, cnx):
+        try:
+            cnx.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._counters["closed"] += 1
+
+    # ----------------------------
+    # Métricas
+    # ----------------------------
+
+    def _observe_wait(self, segundos):
+        with self._cond:
+            self._counters["acquired"] += 1
+            self._wait_sum += segundos
+            self._wait_count += 1
+            for i, limite in enumerate(WAIT_BUCKETS):
+                if segundos <= limite:
+                    self._wait_buckets[i] += 1
+                    break
+            else:
+                self._wait_buckets[-1] += 1
+
+    def stats(self):
+        with self._cond:
+            acumulado = 0
+            buckets = {}
+            for limite, qtd in zip(WAIT_BUCKETS + ("+Inf",), self._wait_buckets):
+                acumulado += qtd
+                buckets[str(limite)] = acumulado
+
+            return {
+                "name": self.name,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._total,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                **self._counters,
+                "wait_seconds": {
+                    "buckets": buckets,
+                    "sum": self._wait_sum,
+                    "count": self._wait_count,
+                },
+            }
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from mysql.connector.abstracts import MySQLConnectionAbstract
+import os
+import threading
+import weakref
+
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") == "1"
+# Handles por conexão; o servidor limita o total em max_prepared_stmt_count
+DB_PREPARED_MAX_PER_CONN = int(os.getenv("DB_PREPARED_MAX_PER_CONN", "32"))
+
+# Conexão física -> {(sql, dictionary): CursorPreparado}. As conexões do pool
+# vivem por muito tempo, então cada statement é preparado uma vez por conexão.
+_por_conexao = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+_stats = {"preparados": 0, "reutilizados": 0, "descartados": 0}
+
+
+def _incr(campo):
+    with _lock:
+        _stats[campo] += 1
+
+
+class CursorPreparado:
+    # Cursor de statement preparado no servidor, reaproveitado entre requisições.
+    # O driver só reprepara quando recebe outro objeto de SQL, por isso execute()
+    # repassa sempre o mesmo texto guardado aqui. Resultados são lidos na hora
+    # (o cursor preparado não é bufferizado) para a conexão ficar livre.
+
+    def __init__(self, cursor, sql):
+        self._cursor = cursor
+        self.sql = sql
+        self._linhas = []
+        self._pos = 0
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, sql=None, params=()):
+        self._cursor.execute(self.sql, tuple(params or ()))
+        self._linhas = self._cursor.fetchall() if self._cursor.with_rows else []
+        self._pos = 0
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+
+    def fetchone(self):
+        if self._pos >= len(self._linhas):
+            return None
+        linha = self._linhas[self._pos]
+        self._pos += 1
+        return linha
+
+    def fetchall(self):
+        linhas = self._linhas[self._pos:]
+        self._pos = len(self._linhas)
+        return linhas
+
+    def close(self):
+        # O handle continua na conexão; só os resultados são descartados.
+        self._linhas = []
+        self._pos = 0
+
+    def desalocar(self):
+        try:
+            self._cursor.close()
+        except Exception:
+            pass
+
+
+def _cache_da_conexao(conn):
+    with _lock:
+        cache = _por_conexao.get(conn)
+        if cache is None:
+            cache = _por_conexao[conn] = OrderedDict()
+        return cache
+
+
+def preparar(conn, sql, dictionary=False):
+    # Cursor preparado para `sql` na conexão física, ou None quando a conexão
+    # não suporta (desligado, ou conexões falsas dos testes).
+    if not DB_PREPARED_STATEMENTS:
+        return None
+
+    # Proxies (pool, métricas) sabem chegar à conexão física
+    metodo = getattr(type(conn), "preparar", None)
+    if metodo is not None:
+        return metodo(conn, sql, dictionary)
+    if not isinstance(conn, MySQLConnectionAbstract):
+        return None
+
+    cache = _cache_da_conexao(conn)
+    chave = (sql, dictionary)
+    cursor = cache.get(chave)
+    if cursor is not None:
+        cache.move_to_end(chave)
+        _incr("reutilizados")
+        return cursor
+
+    cursor = cache[chave] = CursorPreparado(conn.cursor(prepared=True, dictionary=dictionary), sql)
+    _incr("preparados")
+    while len(cache) > DB_PREPARED_MAX_PER_CONN:
+        _, antigo = cache.popitem(last=False)
+        antigo.desalocar()
+        _incr("descartados")
+    return cursor
+
+
+def executar(conn, cursor, sql, params, dictionary=False):
+    # Executa pelo statement preparado da conexão quando disponível; senão,
+    # pelo cursor de texto da própria rotina. Retorna o cursor usado.
+    preparado = preparar(conn, sql, dictionary)
+    if preparado is None:
+        cursor.execute(sql, params)
+        return cursor
+    preparado.execute(sql, params)
+    return preparado
+
+
+def prepared_stats():
+    with _lock:
+        return {
+            "habilitado": DB_PREPARED_STATEMENTS,
+            "conexoes": len(_por_conexao),
+            **_stats
+        }
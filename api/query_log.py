@@ -0,0 +1,179 @@
+from collections import deque
+import logging
+import os
+import re
+import threading
+import time
+
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+QUERY_LOG_SAMPLES = int(os.getenv("QUERY_LOG_SAMPLES", "512"))
+QUERY_LOG_MAX_FINGERPRINTS = int(os.getenv("QUERY_LOG_MAX_FINGERPRINTS", "1000"))
+# Um EXPLAIN por fingerprint a cada intervalo, para não dobrar a carga
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+
+logger = logging.getLogger("api.slow_query")
+
+OUTROS = "<outros>"
+_EXPLICAVEIS = ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+
+# ----------------------------
+# Fingerprint
+# ----------------------------
+
+_COMENTARIOS = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.S)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMEROS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.I)
+_PARAMETROS = re.compile(r"%\([^)]+\)s|%s|\?")
+_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES = re.compile(r"(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+", re.I)
+_ESPACOS = re.compile(r"\s+")
+
+_cache_fp = {}
+_cache_fp_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    # Mesma forma de consulta -> mesmo texto: literais e parâmetros viram "?",
+    # listas IN (...) e VALUES (...), (...) colapsam.
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode(errors="replace")
+    fp = _cache_fp.get(sql)
+    if fp is not None:
+        return fp
+
+    fp = _STRINGS.sub("?", sql)
+    fp = _COMENTARIOS.sub(" ", fp)
+    fp = _NUMEROS.sub("?", fp)
+    fp = _PARAMETROS.sub("?", fp)
+    fp = _LISTAS.sub("(...)", fp)
+    fp = _VALUES.sub(r"\1", fp)
+    fp = _ESPACOS.sub(" ", fp).strip().rstrip(";").strip()
+
+    with _cache_fp_lock:
+        if len(_cache_fp) >= QUERY_LOG_MAX_FINGERPRINTS * 4:
+            _cache_fp.clear()
+        _cache_fp[sql] = fp
+    return fp
+
+
+# ----------------------------
+# Agregação
+# ----------------------------
+
+class _Agregado:
+    __slots__ = ("count", "total", "max", "linhas", "lentas", "amostras", "plano", "explicado_em")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.linhas = 0
+        self.lentas = 0
+        self.amostras = deque(maxlen=QUERY_LOG_SAMPLES)
+        self.plano = None
+        self.explicado_em = None
+
+    def p95(self):
+        if not self.amostras:
+            return 0.0
+        ordenadas = sorted(self.amostras)
+        return ordenadas[min(len(ordenadas) - 1, int(0.95 * len(ordenadas)))]
+
+
+_lock = threading.Lock()
+_agregados = {}
+
+
+def registrar(sql, segundos, linhas=0):
+    # Retorna o fingerprint quando a query passou do limite e merece EXPLAIN.
+    if not QUERY_LOG_ENABLED:
+        return None
+
+    fp = fingerprint(sql)
+    lenta = segundos * 1000 >= SLOW_QUERY_MS
+    with _lock:
+        agregado = _agregados.get(fp)
+        if agregado is None:
+            if len(_agregados) >= QUERY_LOG_MAX_FINGERPRINTS:
+                fp = OUTROS
+                agregado = _agregados.get(OUTROS)
+            if agregado is None:
+                agregado = _agregados[fp] = _Agregado()
+
+        agregado.count += 1
+        agregado.total += segundos
+        agregado.max = max(agregado.max, segundos)
+        agregado.linhas += max(linhas or 0, 0)
+        agregado.amostras.append(segundos)
+        if not lenta:
+            return None
+        agregado.lentas += 1
+
+        agora = time.monotonic()
+        explicar = (
+            fp != OUTROS
+            and fp.split(" ", 1)[0].upper() in _EXPLICAVEIS
+            and (agregado.explicado_em is None or agora - agregado.explicado_em >= SLOW_QUERY_EXPLAIN_INTERVAL)
+        )
+        if explicar:
+            agregado.explicado_em = agora
+
+    logger.warning("Query lenta (%.1f ms, %s linhas): %s", segundos * 1000, linhas, fp)
+    return fp if explicar else None
+
+
+def explicar(conn, fp, sql, params):
+    # Roda na devolução da conexão: sem resultados pendentes nem transação aberta.
+    cursor = None
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        cursor.execute("EXPLAIN " + sql, params)
+        plano = cursor.fetchall()
+    except Exception as e:
+        logger.warning("EXPLAIN indisponível para %s: %s", fp, e)
+        return None
+    finally:
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+    with _lock:
+        agregado = _agregados.get(fp)
+        if agregado is not None:
+            agregado.plano = plano
+    logger.warning("Plano de %s: %s", fp, plano)
+    return plano
+
+
+def top(n=20, ordem="total"):
+    chaves = {
+        "total": lambda item: item[1].total,
+        "p95": lambda item: item[1].p95(),
+        "count": lambda item: item[1].count,
+        "max": lambda item: item[1].max,
+    }
+    with _lock:
+        itens = sorted(_agregados.items(), key=chaves[ordem], reverse=True)[:n]
+        return [
+            {
+                "fingerprint": fp,
+                "count": a.count,
+                "total_ms": round(a.total * 1000, 3),
+                "media_ms": round(a.total / a.count * 1000, 3),
+                "p95_ms": round(a.p95() * 1000, 3),
+                "max_ms": round(a.max * 1000, 3),
+                "linhas": a.linhas,
+                "lentas": a.lentas,
+                "plano": a.plano,
+            }
+            for fp, a in itens
+        ]
+
+
+def limpar():
+    with _lock:
+        _agregados.clear()
@@ -0,0 +1,290 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from decimal import Decimal
+import os
+import threading
+import time
+
+QUOTES_PROVIDER = os.getenv("QUOTES_PROVIDER", "yfinance")
+QUOTES_TTL = float(os.getenv("QUOTES_TTL", "60"))
+# Depois do TTL a cotação ainda é servida por este tempo enquanto é renovada
+QUOTES_STALE_TTL = float(os.getenv("QUOTES_STALE_TTL", "600"))
+QUOTES_WORKERS = int(os.getenv("QUOTES_WORKERS", "2"))
+QUOTES_FETCH_TIMEOUT = float(os.getenv("QUOTES_FETCH_TIMEOUT", "5"))
+QUOTES_YF_SUFFIX = os.getenv("QUOTES_YF_SUFFIX", "")
+
+FRESCA = "fresca"
+VENCIDA = "vencida"
+
+
+# ----------------------------
+# Provedores
+# ----------------------------
+
+class QuoteProvider:
+    # Recebe um lote de tickers e devolve {ticker: preço}; tickers sem
+    # cotação simplesmente ficam de fora.
+    nome = "base"
+
+    def buscar(self, tickers):
+        raise NotImplementedError
+
+
+class YFinanceProvider(QuoteProvider):
+    nome = "yfinance"
+
+    def __init__(self, sufixo=QUOTES_YF_SUFFIX):
+        # Ativos da B3 no Yahoo levam ".SA" (PETR4 -> PETR4.SA)
+        self.sufixo = sufixo
+
+    def _simbolo(self, ticker):
+        return ticker if not self.sufixo or "." in ticker else ticker + self.sufixo
+
+    def buscar(self, tickers):
+        # Import tardio: o yfinance arrasta o pandas e só é preciso aqui
+        import yfinance as yf
+
+        simbolos = {self._simbolo(t): t for t in tickers}
+        dados = yf.download(
+            list(simbolos),
+            period="5d",
+            interval="1d",
+            group_by="column",
+            auto_adjust=False,
+            progress=False,
+            threads=False
+        )
+        if dados is None or dados.empty:
+            return {}
+
+        fechamento = dados["Close"]
+        precos = {}
+        for simbolo, ticker in simbolos.items():
+            serie = fechamento[simbolo] if simbolo in getattr(fechamento, "columns", ()) else fechamento
+            serie = serie.dropna()
+            if len(serie):
+                precos[ticker] = Decimal(str(float(serie.iloc[-1])))
+        return precos
+
+
+class FakeProvider(QuoteProvider):
+    # Feed offline para testes e ambientes sem rede.
+    nome = "fake"
+
+    def __init__(self, precos=None, atraso=0.0, erro=None):
+        self.precos = {t: Decimal(str(p)) for t, p in (precos or {}).items()}
+        self.atraso = atraso
+        self.erro = erro
+        self.chamadas = []
+
+    def buscar(self, tickers):
+        self.chamadas.append(sorted(tickers))
+        if self.atraso:
+            time.sleep(self.atraso)
+        if self.erro:
+            raise self.erro
+        return {t: self.precos[t] for t in tickers if t in self.precos}
+
+
+class NullProvider(QuoteProvider):
+    nome = "off"
+
+    def buscar(self, tickers):
+        return {}
+
+
+def _criar_provider(nome):
+    if nome == "yfinance":
+        return YFinanceProvider()
+    if nome == "off":
+        return NullProvider()
+    raise ValueError(f"QUOTES_PROVIDER desconhecido: {nome}")
+
+
+# ----------------------------
+# Serviço com cache
+# ----------------------------
+
+def normalizar(ticker):
+    return ticker.strip().upper()
+
+
+class QuoteService:
+
+    def __init__(self, provider, ttl=QUOTES_TTL, stale_ttl=QUOTES_STALE_TTL,
+                 workers=QUOTES_WORKERS, clock=time.monotonic):
+        self.provider = provider
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._precos = {}
+        self._em_voo = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quotes")
+        self._stats = {
+            "hits": 0, "vencidas": 0, "misses": 0, "buscas": 0,
+            "tickers_buscados": 0, "falhas": 0, "coalescidas": 0
+        }
+
+    def _estado(self, ticker, agora):
+        item = self._precos.get(ticker)
+        if item is None:
+            return None, None
+        preco, obtido_em = item
+        idade = agora - obtido_em
+        if idade < self.ttl:
+            return preco, FRESCA
+        if idade < self.ttl + self.stale_ttl:
+            return preco, VENCIDA
+        return None, None
+
+    def _buscar_lote(self, tickers):
+        try:
+            precos = self.provider.buscar(tickers)
+        except Exception:
+            with self._lock:
+                self._stats["falhas"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats["buscas"] += 1
+                self._stats["tickers_buscados"] += len(tickers)
+
+        agora = self._clock()
+        with self._lock:
+            for ticker, preco in precos.items():
+                preco = Decimal(str(preco))
+                if preco.is_finite() and preco > 0:
+                    self._precos[ticker] = (preco, agora)
+        return precos
+
+    def _agendar(self, tickers):
+        # Um único fetch em voo por ticker; pedidos concorrentes recebem o
+        # mesmo Future. Os faltantes vão juntos em uma chamada ao provedor.
+        futuros = {}
+        novos = []
+        with self._lock:
+            for ticker in tickers:
+                futuro = self._em_voo.get(ticker)
+                if futuro is not None:
+                    self._stats["coalescidas"] += 1
+                    futuros[ticker] = futuro
+                else:
+                    novos.append(ticker)
+
+            if novos:
+                lote = Future()
+                for ticker in novos:
+                    self._em_voo[ticker] = lote
+                    futuros[ticker] = lote
+            else:
+                lote = None
+
+        if lote is not None:
+            self._executor.submit(self._executar_lote, lote, novos)
+        return futuros
+
+    def _executar_lote(self, lote, tickers):
+        try:
+            lote.set_result(self._buscar_lote(tickers))
+        except Exception as e:
+            lote.set_exception(e)
+        finally:
+            with self._lock:
+                for ticker in tickers:
+                    if self._em_voo.get(ticker) is lote:
+                        del self._em_voo[ticker]
+
+    def _consultar(self, tickers):
+        agora = self._clock()
+        resultado = {}
+        renovar = []
+        with self._lock:
+            for ticker in tickers:
+                preco, estado = self._estado(ticker, agora)
+                if estado == FRESCA:
+                    self._stats["hits"] += 1
+                elif estado == VENCIDA:
+                    self._stats["vencidas"] += 1
+                    renovar.append(ticker)
+                else:
+                    self._stats["misses"] += 1
+                    renovar.append(ticker)
+                if preco is not None:
+                    resultado[ticker] = (preco, estado)
+
+        futuros = self._agendar(renovar) if renovar else {}
+        return resultado, futuros
+
+    def cotacoes(self, tickers):
+        # Nunca espera rede: devolve o que há em cache e agenda a renovação
+        # do que está vencido ou ausente.
+        resultado, _ = self._consultar({normalizar(t) for t in tickers})
+        return resultado
+
+    def cotacao(self, ticker):
+        return self.cotacoes([ticker]).get(normalizar(ticker), (None, None))
+
+    def aguardar(self, tickers, timeout=QUOTES_FETCH_TIMEOUT):
+        # Para jobs e rotas de consulta: espera o lote (coalescido) até `timeout`.
+        tickers = {normalizar(t) for t in tickers}
+        resultado, futuros = self._consultar(tickers)
+        if not futuros:
+            return resultado
+
+        wait(set(futuros.values()), timeout=timeout)
+        agora = self._clock()
+        with self._lock:
+            for ticker in tickers:
+                preco, estado = self._estado(ticker, agora)
+                if preco is not None:
+                    resultado[ticker] = (preco, estado)
+        return resultado
+
+    def limpar(self):
+        with self._lock:
+            self._precos.clear()
+
+    def fechar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "provedor": self.provider.nome,
+                "tickers": len(self._precos),
+                "em_voo": len(self._em_voo)
+            }
+
+
+_lock = threading.Lock()
+_service = None
+
+
+def get_quote_service():
+    global _service
+    with _lock:
+        if _service is None:
+            _service = QuoteService(_criar_provider(QUOTES_PROVIDER))
+        return _service
+
+
+def configurar_provider(provider, **kwargs):
+    global _service
+    with _lock:
+        anterior, _service = _service, QuoteService(provider, **kwargs)
+    if anterior is not None:
+        anterior.fechar()
+    return _service
+
+
+def close_quote_service():
+    global _service
+    with _lock:
+        anterior, _service = _service, None
+    if anterior is not None:
+        anterior.fechar()
+
+
+def quote_stats():
+    return _service.stats() if _service is not None else {"provedor": QUOTES_PROVIDER, "tickers": 0}
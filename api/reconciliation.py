@@ -0,0 +1,266 @@
+from decimal import Decimal
+import os
+import sys
+import time
+
+RECON_BATCH_SIZE = int(os.getenv("RECON_BATCH_SIZE", "5000"))
+# Linhas mais novas que isso ainda podem ter vizinhas de id menor não
+# confirmadas: entram na comparação, mas o checkpoint não passa delas.
+RECON_SETTLE_SECONDS = int(os.getenv("RECON_SETTLE_SECONDS", "300"))
+RECON_WRITE_CHUNK = int(os.getenv("RECON_WRITE_CHUNK", "1000"))
+
+# Contrapartes fixas do ledger para depósito e saque: não são contas
+CONTRAPARTES = {"deposito", "saque"}
+
+LEDGER_SQL = """
+    SELECT id, email_origin, email_destination, valor, create_time
+    FROM transacoes
+    WHERE id > %s
+    ORDER BY id
+"""
+
+SNAPSHOT_UPSERT = """
+    INSERT INTO saldo_snapshots (email, saldo, ate_id)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE saldo = saldo + VALUES(saldo), ate_id = VALUES(ate_id)
+"""
+
+# Saldo da conta inclui os créditos de contas quentes ainda não consolidados
+SHARDS_SQL = "(SELECT COALESCE(SUM(saldo), 0) FROM saldo_shards WHERE saldo_shards.usuario_id = usuarios.id)"
+
+
+class ConciliacaoConcorrente(RuntimeError):
+    pass
+
+
+# ----------------------------
+# Fluxos do ledger
+# ----------------------------
+
+def acumular(linhas, limite):
+    # Soma o fluxo líquido por conta, em ordem de id. Até a primeira linha
+    # recente (create_time > limite) o fluxo é "liquidado" e entra no próximo
+    # snapshot; dali em diante fica em "recente" e só vale para esta comparação.
+    liquidado = {}
+    recente = {}
+    ate_id = None
+    total = 0
+    alvo = liquidado
+
+    for id_, origem, destino, valor, create_time in linhas:
+        total += 1
+        if alvo is liquidado and create_time > limite:
+            alvo = recente
+        if alvo is liquidado:
+            ate_id = id_
+
+        origem = origem.lower()
+        destino = destino.lower()
+        alvo[origem] = alvo.get(origem, Decimal(0)) - valor
+        alvo[destino] = alvo.get(destino, Decimal(0)) + valor
+
+    for fluxo in (liquidado, recente):
+        for conta in CONTRAPARTES:
+            fluxo.pop(conta, None)
+    return {"liquidado": liquidado, "recente": recente, "ate_id": ate_id, "linhas": total}
+
+
+def _ler_ledger(conn, desde_id, batch_size):
+    # Cursor não bufferizado + fetchmany: memória constante em qualquer volume
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(LEDGER_SQL, (desde_id,))
+        while True:
+            lote = cursor.fetchmany(batch_size)
+            if not lote:
+                break
+            yield from lote
+    finally:
+        cursor.close()
+
+
+def comparar(saldos, snapshots, fluxos):
+    # saldos: {email: saldo_cc + shards}; snapshots: {email: saldo até o checkpoint}
+    divergencias = []
+    for email, saldo_cc in saldos.items():
+        esperado = (
+            snapshots.get(email, Decimal(0))
+            + fluxos["liquidado"].get(email, Decimal(0))
+            + fluxos["recente"].get(email, Decimal(0))
+        )
+        if saldo_cc != esperado:
+            divergencias.append({
+                "email": email,
+                "saldo_cc": saldo_cc,
+                "esperado": esperado,
+                "diferenca": saldo_cc - esperado
+            })
+    divergencias.sort(key=lambda d: d["email"])
+    return divergencias
+
+
+# ----------------------------
+# Leitura das contas
+# ----------------------------
+
+def _em_chunks(valores, tamanho):
+    valores = sorted(valores)
+    for inicio in range(0, len(valores), tamanho):
+        yield valores[inicio:inicio + tamanho]
+
+
+def _carregar_contas(cursor, emails, chunk_size):
+    saldos, snapshots = {}, {}
+    for chunk in _em_chunks(emails, chunk_size):
+        marcadores = ", ".join(["%s"] * len(chunk))
+        cursor.execute(
+            f"SELECT email_normalizado, saldo_cc + {SHARDS_SQL} FROM usuarios WHERE email_normalizado IN ({marcadores})",
+            tuple(chunk)
+        )
+        saldos.update(cursor.fetchall())
+        cursor.execute(
+            f"SELECT email, saldo FROM saldo_snapshots WHERE email IN ({marcadores})",
+            tuple(chunk)
+        )
+        snapshots.update(cursor.fetchall())
+    return saldos, snapshots
+
+
+def _carregar_todas(cursor):
+    cursor.execute(
+        f"""
+        SELECT usuarios.email_normalizado, usuarios.saldo_cc + {SHARDS_SQL}, s.saldo
+        FROM usuarios
+        LEFT JOIN saldo_snapshots s ON s.email = usuarios.email_normalizado
+        """
+    )
+    saldos, snapshots = {}, {}
+    for email, saldo_cc, snapshot in cursor.fetchall():
+        saldos[email] = saldo_cc
+        if snapshot is not None:
+            snapshots[email] = snapshot
+    return saldos, snapshots
+
+
+# ----------------------------
+# Execução
+# ----------------------------
+
+def conciliar(conn, completa=False, batch_size=None, settle_seconds=None):
+    batch_size = batch_size or RECON_BATCH_SIZE
+    settle_seconds = RECON_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    inicio = time.perf_counter()
+
+    # Leitura num snapshot consistente: ledger e saldos no mesmo instante,
+    # então cada operação confirmada aparece nos dois ou em nenhum.
+    conn.start_transaction(consistent_snapshot=True, isolation_level="REPEATABLE READ")
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute("SELECT ultimo_id FROM conciliacao_checkpoint WHERE id = 1")
+        linha = cursor.fetchone()
+        desde_id = linha[0] if linha else 0
+        cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (settle_seconds,))
+        limite = cursor.fetchone()[0]
+
+        fluxos = acumular(_ler_ledger(conn, desde_id, batch_size), limite)
+        tocadas = set(fluxos["liquidado"]) | set(fluxos["recente"])
+
+        if completa:
+            saldos, snapshots = _carregar_todas(cursor)
+        else:
+            saldos, snapshots = _carregar_contas(cursor, tocadas, RECON_WRITE_CHUNK)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    divergencias = comparar(saldos, snapshots, fluxos)
+    ate_id = fluxos["ate_id"] or desde_id
+    resultado = {
+        "de_id": desde_id,
+        "ate_id": ate_id,
+        "linhas": fluxos["linhas"],
+        "contas": len(saldos),
+        "sem_conta": len(tocadas - set(saldos)),
+        "divergencias": divergencias,
+        "completa": completa,
+    }
+    resultado["segundos"] = round(time.perf_counter() - inicio, 3)
+    resultado["execucao_id"] = _gravar(conn, resultado, fluxos["liquidado"])
+    return resultado
+
+
+def _gravar(conn, resultado, liquidado):
+    # Snapshot, checkpoint e relatório na mesma transação. O checkpoint avança
+    # por compare-and-set: duas execuções simultâneas não somam o mesmo fluxo.
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            UPDATE conciliacao_checkpoint
+            SET ultimo_id = %s, atualizado_em = NOW()
+            WHERE id = 1 AND ultimo_id = %s
+            """,
+            (resultado["ate_id"], resultado["de_id"])
+        )
+        if cursor.rowcount == 0 and resultado["ate_id"] != resultado["de_id"]:
+            raise ConciliacaoConcorrente("Checkpoint alterado por outra conciliação")
+
+        linhas = [(email, delta, resultado["ate_id"]) for email, delta in sorted(liquidado.items())]
+        for inicio in range(0, len(linhas), RECON_WRITE_CHUNK):
+            cursor.executemany(SNAPSHOT_UPSERT, linhas[inicio:inicio + RECON_WRITE_CHUNK])
+
+        cursor.execute(
+            """
+            INSERT INTO conciliacao_execucoes
+                (de_id, ate_id, linhas, contas, divergencias, completa, segundos, executada_em)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+            """,
+            (
+                resultado["de_id"], resultado["ate_id"], resultado["linhas"], resultado["contas"],
+                len(resultado["divergencias"]), int(resultado["completa"]), resultado["segundos"]
+            )
+        )
+        execucao_id = cursor.lastrowid
+        if resultado["divergencias"]:
+            cursor.executemany(
+                """
+                INSERT INTO conciliacao_divergencias (execucao_id, email, saldo_cc, esperado)
+                VALUES (%s, %s, %s, %s)
+                """,
+                [(execucao_id, d["email"], d["saldo_cc"], d["esperado"]) for d in resultado["divergencias"]]
+            )
+        conn.commit()
+        return execucao_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    from api.connection import _connect
+
+    conn = _connect()
+    try:
+        resultado = conciliar(conn, completa="--completa" in sys.argv)
+        print(
+            f"Conciliação: ids {resultado['de_id']}..{resultado['ate_id']}, {resultado['linhas']} linhas, "
+            f"{resultado['contas']} contas, {len(resultado['divergencias'])} divergências "
+            f"em {resultado['segundos']}s"
+        )
+        for d in resultado["divergencias"]:
+            print(f"  {d['email']}: saldo_cc {d['saldo_cc']} ≠ ledger {d['esperado']}")
+        if resultado["divergencias"]:
+            sys.exit(2)
+    except ConciliacaoConcorrente as e:
+        print(f"Conciliação abortada: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Erro na conciliação: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,164 @@
+import itertools
+import logging
+import threading
+import time
+from mysql.connector import Error
+from mysql.connector.errors import PoolError
+
+logger = logging.getLogger("api.replicas")
+
+# Chaves de leitura-após-escrita guardadas antes de limpar as expiradas
+MAX_ESCRITAS_RECENTES = 100_000
+
+
+class Replica:
+    # Pool de uma réplica e o último atraso medido. O atraso é medido sob
+    # demanda, no máximo uma vez por `intervalo`, por quem for ler dela.
+
+    def __init__(self, nome, pool, intervalo=1.0):
+        self.nome = nome
+        self.pool = pool
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._lag = None
+        self._medido_em = None
+        self._erro = None
+
+    def lag(self):
+        # Segundos de atraso; None = indisponível (erro ou replicação parada)
+        agora = time.monotonic()
+        if self._medido_em is not None and agora - self._medido_em < self.intervalo:
+            return self._lag
+        # Um thread mede; os demais seguem com o valor anterior
+        if not self._lock.acquire(blocking=False):
+            return self._lag
+        try:
+            self._lag = self._medir()
+            self._erro = None
+        except PoolError:
+            # Pool da réplica ocupado: mantém a última medição
+            pass
+        except Exception as e:
+            self._lag = None
+            self._erro = str(e)
+            logger.warning("Réplica %s indisponível: %s", self.nome, e)
+        finally:
+            self._medido_em = time.monotonic()
+            self._lock.release()
+        return self._lag
+
+    def _medir(self):
+        conn = self.pool.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except Error:
+                # MySQL anterior à 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+            linhas = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        # Sem status de replicação: servidor apontado como réplica de propósito
+        if not linhas:
+            return 0.0
+        linha = linhas[0]
+        atraso = linha.get("Seconds_Behind_Source", linha.get("Seconds_Behind_Master"))
+        return None if atraso is None else float(atraso)
+
+    def marcar_falha(self, erro):
+        self._lag = None
+        self._erro = str(erro)
+        self._medido_em = time.monotonic()
+
+    def stats(self):
+        return {
+            "nome": self.nome,
+            "lag": self._lag,
+            "erro": self._erro,
+            "pool": self.pool.stats(),
+        }
+
+
+class Roteador:
+    # Escolhe a réplica de uma leitura: em rodízio entre as que estão dentro
+    # de `max_lag`, e nunca para um usuário que escreveu há menos de `janela`
+    # segundos (leitura após escrita). Sem réplica elegível, devolve None e a
+    # leitura vai para o primário.
+
+    def __init__(self, replicas, max_lag=2.0, janela=5.0):
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.janela = janela
+        self._rodizio = itertools.count()
+        self._lock = threading.Lock()
+        self._escritas = {}
+        self._stats = {
+            "leituras_replica": 0,
+            "leituras_primario": 0,
+            "fallback_escrita": 0,
+            "fallback_lag": 0,
+            "fallback_erro": 0,
+        }
+
+    def _incr(self, campo):
+        with self._lock:
+            self._stats[campo] += 1
+
+    def marcar_escrita(self, chaves):
+        expira = time.monotonic() + self.janela
+        with self._lock:
+            for chave in chaves:
+                self._escritas[chave] = expira
+            if len(self._escritas) > MAX_ESCRITAS_RECENTES:
+                agora = time.monotonic()
+                self._escritas = {c: e for c, e in self._escritas.items() if e > agora}
+
+    def escreveu_recentemente(self, chaves):
+        agora = time.monotonic()
+        with self._lock:
+            return any(self._escritas.get(chave, 0) > agora for chave in chaves)
+
+    def conectar(self, chaves=()):
+        if chaves and self.escreveu_recentemente(chaves):
+            self._incr("fallback_escrita")
+            self._incr("leituras_primario")
+            return None
+
+        inicio = next(self._rodizio)
+        houve_erro = False
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(inicio + i) % len(self.replicas)]
+            lag = replica.lag()
+            if lag is None or lag > self.max_lag:
+                continue
+            try:
+                conn = replica.pool.get_connection()
+            except PoolError:
+                # Pool da réplica ocupado: tenta a próxima, sem marcá-la como falha
+                houve_erro = True
+                continue
+            except Error as e:
+                replica.marcar_falha(e)
+                houve_erro = True
+                continue
+            self._incr("leituras_replica")
+            return conn
+
+        self._incr("fallback_erro" if houve_erro else "fallback_lag")
+        self._incr("leituras_primario")
+        return None
+
+    def fechar(self, timeout=0):
+        for replica in self.replicas:
+            replica.pool.close(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["escritas_recentes"] = len(self._escritas)
+        stats["max_lag"] = self.max_lag
+        stats["replicas"] = [replica.stats() for replica in self.replicas]
+        return stats
@@ -0,0 +1,175 @@
+from api import account_cache
+from api import hot_accounts
+from api import sharding
+from api import xa
+from api.connection import localizar_shard, no_diretorio
+import sys
+
+# Resharding online: move uma conta por vez para outro shard numa transação
+# XA. Durante a cópia a linha da conta fica bloqueada no shard de origem;
+# depois do commit ela some de lá, e as rotas que ainda a procuravam no shard
+# antigo refazem a busca pelo diretório (sharding.reroteia).
+
+
+def _marcar(cursor, user_id):
+    cursor.execute(
+        "UPDATE mapa_shards SET movendo = 1 WHERE usuario_id = %s AND movendo = 0",
+        (user_id,)
+    )
+    return cursor.rowcount == 1
+
+
+def _liberar(cursor, user_id):
+    cursor.execute("UPDATE mapa_shards SET movendo = 0 WHERE usuario_id = %s", (user_id,))
+
+
+def _contraparte(linha, email):
+    if linha["email_origin"].lower() == email:
+        return linha["email_destination"].lower()
+    return linha["email_origin"].lower()
+
+
+def mover_conta(user_id, destino):
+    if not 0 <= destino < sharding.total():
+        raise ValueError(f"Shard inexistente: {destino}")
+    origem = localizar_shard(user_id=user_id, fresco=True)
+    if origem == destino:
+        return {"usuario_id": user_id, "de": origem, "para": destino, "movida": False}
+    if not no_diretorio(_marcar, user_id):
+        raise ValueError(f"Conta {user_id} fora do diretório ou já em movimento")
+
+    try:
+        with xa.Transacao("mover", {"usuario_id": user_id, "de": origem, "para": destino}) as tx:
+            fonte = tx.ramo(origem)
+            fonte.execute(
+                """
+                SELECT id, nome, email, telefone, senha, correntista, saldo_cc
+                FROM usuarios WHERE id = %s FOR UPDATE
+                """,
+                (user_id,)
+            )
+            conta = fonte.fetchone()
+            if not conta:
+                raise ValueError(f"Conta {user_id} não encontrada no shard {origem}")
+            # Créditos de conta quente ainda nos shards de saldo vão junto
+            conta["saldo_cc"] += hot_accounts.consolidar(fonte, user_id)
+            email = conta["email"].lower()
+
+            fonte.execute(
+                """
+                SELECT id, email_origin, email_destination, valor, mensagem, create_time
+                FROM transacoes
+                WHERE email_origin = %s OR email_destination = %s
+                ORDER BY id
+                FOR UPDATE
+                """,
+                (conta["email"], conta["email"])
+            )
+            linhas = fonte.fetchall()
+            # Pela conexão do log: nenhuma outra do shard 0 com os ramos abertos
+            shards = tx.no_coordenador(sharding.localizar_varios, [_contraparte(l, email) for l in linhas])
+
+            # A linha do ledger fica em todo shard que tem uma das duas contas
+            copiar = [l for l in linhas if shards.get(_contraparte(l, email)) != destino]
+            apagar = [l["id"] for l in linhas if shards.get(_contraparte(l, email)) != origem]
+
+            alvo = tx.ramo(destino)
+            alvo.execute(
+                """
+                INSERT INTO usuarios (id, nome, email, telefone, senha, correntista, saldo_cc)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    conta["id"], conta["nome"], conta["email"], conta["telefone"],
+                    conta["senha"], conta["correntista"], conta["saldo_cc"]
+                )
+            )
+            if copiar:
+                alvo.executemany(
+                    """
+                    INSERT INTO transacoes (email_origin, email_destination, valor, mensagem, create_time)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    [
+                        (l["email_origin"], l["email_destination"], l["valor"], l["mensagem"], l["create_time"])
+                        for l in copiar
+                    ]
+                )
+
+            fonte.execute("DELETE FROM usuarios WHERE id = %s", (user_id,))
+            if apagar:
+                marcadores = ", ".join(["%s"] * len(apagar))
+                fonte.execute(f"DELETE FROM transacoes WHERE id IN ({marcadores})", tuple(apagar))
+            fonte.execute("DELETE FROM saldo_shards WHERE usuario_id = %s", (user_id,))
+            fonte.execute("DELETE FROM saldo_snapshots WHERE email = %s", (conta["email"],))
+
+            # O diretório muda na mesma transação que grava a decisão
+            tx.confirmar(junto=lambda cursor: cursor.execute(
+                "UPDATE mapa_shards SET shard = %s, movendo = 0 WHERE usuario_id = %s",
+                (destino, user_id)
+            ))
+    except BaseException:
+        no_diretorio(_liberar, user_id)
+        raise
+
+    sharding.esquecer(email=email, user_id=user_id)
+    account_cache.invalidar(email=email, user_id=user_id)
+    return {"usuario_id": user_id, "de": origem, "para": destino, "movida": True, "ledger": len(copiar)}
+
+
+def _fora_do_lugar(cursor, apos, limite):
+    cursor.execute(
+        """
+        SELECT usuario_id, email_normalizado, shard
+        FROM mapa_shards
+        WHERE usuario_id > %s AND movendo = 0
+        ORDER BY usuario_id
+        LIMIT %s
+        """,
+        (apos, limite)
+    )
+    return cursor.fetchall()
+
+
+def rebalancear(limite=None, lote=1000):
+    # Move para sharding.shard_padrao as contas que estão em outro shard (ex.:
+    # depois de acrescentar um shard em DB_SHARD_HOSTS). Uma conta por vez.
+    movidas = 0
+    falhas = 0
+    apos = 0
+    while limite is None or movidas < limite:
+        linhas = no_diretorio(_fora_do_lugar, apos, lote)
+        if not linhas:
+            break
+        for row in linhas:
+            apos = row["usuario_id"]
+            alvo = sharding.shard_padrao(row["email_normalizado"])
+            if alvo == row["shard"]:
+                continue
+            try:
+                mover_conta(row["usuario_id"], alvo)
+                movidas += 1
+            except Exception as e:
+                falhas += 1
+                print(f"Conta {row['usuario_id']}: {e}")
+            if limite is not None and movidas >= limite:
+                break
+    return {"movidas": movidas, "falhas": falhas}
+
+
+if __name__ == "__main__":
+    uso = "Uso: python -m api.resharding mover <usuario_id> <shard> | rebalancear [limite]"
+    args = sys.argv[1:]
+    try:
+        if len(args) == 3 and args[0] == "mover":
+            resultado = mover_conta(int(args[1]), int(args[2]))
+            print(f"Conta {resultado['usuario_id']}: shard {resultado['de']} -> {resultado['para']}")
+        elif args and args[0] == "rebalancear" and len(args) <= 2:
+            resultado = rebalancear(int(args[1]) if len(args) == 2 else None)
+            print(f"Rebalanceamento: {resultado['movidas']} contas movidas, {resultado['falhas']} falhas")
+        else:
+            print(uso)
+            sys.exit(2)
+    except Exception as e:
+        print(f"Erro no resharding: {e}")
+        sys.exit(1)
@@ -0,0 +1,41 @@
+from decimal import Decimal
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import orjson
+
+
+def _default(valor):
+    if isinstance(valor, Decimal):
+        # String exata: float perderia centavos
+        return str(valor)
+    if isinstance(valor, BaseModel):
+        return valor.model_dump(mode="json")
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    # Resposta padrão do app: orjson para dicts/listas e, para modelos
+    # Pydantic, o serializador compilado direto em bytes (sem dict intermediário).
+
+    def render(self, content) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_response(conteudo, status_code: int = 200):
+    # Dict com Decimal sai pronto: o jsonable_encoder do FastAPI, aplicado a
+    # dicts devolvidos pela rota, transformaria o valor em float.
+    return FastJSONResponse(conteudo, status_code=status_code)
+
+
+def model_response(modelo: BaseModel, response: Response = None, status_code: int = 200):
+    # Devolver a Response pronta pula a revalidação do response_model pelo
+    # FastAPI; os headers definidos na Response injetada são preservados.
+    resposta = FastJSONResponse(modelo, status_code=status_code)
+    if response is not None:
+        resposta.headers.update(response.headers)
+    return resposta
@@ -0,0 +1,193 @@
+from api.cache import TTLCache
+from fastapi import HTTPException
+import contextvars
+import functools
+import os
+import threading
+import zlib
+
+# Shards além do banco principal: "host[:porta][/banco]" separados por vírgula.
+# O shard 0 é o DB_HOST e guarda o diretório (mapa_shards). Vazio = sem sharding.
+DB_SHARD_HOSTS = [h.strip() for h in os.getenv("DB_SHARD_HOSTS", "").split(",") if h.strip()]
+SHARD_MAP_CACHE_TTL = float(os.getenv("SHARD_MAP_CACHE_TTL", "30"))
+SHARD_MAP_CACHE_SIZE = int(os.getenv("SHARD_MAP_CACHE_SIZE", "100000"))
+
+_cache = TTLCache(maxsize=SHARD_MAP_CACHE_SIZE, ttl=SHARD_MAP_CACHE_TTL)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "consultas_diretorio": 0,
+    "contas_registradas": 0,
+    "rerroteamentos": 0,
+}
+
+
+def _incr(campo, qtd=1):
+    with _stats_lock:
+        _stats[campo] += qtd
+
+
+def ativo():
+    return bool(DB_SHARD_HOSTS)
+
+
+def total():
+    return 1 + len(DB_SHARD_HOSTS)
+
+
+def endereco(shard):
+    # (host, porta, banco) de um shard >= 1; porta/banco None = os do DB_HOST
+    servidor, _, banco = DB_SHARD_HOSTS[shard - 1].partition("/")
+    host, _, porta = servidor.partition(":")
+    return host, int(porta) if porta else None, banco or None
+
+
+def shard_padrao(email):
+    # Posição de uma conta nova. Contas existentes seguem o diretório, então
+    # mudar o número de shards não move ninguém (ver api/resharding.py).
+    return zlib.crc32(email.strip().lower().encode()) % total()
+
+
+# ----------------------------
+# Diretório (cursor dictionary=True no shard 0)
+# ----------------------------
+
+def _chaves(email=None, user_id=None):
+    chaves = []
+    if email:
+        chaves.append(f"email:{email.strip().lower()}")
+    if user_id is not None:
+        chaves.append(f"id:{int(user_id)}")
+    return chaves
+
+
+def em_cache(email=None, user_id=None):
+    for chave in _chaves(email, user_id):
+        shard = _cache.get(chave)
+        if shard is not None:
+            return shard
+    return None
+
+
+def _guardar(email, user_id, shard):
+    for chave in _chaves(email, user_id):
+        _cache.set(chave, shard)
+
+
+def esquecer(email=None, user_id=None):
+    for chave in _chaves(email, user_id):
+        _cache.delete(chave)
+
+
+def localizar(cursor, email=None, user_id=None):
+    # Shard da conta, ou None se ela não está no diretório
+    _incr("consultas_diretorio")
+    if user_id is not None:
+        cursor.execute(
+            "SELECT usuario_id, email_normalizado, shard FROM mapa_shards WHERE usuario_id = %s",
+            (user_id,)
+        )
+    else:
+        cursor.execute(
+            "SELECT usuario_id, email_normalizado, shard FROM mapa_shards WHERE email_normalizado = %s",
+            (email.strip().lower(),)
+        )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    _guardar(row["email_normalizado"], row["usuario_id"], row["shard"])
+    return row["shard"]
+
+
+def localizar_varios(cursor, emails):
+    # {email normalizado: shard} das contas do diretório; e-mails ausentes
+    # (ex.: DEPOSITO/SAQUE no ledger) ficam de fora
+    emails = sorted({e.strip().lower() for e in emails})
+    if not emails:
+        return {}
+    marcadores = ", ".join(["%s"] * len(emails))
+    cursor.execute(
+        f"SELECT email_normalizado, shard FROM mapa_shards WHERE email_normalizado IN ({marcadores})",
+        tuple(emails)
+    )
+    return {row["email_normalizado"]: row["shard"] for row in cursor.fetchall()}
+
+
+def registrar_conta(cursor, email, shard):
+    # O id da conta nasce no diretório: único entre todos os shards
+    cursor.execute(
+        "INSERT INTO mapa_shards (email_normalizado, shard) VALUES (%s, %s)",
+        (email.strip().lower(), shard)
+    )
+    _incr("contas_registradas")
+    return cursor.lastrowid
+
+
+def remover_conta(cursor, user_id):
+    cursor.execute("DELETE FROM mapa_shards WHERE usuario_id = %s", (user_id,))
+
+
+def trocar_email(cursor, user_id, email):
+    # Retorna o e-mail anterior, ou None se a conta não está no diretório
+    cursor.execute(
+        "SELECT email_normalizado FROM mapa_shards WHERE usuario_id = %s FOR UPDATE",
+        (user_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute(
+        "UPDATE mapa_shards SET email_normalizado = %s WHERE usuario_id = %s",
+        (email.strip().lower(), user_id)
+    )
+    return row["email_normalizado"]
+
+
+# ----------------------------
+# Nova tentativa após mudança de shard
+# ----------------------------
+
+_rotas = contextvars.ContextVar("sharding_rotas", default=None)
+
+
+def anotar(email, user_id, shard):
+    rotas = _rotas.get()
+    if rotas is not None:
+        rotas.append((email, user_id, shard))
+
+
+def reroteia(func):
+    # Conta movida por um resharding (ou cache vencido) some do shard antigo:
+    # o 404 lá vira uma nova tentativa no shard atual do diretório.
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ativo():
+            return func(*args, **kwargs)
+
+        from api.connection import localizar_shard
+
+        token = _rotas.set([])
+        try:
+            try:
+                return func(*args, **kwargs)
+            except HTTPException as e:
+                if e.status_code != 404:
+                    raise
+                rotas = _rotas.get()
+                if not any(localizar_shard(email, user_id, fresco=True) != shard for email, user_id, shard in rotas):
+                    raise
+            _incr("rerroteamentos")
+            _rotas.set([])
+            return func(*args, **kwargs)
+        finally:
+            _rotas.reset(token)
+
+    return wrapper
+
+
+def sharding_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["shards"] = total()
+    stats["cache"] = _cache.stats()
+    return stats
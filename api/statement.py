@@ -0,0 +1,137 @@
+from datetime import datetime
+from decimal import Decimal
+from fastapi import HTTPException
+import base64
+import csv
+import io
+import json
+import os
+
+EXTRATO_PAGE_MAX = int(os.getenv("EXTRATO_PAGE_MAX", "200"))
+EXTRATO_EXPORT_BATCH = int(os.getenv("EXTRATO_EXPORT_BATCH", "1000"))
+
+COLUNAS = ("id", "email_origin", "email_destination", "valor", "mensagem", "create_time")
+
+
+# ----------------------------
+# Cursor opaco (create_time, id)
+# ----------------------------
+
+def encode_cursor(create_time, transacao_id):
+    bruto = json.dumps([create_time.isoformat(), transacao_id]).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        create_time, transacao_id = json.loads(bruto)
+        return datetime.fromisoformat(create_time), int(transacao_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+# ----------------------------
+# SQL
+# ----------------------------
+
+def _ramo(coluna, extra, apos, descendente, limite):
+    # Cada ramo filtra por uma única coluna de e-mail para usar o índice
+    # (email, create_time, id) em vez de um OR que força varredura.
+    ordem = "DESC" if descendente else "ASC"
+    comparador = "<" if descendente else ">"
+    where = [f"{coluna} = %s"] + extra
+    params = []
+
+    if apos:
+        where.append(f"(create_time {comparador} %s OR (create_time = %s AND id {comparador} %s))")
+        params += [apos[0], apos[0], apos[1]]
+
+    sql = (
+        f"SELECT {', '.join(COLUNAS)} FROM transacoes "
+        f"WHERE {' AND '.join(where)} "
+        f"ORDER BY create_time {ordem}, id {ordem}"
+    )
+    if limite:
+        sql += " LIMIT %s"
+        params.append(limite)
+    return sql, params
+
+
+def statement_query(email, apos=None, limite=None, descendente=True):
+    origem_sql, origem_params = _ramo("email_origin", [], apos, descendente, limite)
+    # Transferência para si mesmo aparece uma única vez
+    destino_sql, destino_params = _ramo(
+        "email_destination", ["email_origin <> %s"], apos, descendente, limite
+    )
+    ordem = "DESC" if descendente else "ASC"
+
+    sql = (
+        f"SELECT * FROM (({origem_sql}) UNION ALL ({destino_sql})) AS extrato "
+        f"ORDER BY create_time {ordem}, id {ordem}"
+    )
+    params = [email] + origem_params + [email, email] + destino_params
+    if limite:
+        sql += " LIMIT %s"
+        params.append(limite)
+    return sql, tuple(params)
+
+
+# ----------------------------
+# Linhas
+# ----------------------------
+
+def item_extrato(row, email):
+    return {
+        "id": row["id"],
+        "tipo": "debito" if row["email_origin"].lower() == email else "credito",
+        "email_origin": row["email_origin"],
+        "email_destination": row["email_destination"],
+        "valor": row["valor"],
+        "mensagem": row["mensagem"],
+        "create_time": row["create_time"],
+    }
+
+
+def pagina_extrato(cursor, email, limite, apos=None):
+    sql, params = statement_query(email, apos=apos, limite=limite + 1)
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+
+    itens = [item_extrato(row, email) for row in rows[:limite]]
+    proximo = None
+    if len(rows) > limite:
+        ultimo = rows[limite - 1]
+        proximo = encode_cursor(ultimo["create_time"], ultimo["id"])
+
+    return {"itens": itens, "proximo_cursor": proximo}
+
+
+def _json_default(valor):
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def ndjson_lines(rows, email):
+    return "".join(
+        json.dumps(item_extrato(row, email), default=_json_default, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+CSV_CABECALHO = ("id", "tipo", "email_origin", "email_destination", "valor", "mensagem", "create_time")
+
+
+def csv_lines(rows, email, cabecalho=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if cabecalho:
+        writer.writerow(CSV_CABECALHO)
+    for row in rows:
+        item = item_extrato(row, email)
+        item["create_time"] = item["create_time"].isoformat()
+        writer.writerow([item[c] for c in CSV_CABECALHO])
+    return buffer.getvalue()
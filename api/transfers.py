@@ -0,0 +1,347 @@
+from fastapi import HTTPException
+from api import idempotency
+from api import account_cache
+from api import audit
+from api import outbox
+from api import hot_accounts
+from api.connection import marcar_escrita
+from mysql.connector import errorcode
+import mysql.connector
+import os
+import random
+import threading
+import time
+
+TRANSFER_MAX_RETRIES = int(os.getenv("TRANSFER_MAX_RETRIES", "3"))
+TRANSFER_BACKOFF_BASE = float(os.getenv("TRANSFER_BACKOFF_BASE", "0.02"))
+TRANSFER_BATCH_CHUNK = int(os.getenv("TRANSFER_BATCH_CHUNK", "500"))
+TRANSFER_BATCH_MAX_ITEMS = int(os.getenv("TRANSFER_BATCH_MAX_ITEMS", "10000"))
+
+LEDGER_INSERT = """
+    INSERT INTO transacoes
+        (email_origin, email_destination, valor, mensagem, create_time)
+    VALUES (%s, %s, %s, %s, NOW())
+"""
+
+DESTINO_SQL = "SELECT id FROM usuarios WHERE email = %s"
+SALDOS_TRANSFERENCIA_SQL = """
+    UPDATE usuarios
+    SET saldo_cc = saldo_cc + CASE id WHEN %s THEN %s WHEN %s THEN %s END
+    WHERE id IN (%s, %s)
+"""
+
+RETRYABLE_ERRNOS = {
+    errorcode.ER_LOCK_DEADLOCK,       # 1213
+    errorcode.ER_LOCK_WAIT_TIMEOUT,   # 1205
+}
+
+_stats_lock = threading.Lock()
+_stats = {
+    "executadas": 0,
+    "retries": 0,
+    "deadlocks": 0,
+    "lock_wait_timeouts": 0,
+    "retries_esgotados": 0,
+    "lotes": 0,
+    "itens_lote": 0,
+}
+
+
+def _incr(campo, qtd=1):
+    with _stats_lock:
+        _stats[campo] += qtd
+
+
+def transfer_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def run_with_retry(conn, func, *args):
+    # Executa func(cursor, *args) numa transação, repetindo em deadlock/lock wait.
+    tentativa = 0
+    while True:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            resultado = func(cursor, *args)
+            conn.commit()
+            return resultado
+
+        except mysql.connector.Error as err:
+            conn.rollback()
+            if err.errno not in RETRYABLE_ERRNOS:
+                raise
+            _incr("deadlocks" if err.errno == errorcode.ER_LOCK_DEADLOCK else "lock_wait_timeouts")
+            if tentativa >= TRANSFER_MAX_RETRIES:
+                _incr("retries_esgotados")
+                raise
+            tentativa += 1
+            _incr("retries")
+            espera = TRANSFER_BACKOFF_BASE * (2 ** (tentativa - 1))
+            time.sleep(espera + random.uniform(0, TRANSFER_BACKOFF_BASE))
+
+        except Exception:
+            conn.rollback()
+            raise
+
+        finally:
+            cursor.close()
+
+
+def lock_sql(qtd):
+    marcadores = ", ".join(["%s"] * qtd)
+    return f"""
+        SELECT id, email, saldo_cc
+        FROM usuarios
+        WHERE id IN ({marcadores})
+        ORDER BY id
+        FOR UPDATE
+    """
+
+
+def destinos_sql(qtd):
+    marcadores = ", ".join(["%s"] * qtd)
+    return f"SELECT id, email FROM usuarios WHERE email IN ({marcadores})"
+
+
+def lock_accounts(cursor, ids):
+    # Bloqueia as linhas sempre em ordem crescente de id: duas transferências
+    # em sentidos opostos disputam os locks na mesma ordem e não travam.
+    ids = sorted(set(ids))
+    cursor.execute(lock_sql(len(ids)), tuple(ids))
+    return {row["id"]: row for row in cursor.fetchall()}
+
+
+def _transferir(cursor, payload, chave=None, hash_req=None, meta=None):
+    if chave:
+        anterior = idempotency.buscar(cursor, "transacoes", chave, hash_req)
+        if anterior is not None:
+            return anterior, True, []
+
+    cursor.execute(DESTINO_SQL, (payload.email_destination,))
+    destino = cursor.fetchone()
+    if not destino:
+        raise HTTPException(status_code=404, detail="Usuário destino não encontrado")
+
+    origem_id = payload.user_origin_id
+    destino_id = destino["id"]
+    if origem_id == destino_id:
+        raise HTTPException(status_code=400, detail="Origem e destino são a mesma conta")
+
+    # Destino quente não entra nos locks: o crédito vai para um shard
+    destino_quente = hot_accounts.e_quente(payload.email_destination)
+    contas = lock_accounts(cursor, (origem_id,) if destino_quente else (origem_id, destino_id))
+    origem = contas.get(origem_id)
+
+    if not origem:
+        raise HTTPException(status_code=404, detail="Usuário origem não encontrado")
+    if origem["email"].lower() != payload.email_origin.lower():
+        raise HTTPException(status_code=400, detail="E-mail de origem não confere")
+    if not destino_quente and (
+        destino_id not in contas or contas[destino_id]["email"].lower() != payload.email_destination.lower()
+    ):
+        raise HTTPException(status_code=404, detail="Usuário destino não encontrado")
+    if hot_accounts.e_quente(origem["email"]):
+        origem["saldo_cc"] += hot_accounts.consolidar(cursor, origem_id)
+    if origem["saldo_cc"] < payload.valor:
+        raise HTTPException(status_code=400, detail="Saldo insuficiente")
+
+    if destino_quente:
+        cursor.execute(
+            "UPDATE usuarios SET saldo_cc = saldo_cc - %s WHERE id = %s",
+            (payload.valor, origem_id)
+        )
+        hot_accounts.creditar(cursor, destino_id, payload.valor)
+    else:
+        # 🔹 Debita origem e credita destino num único UPDATE
+        cursor.execute(
+            SALDOS_TRANSFERENCIA_SQL,
+            (origem_id, -payload.valor, destino_id, payload.valor, origem_id, destino_id)
+        )
+
+    # 🔹 Registro da transação
+    cursor.execute(
+        LEDGER_INSERT,
+        (
+            payload.email_origin,
+            payload.email_destination,
+            payload.valor,
+            payload.mensagem
+        )
+    )
+
+    auditoria = audit.registrar(cursor, [
+        audit.registro(
+            "transferencia", payload.email_origin, payload.email_destination,
+            payload.valor, payload.mensagem, meta
+        )
+    ])
+    outbox.registrar(cursor, [
+        outbox.evento("transferencia", payload.email_origin, payload.email_destination, payload.valor)
+    ])
+
+    resposta = {"status": "ok"}
+    if chave:
+        idempotency.registrar(cursor, "transacoes", chave, hash_req, resposta)
+    return resposta, False, auditoria
+
+
+def executar_transferencia(conn, payload, idempotency_key=None, response=None, meta=None):
+    hash_req = idempotency.hash_requisicao(payload) if idempotency_key else None
+
+    try:
+        resposta, replay, auditoria = run_with_retry(conn, _transferir, payload, idempotency_key, hash_req, meta)
+    except mysql.connector.Error as err:
+        if not (idempotency_key and idempotency.is_duplicate(err)):
+            raise
+        # Requisição repetida concorrente já gravou a chave: devolve a resposta dela
+        cursor = conn.cursor(dictionary=True)
+        try:
+            resposta = idempotency.buscar(cursor, "transacoes", idempotency_key, hash_req)
+        finally:
+            cursor.close()
+        if resposta is None:
+            raise
+        replay = True
+
+    if replay:
+        idempotency.marcar_replay(response)
+        return resposta
+
+    _incr("executadas")
+    audit.publicar(conn, auditoria)
+    account_cache.invalidar(email=payload.email_origin, user_id=payload.user_origin_id)
+    marcar_escrita(email=payload.email_origin, user_id=payload.user_origin_id)
+    account_cache.invalidar(email=payload.email_destination)
+    marcar_escrita(email=payload.email_destination)
+    if idempotency_key:
+        idempotency.lembrar("transacoes", idempotency_key, hash_req, resposta)
+    return resposta
+
+
+def _transferir_lote(cursor, itens, meta=None):
+    # Aplica um chunk de transferências com 4 comandos, qualquer que seja o tamanho
+    # (mais um crédito por destino quente): resolve destinos, bloqueia contas,
+    # atualiza saldos agrupados e grava o ledger.
+    emails = sorted({p.email_destination.lower() for _, p in itens})
+    cursor.execute(destinos_sql(len(emails)), tuple(emails))
+    destinos = {row["email"].lower(): row["id"] for row in cursor.fetchall()}
+
+    origens = {p.user_origin_id for _, p in itens}
+    # Destino quente que não debita neste chunk fica fora dos locks: os
+    # créditos vão para os shards, como em _transferir
+    quentes = {
+        conta_id for email, conta_id in destinos.items()
+        if conta_id not in origens and hot_accounts.e_quente(email)
+    }
+    contas = lock_accounts(cursor, origens | (set(destinos.values()) - quentes))
+    # Origem quente: os shards voltam para o saldo_cc antes dos débitos
+    for conta_id, conta in contas.items():
+        if conta_id in origens and hot_accounts.e_quente(conta["email"]):
+            conta["saldo_cc"] += hot_accounts.consolidar(cursor, conta_id)
+    saldos = {conta_id: conta["saldo_cc"] for conta_id, conta in contas.items()}
+
+    resultados = []
+    deltas = {}
+    creditos_quentes = {}
+    ledger = []
+    registros = []
+    eventos = []
+
+    for indice, p in itens:
+        origem = contas.get(p.user_origin_id)
+        destino_id = destinos.get(p.email_destination.lower())
+        valor = p.valor
+
+        if valor <= 0:
+            erro = "Valor inválido"
+        elif destino_id is None or (destino_id not in contas and destino_id not in quentes):
+            erro = "Usuário destino não encontrado"
+        elif not origem:
+            erro = "Usuário origem não encontrado"
+        elif origem["email"].lower() != p.email_origin.lower():
+            erro = "E-mail de origem não confere"
+        elif p.user_origin_id == destino_id:
+            erro = "Origem e destino são a mesma conta"
+        elif saldos[p.user_origin_id] < valor:
+            erro = "Saldo insuficiente"
+        else:
+            erro = None
+
+        if erro:
+            resultados.append({"indice": indice, "status": "erro", "detail": erro})
+            continue
+
+        saldos[p.user_origin_id] -= valor
+        deltas[p.user_origin_id] = deltas.get(p.user_origin_id, 0) - valor
+        if destino_id in quentes:
+            creditos_quentes[destino_id] = creditos_quentes.get(destino_id, 0) + valor
+        else:
+            saldos[destino_id] += valor
+            deltas[destino_id] = deltas.get(destino_id, 0) + valor
+        ledger.append((p.email_origin, p.email_destination, valor, p.mensagem))
+        registros.append(audit.registro("transferencia", p.email_origin, p.email_destination, valor, p.mensagem, meta))
+        eventos.append(outbox.evento("transferencia", p.email_origin, p.email_destination, valor))
+        resultados.append({"indice": indice, "status": "ok"})
+
+    deltas = {conta_id: delta for conta_id, delta in deltas.items() if delta}
+    if deltas:
+        casos = " ".join(["WHEN %s THEN %s"] * len(deltas))
+        marcadores = ", ".join(["%s"] * len(deltas))
+        params = [v for par in sorted(deltas.items()) for v in par]
+        cursor.execute(
+            f"""
+            UPDATE usuarios
+            SET saldo_cc = saldo_cc + CASE id {casos} END
+            WHERE id IN ({marcadores})
+            """,
+            tuple(params) + tuple(sorted(deltas))
+        )
+
+    # Um crédito por conta quente e por chunk, depois dos locks das contas
+    for conta_id, valor in sorted(creditos_quentes.items()):
+        hot_accounts.creditar(cursor, conta_id, valor)
+
+    if ledger:
+        cursor.executemany(LEDGER_INSERT, ledger)
+    outbox.registrar(cursor, eventos)
+
+    return resultados, audit.registrar(cursor, registros)
+
+
+def executar_lote(conn, payloads, chunk_size=None, meta=None):
+    # Cada chunk é uma transação própria: um chunk com deadlock é repetido sozinho.
+    chunk_size = chunk_size or TRANSFER_BATCH_CHUNK
+    itens = list(enumerate(payloads))
+    resultados = []
+
+    for inicio in range(0, len(itens), chunk_size):
+        chunk = itens[inicio:inicio + chunk_size]
+        try:
+            resultados_chunk, auditoria = run_with_retry(conn, _transferir_lote, chunk, meta)
+        except mysql.connector.Error as err:
+            # Chunks anteriores já foram confirmados; este é reportado como falho.
+            resultados.extend(
+                {"indice": indice, "status": "erro", "detail": f"Erro no banco: {err}"}
+                for indice, _ in chunk
+            )
+            continue
+
+        resultados.extend(resultados_chunk)
+        audit.publicar(conn, auditoria)
+        for resultado, (_, p) in zip(resultados_chunk, chunk):
+            if resultado["status"] == "ok":
+                account_cache.invalidar(email=p.email_origin, user_id=p.user_origin_id)
+                marcar_escrita(email=p.email_origin, user_id=p.user_origin_id)
+                account_cache.invalidar(email=p.email_destination)
+                marcar_escrita(email=p.email_destination)
+
+    ok = sum(1 for r in resultados if r["status"] == "ok")
+    _incr("lotes")
+    _incr("itens_lote", len(resultados))
+    _incr("executadas", ok)
+    return {
+        "ok": ok,
+        "erros": len(resultados) - ok,
+        "resultados": resultados
+    }
@@ -0,0 +1,195 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+from api.quotes import normalizar, get_quote_service, QUOTES_FETCH_TIMEOUT
+import numpy as np
+import os
+import sys
+import time
+
+VALUATION_WRITE_CHUNK = int(os.getenv("VALUATION_WRITE_CHUNK", "5000"))
+
+# Aritmética em inteiros escalados (int64), sem float: quantidade com 8 casas
+# (DECIMAL(20, 8)), preço com 4 e valores intermediários com 4 casas.
+ESCALA_QTD = 10 ** 8
+ESCALA_PRECO = 10 ** 4
+_INT64_MAX = np.iinfo(np.int64).max
+
+# O próprio banco soma por (client_id, ticker) e já entrega os inteiros escalados
+POSICOES_SQL = """
+    SELECT client_id, ticker,
+           CAST(SUM(quantidade) * 100000000 AS SIGNED) AS quantidade,
+           CAST(SUM(valor_investido) * 100 AS SIGNED) AS investido
+    FROM financial_transactions
+    {where}
+    GROUP BY client_id, ticker
+    ORDER BY client_id
+"""
+
+
+def gravar_sql(qtd):
+    # UPDATE com JOIN numa tabela derivada dos totais: um comando por chunk,
+    # e só clientes que já existem em invest_client são tocados
+    linhas = " UNION ALL ".join(
+        ["SELECT %s AS client_id, %s AS patrimonio_total"] + ["SELECT %s, %s"] * (qtd - 1)
+    )
+    return f"""
+    UPDATE invest_client
+    JOIN ({linhas}) AS novos ON novos.client_id = invest_client.client_id
+    SET invest_client.patrimonio_total = novos.patrimonio_total
+"""
+
+
+# ----------------------------
+# Leitura
+# ----------------------------
+
+def carregar_posicoes(conn, client_id=None):
+    cursor = conn.cursor()
+    try:
+        if client_id is None:
+            cursor.execute(POSICOES_SQL.format(where=""))
+        else:
+            cursor.execute(POSICOES_SQL.format(where="WHERE client_id = %s"), (client_id,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    return posicoes_de_linhas(rows)
+
+
+def posicoes_de_linhas(rows):
+    # Tickers viram códigos inteiros: a avaliação indexa a tabela de preços
+    # por código em vez de comparar strings.
+    n = len(rows)
+    clientes, tickers, quantidades, investidos = zip(*rows) if n else ((), (), (), ())
+    codigos = {}
+    ticker_idx = np.fromiter(
+        (codigos.setdefault(normalizar(t), len(codigos)) for t in tickers),
+        dtype=np.int32,
+        count=n
+    )
+    return {
+        "client_id": np.fromiter(clientes, dtype=np.int64, count=n),
+        "ticker_idx": ticker_idx,
+        "tickers": list(codigos),
+        "quantidade": np.fromiter(quantidades, dtype=np.int64, count=n),
+        "investido": np.fromiter(investidos, dtype=np.int64, count=n),
+    }
+
+
+def tickers_de(posicoes):
+    return sorted(posicoes["tickers"])
+
+
+# ----------------------------
+# Avaliação vetorizada
+# ----------------------------
+
+def _preco_escalado(preco):
+    return int((Decimal(preco) * ESCALA_PRECO).to_integral_value(ROUND_HALF_EVEN))
+
+
+def _dividir_arredondando(valor, divisor):
+    # Meio para cima, em inteiros
+    return np.floor_divide(valor + divisor // 2, divisor)
+
+
+def avaliar(posicoes, precos):
+    # `precos`: {ticker: Decimal}. Posições sem cotação ficam pelo custo.
+    n = len(posicoes["client_id"])
+    if n == 0:
+        vazio = np.zeros(0, dtype=np.int64)
+        return {"client_id": vazio, "centavos": vazio, "posicoes": 0, "sem_cotacao": 0}
+
+    tabela = np.array(
+        [_preco_escalado(precos[t]) if precos.get(t) is not None else -1 for t in posicoes["tickers"]],
+        dtype=np.int64
+    )
+    preco = tabela[posicoes["ticker_idx"]]
+    com_cotacao = preco >= 0
+    preco = np.where(com_cotacao, preco, 0)
+
+    # quantidade × preço sem estourar int64: parte inteira e fração separadas
+    quantidade = posicoes["quantidade"]
+    inteira, fracao = np.divmod(quantidade, ESCALA_QTD)
+    if tabela.max(initial=0) > 0 and np.abs(inteira).max() > _INT64_MAX // tabela.max():
+        raise ValueError("Posição fora da faixa suportada pela avaliação")
+
+    mercado = inteira * preco + _dividir_arredondando(fracao * preco, ESCALA_QTD)
+    custo = posicoes["investido"] * (ESCALA_PRECO // 100)
+    valor = np.where(com_cotacao, mercado, custo)
+
+    # Soma por segmento de client_id (as linhas já chegam ordenadas do banco)
+    clientes_id = posicoes["client_id"]
+    if np.any(clientes_id[1:] < clientes_id[:-1]):
+        ordem = np.argsort(clientes_id, kind="stable")
+        clientes_id, valor = clientes_id[ordem], valor[ordem]
+    inicio = np.flatnonzero(np.r_[True, clientes_id[1:] != clientes_id[:-1]])
+    clientes = clientes_id[inicio]
+    total = np.add.reduceat(valor, inicio)
+
+    return {
+        "client_id": clientes,
+        "centavos": _dividir_arredondando(total, ESCALA_PRECO // 100),
+        "posicoes": n,
+        "sem_cotacao": int(n - com_cotacao.sum())
+    }
+
+
+def totais_decimais(avaliacao):
+    return [
+        (int(cliente), Decimal(int(centavos)).scaleb(-2))
+        for cliente, centavos in zip(avaliacao["client_id"], avaliacao["centavos"])
+    ]
+
+
+# ----------------------------
+# Escrita em lote
+# ----------------------------
+
+def gravar_patrimonio(conn, avaliacao, chunk_size=None):
+    # Um UPDATE por chunk em vez de um por cliente, todos na mesma transação:
+    # ou a reavaliação inteira é gravada, ou nenhuma carteira muda.
+    chunk_size = chunk_size or VALUATION_WRITE_CHUNK
+    linhas = totais_decimais(avaliacao)
+    cursor = conn.cursor()
+    try:
+        for inicio in range(0, len(linhas), chunk_size):
+            chunk = linhas[inicio:inicio + chunk_size]
+            cursor.execute(gravar_sql(len(chunk)), tuple(v for linha in chunk for v in linha))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(linhas)
+
+
+def reavaliar_carteiras(conn, service=None, timeout=QUOTES_FETCH_TIMEOUT):
+    service = service or get_quote_service()
+    inicio = time.perf_counter()
+
+    posicoes = carregar_posicoes(conn)
+    cotacoes = service.aguardar(tickers_de(posicoes), timeout=timeout)
+    avaliacao = avaliar(posicoes, {t: preco for t, (preco, _) in cotacoes.items()})
+    clientes = gravar_patrimonio(conn, avaliacao)
+
+    return {
+        "clientes": clientes,
+        "posicoes": avaliacao["posicoes"],
+        "sem_cotacao": avaliacao["sem_cotacao"],
+        "segundos": round(time.perf_counter() - inicio, 3)
+    }
+
+
+if __name__ == "__main__":
+    from api.connection import _connect
+
+    conn = _connect()
+    try:
+        print(f"Reavaliação concluída: {reavaliar_carteiras(conn)}")
+    except Exception as e:
+        print(f"Erro na reavaliação: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
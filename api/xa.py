@@ -0,0 +1,454 @@
+from api import sharding
+from api import connection
+from api.connection import get_connection
+from api.pool import PoolTimeoutError
+import json
+import logging
+import mysql.connector
+import os
+import sys
+import threading
+import uuid
+
+# Transações distribuídas entre shards (XA do MySQL, commit em duas fases).
+# O log fica no shard 0: a linha em 'confirmando' é o ponto de decisão, e
+# quem não chegou lá é desfeito pela recuperação (presumed abort).
+XA_RECOVERY_AGE = float(os.getenv("XA_RECOVERY_AGE", "60"))
+XA_RECOVERY_INTERVAL = float(os.getenv("XA_RECOVERY_INTERVAL", "30"))
+# Cada transação usa até duas conexões do shard 0 (log + ramo no shard 0):
+# o limite deixa o pool do shard 0 suficiente para todas as que estão abertas
+XA_MAX_CONCURRENT = int(os.getenv("XA_MAX_CONCURRENT", str(max(1, connection.DB_POOL_MAX_SIZE // 2))))
+
+XID_PREFIXO = "javer-"
+
+logger = logging.getLogger("api.xa")
+
+_stats_lock = threading.Lock()
+_stats = {
+    "iniciadas": 0,
+    "confirmadas": 0,
+    "abortadas": 0,
+    "commits_pendentes": 0,
+    "recuperadas_commit": 0,
+    "recuperadas_rollback": 0,
+    "falhas_recuperacao": 0,
+}
+
+
+def _incr(campo, qtd=1):
+    with _stats_lock:
+        _stats[campo] += qtd
+
+
+_vagas = threading.BoundedSemaphore(XA_MAX_CONCURRENT)
+
+
+# ----------------------------
+# Log do coordenador (shard 0)
+# ----------------------------
+
+def _liberar_conta(cursor, tipo, dados):
+    # Resharding abortado: a conta volta a poder ser movida
+    if tipo == "mover":
+        cursor.execute("UPDATE mapa_shards SET movendo = 0 WHERE usuario_id = %s", (dados["usuario_id"],))
+
+
+def _abortar(cursor, xid):
+    # Só aborta quem ainda não passou do ponto de decisão
+    cursor.execute("SELECT tipo, dados FROM xa_log WHERE xid = %s", (xid,))
+    row = cursor.fetchone()
+    cursor.execute(
+        "UPDATE xa_log SET estado = 'abortada', atualizado_em = NOW() WHERE xid = %s AND estado = 'preparando'",
+        (xid,)
+    )
+    if cursor.rowcount != 1:
+        return False
+    dados = row["dados"]
+    _liberar_conta(cursor, row["tipo"], json.loads(dados) if isinstance(dados, (str, bytes)) else dados)
+    return True
+
+
+# ----------------------------
+# Coordenador
+# ----------------------------
+
+class Ramo:
+    # Parte de uma transação XA num shard, com conexão própria. A conexão fica
+    # em autocommit enquanto isso: XA START não aceita transação local aberta.
+
+    def __init__(self, shard, gtrid):
+        self.shard = shard
+        self.xid = (gtrid, str(shard))
+        self.estado = "novo"
+        self.conn = get_connection(shard=shard)
+        self.conn.autocommit = True
+        self.cursor = self.conn.cursor(dictionary=True)
+
+    def iniciar(self):
+        self.cursor.execute("XA START %s, %s", self.xid)
+        self.estado = "ativo"
+
+    def preparar(self):
+        self.cursor.execute("XA END %s, %s", self.xid)
+        self.estado = "encerrado"
+        self.cursor.execute("XA PREPARE %s, %s", self.xid)
+        self.estado = "preparado"
+
+    def confirmar(self):
+        self.cursor.execute("XA COMMIT %s, %s", self.xid)
+        self.estado = "confirmado"
+
+    def desfazer(self):
+        try:
+            if self.estado == "ativo":
+                self.cursor.execute("XA END %s, %s", self.xid)
+                self.estado = "encerrado"
+            if self.estado in ("encerrado", "preparado"):
+                self.cursor.execute("XA ROLLBACK %s, %s", self.xid)
+                self.estado = "desfeito"
+        except Exception as e:
+            # Ramo preparado sobrevive à conexão: fica para a recuperação
+            logger.warning("Falha ao desfazer ramo %s: %s", self.xid, e)
+
+    def fechar(self):
+        try:
+            self.cursor.close()
+        except Exception:
+            pass
+        if self.estado in ("novo", "confirmado", "desfeito"):
+            self.conn.autocommit = False
+            self.conn.close()
+        else:
+            # Sessão com XA em aberto não volta para o pool
+            self.conn.descartar()
+
+
+class Transacao:
+    # Uso:
+    #     with Transacao("transferencia", dados) as tx:
+    #         cursor = tx.ramo(shard)  # um ramo por shard, aberto sob demanda
+    #         ...
+    #         tx.confirmar()
+    # Saída com exceção antes de confirmar() desfaz todos os ramos.
+
+    def __init__(self, tipo, dados=None):
+        self.tipo = tipo
+        self.dados = dados or {}
+        self.gtrid = f"{XID_PREFIXO}{uuid.uuid4().hex}"
+        self._ramos = {}
+        self._decidida = False
+        self._log = None
+
+    def __enter__(self):
+        # A conexão do log é tomada antes dos ramos e fica até o fim: decisão
+        # e abort não esperam por outra conexão do pool com ramos abertos
+        if not _vagas.acquire(timeout=connection.DB_POOL_ACQUIRE_TIMEOUT):
+            raise PoolTimeoutError("Tempo esgotado aguardando vaga para transação distribuída")
+        try:
+            self._log = get_connection(shard=0)
+            self._log.autocommit = False
+            self.no_coordenador(lambda cursor: cursor.execute(
+                """
+                INSERT INTO xa_log (xid, tipo, estado, shards, dados, criado_em, atualizado_em)
+                VALUES (%s, %s, 'preparando', '', %s, NOW(), NOW())
+                """,
+                (self.gtrid, self.tipo, json.dumps(self.dados, default=str))
+            ))
+        except BaseException:
+            self._soltar_log()
+            raise
+        _incr("iniciadas")
+        return self
+
+    def no_coordenador(self, func, *args):
+        # func(cursor, *args) numa transação curta do shard 0, pela conexão do log
+        cursor = self._log.cursor(dictionary=True)
+        try:
+            resultado = func(cursor, *args)
+            self._log.commit()
+            return resultado
+        except Exception:
+            self._log.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _soltar_log(self):
+        try:
+            if self._log is not None:
+                self._log.close()
+        finally:
+            self._log = None
+            _vagas.release()
+
+    def ramo(self, shard):
+        ramo = self._ramos.get(shard)
+        if ramo is None:
+            ramo = Ramo(shard, self.gtrid)
+            self._ramos[shard] = ramo
+            ramo.iniciar()
+        return ramo.cursor
+
+    def confirmar(self, junto=None):
+        # Prepara os ramos, decide no log e confirma. `junto(cursor)` roda na
+        # mesma transação do shard 0 que grava a decisão.
+        for ramo in self._ramos.values():
+            ramo.preparar()
+
+        def decidir(cursor):
+            cursor.execute(
+                """
+                UPDATE xa_log
+                SET estado = 'confirmando', shards = %s, atualizado_em = NOW()
+                WHERE xid = %s AND estado = 'preparando'
+                """,
+                (",".join(str(s) for s in sorted(self._ramos)), self.gtrid)
+            )
+            if cursor.rowcount != 1:
+                raise mysql.connector.errors.DatabaseError(
+                    msg=f"Transação distribuída {self.gtrid} abortada pela recuperação"
+                )
+            if junto:
+                junto(cursor)
+
+        self.no_coordenador(decidir)
+        self._decidida = True
+
+        # Daqui em diante a transação vale: falha num COMMIT é da recuperação
+        pendente = False
+        for ramo in self._ramos.values():
+            try:
+                ramo.confirmar()
+            except Exception as e:
+                pendente = True
+                logger.warning("COMMIT do ramo %s falhou; fica para a recuperação: %s", ramo.xid, e)
+        if pendente:
+            _incr("commits_pendentes")
+        else:
+            self._concluir()
+        _incr("confirmadas")
+
+    def _concluir(self):
+        try:
+            self.no_coordenador(lambda cursor: cursor.execute(
+                "UPDATE xa_log SET estado = 'concluida', atualizado_em = NOW() WHERE xid = %s",
+                (self.gtrid,)
+            ))
+        except Exception as e:
+            logger.warning("Falha ao concluir %s no log: %s", self.gtrid, e)
+
+    def __exit__(self, tipo, erro, tb):
+        try:
+            if tipo is not None and not self._decidida:
+                for ramo in self._ramos.values():
+                    ramo.desfazer()
+                try:
+                    self.no_coordenador(_abortar, self.gtrid)
+                except Exception as e:
+                    # Sem o log, a recuperação aborta pela idade
+                    logger.warning("Falha ao abortar %s no log: %s", self.gtrid, e)
+                _incr("abortadas")
+        finally:
+            for ramo in self._ramos.values():
+                ramo.fechar()
+            self._soltar_log()
+        return False
+
+
+# ----------------------------
+# Recuperação
+# ----------------------------
+
+def _preparados(cursor, shard):
+    # gtrids com ramo preparado neste shard. Shards no mesmo servidor veem os
+    # ramos uns dos outros: o bqual (número do shard) separa.
+    cursor.execute("XA RECOVER")
+    gtrids = []
+    for row in cursor.fetchall():
+        dados = row["data"]
+        if isinstance(dados, (bytes, bytearray)):
+            dados = dados.decode()
+        gtrid, bqual = dados[:row["gtrid_length"]], dados[row["gtrid_length"]:]
+        if gtrid.startswith(XID_PREFIXO) and bqual == str(shard):
+            gtrids.append(gtrid)
+    return gtrids
+
+
+def _resolver(shard, gtrids, decisoes):
+    conn = get_connection(shard=shard)
+    conn.autocommit = True
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for gtrid in gtrids:
+            decisao = decisoes.get(gtrid)
+            if decisao is None:
+                continue
+            try:
+                cursor.execute(f"XA {decisao} %s, %s", (gtrid, str(shard)))
+                _incr("recuperadas_commit" if decisao == "COMMIT" else "recuperadas_rollback")
+            except mysql.connector.Error as e:
+                # Ex.: o coordenador concluiu o ramo nesse meio tempo
+                _incr("falhas_recuperacao")
+                logger.warning("Recuperação de %s no shard %s falhou: %s", gtrid, shard, e)
+    finally:
+        cursor.close()
+        conn.autocommit = False
+        conn.close()
+
+
+def recuperar(idade=None):
+    # Conclui (COMMIT) ou desfaz (ROLLBACK) os ramos preparados de todos os
+    # shards conforme o log. 'preparando' mais antiga que `idade` segundos é
+    # coordenador perdido: vira 'abortada'.
+    idade = XA_RECOVERY_AGE if idade is None else idade
+    preparados = {}
+    for shard in range(sharding.total()):
+        conn = get_connection(shard=shard)
+        conn.autocommit = True
+        cursor = conn.cursor(dictionary=True)
+        try:
+            preparados[shard] = _preparados(cursor, shard)
+        finally:
+            cursor.close()
+            conn.autocommit = False
+            conn.close()
+
+    conn = get_connection(shard=0)
+    conn.autocommit = False
+    cursor = conn.cursor(dictionary=True)
+    abortadas = 0
+    try:
+        cursor.execute(
+            "SELECT xid FROM xa_log WHERE estado = 'preparando' AND criado_em < NOW() - INTERVAL %s SECOND",
+            (idade,)
+        )
+        for row in cursor.fetchall():
+            abortadas += _abortar(cursor, row["xid"])
+        conn.commit()
+
+        decisoes = {}
+        gtrids = sorted({g for lista in preparados.values() for g in lista})
+        for gtrid in gtrids:
+            cursor.execute("SELECT estado FROM xa_log WHERE xid = %s", (gtrid,))
+            row = cursor.fetchone()
+            if row is None or row["estado"] == "abortada":
+                decisoes[gtrid] = "ROLLBACK"
+            elif row["estado"] in ("confirmando", "concluida"):
+                decisoes[gtrid] = "COMMIT"
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    for shard, lista in preparados.items():
+        _resolver(shard, lista, decisoes)
+
+    # Decididas sem ramo pendente em nenhum shard estão concluídas
+    restantes = set()
+    for shard in range(sharding.total()):
+        conn = get_connection(shard=shard)
+        conn.autocommit = True
+        cursor = conn.cursor(dictionary=True)
+        try:
+            restantes.update(_preparados(cursor, shard))
+        finally:
+            cursor.close()
+            conn.autocommit = False
+            conn.close()
+
+    conn = get_connection(shard=0)
+    conn.autocommit = False
+    cursor = conn.cursor(dictionary=True)
+    concluidas = 0
+    try:
+        cursor.execute("SELECT xid FROM xa_log WHERE estado = 'confirmando'")
+        for row in cursor.fetchall():
+            if row["xid"] not in restantes:
+                cursor.execute(
+                    "UPDATE xa_log SET estado = 'concluida', atualizado_em = NOW() WHERE xid = %s",
+                    (row["xid"],)
+                )
+                concluidas += 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {
+        "commits": sum(1 for g in decisoes.values() if g == "COMMIT"),
+        "rollbacks": sum(1 for g in decisoes.values() if g == "ROLLBACK"),
+        "abortadas": abortadas,
+        "concluidas": concluidas,
+    }
+
+
+class Recuperador:
+
+    def __init__(self, intervalo=XA_RECOVERY_INTERVAL):
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="javer_xa_recovery", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        # A primeira passada é no startup: resolve o que o processo anterior deixou
+        while True:
+            self.executar()
+            if self._parar.wait(self.intervalo):
+                break
+
+    def executar(self):
+        try:
+            return recuperar()
+        except Exception as e:
+            _incr("falhas_recuperacao")
+            logger.warning("Recuperação XA falhou: %s", e)
+
+    def fechar(self, timeout=10):
+        self._parar.set()
+        self._thread.join(timeout)
+
+
+_lock = threading.Lock()
+_recuperador = None
+
+
+def iniciar_recuperador():
+    global _recuperador
+    if not sharding.ativo() or XA_RECOVERY_INTERVAL <= 0:
+        return None
+    with _lock:
+        if _recuperador is None:
+            _recuperador = Recuperador()
+    return _recuperador
+
+
+def parar_recuperador():
+    global _recuperador
+    with _lock:
+        anterior, _recuperador = _recuperador, None
+    if anterior is not None:
+        anterior.fechar()
+
+
+def xa_stats():
+    with _stats_lock:
+        return {**_stats, "recuperador_ativo": _recuperador is not None}
+
+
+if __name__ == "__main__":
+    try:
+        resultado = recuperar()
+        print(
+            f"Recuperação XA: {resultado['commits']} commits, {resultado['rollbacks']} rollbacks, "
+            f"{resultado['abortadas']} abortadas, {resultado['concluidas']} concluídas"
+        )
+    except Exception as e:
+        print(f"Erro na recuperação: {e}")
+        sys.exit(1)
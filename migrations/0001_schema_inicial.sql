@@ -0,0 +1,52 @@
+-- Esquema base usado pela API Data. IF NOT EXISTS permite adotar um banco já existente.
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INT NOT NULL AUTO_INCREMENT,
+    nome VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    telefone VARCHAR(20) NOT NULL,
+    senha VARCHAR(255) NOT NULL,
+    correntista TINYINT(1) NOT NULL DEFAULT 1,
+    saldo_cc DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS transacoes (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    email_origin VARCHAR(255) NOT NULL,
+    email_destination VARCHAR(255) NOT NULL,
+    valor DECIMAL(15, 2) NOT NULL,
+    mensagem VARCHAR(255) NULL,
+    create_time DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS invest_client (
+    client_id INT NOT NULL,
+    patrimonio_total DECIMAL(18, 2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS financial_transactions (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    client_id INT NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    ticker VARCHAR(20) NOT NULL,
+    nome_ativo VARCHAR(255) NOT NULL,
+    tipo_ativo VARCHAR(50) NOT NULL,
+    quantidade DECIMAL(20, 8) NOT NULL,
+    valor_investido DECIMAL(18, 2) NOT NULL,
+    valor_atual DECIMAL(18, 4) NOT NULL,
+    rentabilidade DECIMAL(10, 4) NOT NULL,
+    create_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    rota VARCHAR(32) NOT NULL,
+    chave VARCHAR(128) NOT NULL,
+    hash_requisicao CHAR(64) NOT NULL,
+    resposta JSON NOT NULL,
+    create_time DATETIME NOT NULL,
+    PRIMARY KEY (rota, chave),
+    KEY idx_idempotency_create_time (create_time)
+);
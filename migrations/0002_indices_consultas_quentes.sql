@@ -0,0 +1,19 @@
+-- Índices para os filtros das rotas: usuarios por e-mail, transacoes por e-mail
+-- de origem/destino (extrato) e invest_client por client_id.
+
+-- Coluna gerada com o e-mail normalizado: unicidade independente de caixa e
+-- lookup indexado para a reativação (antes WHERE LOWER(email) = %s).
+ALTER TABLE usuarios
+    ADD COLUMN email_normalizado VARCHAR(255) AS (LOWER(email)) STORED,
+    ADD UNIQUE KEY uq_usuarios_email_normalizado (email_normalizado),
+    ADD KEY idx_usuarios_email (email);
+
+ALTER TABLE transacoes
+    ADD KEY idx_transacoes_origem_tempo (email_origin, create_time, id),
+    ADD KEY idx_transacoes_destino_tempo (email_destination, create_time, id);
+
+ALTER TABLE invest_client
+    ADD UNIQUE KEY uq_invest_client_client_id (client_id);
+
+ALTER TABLE financial_transactions
+    ADD KEY idx_financial_transactions_cliente_ticker (client_id, ticker);
@@ -0,0 +1,17 @@
+-- Trilha de auditoria das operações financeiras (mensagem e metadados da
+-- requisição). O ledger continua em transacoes; estas linhas podem ser
+-- gravadas em lote, depois do commit da operação (AUDIT_MODE=async).
+
+CREATE TABLE IF NOT EXISTS auditoria (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    evento VARCHAR(32) NOT NULL,
+    email_origin VARCHAR(255) NOT NULL,
+    email_destination VARCHAR(255) NOT NULL,
+    valor DECIMAL(15, 2) NOT NULL,
+    mensagem VARCHAR(255) NULL,
+    metadados JSON NULL,
+    create_time DATETIME(6) NOT NULL,
+    PRIMARY KEY (id),
+    KEY idx_auditoria_tempo (create_time),
+    KEY idx_auditoria_evento_tempo (evento, create_time)
+);
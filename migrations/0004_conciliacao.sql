@@ -0,0 +1,40 @@
+-- Conciliação incremental do saldo_cc contra o ledger (transacoes).
+-- saldo_snapshots guarda, por conta, o saldo líquido do ledger até o
+-- checkpoint; cada execução só lê as linhas com id acima dele.
+
+CREATE TABLE IF NOT EXISTS saldo_snapshots (
+    email VARCHAR(255) NOT NULL,
+    saldo DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    ate_id BIGINT NOT NULL,
+    PRIMARY KEY (email)
+);
+
+CREATE TABLE IF NOT EXISTS conciliacao_checkpoint (
+    id TINYINT NOT NULL,
+    ultimo_id BIGINT NOT NULL,
+    atualizado_em DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+
+INSERT IGNORE INTO conciliacao_checkpoint (id, ultimo_id, atualizado_em) VALUES (1, 0, NOW());
+
+CREATE TABLE IF NOT EXISTS conciliacao_execucoes (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    de_id BIGINT NOT NULL,
+    ate_id BIGINT NOT NULL,
+    linhas INT NOT NULL,
+    contas INT NOT NULL,
+    divergencias INT NOT NULL,
+    completa TINYINT(1) NOT NULL,
+    segundos DECIMAL(10, 3) NOT NULL,
+    executada_em DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS conciliacao_divergencias (
+    execucao_id BIGINT NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    saldo_cc DECIMAL(15, 2) NOT NULL,
+    esperado DECIMAL(15, 2) NOT NULL,
+    PRIMARY KEY (execucao_id, email)
+);
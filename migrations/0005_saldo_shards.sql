@@ -0,0 +1,10 @@
+-- Contas quentes: créditos espalhados em N linhas por conta (HOT_ACCOUNTS).
+-- Saldo da conta = usuarios.saldo_cc + SUM(saldo_shards.saldo); o job de
+-- consolidação move a soma para saldo_cc e zera os shards.
+
+CREATE TABLE IF NOT EXISTS saldo_shards (
+    usuario_id INT NOT NULL,
+    shard SMALLINT NOT NULL,
+    saldo DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (usuario_id, shard)
+);
@@ -0,0 +1,33 @@
+-- Sharding horizontal de contas (DB_SHARD_HOSTS). O diretório e o log das
+-- transações distribuídas vivem no shard 0 (DB_HOST); as demais tabelas
+-- existem em todos os shards, com o mesmo esquema.
+-- shards: 0
+
+-- Diretório conta -> shard. O id da conta nasce aqui (AUTO_INCREMENT), único
+-- entre os shards; movendo = 1 enquanto o resharding copia a conta.
+CREATE TABLE IF NOT EXISTS mapa_shards (
+    usuario_id INT NOT NULL AUTO_INCREMENT,
+    email_normalizado VARCHAR(255) NOT NULL,
+    shard SMALLINT NOT NULL,
+    movendo TINYINT(1) NOT NULL DEFAULT 0,
+    PRIMARY KEY (usuario_id),
+    UNIQUE KEY uq_mapa_shards_email (email_normalizado)
+);
+
+-- Contas anteriores ao sharding ficam no shard 0
+INSERT IGNORE INTO mapa_shards (usuario_id, email_normalizado, shard)
+SELECT id, email_normalizado, 0 FROM usuarios;
+
+-- Log do coordenador XA: estado = 'confirmando' é o ponto de decisão da
+-- transação distribuída; a recuperação conclui ou desfaz os ramos preparados.
+CREATE TABLE IF NOT EXISTS xa_log (
+    xid VARCHAR(64) NOT NULL,
+    tipo VARCHAR(32) NOT NULL,
+    estado VARCHAR(16) NOT NULL,
+    shards VARCHAR(255) NOT NULL,
+    dados JSON NULL,
+    criado_em DATETIME NOT NULL,
+    atualizado_em DATETIME NOT NULL,
+    PRIMARY KEY (xid),
+    KEY idx_xa_log_estado_tempo (estado, criado_em)
+);
@@ -0,0 +1,21 @@
+-- Outbox das movimentações (OUTBOX_ENABLED=1), em todos os shards. O evento
+-- é gravado na mesma transação do depósito, saque, transferência ou aporte.
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    evento VARCHAR(32) NOT NULL,
+    email_origin VARCHAR(255) NOT NULL,
+    email_destination VARCHAR(255) NOT NULL,
+    valor DECIMAL(15,2) NOT NULL,
+    dados JSON NULL,
+    create_time DATETIME(6) NOT NULL,
+    PRIMARY KEY (id),
+    KEY idx_outbox_tempo (create_time)
+);
+
+-- Posição de cada consumidor: último id do outbox já entregue ao destino dele
+CREATE TABLE IF NOT EXISTS outbox_cursores (
+    consumidor VARCHAR(64) NOT NULL,
+    ultimo_id BIGINT NOT NULL DEFAULT 0,
+    atualizado_em DATETIME NOT NULL,
+    PRIMARY KEY (consumidor)
+);
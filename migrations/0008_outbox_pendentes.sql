@@ -0,0 +1,5 @@
+-- Ids do outbox que o relay pulou por um buraco assentado, por consumidor:
+-- {"<id>": "<visto_em>"}. São conferidos a cada passada até a linha aparecer
+-- ou não restar transação aberta desde que o buraco foi visto.
+ALTER TABLE outbox_cursores
+    ADD COLUMN pendentes JSON NULL;
@@ -1,7 +1,18 @@
-from pydantic import BaseModel, EmailStr, Field, PositiveFloat
+from pydantic import AfterValidator, BaseModel, EmailStr, Field, PlainSerializer, PositiveFloat
 from decimal import Decimal
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, Optional
+
+CENTAVO = Decimal("0.01")
+
+# Valores monetários: Decimal com 2 casas (DECIMAL(15, 2) no banco), ligado
+# direto nos parâmetros SQL e emitido no JSON como string decimal exata.
+Dinheiro = Annotated[
+    Decimal,
+    Field(max_digits=15, decimal_places=2, allow_inf_nan=False),
+    AfterValidator(lambda v: v.quantize(CENTAVO)),
+    PlainSerializer(str, return_type=str, when_used="json"),
+]
 
 class CriarConta(BaseModel):
     nome: str
@@ -31,22 +42,22 @@ class TransacaoDataPayload(BaseModel):
     email_origin: EmailStr
     user_origin_id: int
     email_destination: EmailStr
-    valor: float
+    valor: Dinheiro
     mensagem: Optional[str] = None
     
 class DepositoDBRequest(BaseModel):
     email: EmailStr
-    valor: float
+    valor: Dinheiro
     
 class DepositoDBResponse(BaseModel):
-    saldo_atual: float
+    saldo_atual: Dinheiro
     
 class SaqueDBRequest(BaseModel):
     email: EmailStr
-    valor: float
+    valor: Dinheiro
     
 class SaqueDBResponse(BaseModel):
-    saldo_atual: float
+    saldo_atual: Dinheiro
 
 
 
@@ -60,6 +71,6 @@ class TransactionCreateSchema(BaseModel):
 
     quantidade: Decimal
 
-    valor_investido: Decimal
-    valor_atual: Decimal
-    rentabilidade: Decimal
+    valor_investido: Dinheiro
+    valor_atual: Dinheiro
+    rentabilidade: Dinheiro
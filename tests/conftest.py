@@ -1,7 +1,14 @@
 # tests/conftest.py
+import os
+# Custo mínimo do bcrypt para a suíte não gastar segundos por hash
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Sem rede na suíte: cotações só via FakeProvider configurado no teste
+os.environ.setdefault("QUOTES_PROVIDER", "off")
+
 import pytest
 from fastapi.testclient import TestClient
 from api.main import app
+from api import account_cache
 
 @pytest.fixture
 def client():
@@ -12,3 +19,9 @@ def internal_headers():
     return {
         "X-Internal-Key": "INTERNAL_SECRET"
     }
+
+@pytest.fixture(autouse=True)
+def limpa_cache_contas():
+    account_cache.limpar()
+    yield
+    account_cache.limpar()
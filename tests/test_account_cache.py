@@ -0,0 +1,252 @@
+from unittest.mock import patch, MagicMock
+import json
+
+from api import account_cache, hashing
+from api.account_cache import LocalBackend, SharedBackend
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+def build_db(fetchone=None, rowcount=1):
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchone.return_value = fetchone
+    cursor.rowcount = rowcount
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+def conta_em_cache():
+    account_cache.guardar("Ana@Email.com", {"id": 7, "senha": "x", "correntista": 1})
+
+
+# =========================
+# CACHE
+# =========================
+
+def test_guardar_indexa_por_email_e_id():
+    conta_em_cache()
+
+    assert account_cache.get_por_email("ana@email.com")["id"] == 7
+    assert account_cache.get_por_id(7)["email"] == "ana@email.com"
+
+
+def test_invalidar_por_id_remove_entrada_por_email():
+    conta_em_cache()
+
+    account_cache.invalidar(user_id=7)
+
+    assert account_cache.get_por_email("ana@email.com") is None
+    assert account_cache.get_por_id(7) is None
+
+
+def test_invalidar_por_email_remove_entrada_por_id():
+    conta_em_cache()
+
+    account_cache.invalidar(email="ANA@email.com")
+
+    assert account_cache.get_por_id(7) is None
+
+
+def test_metricas_de_eviccao():
+    backend = LocalBackend(maxsize=2, ttl=30)
+    backend.set("a", 1, 30)
+    backend.set("b", 2, 30)
+    backend.set("c", 3, 30)
+
+    assert backend.get("a") is None
+    assert backend.get("c") == 3
+    stats = backend.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+class ClienteCompartilhado:
+    # Stand-in de um cliente redis: só get/set(ex=)/delete.
+    def __init__(self):
+        self.dados = {}
+        self.ttls = {}
+
+    def get(self, chave):
+        return self.dados.get(chave)
+
+    def set(self, chave, valor, ex=None):
+        self.dados[chave] = valor
+        self.ttls[chave] = ex
+
+    def delete(self, *chaves):
+        for chave in chaves:
+            self.dados.pop(chave, None)
+
+
+def test_backend_compartilhado():
+    cliente = ClienteCompartilhado()
+    anterior = account_cache._backend
+    account_cache.configurar_backend(SharedBackend(cliente, prefix="t:"))
+    try:
+        conta_em_cache()
+        assert json.loads(cliente.dados["t:id:7"])["email"] == "ana@email.com"
+        assert cliente.ttls["t:email:ana@email.com"] == 30
+
+        assert account_cache.get_por_email("ana@email.com")["id"] == 7
+        account_cache.invalidar(user_id=7)
+        assert cliente.dados == {}
+        assert account_cache.get_por_email("ana@email.com") is None
+
+        stats = account_cache.account_cache_stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+    finally:
+        account_cache.configurar_backend(anterior)
+
+
+def test_varios_workers_desligam_o_cache_local():
+    with patch.object(account_cache, "ACCOUNT_CACHE_WORKERS", 4):
+        conta_em_cache()
+        assert account_cache.get_por_email("ana@email.com") is None
+        assert account_cache.account_cache_stats()["habilitado"] is False
+
+        anterior = account_cache._backend
+        account_cache.configurar_backend(SharedBackend(ClienteCompartilhado()))
+        try:
+            conta_em_cache()
+            assert account_cache.get_por_email("ana@email.com")["id"] == 7
+        finally:
+            account_cache.configurar_backend(anterior)
+
+
+def test_backend_compartilhado_indisponivel_vira_miss():
+    cliente = MagicMock()
+    cliente.get.side_effect = ConnectionError("fora do ar")
+    backend = SharedBackend(cliente)
+
+    assert backend.get("email:a@b.com") is None
+    assert backend.stats()["errors"] == 1
+
+
+# =========================
+# LOGIN
+# =========================
+
+def test_login_segunda_chamada_vem_do_cache(client):
+    senha_hash = hashing._gerar("x", hashing.BCRYPT_ROUNDS)
+    conn, cursor = build_db(fetchone={"id": 7, "senha": senha_hash, "correntista": 1})
+
+    with patch("api.execute_routes.get_connection", return_value=conn) as mock_conn:
+        for _ in range(2):
+            response = client.post(
+                "/loginUsuarios",
+                json={"email": "ana@email.com", "senha": "x"},
+                headers=internal_headers
+            )
+            assert response.status_code == 200
+            assert response.json()["id"] == 7
+
+    assert mock_conn.call_count == 1
+    assert cursor.execute.call_count == 1
+
+
+def test_login_conta_suspensa_apos_invalidacao(client):
+    conta_em_cache()
+    conn, _ = build_db()
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        client.put("/updateUsuarios/suspender/7", headers=internal_headers)
+
+    conn, _ = build_db(fetchone={"id": 7, "senha": "x", "correntista": 0})
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.post(
+            "/loginUsuarios",
+            json={"email": "ana@email.com", "senha": "x"},
+            headers=internal_headers
+        )
+
+    assert response.status_code == 403
+
+
+# =========================
+# INVALIDAÇÃO NAS ROTAS DE ESCRITA
+# =========================
+
+def test_update_invalida_cache(client):
+    conta_em_cache()
+    conn, cursor = build_db()
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.put(
+            "/updateUsuarios/7",
+            json={"nome": "Ana", "email": "nova@email.com", "telefone": "1"}
+        )
+
+    assert response.status_code == 200
+    # A existência veio do cache: só o UPDATE foi ao banco
+    assert cursor.execute.call_count == 1
+    assert account_cache.get_por_email("ana@email.com") is None
+
+
+def test_reativar_invalida_cache(client):
+    conta_em_cache()
+    conn, _ = build_db()
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.put(
+            "/updateUsuarios/reativar_por_email/",
+            json={"email": "ana@email.com"},
+            headers=internal_headers
+        )
+
+    assert response.status_code == 200
+    assert account_cache.get_por_id(7) is None
+
+
+def test_deposito_e_saque_invalidam_cache(client):
+    for rota in ("/deposito", "/saque"):
+        conta_em_cache()
+        conn, _ = build_db(fetchone={"id": 7, "saldo_cc": 100})
+
+        with patch("api.execute_routes.get_connection", return_value=conn):
+            response = client.post(
+                rota,
+                json={"email": "ana@email.com", "valor": 10},
+                headers=internal_headers
+            )
+
+        assert response.status_code == 200
+        assert account_cache.get_por_id(7) is None
+
+
+def test_transferencia_invalida_origem_e_destino(client):
+    conta_em_cache()
+    account_cache.guardar("bia@email.com", {"id": 8, "senha": "y", "correntista": 1})
+    conn, cursor = build_db(fetchone={"id": 8})
+    cursor.fetchall.return_value = [
+        {"id": 7, "email": "ana@email.com", "saldo_cc": 100},
+        {"id": 8, "email": "bia@email.com", "saldo_cc": 0},
+    ]
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.post(
+            "/transacoesUsuarios",
+            json={
+                "email_origin": "ana@email.com",
+                "user_origin_id": 7,
+                "email_destination": "bia@email.com",
+                "valor": 10
+            },
+            headers=internal_headers
+        )
+
+    assert response.status_code == 200
+    assert account_cache.get_por_id(7) is None
+    assert account_cache.get_por_id(8) is None
+
+
+def test_stats_expoe_cache_de_contas(client):
+    antes = account_cache.account_cache_stats()["hits"]
+    conta_em_cache()
+    account_cache.get_por_email("ana@email.com")
+
+    with patch("api.execute_routes.pool_stats", return_value={}):
+        response = client.get("/internal/stats", headers=internal_headers)
+
+    assert response.status_code == 200
+    assert response.json()["contas"]["hits"] == antes + 1
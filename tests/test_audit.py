@@ -0,0 +1,298 @@
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+from api import audit
+from api.audit import AuditWriter, AUDIT_INSERT
+from api.migrations import carregar_migracoes, MIGRATIONS_DIR
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+class BancoFalso:
+    # Conexões que registram os lotes gravados e quantos commits houve
+    def __init__(self, falhas=0, bloqueio=None):
+        self.lotes = []
+        self.commits = 0
+        self.falhas = falhas
+        self.bloqueio = bloqueio
+        self._lock = threading.Lock()
+
+    def conectar(self):
+        if self.bloqueio is not None:
+            self.bloqueio.wait(5)
+        with self._lock:
+            if self.falhas:
+                self.falhas -= 1
+                raise ConnectionError("RDS indisponível")
+        conn = MagicMock()
+        conn.cursor.return_value.executemany.side_effect = lambda sql, linhas: self.lotes.append(list(linhas))
+
+        def commit():
+            with self._lock:
+                self.commits += 1
+        conn.commit.side_effect = commit
+        return conn
+
+    @property
+    def linhas(self):
+        return [linha for lote in self.lotes for linha in lote]
+
+
+def gravadas(chamada):
+    # Linhas como chegaram ao executemany, sem o atraso do create_time
+    sql, linhas = chamada.args
+    return sql, [linha[:-1] for linha in linhas]
+
+
+def registros(n, evento="deposito"):
+    return [audit.registro(evento, "DEPOSITO", f"u{i}@x.com", Decimal("1.00")) for i in range(n)]
+
+
+# =========================
+# MODOS
+# =========================
+
+def test_modo_off_nao_grava():
+    cursor = MagicMock()
+
+    with patch.object(audit, "AUDIT_MODE", "off"):
+        assert audit.registrar(cursor, registros(2)) == []
+
+    cursor.executemany.assert_not_called()
+
+
+def test_modo_off_ignora_eventos_duraveis_sem_pedido_explicito():
+    cursor = MagicMock()
+    saques = registros(1, evento="saque")
+
+    with patch.object(audit, "AUDIT_MODE", "off"), \
+         patch.object(audit, "AUDIT_DURABLE_EVENTS", {"saque"}):
+        assert audit.registrar(cursor, saques) == []
+        cursor.executemany.assert_not_called()
+
+        assert audit.registrar(cursor, saques, duravel=True) == []
+
+    assert gravadas(cursor.executemany.call_args) == (AUDIT_INSERT, [l[:-1] for l in saques])
+
+
+def test_modo_sync_grava_na_transacao():
+    cursor = MagicMock()
+    linhas = registros(2)
+
+    with patch.object(audit, "AUDIT_MODE", "sync"):
+        assert audit.registrar(cursor, linhas) == []
+
+    cursor.executemany.assert_called_once()
+    assert gravadas(cursor.executemany.call_args) == (AUDIT_INSERT, [l[:-1] for l in linhas])
+
+
+def test_modo_async_adia_exceto_duraveis():
+    cursor = MagicMock()
+    depositos = registros(2)
+    saques = registros(1, evento="saque")
+
+    with patch.object(audit, "AUDIT_MODE", "async"), \
+         patch.object(audit, "AUDIT_DURABLE_EVENTS", {"saque"}):
+        assert audit.registrar(cursor, depositos + saques) == depositos
+        assert audit.registrar(cursor, depositos, duravel=True) == []
+
+    assert gravadas(cursor.executemany.call_args_list[0]) == (AUDIT_INSERT, [l[:-1] for l in saques])
+    assert gravadas(cursor.executemany.call_args_list[1]) == (AUDIT_INSERT, [l[:-1] for l in depositos])
+
+
+def test_registro_guarda_metadados_e_horario_da_operacao():
+    linha = audit.registro("saque", "a@a.com", "SAQUE", Decimal("5.00"), "Saque", {"ip": "10.0.0.1"})
+
+    assert linha[:5] == ("saque", "a@a.com", "SAQUE", Decimal("5.00"), "Saque")
+    assert json.loads(linha[5]) == {"ip": "10.0.0.1"}
+    assert linha[6] is not None
+
+
+def test_horario_vem_do_banco_descontando_a_espera():
+    cursor = MagicMock()
+
+    with patch("api.insercao.time.monotonic", return_value=100.0):
+        linha = audit.registro("deposito", "DEPOSITO", "a@a.com", Decimal("1.00"))
+    # Gravada 1,5 s depois (modo async): NOW(6) menos o tempo na fila
+    with patch("api.insercao.time.monotonic", return_value=101.5):
+        with patch.object(audit, "AUDIT_MODE", "sync"):
+            audit.registrar(cursor, [linha])
+
+    assert "NOW(6) - INTERVAL %s MICROSECOND" in AUDIT_INSERT
+    [gravada] = cursor.executemany.call_args.args[1]
+    assert gravada[-1] == 1_500_000
+
+
+# =========================
+# WRITER
+# =========================
+
+def test_group_commit_por_tamanho():
+    banco = BancoFalso()
+    writer = AuditWriter(banco.conectar, batch_size=250, intervalo=1)
+
+    for i in range(0, 1000, 100):
+        writer.enfileirar(registros(100))
+    assert writer.flush(timeout=5)
+    writer.fechar()
+
+    assert len(banco.linhas) == 1000
+    assert banco.commits == len(banco.lotes) <= 10
+    assert max(len(lote) for lote in banco.lotes) == 250
+    assert writer.stats()["gravados"] == 1000
+
+
+def test_group_commit_por_tempo():
+    banco = BancoFalso()
+    writer = AuditWriter(banco.conectar, batch_size=1000, intervalo=0.05)
+
+    writer.enfileirar(registros(3))
+    assert writer.flush(timeout=2)
+    writer.fechar()
+
+    assert [len(lote) for lote in banco.lotes] == [3]
+
+
+def test_falha_repete_e_depois_descarta():
+    banco = BancoFalso(falhas=1)
+    writer = AuditWriter(banco.conectar, batch_size=10, intervalo=0, tentativas=2)
+    writer.enfileirar(registros(2))
+    assert writer.flush(timeout=2)
+    assert len(banco.linhas) == 2
+
+    banco.falhas = 5
+    writer.enfileirar(registros(1))
+    assert writer.flush(timeout=2)
+    writer.fechar()
+
+    stats = writer.stats()
+    assert stats["descartados"] == 1
+    assert stats["falhas"] == 3
+
+
+def test_desligamento_grava_o_que_ficou_na_fila():
+    banco = BancoFalso()
+    writer = AuditWriter(banco.conectar, batch_size=10_000, intervalo=60)
+
+    writer.enfileirar(registros(5))
+    inicio = time.perf_counter()
+    assert writer.fechar(timeout=5)
+
+    assert time.perf_counter() - inicio < 2
+    assert len(banco.linhas) == 5
+    # Fechado, recusa: quem publica grava na própria conexão
+    assert len(writer.enfileirar(registros(1))) == 1
+
+
+def test_fila_cheia_grava_na_conexao_da_requisicao():
+    bloqueio = threading.Event()
+    banco = BancoFalso(bloqueio=bloqueio)
+    writer = AuditWriter(banco.conectar, batch_size=1, intervalo=0, max_fila=2)
+    conn = MagicMock()
+
+    try:
+        with patch.object(audit, "_writer", writer):
+            # Um lote preso no banco e a fila com duas linhas
+            audit.publicar(conn, registros(1))
+            time.sleep(0.2)
+            audit.publicar(conn, registros(4))
+    finally:
+        bloqueio.set()
+        writer.fechar()
+
+    gravadas_na_hora = conn.cursor.return_value.executemany.call_args.args[1]
+    assert len(gravadas_na_hora) == 2
+    conn.commit.assert_called_once()
+    assert len(banco.linhas) == 3
+    assert writer.stats()["recusados"] == 2
+
+
+# =========================
+# ROTAS
+# =========================
+
+def deposito(client, conn, modo, writer=None):
+    with patch.object(audit, "AUDIT_MODE", modo), \
+         patch.object(audit, "_writer", writer), \
+         patch("api.execute_routes.get_connection", return_value=conn):
+        return client.post(
+            "/deposito",
+            json={"email": "a@a.com", "valor": 10},
+            headers={**internal_headers, "User-Agent": "teste"}
+        )
+
+
+def conexao():
+    conn = MagicMock()
+    conn.cursor.return_value.fetchone.return_value = {"saldo_cc": Decimal("100.00")}
+    return conn
+
+
+def test_deposito_sync_audita_antes_do_commit(client):
+    conn = conexao()
+    ordem = []
+    conn.cursor.return_value.executemany.side_effect = lambda sql, linhas: ordem.append("auditoria")
+    conn.commit.side_effect = lambda: ordem.append("commit")
+
+    assert deposito(client, conn, "sync").status_code == 200
+
+    assert ordem == ["auditoria", "commit"]
+    [linha] = conn.cursor.return_value.executemany.call_args.args[1]
+    assert linha[0] == "deposito"
+    assert json.loads(linha[5])["user_agent"] == "teste"
+
+
+def test_deposito_async_enfileira_depois_do_commit(client):
+    banco = BancoFalso()
+    writer = AuditWriter(banco.conectar, batch_size=100, intervalo=0.01)
+    conn = conexao()
+
+    try:
+        assert deposito(client, conn, "async", writer).status_code == 200
+        assert writer.flush(timeout=2)
+    finally:
+        writer.fechar()
+
+    conn.cursor.return_value.executemany.assert_not_called()
+    conn.commit.assert_called_once()
+    [linha] = banco.linhas
+    assert linha[:4] == ("deposito", "DEPOSITO", "a@a.com", Decimal("10.00"))
+
+
+def test_deposito_com_erro_nao_publica(client):
+    writer = MagicMock()
+    conn = conexao()
+    conn.cursor.return_value.fetchone.return_value = None
+
+    assert deposito(client, conn, "async", writer).status_code == 404
+
+    writer.enfileirar.assert_not_called()
+
+
+def test_migracao_da_tabela_de_auditoria():
+    sql = dict((v, s) for v, _, s in carregar_migracoes(MIGRATIONS_DIR))[3]
+    assert "CREATE TABLE IF NOT EXISTS auditoria" in sql
+
+
+# =========================
+# BENCHMARK – COMMITS
+# =========================
+
+def test_benchmark_commits_sync_vs_async():
+    n = 5000
+    banco = BancoFalso()
+    writer = AuditWriter(banco.conectar, batch_size=500, intervalo=0.05)
+
+    inicio = time.perf_counter()
+    for i in range(n):
+        writer.enfileirar(registros(1))
+    assert writer.flush(timeout=10)
+    decorrido = time.perf_counter() - inicio
+    writer.fechar()
+
+    print(f"\nauditoria: {n} eventos, {banco.commits} commits em lote (sync: {n}) em {decorrido:.2f}s")
+    assert len(banco.linhas) == n
+    assert banco.commits <= n // 50
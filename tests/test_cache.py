@@ -0,0 +1,61 @@
+from api.cache import TTLCache
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def test_get_set_e_estatisticas():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_expira_pelo_ttl():
+    relogio = Relogio()
+    cache = TTLCache(maxsize=2, ttl=10, clock=relogio)
+    cache.set("a", 1)
+
+    relogio.agora = 10
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_ttl_por_entrada():
+    relogio = Relogio()
+    cache = TTLCache(maxsize=2, ttl=10, clock=relogio)
+    cache.set("a", 1, ttl=1)
+
+    relogio.agora = 2
+    assert cache.get("a") is None
+
+
+def test_remove_o_menos_usado():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_delete_e_clear():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+
+    assert cache.delete("a") is True
+    assert cache.delete("a") is False
+    cache.set("b", 2)
+    cache.clear()
+    assert len(cache) == 0
@@ -2,13 +2,64 @@
 import pytest
 import importlib
 from mysql.connector import Error
-from unittest.mock import patch
+from fastapi.testclient import TestClient
+from unittest.mock import patch, MagicMock
 
-def test_connection_pool_error_on_import():
+import api.connection
+from api.main import app
+
+
+@pytest.fixture
+def fresh_connection():
+    api.connection.close_pool(timeout=0)
+    yield api.connection
+    api.connection.close_pool(timeout=0)
+
+
+def test_import_nao_conecta():
+    with patch("mysql.connector.connect") as connect:
+        importlib.reload(api.connection)
+
+    connect.assert_not_called()
+
+
+def test_connection_pool_error_on_init(fresh_connection):
     with patch(
-        "mysql.connector.pooling.MySQLConnectionPool",
+        "mysql.connector.connect",
         side_effect=Error("Erro de conexão")
     ):
         with pytest.raises(Error):
-            import api.connection
-            importlib.reload(api.connection)
+            fresh_connection.init_pool()
+
+
+def test_pool_criado_sob_demanda_por_processo(fresh_connection):
+    with patch("mysql.connector.connect", return_value=MagicMock()) as connect:
+        pool = fresh_connection.get_pool()
+        assert fresh_connection.get_pool() is pool
+        connect.assert_not_called()
+
+        with patch("api.connection.os.getpid", return_value=-1):
+            assert fresh_connection.get_pool() is not pool
+
+
+def test_close_pool_drena_conexoes(fresh_connection):
+    cnx = MagicMock()
+    cnx.in_transaction = False
+
+    with patch("mysql.connector.connect", return_value=cnx):
+        fresh_connection.init_pool()
+        conn = fresh_connection.get_connection()
+        conn.close()
+        fresh_connection.close_pool()
+
+    cnx.close.assert_called_once()
+
+
+def test_lifespan_abre_e_drena_pool():
+    with patch("api.main.init_pool") as init_pool, \
+         patch("api.main.close_pool") as close_pool:
+        with TestClient(app):
+            init_pool.assert_called_once()
+            close_pool.assert_not_called()
+
+    close_pool.assert_called_once()
@@ -20,4 +20,4 @@ def test_realizar_deposito_sucesso(client):
         )
 
         assert response.status_code == 200
-        assert response.json()["saldo_atual"] == 200
+        assert response.json()["saldo_atual"] == "200.00"
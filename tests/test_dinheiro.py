@@ -0,0 +1,87 @@
+import json
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+import pytest
+from pydantic import ValidationError
+
+from schemas.schemas import DepositoDBRequest, DepositoDBResponse, TransacaoDataPayload, TransactionCreateSchema
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+# =========================
+# TIPO DINHEIRO
+# =========================
+
+def test_valor_vira_decimal_com_duas_casas():
+    assert DepositoDBRequest(email="a@a.com", valor=10).valor == Decimal("10.00")
+    assert DepositoDBRequest(email="a@a.com", valor=0.1).valor == Decimal("0.10")
+    assert DepositoDBRequest(email="a@a.com", valor="19.9").valor == Decimal("19.90")
+
+
+@pytest.mark.parametrize("valor", ["10.005", "NaN", "Infinity", "1e20"])
+def test_valor_invalido(valor):
+    with pytest.raises(ValidationError):
+        DepositoDBRequest(email="a@a.com", valor=valor)
+
+
+def test_json_emite_string_decimal_exata():
+    resposta = DepositoDBResponse(saldo_atual=Decimal("150.10"))
+
+    assert json.loads(resposta.model_dump_json()) == {"saldo_atual": "150.10"}
+    assert resposta.model_dump()["saldo_atual"] == Decimal("150.10")
+
+
+def test_soma_exata_sem_float():
+    # 0.1 + 0.2 em float é 0.30000000000000004
+    itens = [TransacaoDataPayload(
+        email_origin="a@a.com", user_origin_id=1, email_destination="b@b.com", valor=v
+    ) for v in (0.1, 0.2)]
+
+    assert sum(i.valor for i in itens) == Decimal("0.30")
+
+
+def test_investimento_usa_dinheiro():
+    dados = {
+        "client_id": 1, "email": "a@a.com", "ticker": "PETR4", "nome_ativo": "P", "tipo_ativo": "acao",
+        "quantidade": "1", "valor_investido": "10", "valor_atual": 0.1, "rentabilidade": "2.5"
+    }
+    transacao = TransactionCreateSchema(**dados)
+
+    assert (transacao.valor_atual, transacao.rentabilidade) == (Decimal("0.10"), Decimal("2.50"))
+    assert json.loads(transacao.model_dump_json())["valor_atual"] == "0.10"
+
+
+# =========================
+# ROTAS
+# =========================
+
+def test_deposito_liga_decimal_no_sql(client):
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchone.return_value = {"id": 1, "saldo_cc": Decimal("0.10")}
+    conn.cursor.return_value = cursor
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.post(
+            "/deposito",
+            json={"email": "a@a.com", "valor": 0.2},
+            headers=internal_headers
+        )
+
+    assert response.status_code == 200
+    assert response.json() == {"saldo_atual": "0.30"}
+    update = cursor.execute.call_args_list[1][0][1]
+    assert update[0] == Decimal("0.20")
+    assert isinstance(update[0], Decimal)
+
+
+def test_deposito_com_centavos_fracionados_422(client):
+    response = client.post(
+        "/deposito",
+        json={"email": "a@a.com", "valor": 10.001},
+        headers=internal_headers
+    )
+
+    assert response.status_code == 422
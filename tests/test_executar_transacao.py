@@ -5,6 +5,12 @@ def test_executar_transacao(client):
         mock_db = MagicMock()
         mock_cursor = MagicMock()
 
+        mock_cursor.fetchone.return_value = {"id": 2}
+        mock_cursor.fetchall.return_value = [
+            {"id": 1, "email": "a@a.com", "saldo_cc": 500},
+            {"id": 2, "email": "b@b.com", "saldo_cc": 0}
+        ]
+
         mock_db.cursor.return_value = mock_cursor
         mock_conn.return_value = mock_db
 
@@ -22,3 +28,4 @@ def test_executar_transacao(client):
 
         assert response.status_code == 200
         assert response.json()["status"] == "ok"
+        mock_db.commit.assert_called_once()
@@ -0,0 +1,113 @@
+# Verifica com EXPLAIN, em um MySQL real, que as consultas quentes das rotas usam índice.
+# Requer TEST_DB_HOST, TEST_DB_USER, TEST_DB_PASSWORD e TEST_DB_NAME (banco descartável).
+import os
+from datetime import datetime
+import pytest
+import mysql.connector
+
+from api import execute_routes as rotas, idempotency, transfers
+from api.migrations import aplicar_migracoes
+from api.statement import statement_query
+
+pytestmark = pytest.mark.skipif(
+    not os.getenv("TEST_DB_HOST"),
+    reason="TEST_DB_HOST não configurado"
+)
+
+USUARIOS = 300
+TRANSACOES = 3000
+
+# O SQL vem das próprias rotas: se uma consulta mudar e perder o índice, o teste falha
+CONSULTAS = {
+    "login": (rotas.LOGIN_SQL, ("u1@x.com",)),
+    "existe_usuario": (rotas.USUARIO_EXISTE_SQL, (1,)),
+    "suspender": (rotas.SUSPENDER_SQL, (1,)),
+    "reativar": (rotas.REATIVAR_SQL, ("u1@x.com",)),
+    "deposito_saldo_com_lock": (rotas.DEPOSITO_LOCK_SQL, ("u1@x.com",)),
+    "deposito_conta_quente": (rotas.DEPOSITO_QUENTE_SQL, ("u1@x.com",)),
+    "saque_saldo_com_lock": (rotas.SAQUE_LOCK_SQL, ("u1@x.com",)),
+    "deposito": (rotas.DEPOSITO_SALDO_SQL, (1, "u1@x.com")),
+    "saque": (rotas.SAQUE_SALDO_SQL, (1, "u1@x.com", 1)),
+    "destino_transferencia": (transfers.DESTINO_SQL, ("u2@x.com",)),
+    "lock_contas": (transfers.lock_sql(2), (1, 2)),
+    "destinos_lote": (transfers.destinos_sql(2), ("u1@x.com", "u2@x.com")),
+    "saldos_transferencia": (transfers.SALDOS_TRANSFERENCIA_SQL, (1, -1, 2, 1, 1, 2)),
+    "idempotencia": (idempotency.BUSCAR_SQL, ("deposito", "k1", 86400)),
+    "patrimonio": (rotas.PATRIMONIO_SQL, (1, 1)),
+    "extrato_primeira_pagina": statement_query("u1@x.com", limite=51),
+    "extrato_pagina_seguinte": statement_query("u1@x.com", apos=(datetime(2030, 1, 1), 10**9), limite=51),
+}
+
+# INSERTs não buscam por índice: o EXPLAIN só confere o texto contra o esquema migrado
+GRAVACOES = {
+    "ledger": (transfers.LEDGER_INSERT, ("u1@x.com", "u2@x.com", 1, "Transferência")),
+}
+
+
+@pytest.fixture(scope="module")
+def conn():
+    conn = mysql.connector.connect(
+        host=os.getenv("TEST_DB_HOST"),
+        user=os.getenv("TEST_DB_USER"),
+        password=os.getenv("TEST_DB_PASSWORD"),
+        database=os.getenv("TEST_DB_NAME"),
+        port=int(os.getenv("TEST_DB_PORT", "3306"))
+    )
+    aplicar_migracoes(conn)
+    _popular(conn)
+    yield conn
+    conn.close()
+
+
+def _popular(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM usuarios")
+    if cursor.fetchone()[0] >= USUARIOS:
+        cursor.close()
+        return
+
+    cursor.executemany(
+        "INSERT INTO usuarios (nome, email, telefone, senha, saldo_cc) VALUES (%s, %s, %s, %s, %s)",
+        [(f"U{i}", f"u{i}@x.com", "1", "x", 100) for i in range(1, USUARIOS + 1)]
+    )
+    cursor.executemany(
+        "INSERT INTO transacoes (email_origin, email_destination, valor, mensagem, create_time) "
+        "VALUES (%s, %s, %s, %s, NOW())",
+        [(f"u{i % USUARIOS + 1}@x.com", f"u{(i + 1) % USUARIOS + 1}@x.com", 1, "seed") for i in range(TRANSACOES)]
+    )
+    cursor.executemany(
+        "INSERT INTO invest_client (client_id, patrimonio_total) VALUES (%s, %s)",
+        [(i, 0) for i in range(1, USUARIOS + 1)]
+    )
+    conn.commit()
+    cursor.execute("ANALYZE TABLE usuarios, transacoes, invest_client, idempotency_keys")
+    cursor.fetchall()
+    cursor.close()
+
+
+@pytest.mark.parametrize("nome", sorted(CONSULTAS))
+def test_consulta_usa_indice(conn, nome):
+    sql, params = CONSULTAS[nome]
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("EXPLAIN " + sql, params)
+    plano = cursor.fetchall()
+    cursor.close()
+
+    tabelas = [linha for linha in plano if linha["table"] and not linha["table"].startswith("<")]
+    assert tabelas, plano
+    for linha in tabelas:
+        if linha.get("Extra") and "no matching row" in linha["Extra"]:
+            continue
+        assert linha["key"] is not None, f"{nome}: {linha}"
+        assert linha["type"] != "ALL", f"{nome}: {linha}"
+
+
+@pytest.mark.parametrize("nome", sorted(GRAVACOES))
+def test_gravacao_confere_com_o_esquema(conn, nome):
+    sql, params = GRAVACOES[nome]
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("EXPLAIN " + sql, params)
+    plano = cursor.fetchall()
+    cursor.close()
+
+    assert plano, nome
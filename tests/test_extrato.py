@@ -0,0 +1,132 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+from api.statement import encode_cursor, decode_cursor, statement_query
+
+INICIO = datetime(2025, 1, 1, 12, 0, 0)
+
+
+def linha(i, origem="a@a.com", destino="b@b.com"):
+    return {
+        "id": i,
+        "email_origin": origem,
+        "email_destination": destino,
+        "valor": Decimal("10.50"),
+        "mensagem": f"m{i}",
+        "create_time": INICIO - timedelta(minutes=i),
+    }
+
+
+def build_db(fetchall=None, lotes=None):
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchall.return_value = fetchall or []
+    cursor.fetchmany.side_effect = lotes or [[]]
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+# ============================
+# CURSOR / SQL
+# ============================
+
+def test_cursor_ida_e_volta():
+    cursor = encode_cursor(INICIO, 42)
+    assert decode_cursor(cursor) == (INICIO, 42)
+
+
+def test_cursor_invalido(client, internal_headers):
+    res = client.get("/extrato/a@a.com?cursor=lixo", headers=internal_headers)
+    assert res.status_code == 400
+
+
+def test_query_keyset_sem_offset():
+    sql, params = statement_query("a@a.com", apos=(INICIO, 7), limite=11)
+
+    assert "OFFSET" not in sql
+    assert "UNION ALL" in sql
+    assert sql.count("create_time < %s OR (create_time = %s AND id < %s)") == 2
+    assert params == (
+        "a@a.com", INICIO, INICIO, 7, 11,
+        "a@a.com", "a@a.com", INICIO, INICIO, 7, 11,
+        11
+    )
+
+
+# ============================
+# PAGINAÇÃO
+# ============================
+
+def test_primeira_pagina_com_proximo_cursor(client, internal_headers):
+    conn, cursor = build_db(fetchall=[linha(1), linha(2), linha(3, origem="DEPOSITO", destino="a@a.com")])
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.get("/extrato/A@a.com?limit=2", headers=internal_headers)
+
+    corpo = res.json()
+    assert res.status_code == 200
+    assert [i["id"] for i in corpo["itens"]] == [1, 2]
+    assert corpo["itens"][0]["tipo"] == "debito"
+    assert corpo["itens"][0]["valor"] == "10.50"
+    assert decode_cursor(corpo["proximo_cursor"]) == (linha(2)["create_time"], 2)
+    assert cursor.execute.call_args.args[1][-1] == 3  # limit + 1
+    conn.close.assert_called_once()
+
+
+def test_ultima_pagina_sem_cursor(client, internal_headers):
+    conn, _ = build_db(fetchall=[linha(5, origem="DEPOSITO", destino="a@a.com")])
+    proximo = encode_cursor(INICIO, 4)
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.get(f"/extrato/a@a.com?limit=2&cursor={proximo}", headers=internal_headers)
+
+    corpo = res.json()
+    assert corpo["proximo_cursor"] is None
+    assert corpo["itens"][0]["tipo"] == "credito"
+
+
+def test_extrato_header_invalido(client):
+    res = client.get("/extrato/a@a.com", headers={"X-Internal-Key": "ERRADO"})
+    assert res.status_code == 403
+
+
+# ============================
+# EXPORTAÇÃO EM STREAMING
+# ============================
+
+def test_exportar_ndjson_em_lotes(client, internal_headers):
+    conn, cursor = build_db(lotes=[[linha(1), linha(2)], [linha(3)], []])
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.get("/extrato/a@a.com/exportar", headers=internal_headers)
+
+    linhas = [json.loads(l) for l in res.text.splitlines()]
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    assert [l["id"] for l in linhas] == [1, 2, 3]
+    assert linhas[0]["valor"] == "10.50"
+    assert cursor.fetchmany.call_count == 3
+    conn.cursor.assert_called_once_with(dictionary=True, buffered=False)
+    assert "ASC" in cursor.execute.call_args.args[0]
+    conn.close.assert_called_once()
+
+
+def test_exportar_csv_com_cabecalho(client, internal_headers):
+    conn, _ = build_db(lotes=[[linha(1)], []])
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.get("/extrato/a@a.com/exportar?formato=csv", headers=internal_headers)
+
+    linhas = res.text.splitlines()
+    assert linhas[0] == "id,tipo,email_origin,email_destination,valor,mensagem,create_time"
+    assert linhas[1].startswith("1,debito,a@a.com,b@b.com,10.50,m1,")
+
+
+def test_exportar_csv_vazio_tem_cabecalho(client, internal_headers):
+    conn, _ = build_db(lotes=[[]])
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.get("/extrato/a@a.com/exportar?formato=csv", headers=internal_headers)
+
+    assert res.text.splitlines() == ["id,tipo,email_origin,email_destination,valor,mensagem,create_time"]
@@ -0,0 +1,168 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from unittest.mock import patch, MagicMock
+
+from api import hashing
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+def build_db(fetchone=None):
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchone.return_value = fetchone
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+# =========================
+# SERVIÇO DE HASHING
+# =========================
+
+def test_gerar_e_verificar():
+    senha_hash = asyncio.run(hashing.gerar_hash("segredo"))
+
+    assert hashing.is_bcrypt(senha_hash)
+    assert hashing.custo(senha_hash) == hashing.BCRYPT_ROUNDS
+    assert asyncio.run(hashing.verificar("segredo", senha_hash)) == (True, None)
+    assert asyncio.run(hashing.verificar("errada", senha_hash)) == (False, None)
+
+
+def test_senha_legada_em_texto_puro_e_migrada():
+    confere, novo_hash = asyncio.run(hashing.verificar("antiga", "antiga"))
+
+    assert confere
+    assert hashing.is_bcrypt(novo_hash)
+    assert asyncio.run(hashing.verificar("outra", "antiga")) == (False, None)
+
+
+def test_rehash_quando_custo_aumenta():
+    antigo = hashing._gerar("segredo", 4)
+
+    with patch("api.hashing.BCRYPT_ROUNDS", 5):
+        confere, novo_hash = asyncio.run(hashing.verificar("segredo", antigo))
+
+    assert confere
+    assert hashing.custo(novo_hash) == 5
+
+
+def test_senha_acima_de_72_bytes():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(hashing.gerar_hash("a" * 73))
+
+    assert exc.value.status_code == 400
+
+
+def test_contrapressao_rejeita_com_503():
+    with patch("api.hashing.HASH_MAX_PENDING", 0):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(hashing.gerar_hash("segredo"))
+
+    assert exc.value.status_code == 503
+    assert exc.value.headers["Retry-After"] == "1"
+    assert hashing.hashing_stats()["pendentes"] == 0
+
+
+def test_hash_nao_bloqueia_event_loop():
+    async def cenario():
+        batidas = 0
+        parar = asyncio.Event()
+
+        async def heartbeat():
+            nonlocal batidas
+            while not parar.is_set():
+                batidas += 1
+                await asyncio.sleep(0.005)
+
+        tarefa = asyncio.create_task(heartbeat())
+        with patch("api.hashing.BCRYPT_ROUNDS", 10):
+            await hashing.gerar_hash("segredo")
+        parar.set()
+        await tarefa
+        return batidas
+
+    # Aquece o pool para não medir o fork dos workers
+    asyncio.run(hashing.gerar_hash("aquecimento"))
+    assert asyncio.run(cenario()) >= 3
+
+
+# =========================
+# ROTAS
+# =========================
+
+def test_criar_usuario_grava_hash(client):
+    conn, cursor = build_db()
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.post(
+            "/usuarios",
+            json={"nome": "Ana", "email": "ana@email.com", "telefone": "1", "senha": "segredo"}
+        )
+
+    assert response.status_code == 200
+    gravada = cursor.execute.call_args[0][1][3]
+    assert gravada != "segredo"
+    assert hashing._conferir("segredo", gravada)
+
+
+def test_update_grava_hash(client):
+    conn, cursor = build_db(fetchone={"id": 1})
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.put(
+            "/updateUsuarios/1",
+            json={"nome": "Ana", "email": "ana@email.com", "telefone": "1", "senha": "nova"}
+        )
+
+    assert response.status_code == 200
+    valores = cursor.execute.call_args[0][1]
+    assert "nova" not in valores
+    assert hashing._conferir("nova", valores[3])
+
+
+def test_login_senha_errada_401(client):
+    senha_hash = hashing._gerar("certa", hashing.BCRYPT_ROUNDS)
+    conn, _ = build_db(fetchone={"id": 1, "senha": senha_hash, "correntista": 1})
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.post(
+            "/loginUsuarios",
+            json={"email": "ana@email.com", "senha": "errada"},
+            headers=internal_headers
+        )
+
+    assert response.status_code == 401
+
+
+def test_login_legado_regrava_hash(client):
+    conn, cursor = build_db(fetchone={"id": 1, "senha": "antiga", "correntista": 1})
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.post(
+            "/loginUsuarios",
+            json={"email": "ana@email.com", "senha": "antiga"},
+            headers=internal_headers
+        )
+
+    assert response.status_code == 200
+    sql, params = cursor.execute.call_args[0]
+    assert "UPDATE usuarios SET senha" in sql
+    assert params[1:] == (1, "antiga")
+    assert response.json()["senha"] == params[0]
+    conn.commit.assert_called_once()
+
+
+def test_login_sobrecarregado_503(client):
+    senha_hash = hashing._gerar("certa", hashing.BCRYPT_ROUNDS)
+    conn, _ = build_db(fetchone={"id": 1, "senha": senha_hash, "correntista": 1})
+
+    with patch("api.execute_routes.get_connection", return_value=conn), \
+         patch("api.hashing.HASH_MAX_PENDING", 0):
+        response = client.post(
+            "/loginUsuarios",
+            json={"email": "ana@email.com", "senha": "certa"},
+            headers=internal_headers
+        )
+
+    assert response.status_code == 503
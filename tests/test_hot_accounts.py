@@ -0,0 +1,336 @@
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+from api import hot_accounts, reconciliation
+from api.execute_routes import _realizar_deposito
+from api.hot_accounts import Consolidador, consolidar_todas
+from api.migrations import carregar_migracoes, MIGRATIONS_DIR
+from api.transfers import executar_transferencia
+from schemas.schemas import DepositoDBRequest, TransacaoDataPayload
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+LOJA = "loja@x.com"
+
+
+class BancoComLocks:
+    # Linhas em memória com lock exclusivo mantido até o commit, como no
+    # InnoDB; cada comando custa um round trip de `latencia` segundos.
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.contas = {LOJA: {"id": 1, "saldo_cc": Decimal("0.00")}}
+        self.shards = {}
+        self.ledger = []
+        self.bloqueadas = []
+        self._locks = {}
+        self._guarda = threading.Lock()
+
+    def conexao(self, **kwargs):
+        return ConexaoFalsa(self)
+
+    def lock(self, chave):
+        with self._guarda:
+            lock = self._locks.setdefault(chave, threading.Lock())
+            self.bloqueadas.append(chave)
+        return lock
+
+    def saldo_total(self, email=LOJA):
+        conta = self.contas[email]
+        return conta["saldo_cc"] + sum(v for (uid, _), v in self.shards.items() if uid == conta["id"])
+
+
+class ConexaoFalsa:
+
+    def __init__(self, banco):
+        self.banco = banco
+        self.autocommit = True
+        self.locks = {}
+
+    def cursor(self, **kwargs):
+        return CursorFalso(self)
+
+    def bloquear(self, chave):
+        if chave not in self.locks:
+            lock = self.banco.lock(chave)
+            lock.acquire()
+            self.locks[chave] = lock
+
+    def commit(self):
+        time.sleep(self.banco.latencia)
+        self.rollback()
+
+    def rollback(self):
+        for lock in self.locks.values():
+            lock.release()
+        self.locks = {}
+
+    def close(self):
+        self.rollback()
+
+
+class CursorFalso:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.banco = conn.banco
+        self.linhas = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        time.sleep(self.banco.latencia)
+        sql = " ".join(sql.split())
+        banco = self.banco
+        self.linhas, self.rowcount = [], 1
+        conta_por_id = {c["id"]: (e, c) for e, c in banco.contas.items()}
+
+        if sql.startswith("SELECT") and "FROM usuarios WHERE email = %s" in sql:
+            if "FOR UPDATE" in sql:
+                self.conn.bloquear(("usuarios", params[0]))
+            conta = banco.contas.get(params[0])
+            self.linhas = [dict(conta)] if conta else []
+        elif sql.startswith("UPDATE usuarios SET saldo_cc = saldo_cc + %s WHERE email"):
+            self.conn.bloquear(("usuarios", params[1]))
+            banco.contas[params[1]]["saldo_cc"] += params[0]
+        elif sql.startswith("UPDATE usuarios SET saldo_cc = saldo_cc - %s WHERE email"):
+            self.conn.bloquear(("usuarios", params[1]))
+            conta = banco.contas[params[1]]
+            self.rowcount = int(conta["saldo_cc"] >= params[2])
+            if self.rowcount:
+                conta["saldo_cc"] -= params[0]
+        elif sql.startswith("SELECT id FROM usuarios WHERE id = %s FOR UPDATE"):
+            self.conn.bloquear(("usuarios", conta_por_id[params[0]][0]))
+            self.linhas = [{"id": params[0]}]
+        elif sql.startswith("UPDATE usuarios SET saldo_cc = saldo_cc + %s WHERE id"):
+            conta_por_id[params[1]][1]["saldo_cc"] += params[0]
+        elif sql.startswith("INSERT INTO saldo_shards"):
+            chave = (params[0], params[1])
+            self.conn.bloquear(("saldo_shards", chave))
+            banco.shards[chave] = banco.shards.get(chave, Decimal(0)) + params[2]
+        elif sql.startswith("SELECT COALESCE(SUM(saldo), 0) AS soma FROM saldo_shards"):
+            chaves = [k for k in banco.shards if k[0] == params[0]]
+            if "FOR UPDATE" in sql:
+                for chave in sorted(chaves):
+                    self.conn.bloquear(("saldo_shards", chave))
+            self.linhas = [{"soma": sum((banco.shards[k] for k in chaves), Decimal(0))}]
+        elif sql.startswith("UPDATE saldo_shards SET saldo = 0"):
+            for chave in banco.shards:
+                if chave[0] == params[0]:
+                    banco.shards[chave] = Decimal(0)
+        elif sql.startswith("SELECT DISTINCT usuario_id FROM saldo_shards"):
+            self.linhas = [{"usuario_id": uid} for uid in sorted({k[0] for k, v in banco.shards.items() if v})]
+        elif sql.startswith("INSERT INTO transacoes"):
+            with banco._guarda:
+                banco.ledger.append(params)
+        else:
+            raise AssertionError(f"SQL inesperado: {sql}")
+
+    def fetchone(self):
+        return self.linhas[0] if self.linhas else None
+
+    def fetchall(self):
+        return self.linhas
+
+    def close(self):
+        pass
+
+
+def quente(*emails):
+    return patch.object(hot_accounts, "HOT_ACCOUNTS", set(emails))
+
+
+def payload(valor=100, email_origin="a@a.com", email_destination="b@b.com"):
+    return TransacaoDataPayload(
+        email_origin=email_origin,
+        email_destination=email_destination,
+        valor=valor,
+        mensagem="teste",
+        user_origin_id=1
+    )
+
+
+# =========================
+# DEPÓSITO E SAQUE
+# =========================
+
+def test_conta_quente_pela_lista_sem_diferenciar_caixa():
+    with quente(LOJA):
+        assert hot_accounts.e_quente("Loja@X.com")
+        assert not hot_accounts.e_quente("outra@x.com")
+    with quente():
+        assert not hot_accounts.e_quente(LOJA)
+
+
+def test_deposito_em_conta_quente_credita_shard_sem_lock_da_conta(client):
+    banco = BancoComLocks()
+    banco.contas[LOJA]["saldo_cc"] = Decimal("100.00")
+
+    with quente(LOJA), patch("api.execute_routes.get_connection", side_effect=banco.conexao):
+        for _ in range(3):
+            response = client.post("/deposito", json={"email": LOJA, "valor": 10}, headers=internal_headers)
+            assert response.status_code == 200
+
+    assert ("usuarios", LOJA) not in banco.bloqueadas
+    assert banco.contas[LOJA]["saldo_cc"] == Decimal("100.00")
+    assert banco.saldo_total() == Decimal("130.00")
+    assert response.json()["saldo_atual"] == "130.00"
+    assert len(banco.ledger) == 3
+
+
+def test_deposito_em_conta_comum_segue_no_saldo_cc(client):
+    banco = BancoComLocks()
+
+    with patch("api.execute_routes.get_connection", side_effect=banco.conexao):
+        response = client.post("/deposito", json={"email": LOJA, "valor": 10}, headers=internal_headers)
+
+    assert response.status_code == 200
+    assert banco.shards == {}
+    assert banco.contas[LOJA]["saldo_cc"] == Decimal("10.00")
+
+
+def test_saque_de_conta_quente_consolida_os_shards(client):
+    banco = BancoComLocks()
+    banco.shards = {(1, 0): Decimal("30.00"), (1, 5): Decimal("20.00")}
+
+    with quente(LOJA), patch("api.execute_routes.get_connection", side_effect=banco.conexao):
+        response = client.post("/saque", json={"email": LOJA, "valor": 45}, headers=internal_headers)
+
+    assert response.status_code == 200
+    assert response.json()["saldo_atual"] == "5.00"
+    assert banco.contas[LOJA]["saldo_cc"] == Decimal("5.00")
+    assert set(banco.shards.values()) == {Decimal(0)}
+
+
+# =========================
+# TRANSFERÊNCIAS
+# =========================
+
+def test_transferencia_para_conta_quente_bloqueia_so_a_origem():
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    cursor.fetchone.return_value = {"id": 2}
+    cursor.fetchall.return_value = [{"id": 1, "email": "a@a.com", "saldo_cc": Decimal("500")}]
+
+    with quente("b@b.com"):
+        executar_transferencia(conn, payload())
+
+    comandos = [" ".join(c.args[0].split()) for c in cursor.execute.call_args_list]
+    lock = next(c for c in cursor.execute.call_args_list if "FOR UPDATE" in c.args[0])
+    assert lock.args[1] == (1,)
+    assert not any("CASE id" in sql for sql in comandos)
+    assert any(sql.startswith("UPDATE usuarios SET saldo_cc = saldo_cc - %s WHERE id = %s") for sql in comandos)
+    credito = next(c for c in cursor.execute.call_args_list if "saldo_shards" in c.args[0])
+    assert credito.args[1][0] == 2 and credito.args[1][2] == 100
+
+
+def test_transferencia_de_conta_quente_soma_os_shards_ao_saldo():
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    cursor.fetchone.side_effect = [{"id": 2}, {"soma": Decimal("80")}]
+    cursor.fetchall.side_effect = [
+        [{"id": 1, "email": "a@a.com", "saldo_cc": Decimal("50")}, {"id": 2, "email": "b@b.com", "saldo_cc": 0}],
+        [{"id": 1}],
+    ]
+
+    with quente("a@a.com"):
+        assert executar_transferencia(conn, payload(valor=120)) == {"status": "ok"}
+
+    assert any(
+        "UPDATE usuarios SET saldo_cc = saldo_cc + %s WHERE id" in c.args[0] and c.args[1] == (Decimal("80"), 1)
+        for c in cursor.execute.call_args_list
+    )
+    conn.commit.assert_called_once()
+
+
+# =========================
+# CONSOLIDAÇÃO
+# =========================
+
+def test_consolidacao_move_shards_para_o_saldo():
+    banco = BancoComLocks()
+    banco.contas["b@x.com"] = {"id": 2, "saldo_cc": Decimal("1.00")}
+    banco.shards = {(1, 0): Decimal("7.50"), (1, 3): Decimal("2.50"), (2, 1): Decimal("0")}
+    antes = hot_accounts.hot_accounts_stats()["consolidacoes"]
+
+    resultado = consolidar_todas(banco.conexao())
+
+    assert resultado == {"contas": 1, "valor": Decimal("10.00")}
+    assert banco.contas[LOJA]["saldo_cc"] == Decimal("10.00")
+    assert banco.saldo_total() == Decimal("10.00")
+    assert hot_accounts.hot_accounts_stats()["consolidacoes"] == antes + 1
+
+
+def test_consolidador_periodico_e_passada_final():
+    banco = BancoComLocks()
+    banco.shards = {(1, 0): Decimal("5.00")}
+    consolidador = Consolidador(banco.conexao, intervalo=0.01)
+    try:
+        limite = time.monotonic() + 2
+        while banco.contas[LOJA]["saldo_cc"] != Decimal("5.00") and time.monotonic() < limite:
+            time.sleep(0.01)
+        assert banco.contas[LOJA]["saldo_cc"] == Decimal("5.00")
+        banco.shards[(1, 2)] = Decimal("1.00")
+    finally:
+        consolidador.fechar()
+
+    assert banco.contas[LOJA]["saldo_cc"] == Decimal("6.00")
+
+
+def test_consolidador_so_sobe_com_contas_quentes():
+    with quente():
+        assert hot_accounts.iniciar_consolidador() is None
+
+
+def test_conciliacao_soma_os_shards_ao_saldo():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = []
+
+    reconciliation._carregar_contas(cursor, {LOJA}, 10)
+    reconciliation._carregar_todas(cursor)
+
+    assert all("saldo_shards" in c.args[0] for c in cursor.execute.call_args_list if "usuarios" in c.args[0])
+
+
+def test_migracao_dos_shards():
+    sql = dict((v, s) for v, _, s in carregar_migracoes(MIGRATIONS_DIR))[5]
+    assert "CREATE TABLE IF NOT EXISTS saldo_shards" in sql
+
+
+def test_stats_expoe_contas_quentes(client):
+    with patch("api.execute_routes.pool_stats", return_value={}):
+        response = client.get("/internal/stats", headers=internal_headers)
+
+    assert {"creditos", "consolidacoes", "shards"} <= set(response.json()["contas_quentes"])
+
+
+# =========================
+# BENCHMARK – CRÉDITOS NUMA CONTA
+# =========================
+
+def depositos_por_segundo(banco, threads=16, por_thread=40):
+    def trabalhar():
+        for _ in range(por_thread):
+            _realizar_deposito(DepositoDBRequest(email=LOJA, valor=Decimal("1.00")))
+
+    with patch("api.execute_routes.get_connection", side_effect=banco.conexao):
+        workers = [threading.Thread(target=trabalhar) for _ in range(threads)]
+        inicio = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        return threads * por_thread / (time.perf_counter() - inicio)
+
+
+def test_benchmark_creditos_concorrentes_numa_conta():
+    comum = BancoComLocks(latencia=0.0005)
+    fragmentada = BancoComLocks(latencia=0.0005)
+
+    taxa_comum = depositos_por_segundo(comum)
+    with quente(LOJA), patch.object(hot_accounts, "HOT_ACCOUNT_SHARDS", 16):
+        taxa_fragmentada = depositos_por_segundo(fragmentada)
+    consolidar_todas(fragmentada.conexao())
+
+    print(f"\ncréditos numa conta: linha única {taxa_comum:,.0f}/s, 16 shards {taxa_fragmentada:,.0f}/s")
+    assert comum.contas[LOJA]["saldo_cc"] == fragmentada.contas[LOJA]["saldo_cc"] == Decimal("640.00")
+    assert taxa_fragmentada > 3 * taxa_comum
@@ -0,0 +1,185 @@
+import json
+import pytest
+import mysql.connector
+from unittest.mock import patch, MagicMock
+
+from api import idempotency
+from schemas.schemas import DepositoDBRequest, SaqueDBRequest
+
+
+@pytest.fixture(autouse=True)
+def limpa_cache():
+    idempotency._cache.clear()
+    yield
+    idempotency._cache.clear()
+
+
+def build_db(fetchone=None):
+    conn = MagicMock()
+    cursor = MagicMock()
+    if isinstance(fetchone, list):
+        cursor.fetchone.side_effect = fetchone
+    else:
+        cursor.fetchone.return_value = fetchone
+    cursor.rowcount = 1
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+def headers(chave):
+    return {"X-Internal-Key": "INTERNAL_SECRET", "Idempotency-Key": chave}
+
+
+def comandos(cursor):
+    return [" ".join(c.args[0].split()) for c in cursor.execute.call_args_list]
+
+
+# ============================
+# DEPÓSITO
+# ============================
+
+def test_deposito_grava_chave_na_mesma_transacao(client):
+    conn, cursor = build_db([None, {"saldo_cc": 100}])
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.post("/deposito", headers=headers("k1"), json={"email": "a@a.com", "valor": 50})
+
+    assert res.status_code == 200
+    sql = comandos(cursor)
+    assert sql[0].startswith("SELECT hash_requisicao, resposta FROM idempotency_keys")
+    assert sql[-1].startswith("INSERT INTO idempotency_keys")
+    conn.commit.assert_called_once()
+
+
+def test_replay_em_cache_nao_toca_o_banco(client):
+    conn, _ = build_db([None, {"saldo_cc": 100}])
+
+    with patch("api.execute_routes.get_connection", return_value=conn) as get_conn:
+        primeira = client.post("/deposito", headers=headers("k2"), json={"email": "a@a.com", "valor": 50})
+        segunda = client.post("/deposito", headers=headers("k2"), json={"email": "a@a.com", "valor": 50})
+
+    assert get_conn.call_count == 1
+    assert segunda.json() == primeira.json()
+    assert segunda.headers[idempotency.REPLAY_HEADER] == "true"
+
+
+def test_replay_do_banco_nao_toca_usuarios(client):
+    hash_req = idempotency.hash_requisicao(SaqueDBRequest(email="a@a.com", valor=50))
+    armazenado = {"hash_requisicao": hash_req, "resposta": json.dumps({"saldo_atual": 50.0})}
+    conn, cursor = build_db(armazenado)
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.post("/saque", headers=headers("k3"), json={"email": "a@a.com", "valor": 50})
+
+    assert res.status_code == 200
+    assert res.json()["saldo_atual"] == "50.00"
+    assert res.headers[idempotency.REPLAY_HEADER] == "true"
+    assert not any("usuarios" in sql for sql in comandos(cursor))
+
+
+def test_chave_reutilizada_com_outro_payload(client):
+    armazenado = {"hash_requisicao": "outro", "resposta": "{}"}
+    conn, _ = build_db(armazenado)
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.post("/deposito", headers=headers("k4"), json={"email": "a@a.com", "valor": 50})
+
+    assert res.status_code == 422
+
+
+def test_corrida_de_chave_duplicada_devolve_resposta_gravada(client):
+    hash_req = idempotency.hash_requisicao(DepositoDBRequest(email="a@a.com", valor=50))
+    vencedora = {"hash_requisicao": hash_req, "resposta": json.dumps({"saldo_atual": 150.0})}
+    conn, cursor = build_db([None, {"saldo_cc": 100}, vencedora])
+
+    def execute(sql, params=None):
+        if sql.strip().startswith("INSERT INTO idempotency_keys"):
+            raise mysql.connector.Error(msg="Duplicate entry", errno=1062)
+        # A chave da outra requisição está no prazo: nada vencido para apagar
+        cursor.rowcount = 0 if sql.strip().startswith("DELETE") else 1
+
+    cursor.execute.side_effect = execute
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.post("/deposito", headers=headers("k5"), json={"email": "a@a.com", "valor": 50})
+
+    assert res.status_code == 200
+    assert res.json()["saldo_atual"] == "150.00"
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
+
+
+# ============================
+# TRANSFERÊNCIA
+# ============================
+
+def test_transferencia_idempotente(client):
+    conn, cursor = build_db([None, {"id": 2}])
+    cursor.fetchall.return_value = [
+        {"id": 1, "email": "a@a.com", "saldo_cc": 500},
+        {"id": 2, "email": "b@b.com", "saldo_cc": 0}
+    ]
+    body = {"email_origin": "a@a.com", "email_destination": "b@b.com", "valor": 10, "user_origin_id": 1}
+
+    with patch("api.execute_routes.get_connection", return_value=conn) as get_conn:
+        primeira = client.post("/transacoesUsuarios", headers=headers("t1"), json=body)
+        segunda = client.post("/transacoesUsuarios", headers=headers("t1"), json=body)
+
+    assert primeira.status_code == segunda.status_code == 200
+    assert get_conn.call_count == 1
+    assert comandos(cursor)[-1].startswith("INSERT INTO idempotency_keys")
+    assert segunda.headers[idempotency.REPLAY_HEADER] == "true"
+
+
+def test_chave_vencida_pode_ser_reutilizada():
+    cursor = MagicMock()
+    inserts = []
+
+    def execute(sql, params=None):
+        if sql.strip().startswith("INSERT INTO idempotency_keys"):
+            inserts.append(params)
+            if len(inserts) == 1:
+                raise mysql.connector.Error(msg="Duplicate entry", errno=1062)
+        cursor.rowcount = 1
+
+    cursor.execute.side_effect = execute
+
+    idempotency.registrar(cursor, "deposito", "k6", "h", {"saldo_atual": 1})
+
+    assert len(inserts) == 2
+    assert " ".join(cursor.execute.call_args_list[1].args[0].split()).startswith("DELETE FROM idempotency_keys")
+    assert cursor.execute.call_args_list[1].args[1] == ("deposito", "k6", idempotency.IDEMPOTENCY_TTL)
+
+
+def test_chave_no_prazo_continua_duplicada():
+    cursor = MagicMock()
+
+    def execute(sql, params=None):
+        if sql.strip().startswith("INSERT INTO idempotency_keys"):
+            raise mysql.connector.Error(msg="Duplicate entry", errno=1062)
+        cursor.rowcount = 0
+
+    cursor.execute.side_effect = execute
+
+    with pytest.raises(mysql.connector.Error) as erro:
+        idempotency.registrar(cursor, "deposito", "k7", "h", {})
+    assert idempotency.is_duplicate(erro.value)
+
+
+def test_purgador_percorre_os_conectores():
+    conn, cursor = build_db()
+    cursor.rowcount = 2
+    purgador = idempotency.Purgador(conectar=lambda: conn, intervalo=60)
+    try:
+        assert purgador.executar() == 2
+    finally:
+        purgador.fechar()
+    conn.close.assert_called_once()
+
+
+def test_purgar_expiradas():
+    conn, cursor = build_db()
+    cursor.rowcount = 3
+
+    assert idempotency.purgar_expiradas(conn) == 3
+    conn.commit.assert_called_once()
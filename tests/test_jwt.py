@@ -1,4 +1,5 @@
 import pytest
+from datetime import datetime, timedelta
 from fastapi import HTTPException
 from jose import JWTError
 from unittest.mock import patch
@@ -55,6 +56,34 @@ def test_get_current_user_id_sem_sub():
         assert exc.value.detail == "Token inválido"
 
 
+@pytest.mark.parametrize("sub", ["abc", "1.5", ["1"]])
+def test_get_current_user_id_sub_nao_inteiro(sub):
+    with patch("api.jwt.SECRET_KEY", "chave_teste"):
+        from api import jwt as api_jwt
+
+        token = api_jwt._backend.encode(
+            {"sub": sub, "exp": datetime.utcnow() + timedelta(minutes=5)},
+            api_jwt._chave_hmac(),
+            api_jwt.ALGORITHM
+        )
+
+        with pytest.raises(HTTPException) as exc:
+            api_jwt.get_current_user_id(token)
+
+        assert exc.value.status_code == 401
+
+
+def test_cache_nao_guarda_o_segredo_em_claro():
+    with patch("api.jwt.SECRET_KEY", "chave_secreta_cache"):
+        from api import jwt as api_jwt
+
+        token = api_jwt.create_access_token({"sub": "3"})
+        assert api_jwt.get_current_user_id(token) == 3
+
+        chaves = list(api_jwt._hmac) + [api_jwt._chave_cache(token)]
+        assert "chave_secreta_cache" not in repr(chaves)
+
+
 def test_get_current_user_id_jwt_error():
     with patch("api.jwt.SECRET_KEY", "chave_teste"):
         from api.jwt import get_current_user_id
@@ -64,3 +93,154 @@ def test_get_current_user_id_jwt_error():
 
         assert exc.value.status_code == 401
         assert exc.value.detail == "Token inválido"
+
+
+# ============================
+# Cache de tokens verificados
+# ============================
+
+def test_token_verificado_vem_do_cache():
+    with patch("api.jwt.SECRET_KEY", "chave_cache"):
+        from api import jwt as api_jwt
+
+        token = api_jwt.create_access_token({"sub": "7"})
+        assert api_jwt.get_current_user_id(token) == 7
+
+        with patch.object(api_jwt._backend, "decode") as decode:
+            assert api_jwt.get_current_user_id(token) == 7
+            decode.assert_not_called()
+
+
+def test_cache_respeita_troca_de_secret_key():
+    from api import jwt as api_jwt
+
+    with patch("api.jwt.SECRET_KEY", "chave_a"):
+        token = api_jwt.create_access_token({"sub": "7"})
+        assert api_jwt.get_current_user_id(token) == 7
+
+    with patch("api.jwt.SECRET_KEY", "chave_b"):
+        with pytest.raises(HTTPException) as exc:
+            api_jwt.get_current_user_id(token)
+
+    assert exc.value.status_code == 401
+
+
+def test_token_expirado_nao_entra_no_cache():
+    from datetime import datetime, timedelta
+    from jose import jwt
+
+    with patch("api.jwt.SECRET_KEY", "chave_teste"):
+        from api.jwt import get_current_user_id, _cache
+
+        token = jwt.encode(
+            {"sub": "1", "exp": datetime.utcnow() - timedelta(seconds=1)},
+            "chave_teste",
+            algorithm="HS256"
+        )
+        tamanho = len(_cache)
+
+        with pytest.raises(HTTPException):
+            get_current_user_id(token)
+
+        assert len(_cache) == tamanho
+
+
+# ============================
+# Chaves assimétricas e rotação
+# ============================
+
+def gerar_par():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    privada = ec.generate_private_key(ec.SECP256R1())
+    pem_privada = privada.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    pem_publica = privada.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return pem_privada, pem_publica
+
+
+def test_rotacao_de_chaves_es256():
+    from api import jwt as api_jwt
+    from api.jwt import KeySet
+
+    keyset = KeySet()
+    keyset.rotacionar("k1", *gerar_par())
+
+    with patch("api.jwt.ALGORITHM", "ES256"), patch("api.jwt.KEYSET", keyset):
+        antigo = api_jwt.create_access_token({"sub": "5"})
+        assert api_jwt.get_current_user_id(antigo) == 5
+
+        keyset.rotacionar("k2", *gerar_par())
+        novo = api_jwt.create_access_token({"sub": "6"})
+
+        assert api_jwt._backend.header(novo)["kid"] == "k2"
+        # Token da chave anterior continua válido até ela ser aposentada
+        assert api_jwt.get_current_user_id(antigo) == 5
+        assert api_jwt.get_current_user_id(novo) == 6
+
+        keyset.aposentar("k1")
+        with pytest.raises(HTTPException) as exc:
+            api_jwt.get_current_user_id(antigo)
+        assert exc.value.status_code == 401
+        assert api_jwt.get_current_user_id(novo) == 6
+
+
+def test_carregar_diretorio_de_chaves(tmp_path):
+    from api.jwt import KeySet
+
+    privada, publica = gerar_par()
+    (tmp_path / "k1.pub.pem").write_text(publica)
+    (tmp_path / "k1.pem").write_text(privada)
+    (tmp_path / "k0.pub.pem").write_text(gerar_par()[1])
+
+    keyset = KeySet()
+    keyset.carregar_diretorio(tmp_path, kid_ativo="k1")
+
+    assert keyset.kids() == ["k0", "k1"]
+    assert keyset.kid_ativo == "k1"
+
+
+def test_backend_pyjwt():
+    pytest.importorskip("jwt")
+    from api import jwt as api_jwt
+
+    try:
+        api_jwt.configurar_backend("pyjwt")
+        with patch("api.jwt.SECRET_KEY", "chave_teste_pyjwt_com_32_bytes!!"):
+            token = api_jwt.create_access_token({"sub": "9"})
+            assert api_jwt.get_current_user_id(token) == 9
+    finally:
+        api_jwt.configurar_backend("jose")
+
+
+# ============================
+# Micro-benchmark
+# ============================
+
+def test_benchmark_decode_com_cache():
+    import time
+    from api import jwt as api_jwt
+
+    with patch("api.jwt.SECRET_KEY", "chave_benchmark"):
+        token = api_jwt.create_access_token({"sub": "1"})
+        n = 2000
+
+        inicio = time.perf_counter()
+        for _ in range(n):
+            api_jwt._decodificar(token)
+        sem_cache = n / (time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        for _ in range(n):
+            api_jwt.get_current_user_id(token)
+        com_cache = n / (time.perf_counter() - inicio)
+
+    print(f"\njwt: {sem_cache:,.0f} tokens/s sem cache, {com_cache:,.0f} tokens/s com cache")
+    assert com_cache > sem_cache * 3
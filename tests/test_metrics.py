@@ -0,0 +1,105 @@
+import re
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+from api import metrics
+from api.metrics import Histogram, InstrumentedConnection
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+POOL = {
+    "size": 2, "in_use": 0, "idle": 2, "waiting": 0,
+    "timeouts": 1, "queue_full": 0, "acquire_failures": 1,
+}
+
+
+def fake_pool():
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchone.return_value = {"id": 1, "saldo_cc": Decimal("100.00")}
+    conn.cursor.return_value = cursor
+    pool = MagicMock()
+    pool.get_connection.return_value = conn
+    pool.stats.return_value = POOL
+    return pool, conn
+
+
+# =========================
+# PRIMITIVAS
+# =========================
+
+def test_histograma_cumulativo():
+    h = Histogram("teste_seconds", "ajuda", (0.1, 1.0), ("rota",))
+    h.observar(0.05, "/a")
+    h.observar(0.5, "/a")
+    h.observar(5, "/a")
+
+    linhas = h.exportar()
+
+    assert 'teste_seconds_bucket{rota="/a",le="0.1"} 1' in linhas
+    assert 'teste_seconds_bucket{rota="/a",le="1.0"} 2' in linhas
+    assert 'teste_seconds_bucket{rota="/a",le="+Inf"} 3' in linhas
+    assert 'teste_seconds_count{rota="/a"} 3' in linhas
+
+
+def test_conexao_instrumentada_repassa_atributos():
+    bruta = MagicMock()
+    conn = InstrumentedConnection(bruta)
+
+    conn.autocommit = False
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT 1")
+    cursor.rowcount
+
+    assert bruta.autocommit is False
+    bruta.cursor.assert_called_once_with(dictionary=True)
+    bruta.cursor.return_value.execute.assert_called_once_with("SELECT 1")
+
+
+# =========================
+# MIDDLEWARE E /metrics
+# =========================
+
+def test_server_timing_conta_queries_da_requisicao(client):
+    pool, _ = fake_pool()
+
+    with patch("api.connection.get_pool", return_value=pool):
+        response = client.post("/deposito", json={"email": "a@a.com", "valor": 10}, headers=internal_headers)
+
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    # SELECT ... FOR UPDATE, UPDATE, INSERT no ledger e COMMIT
+    assert 'desc="4 queries"' in timing
+    assert re.search(r"app;dur=\d+\.\d+", timing)
+    assert "pool;dur=" in timing
+
+
+def test_metrics_em_formato_prometheus(client):
+    pool, _ = fake_pool()
+
+    with patch("api.connection.get_pool", return_value=pool), \
+         patch("api.execute_routes.pool_stats", return_value=POOL):
+        client.post("/saque", json={"email": "a@a.com", "valor": 10}, headers=internal_headers)
+        response = client.get("/metrics", headers=internal_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    corpo = response.text
+    assert 'http_requests_total{method="POST",rota="/saque",status="200"}' in corpo
+    assert 'http_request_duration_seconds_bucket{method="POST",rota="/saque",le="+Inf"}' in corpo
+    assert 'db_queries_per_request_bucket{rota="/saque",le="5"}' in corpo
+    assert "# TYPE db_pool_acquire_wait_seconds histogram" in corpo
+    assert "db_pool_timeouts_total 1" in corpo
+    # A própria raspagem está em andamento
+    assert "http_requests_in_flight 1" in corpo
+
+
+def test_rota_desconhecida_nao_cria_label_por_url(client):
+    client.get("/nao/existe/123")
+
+    assert 'rota="/nao/existe/123"' not in metrics.exportar_prometheus()
+    assert 'rota="desconhecida",status="404"' in metrics.exportar_prometheus()
+
+
+def test_metrics_exige_chave(client):
+    assert client.get("/metrics", headers={"X-Internal-Key": "ERRADA"}).status_code == 403
@@ -0,0 +1,115 @@
+import pytest
+from unittest.mock import MagicMock
+
+from api.migrations import carregar_migracoes, separar_comandos, aplicar_migracoes, shards_da_migracao, MIGRATIONS_DIR
+
+
+def build_db(aplicadas=()):
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(v,) for v in aplicadas]
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+def escrever(diretorio, nome, sql):
+    (diretorio / nome).write_text(sql, encoding="utf-8")
+
+
+# ============================
+# CARREGAMENTO
+# ============================
+
+def test_migracoes_do_repositorio_carregam_em_ordem():
+    migracoes = carregar_migracoes(MIGRATIONS_DIR)
+    versoes = [v for v, _, _ in migracoes]
+
+    assert versoes == sorted(versoes)
+    assert versoes[:2] == [1, 2]
+
+
+def test_indice_de_email_normalizado_existe():
+    sql = dict((v, s) for v, _, s in carregar_migracoes(MIGRATIONS_DIR))[2]
+    assert "email_normalizado" in sql and "UNIQUE KEY" in sql
+
+
+def test_nome_invalido(tmp_path):
+    escrever(tmp_path, "sem_versao.sql", "SELECT 1;")
+    with pytest.raises(ValueError):
+        carregar_migracoes(tmp_path)
+
+
+def test_separar_comandos_ignora_comentarios():
+    sql = "-- comentário; com ponto e vírgula\nCREATE TABLE a (x INT);\n\nALTER TABLE a\n    ADD KEY k (x);\n"
+    assert separar_comandos(sql) == ["CREATE TABLE a (x INT)", "ALTER TABLE a\n    ADD KEY k (x)"]
+
+
+# ============================
+# APLICAÇÃO
+# ============================
+
+def test_aplica_somente_pendentes(tmp_path):
+    escrever(tmp_path, "0001_a.sql", "CREATE TABLE a (x INT);")
+    escrever(tmp_path, "0002_b.sql", "CREATE TABLE b (x INT);\nCREATE TABLE c (x INT);")
+    conn, cursor = build_db(aplicadas=[1])
+
+    assert aplicar_migracoes(conn, tmp_path) == [2]
+
+    executados = [c.args[0] for c in cursor.execute.call_args_list]
+    assert "CREATE TABLE a (x INT)" not in executados
+    assert "CREATE TABLE b (x INT)" in executados and "CREATE TABLE c (x INT)" in executados
+    assert cursor.execute.call_args_list[-1].args[1] == (2, "b")
+    conn.commit.assert_called_once()
+
+
+def test_para_na_migracao_que_falha(tmp_path):
+    escrever(tmp_path, "0001_a.sql", "CREATE TABLE a (x INT);")
+    escrever(tmp_path, "0002_b.sql", "QUEBRADO;")
+    conn, cursor = build_db()
+
+    def execute(sql, params=None):
+        if sql == "QUEBRADO":
+            raise RuntimeError("erro de sintaxe")
+
+    cursor.execute.side_effect = execute
+
+    with pytest.raises(RuntimeError):
+        aplicar_migracoes(conn, tmp_path)
+
+    assert conn.commit.call_count == 1
+    cursor.close.assert_called_once()
+
+
+def test_ate_versao(tmp_path):
+    escrever(tmp_path, "0001_a.sql", "CREATE TABLE a (x INT);")
+    escrever(tmp_path, "0002_b.sql", "CREATE TABLE b (x INT);")
+    conn, _ = build_db()
+
+    assert aplicar_migracoes(conn, tmp_path, ate=1) == [1]
+
+
+# ============================
+# SHARDS
+# ============================
+
+def test_diretorio_e_log_xa_so_no_shard_0():
+    migracoes = {v: s for v, _, s in carregar_migracoes(MIGRATIONS_DIR)}
+
+    assert shards_da_migracao(migracoes[6]) == {0}
+    assert all(shards_da_migracao(sql) is None for v, sql in migracoes.items() if v != 6)
+
+
+def test_migracao_de_outro_shard_so_e_registrada(tmp_path):
+    escrever(tmp_path, "0001_a.sql", "CREATE TABLE a (x INT);")
+    escrever(tmp_path, "0002_b.sql", "-- shards: 0\nCREATE TABLE b (x INT);")
+
+    conn, cursor = build_db()
+    assert aplicar_migracoes(conn, tmp_path, shard=1) == [1, 2]
+    executados = [c.args[0] for c in cursor.execute.call_args_list]
+    assert "CREATE TABLE a (x INT)" in executados
+    assert "CREATE TABLE b (x INT)" not in executados
+    assert cursor.execute.call_args_list[-1].args[1] == (2, "b")
+
+    conn, cursor = build_db()
+    assert aplicar_migracoes(conn, tmp_path, shard=0) == [1, 2]
+    assert "CREATE TABLE b (x INT)" in [c.args[0] for c in cursor.execute.call_args_list]
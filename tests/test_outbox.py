@@ -0,0 +1,362 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from api import outbox
+from api.outbox import ArquivoSink, FilaSink, Relay, OUTBOX_INSERT, publicar_lote
+from api.migrations import carregar_migracoes, MIGRATIONS_DIR
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+class OutboxFalso:
+    # Tabelas outbox e outbox_cursores em memória; o cursor só muda no commit
+    def __init__(self):
+        self.linhas = []
+        self.cursores = {}
+        self.pendentes = {}
+        self.agora = datetime(2026, 1, 1, 12, 0, 0)
+        self.sequencia = 0
+        # Início da transação aberta mais antiga (innodb_trx) e ramos XA preparados
+        self.transacao_aberta = None
+        self.xa_preparados = []
+        self._lock = threading.Lock()
+
+    def inserir(self, id_, idade=60, evento="deposito"):
+        self.sequencia = max(self.sequencia, id_)
+        self.linhas.append({
+            "id": id_,
+            "evento": evento,
+            "email_origin": "DEPOSITO",
+            "email_destination": "a@a.com",
+            "valor": Decimal("10.00"),
+            "dados": None,
+            "create_time": self.agora - timedelta(seconds=idade),
+        })
+        self.linhas.sort(key=lambda l: l["id"])
+
+    def conectar(self):
+        banco = self
+        pendente = {}
+        novas = []
+        conn = MagicMock()
+
+        def executemany(sql, linhas):
+            # NOW(6) - INTERVAL %s MICROSECOND pelo relógio do banco
+            for *valores, atraso in linhas:
+                novas.append(dict(
+                    zip(("evento", "email_origin", "email_destination", "valor", "dados"), valores),
+                    create_time=banco.agora - timedelta(microseconds=atraso),
+                ))
+
+        def execute(sql, params=()):
+            cursor = conn.cursor.return_value
+            if "INSERT IGNORE INTO outbox_cursores" in sql:
+                banco.cursores.setdefault(params[0], 0)
+            elif "SELECT ultimo_id" in sql and "FOR UPDATE" in sql:
+                cursor.fetchone.return_value = {
+                    "ultimo_id": banco.cursores[params[0]],
+                    "pendentes": banco.pendentes.get(params[0]),
+                    "agora": banco.agora,
+                }
+            elif "SELECT ultimo_id" in sql:
+                cursor.fetchall.return_value = [
+                    {"ultimo_id": ultimo, "pendentes": banco.pendentes.get(nome)}
+                    for nome, ultimo in banco.cursores.items()
+                ]
+            elif sql == "XA RECOVER":
+                cursor.fetchall.return_value = banco.xa_preparados
+            elif "innodb_trx" in sql:
+                cursor.fetchone.return_value = {"inicio": banco.transacao_aberta}
+            elif "WHERE id IN" in sql:
+                cursor.fetchall.return_value = [l for l in banco.linhas if l["id"] in params]
+            elif "DELETE FROM outbox" in sql:
+                limite, retencao = params
+                antes = len(banco.linhas)
+                banco.linhas = [
+                    l for l in banco.linhas
+                    if l["id"] > limite or l["create_time"] >= banco.agora - timedelta(seconds=retencao)
+                ]
+                cursor.rowcount = antes - len(banco.linhas)
+            elif "FROM outbox" in sql:
+                settle, apos, limite = params
+                limiar = banco.agora - timedelta(seconds=settle)
+                cursor.fetchall.return_value = [
+                    {**l, "assentado": l["create_time"] < limiar}
+                    for l in banco.linhas if l["id"] > apos
+                ][:limite]
+            elif "UPDATE outbox_cursores" in sql:
+                pendente[params[2]] = params[:2]
+
+        def commit():
+            with banco._lock:
+                for nome, (ultimo, pendentes) in pendente.items():
+                    banco.cursores[nome] = ultimo
+                    banco.pendentes[nome] = pendentes
+                for linha in novas:
+                    banco.sequencia += 1
+                    banco.linhas.append({"id": banco.sequencia, **linha})
+            pendente.clear()
+            novas.clear()
+
+        def rollback():
+            pendente.clear()
+            novas.clear()
+
+        conn.cursor.return_value.execute.side_effect = execute
+        conn.cursor.return_value.executemany.side_effect = executemany
+        conn.commit.side_effect = commit
+        conn.rollback.side_effect = rollback
+        return conn
+
+
+class SinkComFalha:
+    def __init__(self, falhas=1):
+        self.falhas = falhas
+        self.eventos = []
+
+    def publicar(self, eventos):
+        if self.falhas:
+            self.falhas -= 1
+            raise ConnectionError("broker indisponível")
+        self.eventos.extend(eventos)
+
+
+def ids(eventos):
+    return [e["id"] for e in eventos]
+
+
+# =========================
+# ESCRITA
+# =========================
+
+def test_desligado_nao_grava():
+    cursor = MagicMock()
+
+    with patch.object(outbox, "OUTBOX_ENABLED", False):
+        outbox.registrar(cursor, [outbox.evento("saque", "a@a.com", "SAQUE", Decimal("1.00"))])
+
+    cursor.executemany.assert_not_called()
+
+
+def test_ligado_grava_com_dados_em_json():
+    cursor = MagicMock()
+    eventos = [outbox.evento("investimento", "a@a.com", "PETR4", Decimal("50.00"), client_id=7)]
+
+    with patch.object(outbox, "OUTBOX_ENABLED", True):
+        outbox.registrar(cursor, eventos)
+
+    sql, [linha] = cursor.executemany.call_args.args
+    assert sql == OUTBOX_INSERT
+    assert linha[:4] == ("investimento", "a@a.com", "PETR4", Decimal("50.00"))
+    assert json.loads(linha[4]) == {"client_id": 7}
+    assert "NOW(6)" in OUTBOX_INSERT
+
+
+def test_deposito_grava_evento_antes_do_commit(client):
+    conn = MagicMock()
+    conn.cursor.return_value.fetchone.return_value = {"saldo_cc": Decimal("100.00")}
+    ordem = []
+    conn.cursor.return_value.executemany.side_effect = lambda sql, linhas: ordem.append(list(linhas))
+    conn.commit.side_effect = lambda: ordem.append("commit")
+
+    with patch.object(outbox, "OUTBOX_ENABLED", True), \
+         patch("api.execute_routes.get_connection", return_value=conn):
+        resposta = client.post("/deposito", json={"email": "a@a.com", "valor": 10}, headers=internal_headers)
+
+    assert resposta.status_code == 200
+    [[linha], fim] = ordem
+    assert fim == "commit"
+    assert linha[:4] == ("deposito", "DEPOSITO", "a@a.com", Decimal("10.00"))
+
+
+# =========================
+# RELAY
+# =========================
+
+def test_publica_em_ordem_e_avanca_o_cursor():
+    banco = OutboxFalso()
+    for i in range(1, 6):
+        banco.inserir(i)
+    sink = FilaSink()
+
+    assert publicar_lote(banco.conectar(), "razao", sink, limite=3) == 3
+    assert publicar_lote(banco.conectar(), "razao", sink, limite=3) == 2
+    assert publicar_lote(banco.conectar(), "razao", sink, limite=3) == 0
+
+    assert [sink.fila.get_nowait()["id"] for _ in range(5)] == [1, 2, 3, 4, 5]
+    assert banco.cursores["razao"] == 5
+
+
+def test_falha_no_destino_entrega_o_lote_de_novo():
+    banco = OutboxFalso()
+    banco.inserir(1)
+    banco.inserir(2)
+    sink = SinkComFalha()
+
+    with pytest.raises(ConnectionError):
+        publicar_lote(banco.conectar(), "razao", sink)
+    assert banco.cursores["razao"] == 0
+
+    assert publicar_lote(banco.conectar(), "razao", sink) == 2
+    assert ids(sink.eventos) == [1, 2]
+
+
+def test_buraco_recente_espera_a_transacao_aberta():
+    banco = OutboxFalso()
+    banco.inserir(1)
+    banco.inserir(3, idade=1)
+    sink = SinkComFalha(falhas=0)
+
+    assert publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10) == 1
+
+    # A transação com o id 2 confirma depois
+    banco.inserir(2, idade=0)
+    assert publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10) == 2
+    assert ids(sink.eventos) == [1, 2, 3]
+
+
+def test_relogio_da_aplicacao_atrasado_nao_assenta_evento_novo():
+    # Aplicação três horas atrás do banco: com o relógio dela, o evento novo
+    # atrás do buraco pareceria assentado e o id 2 seria pulado
+    banco = OutboxFalso()
+    banco.agora = datetime.now() + timedelta(hours=3)
+    banco.inserir(1)
+    banco.sequencia += 1  # id 2 fica com uma transação ainda aberta
+    conn = banco.conectar()
+    with patch.object(outbox, "OUTBOX_ENABLED", True):
+        outbox.registrar(conn.cursor(), [outbox.evento("saque", "a@a.com", "SAQUE", Decimal("1.00"))])
+    conn.commit()
+    sink = SinkComFalha(falhas=0)
+
+    assert ids(banco.linhas) == [1, 3]
+    assert publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10) == 1
+    assert ids(sink.eventos) == [1]
+
+
+def test_buraco_assentado_segue_e_fica_pendente():
+    banco = OutboxFalso()
+    banco.inserir(1)
+    banco.inserir(3, idade=30)
+    banco.transacao_aberta = banco.agora - timedelta(seconds=60)
+    sink = SinkComFalha(falhas=0)
+
+    assert publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10) == 2
+    assert ids(sink.eventos) == [1, 3]
+    assert banco.cursores["razao"] == 3
+    assert json.loads(banco.pendentes["razao"]) == {"2": banco.agora.isoformat()}
+
+
+def test_id_pendente_confirmado_depois_e_entregue():
+    # Transação presa (ramo XA preparado, lock wait) muito além do settle
+    banco = OutboxFalso()
+    banco.inserir(1)
+    banco.inserir(3, idade=30)
+    banco.xa_preparados = [{"formatID": 1, "gtrid_length": 10, "bqual_length": 1, "data": "javer-xa-10"}]
+    sink = SinkComFalha(falhas=0)
+    publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10)
+
+    banco.agora += timedelta(minutes=5)
+    assert publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10) == 0
+    assert "2" in json.loads(banco.pendentes["razao"])
+
+    # A recuperação XA confirma o ramo: o evento sai fora de ordem, mas sai
+    banco.xa_preparados = []
+    banco.inserir(2, idade=400)
+    banco.inserir(4, idade=0)
+    assert publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10) == 2
+    assert ids(sink.eventos) == [1, 3, 2, 4]
+    assert banco.pendentes["razao"] is None
+    assert banco.cursores["razao"] == 4
+
+
+def test_id_pendente_sem_transacao_aberta_e_descartado():
+    banco = OutboxFalso()
+    banco.inserir(1)
+    banco.inserir(3, idade=30)
+    banco.transacao_aberta = banco.agora - timedelta(seconds=60)
+    sink = SinkComFalha(falhas=0)
+    publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10)
+
+    # Ainda há transação aberta de antes do buraco: o id continua pendente
+    banco.agora += timedelta(minutes=1)
+    publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10)
+    assert "2" in json.loads(banco.pendentes["razao"])
+
+    # Todas as abertas começaram depois: quem tinha o id 2 fez rollback
+    banco.transacao_aberta = banco.agora
+    publicar_lote(banco.conectar(), "razao", sink, settle_seconds=10)
+    assert banco.pendentes["razao"] is None
+    assert ids(sink.eventos) == [1, 3]
+
+
+def test_consumidores_tem_cursores_independentes():
+    banco = OutboxFalso()
+    for i in range(1, 4):
+        banco.inserir(i)
+    rapido = SinkComFalha(falhas=0)
+    lento = SinkComFalha(falhas=5)
+
+    relay = Relay({"rapido": rapido, "lento": lento}, conectar=banco.conectar, intervalo=60, batch_size=2)
+    try:
+        assert relay.executar() == 3
+    finally:
+        relay.fechar()
+
+    assert ids(rapido.eventos) == [1, 2, 3]
+    assert lento.eventos == []
+    assert banco.cursores == {"rapido": 3, "lento": 0}
+
+
+def test_purga_respeita_pendentes_e_roda_no_relay():
+    banco = OutboxFalso()
+    for i in (1, 2, 4, 5):
+        banco.inserir(i, idade=3600)
+    banco.cursores["razao"] = 5
+    banco.pendentes["razao"] = json.dumps({"3": banco.agora.isoformat()})
+
+    with patch.object(outbox, "OUTBOX_RETENTION_SECONDS", 60):
+        relay = Relay({}, conectar=banco.conectar, intervalo=0.01, intervalo_purga=0.01)
+        try:
+            limite = time.monotonic() + 2
+            while len(banco.linhas) == 4 and time.monotonic() < limite:
+                time.sleep(0.01)
+        finally:
+            relay.fechar()
+
+    # O id 3 ainda pode ser confirmado: a purga para antes dele
+    assert ids(banco.linhas) == [4, 5]
+
+
+def test_arquivo_grava_ndjson(tmp_path):
+    caminho = tmp_path / "eventos.ndjson"
+    banco = OutboxFalso()
+    banco.inserir(1)
+    banco.inserir(2, evento="saque")
+
+    publicar_lote(banco.conectar(), "arquivo", ArquivoSink(str(caminho)), shard=1)
+
+    linhas = [json.loads(l) for l in caminho.read_text(encoding="utf-8").splitlines()]
+    assert [(l["id"], l["shard"], l["evento"]) for l in linhas] == [(1, 1, "deposito"), (2, 1, "saque")]
+    assert linhas[0]["valor"] == "10.00"
+
+
+def test_consumidores_configurados(tmp_path):
+    consumidores = outbox.consumidores_configurados(f"razao=file:{tmp_path}/e.ndjson, fila=queue")
+
+    assert isinstance(consumidores["razao"], ArquivoSink)
+    assert isinstance(consumidores["fila"], FilaSink)
+    with pytest.raises(ValueError):
+        outbox.consumidores_configurados("x=kafka")
+
+
+def test_migracao_do_outbox():
+    sql = dict((v, s) for v, _, s in carregar_migracoes(MIGRATIONS_DIR))[7]
+    assert "CREATE TABLE IF NOT EXISTS outbox" in sql
+    assert "CREATE TABLE IF NOT EXISTS outbox_cursores" in sql
+    assert "ADD COLUMN pendentes JSON" in dict((v, s) for v, _, s in carregar_migracoes(MIGRATIONS_DIR))[8]
@@ -0,0 +1,193 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+from mysql.connector.errors import PoolError
+
+from api.pool import ConnectionPool, PoolTimeoutError, PoolQueueFullError
+
+
+# ============================
+# HELPERS
+# ============================
+
+def build_pool(**kwargs):
+    criadas = []
+
+    def factory():
+        cnx = MagicMock()
+        cnx.in_transaction = False
+        criadas.append(cnx)
+        return cnx
+
+    pool = ConnectionPool(factory, **kwargs)
+    return pool, criadas
+
+
+# ============================
+# CHECKOUT / DEVOLUÇÃO
+# ============================
+
+def test_open_cria_min_size():
+    pool, criadas = build_pool(min_size=2, max_size=4)
+    pool.open()
+
+    assert len(criadas) == 2
+    assert pool.stats()["idle"] == 2
+
+
+def test_cresce_ate_max_size_e_reutiliza():
+    pool, criadas = build_pool(min_size=0, max_size=2)
+
+    a = pool.get_connection()
+    b = pool.get_connection()
+    assert pool.stats()["in_use"] == 2
+
+    a.close()
+    c = pool.get_connection()
+
+    assert len(criadas) == 2
+    assert c._cnx is criadas[0]
+    b.close()
+    c.close()
+    assert pool.stats()["in_use"] == 0
+
+
+def test_close_do_proxy_devolve_sem_fechar():
+    pool, criadas = build_pool(min_size=1, max_size=1)
+    pool.open()
+
+    conn = pool.get_connection()
+    conn.autocommit = False
+    conn.close()
+    conn.close()
+
+    assert criadas[0].autocommit is False
+    criadas[0].close.assert_not_called()
+    assert pool.stats()["idle"] == 1
+
+
+def test_devolucao_faz_rollback_de_transacao_aberta():
+    pool, criadas = build_pool(min_size=1, max_size=1)
+    pool.open()
+
+    conn = pool.get_connection()
+    criadas[0].in_transaction = True
+    conn.close()
+
+    criadas[0].rollback.assert_called_once()
+
+
+def test_uso_apos_devolucao_falha():
+    pool, _ = build_pool(min_size=1, max_size=1)
+    conn = pool.get_connection()
+    conn.close()
+
+    with pytest.raises(PoolError):
+        conn.cursor()
+
+
+# ============================
+# FILA DE ESPERA
+# ============================
+
+def test_espera_na_fila_ate_conexao_liberada():
+    pool, _ = build_pool(min_size=0, max_size=1, acquire_timeout=2)
+    conn = pool.get_connection()
+
+    threading.Timer(0.05, conn.close).start()
+    outra = pool.get_connection()
+
+    assert outra is not None
+    stats = pool.stats()
+    assert stats["acquire_failures"] == 0
+    assert stats["wait_seconds"]["count"] == 2
+    assert stats["wait_seconds"]["sum"] >= 0.04
+
+
+def test_timeout_de_aquisicao():
+    pool, _ = build_pool(min_size=0, max_size=1)
+    pool.get_connection()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.get_connection(timeout=0.02)
+
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["acquire_failures"] == 1
+
+
+def test_fila_cheia_falha_imediatamente():
+    pool, _ = build_pool(min_size=0, max_size=1, max_waiters=0)
+    pool.get_connection()
+
+    inicio = time.monotonic()
+    with pytest.raises(PoolQueueFullError):
+        pool.get_connection(timeout=5)
+
+    assert time.monotonic() - inicio < 1
+    assert pool.stats()["queue_full"] == 1
+
+
+def test_falha_ao_conectar_libera_vaga():
+    fabrica = MagicMock(side_effect=[Exception("RDS fora"), MagicMock()])
+    pool = ConnectionPool(fabrica, min_size=0, max_size=1)
+
+    with pytest.raises(Exception):
+        pool.get_connection()
+
+    assert pool.stats()["size"] == 0
+    assert pool.get_connection() is not None
+
+
+# ============================
+# HEALTH CHECK / REAPING
+# ============================
+
+def test_health_check_descarta_conexao_morta():
+    pool, criadas = build_pool(min_size=1, max_size=2, ping_after=0)
+    pool.open()
+    criadas[0].ping.side_effect = Exception("gone away")
+
+    conn = pool.get_connection()
+
+    assert conn._cnx is criadas[1]
+    criadas[0].close.assert_called_once()
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_reap_idle_respeita_min_size():
+    pool, criadas = build_pool(min_size=1, max_size=3, max_idle=0)
+    conns = [pool.get_connection() for _ in range(3)]
+    for c in conns:
+        c.close()
+
+    assert pool.stats()["size"] == 1
+    assert pool.stats()["reaped"] == 2
+
+
+def test_close_drena_ociosas():
+    pool, criadas = build_pool(min_size=2, max_size=2)
+    pool.open()
+    pool.close()
+
+    for cnx in criadas:
+        cnx.close.assert_called_once()
+    with pytest.raises(PoolError):
+        pool.get_connection()
+
+
+# ============================
+# ENDPOINT DE MÉTRICAS
+# ============================
+
+def test_internal_stats(client, internal_headers):
+    res = client.get("/internal/stats", headers=internal_headers)
+
+    assert res.status_code == 200
+    assert "in_use" in res.json()["pool"]
+
+
+def test_internal_stats_header_invalido(client):
+    res = client.get("/internal/stats", headers={"X-Internal-Key": "ERRADO"})
+    assert res.status_code == 403
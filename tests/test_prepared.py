@@ -0,0 +1,226 @@
+import os
+import time
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+import mysql.connector
+import pytest
+from mysql.connector.connection import MySQLConnection
+
+from api import connection, prepared
+from api.metrics import InstrumentedConnection
+from api.pool import ConnectionPool
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+def conexao_fisica():
+    # Passa no isinstance do driver; cada cursor(prepared=True) é um mock novo
+    cnx = MagicMock(spec=MySQLConnection)
+    cnx.in_transaction = False
+    texto = MagicMock()
+    texto.fetchone.return_value = {"saldo_cc": Decimal("100.00")}
+    preparados = []
+
+    def cursor(prepared=False, dictionary=False, **kwargs):
+        if not prepared:
+            return texto
+        c = MagicMock()
+        c.with_rows = False
+        c.rowcount = 1
+        preparados.append(c)
+        return c
+
+    cnx.cursor.side_effect = cursor
+    return cnx, texto, preparados
+
+
+# =========================
+# MODO DO DRIVER
+# =========================
+
+def test_modo_auto_usa_extensao_c_quando_disponivel():
+    with patch.object(mysql.connector, "HAVE_CEXT", True):
+        assert connection.driver_usa_pure("auto") is False
+        assert connection.driver_usa_pure("pure") is True
+    with patch.object(mysql.connector, "HAVE_CEXT", False):
+        assert connection.driver_usa_pure("auto") is True
+        with pytest.raises(RuntimeError):
+            connection.driver_usa_pure("c")
+    with pytest.raises(ValueError):
+        connection.driver_usa_pure("rapido")
+
+
+def test_connect_repassa_use_pure():
+    with patch("api.connection.mysql.connector.connect") as connect:
+        connection._connect("pure")
+
+    assert connect.call_args.kwargs["use_pure"] is True
+
+
+# =========================
+# CACHE POR CONEXÃO
+# =========================
+
+def test_prepara_uma_vez_por_conexao():
+    cnx, _, preparados = conexao_fisica()
+    sql = "UPDATE usuarios SET saldo_cc = saldo_cc + %s WHERE email = %s"
+
+    for valor in (1, 2, 3):
+        prepared.executar(cnx, None, sql, (valor, "a@a.com"))
+
+    assert len(preparados) == 1
+    chamadas = preparados[0].execute.call_args_list
+    assert [c.args[1] for c in chamadas] == [(1, "a@a.com"), (2, "a@a.com"), (3, "a@a.com")]
+    # Mesmo objeto de SQL: o driver não reprepara
+    assert all(c.args[0] is sql for c in chamadas)
+
+    outra, _, preparados_outra = conexao_fisica()
+    prepared.executar(outra, None, sql, (1, "a@a.com"))
+    assert len(preparados_outra) == 1
+
+
+def test_select_preparado_le_resultado_na_hora():
+    cnx = MagicMock(spec=MySQLConnection)
+    bruto = cnx.cursor.return_value
+    bruto.with_rows = True
+    bruto.fetchall.return_value = [{"id": 1}]
+
+    cursor = prepared.executar(cnx, None, "SELECT id FROM usuarios WHERE email = %s", ("a@a.com",), dictionary=True)
+
+    cnx.cursor.assert_called_once_with(prepared=True, dictionary=True)
+    bruto.fetchall.assert_called_once()
+    assert cursor.fetchone() == {"id": 1}
+    assert cursor.fetchone() is None
+    cursor.close()
+    bruto.close.assert_not_called()
+
+
+def test_limite_por_conexao_desaloca_o_mais_antigo():
+    cnx, _, preparados = conexao_fisica()
+
+    with patch.object(prepared, "DB_PREPARED_MAX_PER_CONN", 2):
+        for i in range(3):
+            prepared.preparar(cnx, f"SELECT {i}")
+
+    preparados[0].close.assert_called_once()
+    preparados[2].close.assert_not_called()
+
+
+def test_conexao_falsa_usa_cursor_de_texto():
+    conn = MagicMock()
+    cursor = MagicMock()
+
+    assert prepared.executar(conn, cursor, "SELECT 1", ()) is cursor
+    cursor.execute.assert_called_once_with("SELECT 1", ())
+
+
+def test_desligado_usa_cursor_de_texto():
+    cnx, texto, preparados = conexao_fisica()
+
+    with patch.object(prepared, "DB_PREPARED_STATEMENTS", False):
+        prepared.executar(cnx, texto, "SELECT 1", ())
+
+    assert preparados == []
+    texto.execute.assert_called_once()
+
+
+def test_proxies_do_pool_e_metricas_chegam_na_conexao_fisica():
+    cnx, _, preparados = conexao_fisica()
+    pool = ConnectionPool(lambda: cnx, min_size=0, max_size=1)
+
+    for _ in range(2):
+        conn = InstrumentedConnection(pool.get_connection())
+        prepared.executar(conn, None, "DELETE FROM t WHERE id = %s", (1,))
+        conn.close()
+
+    assert len(preparados) == 1
+    assert preparados[0].execute.call_count == 2
+
+
+# =========================
+# ROTAS
+# =========================
+
+def test_deposito_usa_statements_preparados(client):
+    cnx, texto, preparados = conexao_fisica()
+    pool = ConnectionPool(lambda: cnx, min_size=0, max_size=1)
+
+    with patch("api.connection.get_pool", return_value=pool):
+        for _ in range(2):
+            response = client.post("/deposito", json={"email": "a@a.com", "valor": 10}, headers=internal_headers)
+            assert response.status_code == 200
+
+    # UPDATE de saldo e INSERT no ledger, preparados uma única vez
+    assert len(preparados) == 2
+    assert "saldo_cc + %s" in preparados[0].execute.call_args.args[0]
+    assert "INSERT INTO transacoes" in preparados[1].execute.call_args.args[0]
+    assert all(p.execute.call_count == 2 for p in preparados)
+    # O SELECT ... FOR UPDATE segue pelo cursor de texto
+    assert "FOR UPDATE" in texto.execute.call_args_list[0].args[0]
+
+
+def test_saque_sem_saldo_pelo_rowcount_preparado(client):
+    cnx = MagicMock(spec=MySQLConnection)
+    cnx.in_transaction = False
+    texto = MagicMock()
+    texto.fetchone.return_value = {"saldo_cc": Decimal("100.00")}
+    debito = MagicMock(with_rows=False, rowcount=0)
+    cnx.cursor.side_effect = lambda prepared=False, **kw: debito if prepared else texto
+    pool = ConnectionPool(lambda: cnx, min_size=0, max_size=1)
+
+    with patch("api.connection.get_pool", return_value=pool):
+        response = client.post("/saque", json={"email": "a@a.com", "valor": 10}, headers=internal_headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Saldo insuficiente"
+
+
+def test_stats_expoe_driver(client):
+    with patch("api.execute_routes.pool_stats", return_value={}):
+        response = client.get("/internal/stats", headers=internal_headers)
+
+    driver = response.json()["driver"]
+    assert driver["modo"] == connection.DB_DRIVER_MODE
+    assert {"preparados", "reutilizados", "descartados"} <= set(driver["prepared"])
+
+
+# =========================
+# BENCHMARK (MySQL real)
+# =========================
+
+@pytest.mark.skipif(not os.getenv("TEST_DB_HOST"), reason="TEST_DB_HOST não configurado")
+def test_benchmark_modos_do_driver():
+    from api.execute_routes import LOGIN_SQL
+
+    n = int(os.getenv("BENCH_QUERIES", "2000"))
+    resultados = {}
+    for modo in ("pure", "c"):
+        if modo == "c" and not mysql.connector.HAVE_CEXT:
+            continue
+        cnx = mysql.connector.connect(
+            host=os.getenv("TEST_DB_HOST"),
+            user=os.getenv("TEST_DB_USER"),
+            password=os.getenv("TEST_DB_PASSWORD"),
+            database=os.getenv("TEST_DB_NAME"),
+            port=int(os.getenv("TEST_DB_PORT", "3306")),
+            use_pure=modo == "pure"
+        )
+        try:
+            texto = cnx.cursor(dictionary=True)
+            inicio = time.perf_counter()
+            for i in range(n):
+                texto.execute(LOGIN_SQL, (f"u{i % 300 + 1}@x.com",))
+                texto.fetchall()
+            resultados[f"{modo}/texto"] = n / (time.perf_counter() - inicio)
+            texto.close()
+
+            inicio = time.perf_counter()
+            for i in range(n):
+                prepared.executar(cnx, None, LOGIN_SQL, (f"u{i % 300 + 1}@x.com",), dictionary=True).fetchall()
+            resultados[f"{modo}/preparado"] = n / (time.perf_counter() - inicio)
+        finally:
+            cnx.close()
+
+    print("\n" + ", ".join(f"{modo}: {qps:,.0f} q/s" for modo, qps in resultados.items()))
+    assert resultados
@@ -0,0 +1,148 @@
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from api import query_log
+from api.metrics import InstrumentedConnection
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+@pytest.fixture(autouse=True)
+def limpa_query_log():
+    query_log.limpar()
+    yield
+    query_log.limpar()
+
+
+# =========================
+# FINGERPRINT
+# =========================
+
+def test_fingerprint_remove_literais():
+    a = query_log.fingerprint("SELECT * FROM usuarios WHERE email = 'a@a.com' AND id = 10")
+    b = query_log.fingerprint("select * from usuarios where email = 'b@b.com' and id = 2  ;")
+
+    assert a == "SELECT * FROM usuarios WHERE email = ? AND id = ?"
+    assert b.upper() == a.upper()
+
+
+def test_fingerprint_colapsa_listas_e_values():
+    assert query_log.fingerprint("SELECT id FROM t WHERE id IN (%s, %s, %s)") == \
+        query_log.fingerprint("SELECT id FROM t WHERE id IN (1,2)") == \
+        "SELECT id FROM t WHERE id IN (...)"
+    assert query_log.fingerprint(
+        "INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s) /* lote */"
+    ) == "INSERT INTO t (a, b) VALUES (...)"
+
+
+def test_fingerprint_preserva_identificadores_com_digitos():
+    assert query_log.fingerprint("SELECT saldo_v2 FROM t1 WHERE x = -3.5") == "SELECT saldo_v2 FROM t1 WHERE x = ?"
+
+
+# =========================
+# AGREGAÇÃO
+# =========================
+
+def test_agrega_por_fingerprint():
+    for i in range(100):
+        query_log.registrar(f"SELECT * FROM usuarios WHERE id = {i}", (i + 1) / 1000, linhas=1)
+    query_log.registrar("SELECT 1", 0.5)
+
+    por_total = query_log.top(ordem="total")
+    assert por_total[0]["fingerprint"] == "SELECT * FROM usuarios WHERE id = ?"
+    assert por_total[0]["count"] == 100
+    assert por_total[0]["linhas"] == 100
+    assert por_total[0]["p95_ms"] == pytest.approx(96.0)
+    assert query_log.top(1, ordem="max")[0]["fingerprint"] == "SELECT ?"
+
+
+def test_excesso_de_fingerprints_vai_para_outros():
+    with patch.object(query_log, "QUERY_LOG_MAX_FINGERPRINTS", 2):
+        query_log.registrar("SELECT a FROM t", 0.001)
+        query_log.registrar("SELECT b FROM t", 0.001)
+        query_log.registrar("SELECT c FROM t", 0.001)
+
+    assert {q["fingerprint"] for q in query_log.top()} == {"SELECT a FROM t", "SELECT b FROM t", query_log.OUTROS}
+
+
+# =========================
+# QUERY LENTA E EXPLAIN
+# =========================
+
+def test_query_lenta_roda_explain_na_devolucao():
+    bruta = MagicMock()
+    explain = MagicMock()
+    explain.fetchall.return_value = [{"type": "ALL", "rows": 1000}]
+    bruta.cursor.side_effect = [MagicMock(rowcount=3), explain]
+    conn = InstrumentedConnection(bruta)
+
+    with patch.object(query_log, "SLOW_QUERY_MS", 0):
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM usuarios WHERE email = %s", ("a@a.com",))
+        explain.execute.assert_not_called()
+        conn.close()
+
+    explain.execute.assert_called_once_with("EXPLAIN SELECT * FROM usuarios WHERE email = %s", ("a@a.com",))
+    bruta.close.assert_called_once()
+    [consulta] = query_log.top()
+    assert consulta["lentas"] == 1
+    assert consulta["linhas"] == 3
+    assert consulta["plano"] == [{"type": "ALL", "rows": 1000}]
+
+
+def test_explain_limitado_por_intervalo():
+    with patch.object(query_log, "SLOW_QUERY_MS", 0):
+        primeira = query_log.registrar("SELECT * FROM t WHERE id = 1", 0.3)
+        segunda = query_log.registrar("SELECT * FROM t WHERE id = 2", 0.3)
+        comando = query_log.registrar("COMMIT", 0.3)
+
+    assert primeira == "SELECT * FROM t WHERE id = ?"
+    assert segunda is None
+    assert comando is None
+    assert query_log.top()[0]["lentas"] == 2
+
+
+def test_falha_no_explain_nao_impede_devolucao():
+    bruta = MagicMock()
+    explain = MagicMock()
+    explain.execute.side_effect = Exception("Unread result found")
+    bruta.cursor.side_effect = [MagicMock(), explain]
+    conn = InstrumentedConnection(bruta)
+
+    with patch.object(query_log, "SLOW_QUERY_MS", 0):
+        conn.cursor().execute("UPDATE t SET x = 1")
+        conn.close()
+
+    bruta.close.assert_called_once()
+    assert query_log.top()[0]["plano"] is None
+
+
+# =========================
+# ROTA
+# =========================
+
+def test_rota_top_queries(client):
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchone.return_value = {"id": 1, "saldo_cc": Decimal("100.00")}
+    conn.cursor.return_value = cursor
+    pool = MagicMock()
+    pool.get_connection.return_value = conn
+
+    with patch("api.connection.get_pool", return_value=pool):
+        client.post("/deposito", json={"email": "a@a.com", "valor": 10}, headers=internal_headers)
+        client.post("/deposito", json={"email": "b@b.com", "valor": 5}, headers=internal_headers)
+
+    response = client.get("/internal/queries?top=10&ordem=count", headers=internal_headers)
+
+    assert response.status_code == 200
+    queries = {q["fingerprint"]: q for q in response.json()["queries"]}
+    assert queries["UPDATE usuarios SET saldo_cc = saldo_cc + ? WHERE email = ?"]["count"] == 2
+
+
+def test_rota_top_queries_exige_chave(client):
+    response = client.get("/internal/queries", headers={"X-Internal-Key": "errada"})
+
+    assert response.status_code == 403
@@ -0,0 +1,162 @@
+import threading
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from api import quotes
+from api.quotes import QuoteService, FakeProvider, FRESCA, VENCIDA
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def feed():
+    provider = FakeProvider({"PETR4": "38.50", "VALE3": "61.20"})
+    service = quotes.configurar_provider(provider)
+    yield provider, service
+    quotes.close_quote_service()
+
+
+# =========================
+# SERVIÇO
+# =========================
+
+def test_lote_em_uma_chamada_ao_provedor():
+    provider = FakeProvider({"PETR4": 38.5, "VALE3": 61.2})
+    service = QuoteService(provider)
+
+    cotacoes = service.aguardar(["petr4", "VALE3", "XXXX3"])
+
+    assert provider.chamadas == [["PETR4", "VALE3", "XXXX3"]]
+    assert cotacoes["PETR4"] == (Decimal("38.5"), FRESCA)
+    assert "XXXX3" not in cotacoes
+
+
+def test_cotacao_nunca_espera_rede():
+    provider = FakeProvider({"PETR4": 38.5}, atraso=0.2)
+    service = QuoteService(provider)
+
+    # Primeira leitura: nada em cache, retorna na hora e agenda a busca
+    assert service.cotacao("PETR4") == (None, None)
+    service.aguardar(["PETR4"])
+    assert service.cotacao("PETR4") == (Decimal("38.5"), FRESCA)
+
+
+def test_stale_while_revalidate():
+    relogio = Relogio()
+    provider = FakeProvider({"PETR4": 38.5})
+    service = QuoteService(provider, ttl=60, stale_ttl=600, clock=relogio)
+    service.aguardar(["PETR4"])
+
+    relogio.agora = 100
+    provider.precos["PETR4"] = Decimal("40")
+    # Vencida: serve o preço antigo e renova em segundo plano
+    assert service.cotacao("PETR4") == (Decimal("38.5"), VENCIDA)
+    service.aguardar(["PETR4"])
+    assert service.cotacao("PETR4") == (Decimal("40"), FRESCA)
+
+    relogio.agora = 1000
+    assert service.cotacao("PETR4") == (None, None)
+
+
+def test_buscas_concorrentes_sao_coalescidas():
+    provider = FakeProvider({"PETR4": 38.5}, atraso=0.1)
+    service = QuoteService(provider)
+    barreira = threading.Barrier(10)
+
+    def pedir():
+        barreira.wait()
+        service.aguardar(["PETR4"])
+
+    threads = [threading.Thread(target=pedir) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(provider.chamadas) == 1
+    assert service.stats()["coalescidas"] == 9
+
+
+def test_falha_do_provedor_mantem_cache():
+    relogio = Relogio()
+    provider = FakeProvider({"PETR4": 38.5})
+    service = QuoteService(provider, ttl=60, stale_ttl=600, clock=relogio)
+    service.aguardar(["PETR4"])
+
+    relogio.agora = 100
+    provider.erro = ConnectionError("sem rede")
+    assert service.aguardar(["PETR4"]) == {"PETR4": (Decimal("38.5"), VENCIDA)}
+    assert service.stats()["falhas"] == 1
+
+
+# =========================
+# /invest
+# =========================
+
+PAYLOAD = {
+    "client_id": 1,
+    "email": "ana@email.com",
+    "ticker": "PETR4",
+    "nome_ativo": "Petrobras",
+    "tipo_ativo": "acao",
+    "quantidade": "10",
+    "valor_investido": "350",
+    "valor_atual": "1",
+    "rentabilidade": "0"
+}
+
+
+def test_criar_transacao_usa_cotacao_em_cache(client, feed):
+    _, service = feed
+    service.aguardar(["PETR4"])
+    conn = MagicMock()
+    cursor = MagicMock()
+    conn.cursor.return_value = cursor
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        response = client.post("/invest/create", json=PAYLOAD)
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["cotacao"] == FRESCA
+    assert body["valor_atual"] == "385.0000"
+    assert body["rentabilidade"] == "10.0000"
+    params = cursor.execute.call_args_list[0][0][1]
+    assert params[7:] == (385.0, 10.0)
+
+
+def test_criar_transacao_sem_cotacao_nao_espera(client):
+    provider = FakeProvider({"PETR4": 38.5}, atraso=1)
+    quotes.configurar_provider(provider)
+    conn = MagicMock()
+    conn.cursor.return_value = MagicMock()
+
+    try:
+        with patch("api.execute_routes.get_connection", return_value=conn):
+            response = client.post("/invest/create", json=PAYLOAD)
+    finally:
+        quotes.close_quote_service()
+
+    assert response.status_code == 201
+    assert response.json()["cotacao"] == "cliente"
+    assert response.json()["valor_atual"] == "1.00"
+
+
+def test_rota_cotacoes(client, feed):
+    provider, _ = feed
+
+    response = client.get("/invest/cotacoes?tickers=PETR4,VALE3", headers=internal_headers)
+
+    assert response.status_code == 200
+    assert response.json()["VALE3"] == {"preco": "61.20", "estado": FRESCA}
+    assert len(provider.chamadas) == 1
@@ -0,0 +1,278 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from api import reconciliation
+from api.reconciliation import acumular, comparar, conciliar, ConciliacaoConcorrente
+from api.migrations import carregar_migracoes, MIGRATIONS_DIR
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+AGORA = datetime(2026, 10, 18, 3, 0, 0)
+
+
+class BancoConciliacao:
+    # Tabelas em memória respondendo às consultas da conciliação
+    def __init__(self):
+        self.ledger = []
+        self.saldos = {}
+        self.snapshots = {}
+        self.checkpoint = 0
+        self.execucoes = []
+        self.divergencias = []
+        self.linhas_lidas = 0
+
+    def operar(self, origem, destino, valor, idade=timedelta(hours=1)):
+        valor = Decimal(valor)
+        self.ledger.append((len(self.ledger) + 1, origem, destino, valor, AGORA - idade))
+        for email, sinal in ((origem.lower(), -1), (destino.lower(), 1)):
+            if email not in reconciliation.CONTRAPARTES:
+                self.saldos[email] = self.saldos.get(email, Decimal(0)) + sinal * valor
+
+    def conexao(self, **kwargs):
+        conn = MagicMock()
+        conn.cursor.side_effect = lambda **kwargs: self._cursor()
+        return conn
+
+    def _cursor(self):
+        cursor = MagicMock()
+        estado = {"linhas": []}
+
+        def execute(sql, params=()):
+            estado["linhas"] = self._consultar(cursor, sql, params)
+
+        def fetchmany(n):
+            lote, estado["linhas"] = estado["linhas"][:n], estado["linhas"][n:]
+            self.linhas_lidas += len(lote) if lote and len(lote[0]) == 5 else 0
+            return lote
+
+        def executemany(sql, linhas):
+            for linha in linhas:
+                self._consultar(cursor, sql, linha)
+
+        cursor.execute.side_effect = execute
+        cursor.executemany.side_effect = executemany
+        cursor.fetchone.side_effect = lambda: estado["linhas"][0] if estado["linhas"] else None
+        cursor.fetchall.side_effect = lambda: estado["linhas"]
+        cursor.fetchmany.side_effect = fetchmany
+        return cursor
+
+    def _consultar(self, cursor, sql, params):
+        sql = " ".join(sql.split())
+        if sql.startswith("SELECT ultimo_id FROM conciliacao_checkpoint"):
+            return [(self.checkpoint,)]
+        if sql.startswith("SELECT NOW()"):
+            return [(AGORA - timedelta(seconds=params[0]),)]
+        if sql.startswith("SELECT id, email_origin"):
+            return [linha for linha in self.ledger if linha[0] > params[0]]
+        if "FROM usuarios WHERE email_normalizado IN" in sql:
+            return [(e, self.saldos[e]) for e in params if e in self.saldos]
+        if "FROM saldo_snapshots WHERE email IN" in sql:
+            return [(e, self.snapshots[e]) for e in params if e in self.snapshots]
+        if "LEFT JOIN saldo_snapshots" in sql:
+            return [(e, s, self.snapshots.get(e)) for e, s in self.saldos.items()]
+        if sql.startswith("UPDATE conciliacao_checkpoint"):
+            novo, anterior = params
+            cursor.rowcount = int(self.checkpoint == anterior and novo != anterior)
+            if self.checkpoint == anterior:
+                self.checkpoint = novo
+            return []
+        if sql.startswith("INSERT INTO saldo_snapshots"):
+            email, delta, _ = params
+            self.snapshots[email] = self.snapshots.get(email, Decimal(0)) + delta
+            return []
+        if sql.startswith("INSERT INTO conciliacao_execucoes"):
+            self.execucoes.append(params)
+            cursor.lastrowid = len(self.execucoes)
+            return []
+        if sql.startswith("INSERT INTO conciliacao_divergencias"):
+            self.divergencias.append(params)
+            return []
+        raise AssertionError(f"SQL inesperado: {sql}")
+
+
+def popular(banco, n, contas=20):
+    for i in range(n):
+        if i % 3 == 0:
+            banco.operar("DEPOSITO", f"u{i % contas}@x.com", "100.00")
+        elif i % 3 == 1:
+            banco.operar(f"u{i % contas}@x.com", "SAQUE", "1.10")
+        else:
+            banco.operar(f"U{i % contas}@X.com", f"u{(i + 1) % contas}@x.com", "2.35")
+
+
+# =========================
+# ACUMULAÇÃO
+# =========================
+
+def test_acumula_fluxo_liquido_sem_contrapartes():
+    limite = AGORA - timedelta(minutes=5)
+    linhas = [
+        (1, "DEPOSITO", "A@x.com", Decimal("10.00"), AGORA - timedelta(hours=1)),
+        (2, "a@x.com", "b@x.com", Decimal("3.00"), AGORA - timedelta(hours=1)),
+        (3, "b@x.com", "SAQUE", Decimal("1.00"), AGORA),
+        (4, "a@x.com", "b@x.com", Decimal("1.00"), AGORA - timedelta(hours=1)),
+    ]
+
+    fluxos = acumular(linhas, limite)
+
+    assert fluxos["liquidado"] == {"a@x.com": Decimal("7.00"), "b@x.com": Decimal("3.00")}
+    # A partir da primeira linha recente, nada entra no checkpoint
+    assert fluxos["recente"] == {"a@x.com": Decimal("-1.00"), "b@x.com": Decimal("0.00")}
+    assert fluxos["ate_id"] == 2
+    assert fluxos["linhas"] == 4
+
+
+def test_compara_snapshot_mais_fluxos():
+    fluxos = {"liquidado": {"a": Decimal("5")}, "recente": {"a": Decimal("1")}}
+    saldos = {"a": Decimal("16"), "b": Decimal("3")}
+
+    divergencias = comparar(saldos, {"a": Decimal("10")}, fluxos)
+
+    assert divergencias == [{"email": "b", "saldo_cc": Decimal("3"), "esperado": Decimal("0"), "diferenca": Decimal("3")}]
+
+
+# =========================
+# EXECUÇÃO INCREMENTAL
+# =========================
+
+def test_primeira_execucao_cria_snapshot_e_checkpoint():
+    banco = BancoConciliacao()
+    popular(banco, 300)
+
+    resultado = conciliar(banco.conexao(), batch_size=64)
+
+    assert resultado["divergencias"] == []
+    assert resultado["linhas"] == 300
+    assert banco.checkpoint == 300
+    assert banco.snapshots == banco.saldos
+    assert banco.execucoes[0][:5] == (0, 300, 300, 20, 0)
+
+
+def test_execucao_seguinte_le_so_linhas_novas():
+    banco = BancoConciliacao()
+    popular(banco, 300)
+    conciliar(banco.conexao())
+    banco.operar("DEPOSITO", "u1@x.com", "5.00")
+    banco.operar("u1@x.com", "u2@x.com", "1.00")
+    banco.linhas_lidas = 0
+
+    resultado = conciliar(banco.conexao())
+
+    assert resultado["linhas"] == 2
+    assert banco.linhas_lidas == 2
+    assert resultado["contas"] == 2
+    assert resultado["divergencias"] == []
+    assert banco.snapshots == banco.saldos
+
+
+def test_detecta_saldo_alterado_fora_do_ledger():
+    banco = BancoConciliacao()
+    popular(banco, 60)
+    conciliar(banco.conexao())
+    banco.operar("DEPOSITO", "u1@x.com", "5.00")
+    banco.saldos["u1@x.com"] += Decimal("0.01")
+    banco.saldos["u7@x.com"] += Decimal("50.00")
+
+    incremental = conciliar(banco.conexao())
+    completa = conciliar(banco.conexao(), completa=True)
+
+    assert [d["email"] for d in incremental["divergencias"]] == ["u1@x.com"]
+    assert incremental["divergencias"][0]["diferenca"] == Decimal("0.01")
+    # Conta sem movimento só aparece na varredura completa
+    assert [d["email"] for d in completa["divergencias"]] == ["u1@x.com", "u7@x.com"]
+    assert banco.divergencias[0][1:] == ("u1@x.com", banco.saldos["u1@x.com"], banco.saldos["u1@x.com"] - Decimal("0.01"))
+
+
+def test_linhas_recentes_nao_avancam_checkpoint():
+    banco = BancoConciliacao()
+    popular(banco, 30)
+    banco.operar("DEPOSITO", "u1@x.com", "5.00", idade=timedelta(seconds=10))
+    banco.operar("DEPOSITO", "u2@x.com", "7.00", idade=timedelta(hours=2))
+
+    resultado = conciliar(banco.conexao(), settle_seconds=300)
+
+    assert resultado["divergencias"] == []
+    assert banco.checkpoint == 30
+    assert banco.snapshots["u1@x.com"] == banco.saldos["u1@x.com"] - Decimal("5.00")
+
+    # Na próxima execução, já liquidadas, as duas linhas entram no snapshot
+    resultado = conciliar(banco.conexao(), settle_seconds=0)
+    assert resultado["linhas"] == 2
+    assert banco.checkpoint == 32
+    assert banco.snapshots == banco.saldos
+
+
+def test_checkpoint_alterado_aborta_sem_gravar():
+    banco = BancoConciliacao()
+    popular(banco, 30)
+    conn = banco.conexao()
+    original = banco._consultar
+
+    def concorrente(cursor, sql, params):
+        if sql.lstrip().startswith("UPDATE conciliacao_checkpoint"):
+            banco.checkpoint = 10
+        return original(cursor, sql, params)
+
+    with patch.object(banco, "_consultar", side_effect=concorrente):
+        with pytest.raises(ConciliacaoConcorrente):
+            conciliar(conn)
+
+    assert banco.snapshots == {}
+    conn.rollback.assert_called()
+
+
+def test_migracao_da_conciliacao():
+    sql = dict((v, s) for v, _, s in carregar_migracoes(MIGRATIONS_DIR))[4]
+    assert "saldo_snapshots" in sql and "conciliacao_checkpoint" in sql
+
+
+# =========================
+# ROTA
+# =========================
+
+def test_rota_conciliacao(client):
+    banco = BancoConciliacao()
+    popular(banco, 30)
+    banco.saldos["u3@x.com"] -= Decimal("1.00")
+
+    with patch("api.execute_routes.get_connection", side_effect=banco.conexao):
+        response = client.post("/internal/conciliacao?completa=true", headers=internal_headers)
+
+    assert response.status_code == 200
+    corpo = response.json()
+    assert corpo["linhas"] == 30
+    assert [d["email"] for d in corpo["divergencias"]] == ["u3@x.com"]
+    assert corpo["divergencias"][0]["diferenca"] == "-1.00"
+
+
+def test_rota_conciliacao_exige_chave(client):
+    response = client.post("/internal/conciliacao", headers={"X-Internal-Key": "errada"})
+
+    assert response.status_code == 403
+
+
+# =========================
+# BENCHMARK – INCREMENTAL
+# =========================
+
+def test_benchmark_incremental_proporcional_as_linhas_novas():
+    banco = BancoConciliacao()
+    popular(banco, 200_000, contas=5_000)
+
+    inicio = time.perf_counter()
+    conciliar(banco.conexao())
+    completa = time.perf_counter() - inicio
+
+    popular(banco, 1_000, contas=5_000)
+    banco.linhas_lidas = 0
+    inicio = time.perf_counter()
+    resultado = conciliar(banco.conexao())
+    incremental = time.perf_counter() - inicio
+
+    print(f"\nconciliação: histórico 200k linhas em {completa:.2f}s, 1k linhas novas em {incremental:.3f}s")
+    assert resultado["divergencias"] == []
+    assert banco.linhas_lidas == 1_000
+    assert incremental < completa
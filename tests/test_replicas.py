@@ -0,0 +1,299 @@
+import time
+from unittest.mock import patch
+
+import mysql.connector
+import pytest
+from fastapi import HTTPException
+
+from api import account_cache, connection
+from api.execute_routes import _login_usuario, _update_usuario, _suspender_conta
+from schemas.schemas import LoginSchema, UpdateUserSchema
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+class ServidorFalso:
+    # Stand-in de um servidor MySQL: tabela de usuários, status de replicação
+    # e o registro de cada comando recebido.
+    def __init__(self, nome, lag=None):
+        self.nome = nome
+        self.lag = lag
+        self.fora_do_ar = False
+        self.usuarios = {}
+        self.comandos = []
+
+    def conectar(self):
+        if self.fora_do_ar:
+            raise mysql.connector.Error(msg=f"Can't connect to MySQL server on '{self.nome}'", errno=2003)
+        return ConexaoFalsa(self)
+
+    def consultas(self, trecho):
+        return [sql for sql in self.comandos if trecho in sql]
+
+
+class ConexaoFalsa:
+
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.in_transaction = False
+        self.autocommit = True
+
+    def cursor(self, **kwargs):
+        return CursorFalso(self.servidor)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+class CursorFalso:
+
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.linhas = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        servidor = self.servidor
+        servidor.comandos.append(sql)
+        usuarios = servidor.usuarios
+
+        if sql == "SHOW REPLICA STATUS":
+            self.linhas = [] if servidor.lag == "primario" else [{"Seconds_Behind_Source": servidor.lag}]
+        elif sql.startswith("SELECT id, senha, correntista FROM usuarios WHERE email"):
+            self.linhas = [
+                {"id": u["id"], "senha": u["senha"], "correntista": u.get("correntista", 1)}
+                for u in usuarios.values() if u["email"] == params[0]
+            ]
+        elif sql.startswith("SELECT id FROM usuarios WHERE id"):
+            self.linhas = [{"id": params[0]}] if params[0] in usuarios else []
+        elif sql.startswith("SELECT email FROM usuarios WHERE id"):
+            self.linhas = [{"email": usuarios[params[0]]["email"]}] if params[0] in usuarios else []
+        elif sql.startswith("UPDATE usuarios SET correntista = 0"):
+            usuarios[params[0]]["correntista"] = 0
+            self.rowcount = 1
+        elif sql.startswith("UPDATE usuarios"):
+            user_id = params[-1]
+            usuarios[user_id].update(nome=params[0], email=params[1])
+            self.rowcount = 1
+        else:
+            raise AssertionError(f"SQL inesperado: {sql}")
+
+    def fetchone(self):
+        return self.linhas[0] if self.linhas else None
+
+    def fetchall(self):
+        return self.linhas
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def servidores():
+    primario = ServidorFalso("primario", lag="primario")
+    replica = ServidorFalso("replica1", lag=0)
+    for servidor in (primario, replica):
+        servidor.usuarios[1] = {"id": 1, "email": "a@a.com", "nome": "A", "senha": "hash"}
+
+    def conectar(modo=None, host=None, port=None):
+        assert host in (None, "replica1")
+        return (replica if host == "replica1" else primario).conectar()
+
+    connection.close_pool(0)
+    with patch.object(connection, "_connect", conectar), \
+         patch.object(connection, "DB_REPLICA_HOSTS", ["replica1:3307"]), \
+         patch.object(connection, "DB_REPLICA_LAG_CHECK_INTERVAL", 0), \
+         patch.object(connection, "DB_REPLICA_MAX_LAG", 2.0):
+        yield primario, replica
+        connection.close_pool(0)
+
+
+def login(email="a@a.com"):
+    # Sem cache de contas: cada login vai ao banco
+    account_cache.limpar()
+    return _login_usuario(LoginSchema(email=email, senha="x"))
+
+
+# =========================
+# ROTEAMENTO
+# =========================
+
+def test_login_le_da_replica(servidores):
+    primario, replica = servidores
+
+    assert login()["id"] == 1
+
+    assert len(replica.consultas("FROM usuarios WHERE email")) == 1
+    assert primario.consultas("FROM usuarios") == []
+    assert connection.replica_stats()["leituras_replica"] == 1
+
+
+def test_conta_que_nao_chegou_na_replica_e_confirmada_no_primario(servidores):
+    primario, replica = servidores
+    primario.usuarios[2] = {"id": 2, "email": "novo@a.com", "nome": "N", "senha": "hash"}
+
+    assert login("novo@a.com")["id"] == 2
+
+    assert len(replica.consultas("FROM usuarios WHERE email")) == 1
+    assert len(primario.consultas("FROM usuarios WHERE email")) == 1
+
+    with pytest.raises(HTTPException) as erro:
+        login("ninguem@a.com")
+    assert erro.value.status_code == 404
+
+
+def test_replica_atrasada_cai_no_primario(servidores):
+    primario, replica = servidores
+    replica.lag = 30
+
+    login()
+
+    assert replica.consultas("FROM usuarios") == []
+    assert len(primario.consultas("FROM usuarios WHERE email")) == 1
+    stats = connection.replica_stats()
+    assert stats["fallback_lag"] == 1
+    assert stats["replicas"][0]["lag"] == 30.0
+
+    # Alcançou o primário: volta a receber leituras
+    replica.lag = 0
+    login()
+    assert len(replica.consultas("FROM usuarios WHERE email")) == 1
+
+
+def test_replicacao_parada_cai_no_primario(servidores):
+    primario, replica = servidores
+    replica.lag = None
+
+    login()
+
+    assert len(primario.consultas("FROM usuarios WHERE email")) == 1
+
+
+def test_replica_fora_do_ar_cai_no_primario(servidores):
+    primario, replica = servidores
+    replica.fora_do_ar = True
+
+    login()
+
+    assert len(primario.consultas("FROM usuarios WHERE email")) == 1
+    assert "Can't connect" in connection.replica_stats()["replicas"][0]["erro"]
+
+
+def test_verificacao_de_atraso_respeita_intervalo(servidores):
+    _, replica = servidores
+
+    with patch.object(connection, "DB_REPLICA_LAG_CHECK_INTERVAL", 60):
+        connection.close_pool(0)
+        for _ in range(5):
+            login()
+
+    assert len(replica.consultas("SHOW REPLICA STATUS")) == 1
+    assert len(replica.consultas("FROM usuarios WHERE email")) == 5
+
+
+# =========================
+# LEITURA APÓS ESCRITA
+# =========================
+
+def test_update_le_da_replica_e_escreve_no_primario(servidores):
+    primario, replica = servidores
+
+    _update_usuario(1, UpdateUserSchema(nome="B", email="a@a.com", telefone="1"))
+
+    assert len(replica.consultas("SELECT id FROM usuarios WHERE id")) == 1
+    assert len(primario.consultas("UPDATE usuarios")) == 1
+    assert replica.consultas("UPDATE") == []
+    assert primario.usuarios[1]["nome"] == "B"
+
+
+def test_usuario_que_escreveu_le_do_primario(servidores):
+    primario, replica = servidores
+
+    _update_usuario(1, UpdateUserSchema(nome="B", email="a@a.com", telefone="1"))
+    _update_usuario(1, UpdateUserSchema(nome="C", email="a@a.com", telefone="1"))
+    login()
+
+    # Só a primeira checagem foi à réplica; depois da escrita, tudo no primário
+    assert len(replica.consultas("FROM usuarios WHERE")) == 1
+    assert len(primario.consultas("SELECT id FROM usuarios WHERE id")) == 1
+    assert len(primario.consultas("FROM usuarios WHERE email")) == 1
+    assert connection.replica_stats()["fallback_escrita"] == 2
+
+
+def test_login_depois_de_suspender_le_do_primario(servidores):
+    primario, replica = servidores
+
+    _suspender_conta(1)
+    # A réplica ainda não recebeu a suspensão
+    with pytest.raises(HTTPException) as erro:
+        login()
+
+    assert erro.value.status_code == 403
+    assert replica.consultas("FROM usuarios WHERE email") == []
+
+
+def test_login_lido_da_replica_nao_entra_no_cache(servidores):
+    account_cache.limpar()
+
+    _login_usuario(LoginSchema(email="a@a.com", senha="x"))
+
+    assert account_cache.get_por_email("a@a.com") is None
+
+
+def test_outro_usuario_segue_na_replica(servidores):
+    _, replica = servidores
+    replica.usuarios[3] = {"id": 3, "email": "c@c.com", "nome": "C", "senha": "hash"}
+
+    connection.marcar_escrita(email="a@a.com")
+    login("c@c.com")
+
+    assert len(replica.consultas("FROM usuarios WHERE email")) == 1
+
+
+def test_janela_de_leitura_apos_escrita_expira(servidores):
+    primario, replica = servidores
+
+    with patch.object(connection, "DB_READ_YOUR_WRITES_SECONDS", 0.05):
+        connection.close_pool(0)
+        connection.marcar_escrita(email="A@a.com")
+        login()
+        time.sleep(0.06)
+        login()
+
+    assert len(primario.consultas("FROM usuarios WHERE email")) == 1
+    assert len(replica.consultas("FROM usuarios WHERE email")) == 1
+
+
+# =========================
+# SEM RÉPLICAS / STATS
+# =========================
+
+def test_sem_replicas_tudo_no_primario(servidores):
+    primario, replica = servidores
+
+    with patch.object(connection, "DB_REPLICA_HOSTS", []):
+        connection.close_pool(0)
+        login()
+        assert connection.replica_stats() == {"replicas": []}
+
+    assert replica.comandos == []
+    assert len(primario.consultas("FROM usuarios WHERE email")) == 1
+
+
+def test_stats_expoe_replicas(client, servidores):
+    with patch("api.execute_routes.pool_stats", return_value={}):
+        response = client.get("/internal/stats", headers=internal_headers)
+
+    replicas = response.json()["replicas"]
+    assert replicas["replicas"][0]["nome"] == "replica1:3307"
+    assert {"leituras_replica", "leituras_primario", "fallback_lag"} <= set(replicas)
@@ -0,0 +1,88 @@
+import json
+import time
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from api.responses import FastJSONResponse, model_response
+from schemas.schemas import DepositoDBResponse
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+# =========================
+# SERIALIZAÇÃO
+# =========================
+
+def test_modelo_serializado_direto_em_bytes():
+    resposta = FastJSONResponse(DepositoDBResponse(saldo_atual=Decimal("150.10")))
+
+    assert json.loads(resposta.body) == {"saldo_atual": "150.10"}
+    assert resposta.headers["content-type"] == "application/json"
+
+
+def test_dict_com_decimal_e_datetime():
+    resposta = FastJSONResponse({
+        "valor": Decimal("10.50"),
+        "quando": datetime(2026, 1, 2, 3, 4, 5),
+        "modelo": DepositoDBResponse(saldo_atual=Decimal("1")),
+        1: "chave inteira"
+    })
+
+    assert json.loads(resposta.body) == {
+        "valor": "10.50",
+        "quando": "2026-01-02T03:04:05",
+        "modelo": {"saldo_atual": "1.00"},
+        "1": "chave inteira"
+    }
+
+
+def test_model_response_preserva_headers():
+    injetada = MagicMock(headers={"Idempotency-Replayed": "true"})
+
+    resposta = model_response(DepositoDBResponse(saldo_atual=Decimal("1")), injetada)
+
+    assert resposta.headers["Idempotency-Replayed"] == "true"
+
+
+def test_render_mais_rapido_que_jsonable_encoder():
+    modelo = DepositoDBResponse(saldo_atual=Decimal("150.10"))
+    n = 20000
+
+    inicio = time.perf_counter()
+    for _ in range(n):
+        JSONResponse(jsonable_encoder(modelo))
+    padrao = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for _ in range(n):
+        FastJSONResponse(modelo)
+    rapido = time.perf_counter() - inicio
+
+    print(f"\nrender: padrão {n / padrao:,.0f}/s, orjson/pydantic {n / rapido:,.0f}/s")
+    assert rapido < padrao
+
+
+# =========================
+# BENCHMARK /deposito
+# =========================
+
+def test_benchmark_requisicoes_deposito(client):
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchone.return_value = {"id": 1, "saldo_cc": Decimal("100.00")}
+    conn.cursor.return_value = cursor
+    n = 500
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        inicio = time.perf_counter()
+        for _ in range(n):
+            response = client.post("/deposito", json={"email": "a@a.com", "valor": 10}, headers=internal_headers)
+        decorrido = time.perf_counter() - inicio
+
+    assert response.status_code == 200
+    assert response.json() == {"saldo_atual": "110.00"}
+    print(f"\n/deposito: {n / decorrido:,.0f} req/s (DB mockado, TestClient)")
@@ -0,0 +1,109 @@
+import asyncio
+import time
+import httpx
+import pytest
+from unittest.mock import patch, MagicMock
+from fastapi import HTTPException
+
+from api.connection import run_db, DB_EXECUTOR_WORKERS
+from api.execute_routes import _realizar_deposito
+from api.main import app
+from schemas.schemas import DepositoDBRequest
+
+LATENCIA_QUERY = 0.01
+CONCORRENCIA = 10
+
+
+# ============================
+# HELPERS
+# ============================
+
+def build_slow_db():
+    """Conexão mock cujo execute bloqueia como uma query real no RDS."""
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.execute.side_effect = lambda *args, **kwargs: time.sleep(LATENCIA_QUERY)
+    cursor.fetchone.return_value = {"id": 1, "saldo_cc": 100}
+    conn.cursor.return_value = cursor
+    return conn
+
+
+# ============================
+# run_db
+# ============================
+
+def test_run_db_retorna_resultado():
+    assert asyncio.run(run_db(lambda a, b=0: a + b, 1, b=2)) == 3
+
+
+def test_run_db_propaga_http_exception():
+    def falha():
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run_db(falha))
+
+    assert exc.value.status_code == 404
+
+
+def test_event_loop_nao_bloqueia_durante_query():
+    async def cenario():
+        ticks = 0
+        parar = asyncio.Event()
+
+        async def heartbeat():
+            nonlocal ticks
+            while not parar.is_set():
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        tarefa = asyncio.create_task(heartbeat())
+        await run_db(time.sleep, 0.1)
+        parar.set()
+        await tarefa
+        return ticks
+
+    assert asyncio.run(cenario()) >= 5
+
+
+# ============================
+# BENCHMARK – THROUGHPUT CONCORRENTE
+# ============================
+
+def test_benchmark_deposito_concorrente():
+    data = DepositoDBRequest(email="a@a.com", valor=10)
+
+    async def antes():
+        # Comportamento anterior: o driver rodava direto no event loop.
+        async def handler():
+            return _realizar_deposito(data)
+        await asyncio.gather(*(handler() for _ in range(CONCORRENCIA)))
+
+    async def depois():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            respostas = await asyncio.gather(*(
+                ac.post(
+                    "/deposito",
+                    json={"email": "a@a.com", "valor": 10},
+                    headers={"X-Internal-Key": "INTERNAL_SECRET"}
+                )
+                for _ in range(CONCORRENCIA)
+            ))
+        assert all(r.status_code == 200 for r in respostas)
+
+    with patch("api.execute_routes.get_connection", side_effect=lambda **kwargs: build_slow_db()):
+        inicio = time.perf_counter()
+        asyncio.run(antes())
+        tempo_antes = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        asyncio.run(depois())
+        tempo_depois = time.perf_counter() - inicio
+
+    print(
+        f"\n{CONCORRENCIA} depósitos concorrentes ({DB_EXECUTOR_WORKERS} workers): "
+        f"antes {CONCORRENCIA / tempo_antes:.1f} req/s, "
+        f"depois {CONCORRENCIA / tempo_depois:.1f} req/s"
+    )
+    assert tempo_depois < tempo_antes
@@ -45,7 +45,7 @@ def test_deposito_sucesso():
         response = client.post("/deposito", headers=internal_headers, json=payload)
 
     assert response.status_code == 200
-    assert response.json()["saldo_atual"] == 100  # porque mock retorna sempre 100
+    assert response.json()["saldo_atual"] == "150.00"  # saldo lido com lock + depósito
 
 def test_deposito_usuario_nao_encontrado():
     conn, cursor = build_db(fetchone=None)
@@ -108,7 +108,7 @@ def test_saque_sucesso():
         response = client.post("/saque", headers=internal_headers, json=payload)
 
     assert response.status_code == 200
-    assert response.json()["saldo_atual"] == 200  # retorna valor mockado
+    assert response.json()["saldo_atual"] == "150.00"  # saldo lido com lock - saque
 
 def test_saque_usuario_nao_encontrado():
     conn, cursor = build_db(fetchone=None)
@@ -168,3 +168,42 @@ def test_saque_erro_generico():
     conn.rollback.assert_called_once()
     cursor.close.assert_called_once()
     conn.close.assert_called_once()
+
+def test_saque_update_condicional_sem_linhas():
+    # Saldo mudou entre a leitura e o UPDATE: a condição saldo_cc >= valor barra o saque
+    conn, cursor = build_db(fetchone={"id": 1, "saldo_cc": 100}, rowcount=0)
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        payload = {"email": "a@a.com", "valor": 50}
+        response = client.post("/saque", headers=internal_headers, json=payload)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Saldo insuficiente"
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
+
+# =========================
+# ROUND TRIPS
+# =========================
+
+def test_deposito_tres_comandos_sem_select_final():
+    conn, cursor = build_db(fetchone={"id": 1, "saldo_cc": 100})
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        client.post("/deposito", headers=internal_headers, json={"email": "a@a.com", "valor": 50})
+
+    comandos = [c.args[0] for c in cursor.execute.call_args_list]
+    assert len(comandos) == 3
+    assert "FOR UPDATE" in comandos[0]
+    assert cursor.fetchone.call_count == 1
+
+def test_saque_tres_comandos_com_update_condicional():
+    conn, cursor = build_db(fetchone={"id": 1, "saldo_cc": 100})
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        client.post("/saque", headers=internal_headers, json={"email": "a@a.com", "valor": 50})
+
+    comandos = [c.args[0] for c in cursor.execute.call_args_list]
+    assert len(comandos) == 3
+    assert "saldo_cc >= %s" in comandos[1]
+    assert cursor.fetchone.call_count == 1
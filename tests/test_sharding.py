@@ -0,0 +1,686 @@
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+import mysql.connector
+import pytest
+from fastapi import HTTPException, Response
+
+from api import connection, resharding, sharding, xa
+from api.execute_routes import (
+    _executar_transacao_data,
+    _executar_transacoes_lote,
+    _insert_usuario,
+    _login_usuario,
+    _realizar_deposito,
+    _update_usuario,
+)
+from schemas.schemas import CriarConta, DepositoDBRequest, LoginSchema, TransacaoDataPayload, UpdateUserSchema
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter("DECIMAL", lambda v: Decimal(v.decode()).quantize(Decimal("0.01")))
+
+ESQUEMA = """
+    CREATE TABLE usuarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        email TEXT NOT NULL,
+        telefone TEXT NOT NULL,
+        senha TEXT NOT NULL,
+        correntista INTEGER NOT NULL DEFAULT 1,
+        saldo_cc DECIMAL NOT NULL DEFAULT 0,
+        email_normalizado TEXT GENERATED ALWAYS AS (lower(email)) STORED
+    );
+    CREATE UNIQUE INDEX uq_usuarios_email_normalizado ON usuarios (email_normalizado);
+    CREATE TABLE transacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email_origin TEXT NOT NULL,
+        email_destination TEXT NOT NULL,
+        valor DECIMAL NOT NULL,
+        mensagem TEXT,
+        create_time DATETIME NOT NULL
+    );
+    CREATE TABLE idempotency_keys (
+        rota TEXT NOT NULL,
+        chave TEXT NOT NULL,
+        hash_requisicao TEXT NOT NULL,
+        resposta TEXT NOT NULL,
+        create_time DATETIME NOT NULL,
+        PRIMARY KEY (rota, chave)
+    );
+    CREATE TABLE saldo_shards (
+        usuario_id INTEGER NOT NULL,
+        shard INTEGER NOT NULL,
+        saldo DECIMAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (usuario_id, shard)
+    );
+    CREATE TABLE saldo_snapshots (email TEXT PRIMARY KEY, saldo DECIMAL NOT NULL, ate_id INTEGER NOT NULL);
+    CREATE TABLE dir.mapa_shards (
+        usuario_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email_normalizado TEXT NOT NULL UNIQUE,
+        shard INTEGER NOT NULL,
+        movendo INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE dir.xa_log (
+        xid TEXT PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        shards TEXT NOT NULL,
+        dados TEXT,
+        criado_em DATETIME NOT NULL,
+        atualizado_em DATETIME NOT NULL
+    );
+"""
+
+# Dialeto MySQL das rotas -> SQLite
+TRADUCOES = [
+    (re.compile(r"NOW\(\) - INTERVAL %s SECOND"), "datetime('now', (-1 * %s) || ' seconds')"),
+    (re.compile(r"NOW\(\)"), "datetime('now')"),
+    (re.compile(r"\s+FOR UPDATE"), ""),
+    (re.compile(r"\b(mapa_shards|xa_log)\b"), r"dir.\1"),
+    (re.compile(r"%s"), "?"),
+]
+
+
+def traduzir(sql):
+    sql = " ".join(sql.split())
+    for padrao, troca in TRADUCOES:
+        sql = padrao.sub(troca, sql)
+    return sql
+
+
+class ServidorLocal:
+    # Uma instância de banco por shard: SQLite em arquivo (WAL), com o
+    # diretório num arquivo anexado para os locks não se misturarem, e XA
+    # de verdade: ramo preparado sobrevive à sessão até COMMIT/ROLLBACK.
+
+    def __init__(self, pasta):
+        pasta.mkdir()
+        self.arquivo = str(pasta / "dados.db")
+        self.diretorio = str(pasta / "diretorio.db")
+        self.preparados = {}
+        self.comandos = []
+        conn = self.sqlite()
+        conn.executescript(ESQUEMA)
+        conn.close()
+
+    def sqlite(self):
+        conn = sqlite3.connect(
+            self.arquivo, isolation_level=None, timeout=0.5,
+            detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("ATTACH DATABASE ? AS dir", (self.diretorio,))
+        return conn
+
+    def conectar(self):
+        return SessaoLocal(self)
+
+    def sql(self, sql, params=()):
+        conn = self.sqlite()
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(r) for r in conn.execute(traduzir(sql), params).fetchall()]
+        finally:
+            conn.close()
+
+    def usuario(self, email):
+        linhas = self.sql("SELECT * FROM usuarios WHERE email = %s", (email,))
+        return linhas[0] if linhas else None
+
+    def ledger(self, email):
+        return self.sql(
+            "SELECT email_origin, email_destination, valor FROM transacoes "
+            "WHERE email_origin = %s OR email_destination = %s ORDER BY id",
+            (email, email)
+        )
+
+    def fechar(self):
+        for conn in self.preparados.values():
+            conn.close()
+
+
+class SessaoLocal:
+
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.db = servidor.sqlite()
+        self.autocommit = False
+        self.xa = None
+
+    @property
+    def in_transaction(self):
+        return self.db.in_transaction
+
+    def cursor(self, dictionary=False, **kwargs):
+        return CursorLocal(self, dictionary)
+
+    def commit(self):
+        if self.db.in_transaction:
+            self.db.execute("COMMIT")
+
+    def rollback(self):
+        if self.db.in_transaction:
+            self.db.execute("ROLLBACK")
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        # Desconexão desfaz o XA não preparado, como no MySQL
+        if self.xa is not None:
+            self.xa[1].close()
+        self.db.close()
+
+
+class CursorLocal:
+
+    def __init__(self, sessao, dictionary):
+        self.sessao = sessao
+        self.dictionary = dictionary
+        self.linhas = []
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def _xa(self, sql, params):
+        sessao = self.sessao
+        servidor = sessao.servidor
+        comando = sql.split()[1]
+        xid = tuple(params)
+        if comando == "START":
+            db = servidor.sqlite()
+            db.execute("BEGIN")
+            sessao.xa = (xid, db)
+        elif comando == "END":
+            pass
+        elif comando == "PREPARE":
+            servidor.preparados[xid] = sessao.xa[1]
+            sessao.xa = None
+        elif comando == "RECOVER":
+            self.linhas = [
+                {"formatID": 1, "gtrid_length": len(g), "bqual_length": len(b), "data": (g + b).encode()}
+                for g, b in servidor.preparados
+            ]
+        else:
+            if sessao.xa is not None and sessao.xa[0] == xid:
+                db, sessao.xa = sessao.xa[1], None
+            elif xid in servidor.preparados:
+                db = servidor.preparados.pop(xid)
+            else:
+                raise mysql.connector.Error(msg="XAER_NOTA: Unknown XID", errno=1397)
+            db.execute("COMMIT" if comando == "COMMIT" else "ROLLBACK")
+            db.close()
+
+    def _executar(self, metodo, sql, params):
+        self.sessao.servidor.comandos.append(" ".join(sql.split()))
+        if sql.strip().startswith("XA "):
+            return self._xa(sql.strip(), params)
+        sessao = self.sessao
+        db = sessao.xa[1] if sessao.xa is not None else sessao.db
+        if sessao.xa is None and not sessao.autocommit and not db.in_transaction:
+            db.execute("BEGIN")
+        try:
+            cursor = getattr(db, metodo)(traduzir(sql), params)
+        except sqlite3.IntegrityError as e:
+            raise mysql.connector.errors.IntegrityError(msg=str(e), errno=1062)
+        except sqlite3.OperationalError as e:
+            raise mysql.connector.errors.DatabaseError(msg=str(e), errno=1205)
+        colunas = [c[0] for c in cursor.description or ()]
+        linhas = cursor.fetchall() if colunas else []
+        self.linhas = [dict(zip(colunas, l)) for l in linhas] if self.dictionary else linhas
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid
+
+    def execute(self, sql, params=()):
+        self._executar("execute", sql, tuple(params or ()))
+
+    def executemany(self, sql, seq):
+        self._executar("executemany", sql, [tuple(p) for p in seq])
+
+    def fetchone(self):
+        return self.linhas.pop(0) if self.linhas else None
+
+    def fetchall(self):
+        linhas, self.linhas = self.linhas, []
+        return linhas
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def shards(tmp_path):
+    servidores = [ServidorLocal(tmp_path / f"shard{i}") for i in range(3)]
+
+    def conectar(modo=None, host=None, port=None, database=None):
+        return servidores[int(host.removeprefix("shard")) if host else 0].conectar()
+
+    connection.close_pool(0)
+    sharding._cache.clear()
+    with patch.object(connection, "_connect", conectar), \
+         patch.object(sharding, "DB_SHARD_HOSTS", ["shard1", "shard2"]):
+        yield servidores
+        connection.close_pool(0)
+    sharding._cache.clear()
+    for servidor in servidores:
+        servidor.fechar()
+
+
+def email_no_shard(shard, nome):
+    # E-mail cujo shard padrão (crc32 % 3) é `shard`
+    i = 0
+    while zlib.crc32(f"{nome}{i}@a.com".encode()) % 3 != shard:
+        i += 1
+    return f"{nome}{i}@a.com"
+
+
+def criar(servidores, shard, nome, saldo="0"):
+    email = email_no_shard(shard, nome)
+    _insert_usuario(CriarConta(nome=nome, email=email, telefone="1", senha="x"), "hash")
+    servidores[shard].sql("UPDATE usuarios SET saldo_cc = %s WHERE email = %s", (saldo, email))
+    conta = servidores[shard].usuario(email)
+    return conta["id"], email
+
+
+def transferir(origem, destino, valor, chave=None, response=None):
+    (origem_id, email_origem), (_, email_destino) = origem, destino
+    payload = TransacaoDataPayload(
+        email_origin=email_origem, user_origin_id=origem_id,
+        email_destination=email_destino, valor=valor
+    )
+    return _executar_transacao_data(payload, chave, response)
+
+
+def saldo(servidor, email):
+    return servidor.usuario(email)["saldo_cc"]
+
+
+def xa_log(servidores):
+    return servidores[0].sql("SELECT tipo, estado, shards FROM xa_log")
+
+
+# =========================
+# DIRETÓRIO E ROTEAMENTO
+# =========================
+
+def test_sem_shards_tudo_no_primario():
+    assert not sharding.ativo()
+    assert connection.localizar_shard(email="a@a.com") == 0
+
+
+def test_conta_nova_vai_para_o_shard_do_email(shards):
+    ids = [criar(shards, shard, "ana")[0] for shard in range(3)]
+
+    # Ids vêm do diretório: únicos entre os shards
+    assert ids == [1, 2, 3]
+    mapa = shards[0].sql("SELECT usuario_id, shard FROM mapa_shards ORDER BY usuario_id")
+    assert [m["shard"] for m in mapa] == [0, 1, 2]
+    for shard, servidor in enumerate(shards):
+        assert len(servidor.sql("SELECT id FROM usuarios")) == 1
+        assert servidor.sql("SELECT id FROM usuarios")[0]["id"] == ids[shard]
+
+
+def test_email_duplicado_nao_cria_conta(shards):
+    _, email = criar(shards, 1, "ana")
+
+    with pytest.raises(HTTPException) as erro:
+        _insert_usuario(CriarConta(nome="outra", email=email.upper(), telefone="1", senha="x"), "hash")
+
+    assert erro.value.status_code == 500
+    assert len(shards[0].sql("SELECT usuario_id FROM mapa_shards")) == 1
+    assert len(shards[1].sql("SELECT id FROM usuarios")) == 1
+
+
+def test_rotas_vao_ao_shard_da_conta(shards):
+    conta_id, email = criar(shards, 2, "bia")
+    shards[2].comandos.clear()
+    shards[0].comandos.clear()
+
+    resposta = _realizar_deposito(DepositoDBRequest(email=email, valor=Decimal("10")))
+    assert resposta.saldo_atual == Decimal("10.00")
+    assert _login_usuario(LoginSchema(email=email, senha="x"))["id"] == conta_id
+
+    assert saldo(shards[2], email) == Decimal("10.00")
+    assert len([c for c in shards[2].comandos if "usuarios" in c]) >= 3
+    # O shard 0 só serviu o diretório, uma vez: depois vale o cache
+    assert [c for c in shards[0].comandos if "usuarios" in c] == []
+    assert len([c for c in shards[0].comandos if "mapa_shards" in c]) <= 1
+
+
+# =========================
+# TRANSFERÊNCIA ENTRE SHARDS
+# =========================
+
+def test_transferencia_entre_shards_confirma_os_dois_ramos(shards):
+    ana = criar(shards, 1, "ana", "100")
+    bia = criar(shards, 2, "bia")
+
+    assert transferir(ana, bia, "30") == {"status": "ok"}
+
+    assert saldo(shards[1], ana[1]) == Decimal("70.00")
+    assert saldo(shards[2], bia[1]) == Decimal("30.00")
+    # Ledger nos dois shards: extrato e conciliação seguem locais
+    assert shards[1].ledger(ana[1]) == [{"email_origin": ana[1], "email_destination": bia[1], "valor": 30}]
+    assert shards[2].ledger(bia[1]) == shards[1].ledger(ana[1])
+    assert xa_log(shards) == [{"tipo": "transferencia", "estado": "concluida", "shards": "1,2"}]
+    assert all(not s.preparados for s in shards)
+
+
+def test_transferencia_no_mesmo_shard_nao_usa_xa(shards):
+    ana = criar(shards, 1, "ana", "100")
+    caio = criar(shards, 1, "caio")
+
+    transferir(ana, caio, "30")
+
+    assert saldo(shards[1], caio[1]) == Decimal("30.00")
+    assert xa_log(shards) == []
+
+
+def test_saldo_insuficiente_desfaz_os_dois_ramos(shards):
+    ana = criar(shards, 1, "ana", "10")
+    bia = criar(shards, 2, "bia")
+
+    with pytest.raises(HTTPException) as erro:
+        transferir(ana, bia, "30")
+
+    assert erro.value.detail == "Saldo insuficiente"
+    assert saldo(shards[1], ana[1]) == Decimal("10.00")
+    assert shards[1].ledger(ana[1]) == [] and shards[2].ledger(bia[1]) == []
+    assert xa_log(shards)[0]["estado"] == "abortada"
+
+
+def test_destino_inexistente_desfaz_o_debito(shards):
+    ana = criar(shards, 2, "ana", "100")
+    ninguem = (0, email_no_shard(0, "ninguem"))
+
+    with pytest.raises(HTTPException) as erro:
+        transferir(ana, ninguem, "30")
+
+    assert erro.value.status_code == 404
+    assert saldo(shards[2], ana[1]) == Decimal("100.00")
+    assert all(not s.preparados for s in shards)
+
+
+def test_idempotencia_entre_shards(shards):
+    ana = criar(shards, 1, "ana", "100")
+    bia = criar(shards, 2, "bia")
+
+    transferir(ana, bia, "30", chave="k1")
+    response = Response()
+    assert transferir(ana, bia, "30", chave="k1", response=response) == {"status": "ok"}
+
+    assert response.headers["Idempotency-Replayed"] == "true"
+    assert saldo(shards[1], ana[1]) == Decimal("70.00")
+    assert len(xa_log(shards)) == 1
+
+
+def test_lote_separa_itens_do_mesmo_shard_e_entre_shards(shards):
+    ana = criar(shards, 1, "ana", "100")
+    caio = criar(shards, 1, "caio")
+    bia = criar(shards, 2, "bia")
+
+    def item(origem, destino, valor):
+        return TransacaoDataPayload(
+            email_origin=origem[1], user_origin_id=origem[0],
+            email_destination=destino[1], valor=valor
+        )
+
+    resultado = _executar_transacoes_lote([item(ana, bia, "10"), item(ana, caio, "20"), item(bia, ana, "50")], None)
+
+    assert [r["indice"] for r in resultado["resultados"]] == [0, 1, 2]
+    assert [r["status"] for r in resultado["resultados"]] == ["ok", "ok", "erro"]
+    assert resultado["resultados"][2]["detail"] == "Saldo insuficiente"
+    assert saldo(shards[1], ana[1]) == Decimal("70.00")
+    assert saldo(shards[2], bia[1]) == Decimal("10.00")
+
+
+class SessaoContada:
+    # Conexão sem banco para o teste de concorrência: só responde ao xa_log
+    def __init__(self):
+        self.autocommit = False
+        self.in_transaction = False
+
+    def cursor(self, **kwargs):
+        cursor = MagicMock()
+        cursor.rowcount = 1
+        cursor.fetchone.return_value = None
+        return cursor
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_transacoes_concorrentes_nao_esgotam_o_pool_do_shard_0():
+    # Pool de 2 conexões por shard e ramos no shard 0: log e ramo de uma
+    # transação cabem juntos, e as demais esperam a vez em vez de estourar
+    erros = []
+
+    def transacao():
+        try:
+            with xa.Transacao("teste") as tx:
+                time.sleep(0.02)
+                tx.ramo(0)
+                tx.ramo(1)
+                time.sleep(0.02)
+                tx.confirmar()
+        except Exception as e:
+            erros.append(e)
+
+    connection.close_pool(0)
+    with patch.object(connection, "_connect", lambda **kwargs: SessaoContada()), \
+         patch.object(connection, "DB_POOL_MAX_SIZE", 2), \
+         patch.object(connection, "DB_POOL_ACQUIRE_TIMEOUT", 2), \
+         patch.object(sharding, "DB_SHARD_HOSTS", ["shard1"]), \
+         patch.object(xa, "_vagas", threading.BoundedSemaphore(1)):
+        threads = [threading.Thread(target=transacao) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert connection.pool_stats()["timeouts"] == 0
+        connection.close_pool(0)
+
+    assert erros == []
+    assert xa.xa_stats()["confirmadas"] >= 6
+
+
+# =========================
+# RECUPERAÇÃO
+# =========================
+
+def test_commit_perdido_apos_a_decisao_e_concluido_pela_recuperacao(shards):
+    ana = criar(shards, 1, "ana", "100")
+    bia = criar(shards, 2, "bia")
+    confirmar = xa.Ramo.confirmar
+
+    def cai_no_shard_2(ramo):
+        if ramo.shard == 2:
+            raise mysql.connector.Error(msg="Lost connection to MySQL server", errno=2013)
+        confirmar(ramo)
+
+    with patch.object(xa.Ramo, "confirmar", cai_no_shard_2):
+        assert transferir(ana, bia, "30") == {"status": "ok"}
+
+    # Decidida: o ramo do destino ficou preparado, à espera da recuperação
+    assert list(shards[2].preparados)[0][1] == "2"
+    assert xa_log(shards)[0]["estado"] == "confirmando"
+    assert saldo(shards[2], bia[1]) == Decimal("0.00")
+
+    assert xa.recuperar() == {"commits": 1, "rollbacks": 0, "abortadas": 0, "concluidas": 1}
+
+    assert saldo(shards[2], bia[1]) == Decimal("30.00")
+    assert xa_log(shards)[0]["estado"] == "concluida"
+    assert not shards[2].preparados
+
+
+def test_coordenador_perdido_antes_da_decisao_e_desfeito(shards):
+    ana = criar(shards, 1, "ana", "100")
+
+    # Coordenador cai com o ramo preparado e o log ainda em 'preparando'
+    tx = xa.Transacao("transferencia").__enter__()
+    tx.ramo(1).execute("UPDATE usuarios SET saldo_cc = saldo_cc - 30 WHERE id = %s", (ana[0],))
+    for ramo in tx._ramos.values():
+        ramo.preparar()
+        ramo.fechar()
+    tx._soltar_log()
+    assert shards[1].preparados
+
+    # Recente: pode ser um coordenador vivo, não mexe
+    assert xa.recuperar(idade=60)["rollbacks"] == 0
+    assert shards[1].preparados
+
+    assert xa.recuperar(idade=-1) == {"commits": 0, "rollbacks": 1, "abortadas": 1, "concluidas": 0}
+    assert not shards[1].preparados
+    assert saldo(shards[1], ana[1]) == Decimal("100.00")
+    assert xa_log(shards)[0]["estado"] == "abortada"
+
+
+# =========================
+# TROCA DE E-MAIL
+# =========================
+
+def test_troca_de_email_atualiza_diretorio_e_shard(shards):
+    ana = criar(shards, 1, "ana")
+
+    _update_usuario(ana[0], UpdateUserSchema(nome="ana", email="nova@a.com", telefone="1"))
+
+    assert shards[1].usuario("nova@a.com")["id"] == ana[0]
+    assert shards[0].sql("SELECT email_normalizado FROM mapa_shards WHERE usuario_id = %s", (ana[0],)) == [
+        {"email_normalizado": "nova@a.com"}
+    ]
+
+
+def test_email_de_conta_em_outro_shard_nao_e_aceito(shards):
+    ana = criar(shards, 1, "ana")
+    bia = criar(shards, 2, "bia")
+
+    with pytest.raises(mysql.connector.Error):
+        _update_usuario(ana[0], UpdateUserSchema(nome="ana", email=bia[1], telefone="1"))
+
+    # Nada mudou: nem o shard da conta, nem o diretório
+    assert shards[1].usuario(ana[1]) is not None
+    assert shards[1].usuario(bia[1]) is None
+    assert shards[0].sql("SELECT email_normalizado FROM mapa_shards WHERE usuario_id = %s", (ana[0],)) == [
+        {"email_normalizado": ana[1]}
+    ]
+
+
+def test_falha_no_shard_devolve_o_email_ao_diretorio(shards):
+    ana = criar(shards, 1, "ana")
+    shards[1].sql("CREATE TRIGGER falha BEFORE UPDATE ON usuarios BEGIN SELECT RAISE(ABORT, 'falha'); END")
+
+    with pytest.raises(mysql.connector.Error):
+        _update_usuario(ana[0], UpdateUserSchema(nome="ana", email="nova@a.com", telefone="1"))
+
+    assert shards[1].usuario(ana[1]) is not None
+    assert shards[0].sql("SELECT email_normalizado FROM mapa_shards WHERE usuario_id = %s", (ana[0],)) == [
+        {"email_normalizado": ana[1]}
+    ]
+
+
+# =========================
+# RESHARDING
+# =========================
+
+def test_mover_conta_leva_saldo_e_ledger(shards):
+    ana = criar(shards, 1, "ana", "100")
+    bia = criar(shards, 2, "bia")
+    caio = criar(shards, 1, "caio")
+    _realizar_deposito(DepositoDBRequest(email=ana[1], valor=Decimal("50")))
+    transferir(ana, bia, "30")
+    transferir(ana, caio, "20")
+
+    resultado = resharding.mover_conta(ana[0], 2)
+
+    assert resultado == {"usuario_id": ana[0], "de": 1, "para": 2, "movida": True, "ledger": 2}
+    assert shards[1].usuario(ana[1]) is None
+    movida = shards[2].usuario(ana[1])
+    assert (movida["id"], movida["saldo_cc"]) == (ana[0], Decimal("100.00"))
+    # Cada linha do ledger fica onde há uma das contas, uma vez por shard
+    assert sorted((l["email_origin"], l["valor"]) for l in shards[2].ledger(ana[1])) == sorted([
+        ("DEPOSITO", 50), (ana[1], 30), (ana[1], 20)
+    ])
+    assert shards[1].ledger(ana[1]) == [{"email_origin": ana[1], "email_destination": caio[1], "valor": 20}]
+    assert shards[0].sql("SELECT shard, movendo FROM mapa_shards WHERE usuario_id = %s", (ana[0],)) == [
+        {"shard": 2, "movendo": 0}
+    ]
+    assert xa_log(shards)[-1] == {"tipo": "mover", "estado": "concluida", "shards": "1,2"}
+
+    # Depois da mudança, a transferência para caio passou a ser entre shards
+    transferir(ana, caio, "10")
+    assert saldo(shards[1], caio[1]) == Decimal("30.00")
+
+
+def test_rota_com_cache_vencido_rerroteia(shards):
+    ana = criar(shards, 1, "ana", "100")
+    resharding.mover_conta(ana[0], 0)
+    # Outro worker ainda com a posição antiga no cache
+    sharding._guardar(ana[1], ana[0], 1)
+
+    resposta = _realizar_deposito(DepositoDBRequest(email=ana[1], valor=Decimal("5")))
+
+    assert resposta.saldo_atual == Decimal("105.00")
+    assert saldo(shards[0], ana[1]) == Decimal("105.00")
+    assert sharding.sharding_stats()["rerroteamentos"] >= 1
+
+
+def test_conta_em_movimento_nao_e_movida_de_novo(shards):
+    ana = criar(shards, 1, "ana", "100")
+    shards[0].sql("UPDATE mapa_shards SET movendo = 1 WHERE usuario_id = %s", (ana[0],))
+
+    with pytest.raises(ValueError):
+        resharding.mover_conta(ana[0], 2)
+
+    assert shards[1].usuario(ana[1]) is not None
+
+
+def test_falha_no_meio_da_mudanca_mantem_a_conta_no_lugar(shards):
+    ana = criar(shards, 1, "ana", "100")
+    # Conta com o mesmo e-mail já no destino: o INSERT falha no ramo de destino
+    shards[2].sql(
+        "INSERT INTO usuarios (nome, email, telefone, senha) VALUES ('x', %s, '1', 'h')", (ana[1],)
+    )
+
+    with pytest.raises(mysql.connector.Error):
+        resharding.mover_conta(ana[0], 2)
+
+    assert saldo(shards[1], ana[1]) == Decimal("100.00")
+    assert shards[0].sql("SELECT shard, movendo FROM mapa_shards WHERE usuario_id = %s", (ana[0],)) == [
+        {"shard": 1, "movendo": 0}
+    ]
+    assert xa_log(shards)[-1]["estado"] == "abortada"
+    assert all(not s.preparados for s in shards)
+
+
+def test_rebalancear_move_contas_fora_do_shard_padrao(shards):
+    ana = criar(shards, 1, "ana", "100")
+    resharding.mover_conta(ana[0], 0)
+
+    assert resharding.rebalancear() == {"movidas": 1, "falhas": 0}
+    assert saldo(shards[1], ana[1]) == Decimal("100.00")
+    assert resharding.rebalancear() == {"movidas": 0, "falhas": 0}
+
+
+def test_stats_expoe_sharding(client, shards):
+    with patch("api.execute_routes.pool_stats", return_value={}):
+        response = client.get("/internal/stats", headers=internal_headers)
+
+    stats = response.json()["sharding"]
+    assert stats["shards"] == 3
+    assert set(stats["pools"]) == {"1", "2"}
+    assert {"iniciadas", "confirmadas", "recuperadas_commit"} <= set(stats["xa"])
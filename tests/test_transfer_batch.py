@@ -0,0 +1,247 @@
+import time
+import mysql.connector
+from decimal import Decimal
+from unittest.mock import patch
+
+from api import hot_accounts
+from api.transfers import executar_lote, executar_transferencia
+from schemas.schemas import TransacaoDataPayload
+
+
+# ============================
+# HELPERS
+# ============================
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        self.db.round_trips += 1
+        if self.db.falhas:
+            raise self.db.falhas.pop(0)
+        sql = " ".join(sql.split())
+
+        if sql.startswith("SELECT id FROM usuarios WHERE email = %s"):
+            conta = self.db.por_email.get(params[0].lower())
+            self._rows = [{"id": conta["id"]}] if conta else []
+        elif sql.startswith("SELECT id, email FROM usuarios WHERE email IN"):
+            self._rows = [
+                {"id": c["id"], "email": c["email"]}
+                for e in params if (c := self.db.por_email.get(e))
+            ]
+        elif "FOR UPDATE" in sql:
+            self.db.bloqueadas.extend(params)
+            self._rows = [dict(self.db.contas[i]) for i in params if i in self.db.contas]
+        elif sql.startswith("UPDATE usuarios SET saldo_cc = saldo_cc + CASE id"):
+            k = len(params) // 3
+            for conta_id, delta in zip(params[0:2 * k:2], params[1:2 * k:2]):
+                self.db.contas[conta_id]["saldo_cc"] += Decimal(str(delta))
+        elif sql.startswith("INSERT INTO transacoes"):
+            self.db.ledger.append(params)
+        elif sql.startswith("INSERT INTO saldo_shards"):
+            self.db.shards.append((params[0], params[2]))
+        else:
+            raise AssertionError(f"SQL inesperado: {sql}")
+
+    def executemany(self, sql, seq):
+        self.db.round_trips += 1
+        self.db.ledger.extend(seq)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self, n_contas=3, saldo=100):
+        self.contas = {
+            i: {"id": i, "email": f"u{i}@x.com", "saldo_cc": Decimal(saldo)}
+            for i in range(1, n_contas + 1)
+        }
+        self.por_email = {c["email"]: c for c in self.contas.values()}
+        self.ledger = []
+        self.shards = []
+        self.bloqueadas = []
+        self.round_trips = 0
+        self.commits = 0
+        self.falhas = []
+        self.autocommit = True
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.round_trips += 1
+        self.commits += 1
+
+    def rollback(self):
+        self.round_trips += 1
+
+    def close(self):
+        pass
+
+
+def item(origem, destino, valor):
+    return TransacaoDataPayload(
+        email_origin=f"u{origem}@x.com",
+        email_destination=f"u{destino}@x.com",
+        valor=valor,
+        mensagem="lote",
+        user_origin_id=origem
+    )
+
+
+# ============================
+# RESULTADO POR ITEM
+# ============================
+
+def test_lote_resultado_por_item():
+    db = FakeDB()
+    lote = [
+        item(1, 2, 60),
+        item(1, 3, 60),    # saldo insuficiente depois do primeiro
+        item(2, 3, 150),   # recebeu 60 no primeiro item
+        item(1, 9, 10),    # destino inexistente
+        item(1, 1, 10),    # mesma conta
+    ]
+
+    res = executar_lote(db, lote)
+
+    assert [r["status"] for r in res["resultados"]] == ["ok", "erro", "ok", "erro", "erro"]
+    assert res["resultados"][1]["detail"] == "Saldo insuficiente"
+    assert res["ok"] == 2 and res["erros"] == 3
+    assert db.contas[1]["saldo_cc"] == 40
+    assert db.contas[2]["saldo_cc"] == 10
+    assert db.contas[3]["saldo_cc"] == 250
+    assert len(db.ledger) == 2
+
+
+def test_lote_commit_por_chunk():
+    db = FakeDB(saldo=1000)
+    lote = [item(1, 2, 1) for _ in range(10)]
+
+    res = executar_lote(db, lote, chunk_size=3)
+
+    assert res["ok"] == 10
+    assert db.commits == 4
+
+
+def test_lote_repete_chunk_em_deadlock():
+    db = FakeDB()
+    db.falhas = [mysql.connector.Error(msg="Deadlock", errno=1213)]
+
+    with patch("api.transfers.time.sleep"):
+        res = executar_lote(db, [item(1, 2, 10)])
+
+    assert res["ok"] == 1
+    assert db.contas[2]["saldo_cc"] == 110
+
+
+def test_lote_chunk_com_erro_nao_derruba_anteriores():
+    db = FakeDB(saldo=1000)
+    lote = [item(1, 2, 1) for _ in range(4)]
+    chamadas = {"n": 0}
+    original = FakeCursor.execute
+
+    def execute(self, sql, params=()):
+        chamadas["n"] += 1
+        if chamadas["n"] == 4:  # primeiro comando do segundo chunk
+            raise mysql.connector.Error(msg="Erro", errno=1146)
+        return original(self, sql, params)
+
+    with patch.object(FakeCursor, "execute", execute):
+        res = executar_lote(db, lote, chunk_size=2)
+
+    assert [r["status"] for r in res["resultados"]] == ["ok", "ok", "erro", "erro"]
+    assert db.contas[2]["saldo_cc"] == 1002
+
+
+def test_lote_para_conta_quente_nao_bloqueia_o_destino():
+    db = FakeDB()
+
+    with patch.object(hot_accounts, "HOT_ACCOUNTS", {"u3@x.com"}):
+        res = executar_lote(db, [item(1, 3, 10), item(2, 3, 20), item(1, 2, 5)])
+
+    assert res["ok"] == 3
+    assert 3 not in db.bloqueadas
+    # Um crédito só nos shards da conta quente; o saldo_cc dela não muda
+    assert db.shards == [(3, Decimal("30"))]
+    assert db.contas[3]["saldo_cc"] == 100
+    assert db.contas[1]["saldo_cc"] == 85
+    assert db.contas[2]["saldo_cc"] == 85
+    assert len(db.ledger) == 3
+
+
+# ============================
+# ROTA
+# ============================
+
+def test_rota_lote(client, internal_headers):
+    db = FakeDB()
+
+    with patch("api.execute_routes.get_connection", return_value=db):
+        res = client.post(
+            "/transacoesUsuarios/lote",
+            headers=internal_headers,
+            json=[
+                {"email_origin": "u1@x.com", "email_destination": "u2@x.com", "valor": 10, "user_origin_id": 1},
+                {"email_origin": "u1@x.com", "email_destination": "u2@x.com", "valor": 1000, "user_origin_id": 1},
+            ]
+        )
+
+    assert res.status_code == 200
+    assert res.json()["ok"] == 1
+    assert res.json()["resultados"][1]["detail"] == "Saldo insuficiente"
+
+
+def test_rota_lote_vazio(client, internal_headers):
+    res = client.post("/transacoesUsuarios/lote", headers=internal_headers, json=[])
+    assert res.status_code == 400
+
+
+def test_rota_lote_header_invalido(client):
+    res = client.post("/transacoesUsuarios/lote", headers={"X-Internal-Key": "ERRADO"}, json=[])
+    assert res.status_code == 403
+
+
+# ============================
+# BENCHMARK – 10K TRANSFERÊNCIAS
+# ============================
+
+def test_benchmark_lote_vs_individual():
+    n = 10_000
+    contas = 200
+    # Cada conta paga à seguinte, em anel
+    lote = [item(i % contas + 1, (i + 1) % contas + 1, 1) for i in range(n)]
+
+    individual = FakeDB(n_contas=contas, saldo=10_000)
+    inicio = time.perf_counter()
+    for p in lote:
+        executar_transferencia(individual, p)
+    tempo_individual = time.perf_counter() - inicio
+
+    em_lote = FakeDB(n_contas=contas, saldo=10_000)
+    inicio = time.perf_counter()
+    res = executar_lote(em_lote, lote, chunk_size=500)
+    tempo_lote = time.perf_counter() - inicio
+
+    rtt = 0.0005  # 0,5 ms por ida e volta ao RDS
+    print(
+        f"\n{len(lote)} transferências: individual {individual.round_trips} round trips "
+        f"({tempo_individual:.2f}s CPU, ~{individual.round_trips * rtt:.1f}s com RTT de 0,5ms); "
+        f"lote {em_lote.round_trips} round trips "
+        f"({tempo_lote:.2f}s CPU, ~{em_lote.round_trips * rtt:.2f}s com RTT de 0,5ms)"
+    )
+
+    assert res["ok"] == len(lote)
+    assert {i: c["saldo_cc"] for i, c in em_lote.contas.items()} == \
+        {i: c["saldo_cc"] for i, c in individual.contas.items()}
+    assert em_lote.round_trips * 50 < individual.round_trips
@@ -0,0 +1,205 @@
+import pytest
+import mysql.connector
+from unittest.mock import patch, MagicMock
+from fastapi import HTTPException
+
+from api import transfers
+from api.transfers import executar_transferencia, transfer_stats
+from schemas.schemas import TransacaoDataPayload
+
+
+# ============================
+# HELPERS
+# ============================
+
+def build_db(destino_id=2, contas=None, falhas=()):
+    """Conexão mock; `falhas` lista erros levantados nos UPDATEs, em ordem."""
+    if contas is None:
+        contas = [
+            {"id": 1, "email": "a@a.com", "saldo_cc": 500},
+            {"id": 2, "email": "b@b.com", "saldo_cc": 0}
+        ]
+    falhas = list(falhas)
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchone.return_value = {"id": destino_id} if destino_id else None
+    cursor.fetchall.return_value = contas
+
+    def execute(sql, params=None):
+        if sql.strip().startswith("UPDATE") and falhas:
+            raise falhas.pop(0)
+
+    cursor.execute.side_effect = execute
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+def payload(valor=100, origem_id=1, email_origin="a@a.com", email_destination="b@b.com"):
+    return TransacaoDataPayload(
+        email_origin=email_origin,
+        email_destination=email_destination,
+        valor=valor,
+        mensagem="teste",
+        user_origin_id=origem_id
+    )
+
+
+def deadlock():
+    return mysql.connector.Error(msg="Deadlock found", errno=1213)
+
+
+@pytest.fixture(autouse=True)
+def sem_backoff():
+    with patch("api.transfers.time.sleep"):
+        yield
+
+
+# ============================
+# ORDEM DE LOCKS
+# ============================
+
+def test_locks_em_ordem_crescente_de_id():
+    conn, cursor = build_db(destino_id=1, contas=[
+        {"id": 1, "email": "b@b.com", "saldo_cc": 0},
+        {"id": 7, "email": "a@a.com", "saldo_cc": 500}
+    ])
+
+    executar_transferencia(conn, payload(origem_id=7))
+
+    sql, params = cursor.execute.call_args_list[1].args
+    assert "ORDER BY id" in sql and "FOR UPDATE" in sql
+    assert params == (1, 7)
+    conn.commit.assert_called_once()
+
+
+def test_debito_e_credito_num_unico_update():
+    conn, cursor = build_db()
+
+    executar_transferencia(conn, payload(valor=100))
+
+    updates = [c for c in cursor.execute.call_args_list if c.args[0].strip().startswith("UPDATE")]
+    assert len(updates) == 1
+    assert updates[0].args[1] == (1, -100, 2, 100, 1, 2)
+
+
+# ============================
+# VALIDAÇÕES
+# ============================
+
+def test_saldo_insuficiente():
+    conn, _ = build_db()
+
+    with pytest.raises(HTTPException) as exc:
+        executar_transferencia(conn, payload(valor=501))
+
+    assert exc.value.status_code == 400
+    assert exc.value.detail == "Saldo insuficiente"
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
+
+
+def test_destino_inexistente():
+    conn, _ = build_db(destino_id=None)
+
+    with pytest.raises(HTTPException) as exc:
+        executar_transferencia(conn, payload())
+
+    assert exc.value.status_code == 404
+
+
+def test_origem_inexistente():
+    conn, _ = build_db(contas=[{"id": 2, "email": "b@b.com", "saldo_cc": 0}])
+
+    with pytest.raises(HTTPException) as exc:
+        executar_transferencia(conn, payload())
+
+    assert exc.value.status_code == 404
+    assert exc.value.detail == "Usuário origem não encontrado"
+
+
+def test_email_origem_divergente():
+    conn, _ = build_db()
+
+    with pytest.raises(HTTPException) as exc:
+        executar_transferencia(conn, payload(email_origin="outro@a.com"))
+
+    assert exc.value.status_code == 400
+
+
+def test_mesma_conta():
+    conn, _ = build_db(destino_id=1)
+
+    with pytest.raises(HTTPException) as exc:
+        executar_transferencia(conn, payload())
+
+    assert exc.value.status_code == 400
+
+
+# ============================
+# RETRY EM DEADLOCK
+# ============================
+
+def test_retry_em_deadlock():
+    antes = transfer_stats()
+    conn, _ = build_db(falhas=[deadlock(), mysql.connector.Error(msg="Lock wait", errno=1205)])
+
+    assert executar_transferencia(conn, payload()) == {"status": "ok"}
+
+    depois = transfer_stats()
+    assert depois["retries"] - antes["retries"] == 2
+    assert depois["deadlocks"] - antes["deadlocks"] == 1
+    assert depois["lock_wait_timeouts"] - antes["lock_wait_timeouts"] == 1
+    assert conn.rollback.call_count == 2
+    conn.commit.assert_called_once()
+
+
+def test_retry_esgotado():
+    antes = transfer_stats()
+    conn, _ = build_db(falhas=[deadlock() for _ in range(transfers.TRANSFER_MAX_RETRIES + 1)])
+
+    with pytest.raises(mysql.connector.Error):
+        executar_transferencia(conn, payload())
+
+    assert transfer_stats()["retries_esgotados"] - antes["retries_esgotados"] == 1
+    conn.commit.assert_not_called()
+
+
+def test_erro_nao_retentavel_nao_repete():
+    conn, _ = build_db(falhas=[mysql.connector.Error(msg="Erro", errno=1146)])
+
+    with pytest.raises(mysql.connector.Error):
+        executar_transferencia(conn, payload())
+
+    conn.rollback.assert_called_once()
+
+
+# ============================
+# ROTA
+# ============================
+
+def test_rota_valor_invalido(client, internal_headers):
+    res = client.post(
+        "/transacoesUsuarios",
+        headers=internal_headers,
+        json={"email_origin": "a@a.com", "email_destination": "b@b.com", "valor": 0, "user_origin_id": 1}
+    )
+    assert res.status_code == 400
+
+
+def test_rota_saldo_insuficiente(client, internal_headers):
+    conn, _ = build_db()
+
+    with patch("api.execute_routes.get_connection", return_value=conn):
+        res = client.post(
+            "/transacoesUsuarios",
+            headers=internal_headers,
+            json={"email_origin": "a@a.com", "email_destination": "b@b.com", "valor": 1000, "user_origin_id": 1}
+        )
+
+    assert res.status_code == 400
+    conn.close.assert_called_once()
+
+
+def test_stats_expoe_transferencias(client, internal_headers):
+    res = client.get("/internal/stats", headers=internal_headers)
+    assert "retries" in res.json()["transferencias"]
@@ -0,0 +1,191 @@
+import random
+import sqlite3
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+import pytest
+
+from api import quotes, valuation
+from api.quotes import FakeProvider
+
+internal_headers = {"X-Internal-Key": "INTERNAL_SECRET"}
+
+
+class ConexaoSqlite:
+    # UPDATE ... JOIN do MySQL vira UPDATE ... FROM no SQLite
+    def __init__(self, banco):
+        self.banco = banco
+
+    def cursor(self):
+        conexao = self
+
+        class Cursor:
+            def execute(self, sql, params=()):
+                sql = sql.replace("JOIN (", "FROM (").replace(" ON ", " WHERE ")
+                sql = sql.replace("SET invest_client.patrimonio_total = novos.patrimonio_total", "")
+                sql = sql.replace("UPDATE invest_client", "UPDATE invest_client SET patrimonio_total = novos.patrimonio_total")
+                conexao.banco.execute(sql.replace("%s", "?"), [float(p) if isinstance(p, Decimal) else p for p in params])
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+    def commit(self):
+        self.banco.commit()
+
+    def rollback(self):
+        self.banco.rollback()
+
+
+def linha(client_id, ticker, quantidade, investido):
+    # Como o banco entrega: inteiros já escalados pelo CAST do SELECT
+    return (
+        client_id,
+        ticker,
+        int(Decimal(quantidade) * valuation.ESCALA_QTD),
+        int(Decimal(investido) * 100)
+    )
+
+
+# =========================
+# AVALIAÇÃO
+# =========================
+
+def test_avalia_por_cliente_com_cotacao_e_custo():
+    posicoes = valuation.posicoes_de_linhas([
+        linha(1, "PETR4", "10", "300"),
+        linha(1, "vale3", "0.5", "30"),
+        linha(2, "XXXX3", "3", "99.99"),
+    ])
+
+    avaliacao = valuation.avaliar(posicoes, {"PETR4": Decimal("38.5"), "VALE3": Decimal("61.2345")})
+
+    assert valuation.totais_decimais(avaliacao) == [
+        (1, Decimal("415.62")),  # 385 + 30.61725
+        (2, Decimal("99.99")),   # sem cotação: pelo custo
+    ]
+    assert avaliacao["sem_cotacao"] == 1
+
+
+def test_confere_com_decimal_linha_a_linha():
+    rng = random.Random(7)
+    precos = {f"T{i}": Decimal(rng.randint(1, 5_000_000)) / 10_000 for i in range(20)}
+    rows = []
+    for _ in range(2000):
+        quantidade = Decimal(rng.randint(1, 10 ** 14)) / valuation.ESCALA_QTD
+        rows.append(linha(rng.randint(1, 50), f"T{rng.randint(0, 19)}", quantidade, "1"))
+
+    avaliacao = valuation.avaliar(valuation.posicoes_de_linhas(rows), precos)
+
+    esperado = {}
+    for client_id, ticker, quantidade, _ in rows:
+        valor = (Decimal(quantidade) / valuation.ESCALA_QTD * precos[ticker]).quantize(
+            Decimal("0.0001"), rounding=ROUND_HALF_UP
+        )
+        esperado[client_id] = esperado.get(client_id, Decimal(0)) + valor
+    esperado = [
+        (c, v.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)) for c, v in sorted(esperado.items())
+    ]
+    assert valuation.totais_decimais(avaliacao) == esperado
+
+
+def test_posicao_fora_da_faixa():
+    posicoes = valuation.posicoes_de_linhas([(1, "PETR4", int(np.iinfo(np.int64).max), 0)])
+
+    with pytest.raises(ValueError):
+        valuation.avaliar(posicoes, {"PETR4": Decimal("100000")})
+
+
+def test_gravacao_em_lote():
+    conn = MagicMock()
+    cursor = MagicMock()
+    conn.cursor.return_value = cursor
+    avaliacao = {"client_id": np.arange(1, 6), "centavos": np.arange(100, 600, 100)}
+
+    assert valuation.gravar_patrimonio(conn, avaliacao, chunk_size=2) == 5
+
+    assert cursor.execute.call_count == 3
+    sql, params = cursor.execute.call_args_list[0][0]
+    assert sql.lstrip().startswith("UPDATE invest_client") and "INSERT" not in sql
+    assert params == (1, Decimal("1.00"), 2, Decimal("2.00"))
+    assert cursor.execute.call_args_list[2][0][1] == (5, Decimal("5.00"))
+    conn.commit.assert_called_once()
+
+
+def test_gravacao_so_atualiza_clientes_existentes():
+    banco = sqlite3.connect(":memory:")
+    banco.execute("CREATE TABLE invest_client (client_id INT NOT NULL, patrimonio_total NUMERIC NOT NULL DEFAULT 0)")
+    banco.executemany("INSERT INTO invest_client VALUES (?, 0)", [(1,), (3,)])
+    avaliacao = {"client_id": np.array([1, 2, 3]), "centavos": np.array([150, 250, 350])}
+
+    valuation.gravar_patrimonio(ConexaoSqlite(banco), avaliacao, chunk_size=2)
+
+    assert banco.execute("SELECT client_id, patrimonio_total FROM invest_client ORDER BY client_id").fetchall() == [
+        (1, 1.5), (3, 3.5)
+    ]
+
+
+def test_falha_no_meio_nao_grava_nenhum_lote():
+    conn = MagicMock()
+    cursor = MagicMock()
+    conn.cursor.return_value = cursor
+    cursor.execute.side_effect = [None, RuntimeError("conexão perdida")]
+    avaliacao = {"client_id": np.arange(1, 6), "centavos": np.arange(100, 600, 100)}
+
+    with pytest.raises(RuntimeError):
+        valuation.gravar_patrimonio(conn, avaliacao, chunk_size=2)
+
+    conn.commit.assert_not_called()
+    conn.rollback.assert_called_once()
+
+
+# =========================
+# ROTA
+# =========================
+
+def test_rota_reavaliar(client):
+    quotes.configurar_provider(FakeProvider({"PETR4": "38.5"}))
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [linha(1, "PETR4", "10", "300")]
+    conn.cursor.return_value = cursor
+
+    try:
+        with patch("api.execute_routes.get_connection", return_value=conn):
+            response = client.post("/invest/reavaliar?client_id=1", headers=internal_headers)
+    finally:
+        quotes.close_quote_service()
+
+    assert response.status_code == 200
+    assert response.json() == {"clientes": 1, "posicoes": 1, "sem_cotacao": 0, "patrimonio_total": "385.00"}
+    assert cursor.execute.call_args_list[0][0][1] == (1,)
+    assert cursor.execute.call_args_list[-1][0][1] == (1, Decimal("385.00"))
+
+
+# =========================
+# BENCHMARK
+# =========================
+
+def test_benchmark_um_milhao_de_posicoes():
+    n = 1_000_000
+    rng = np.random.default_rng(1)
+    tickers = [f"T{i}" for i in range(500)]
+    posicoes = {
+        "client_id": np.sort(rng.integers(1, 100_000, n)),
+        "ticker_idx": rng.integers(0, 500, n).astype(np.int32),
+        "tickers": tickers,
+        "quantidade": rng.integers(1, 10 ** 12, n),
+        "investido": rng.integers(1, 10 ** 7, n),
+    }
+    precos = {t: Decimal(int(p)) / 100 for t, p in zip(tickers, rng.integers(100, 100_000, 500))}
+
+    inicio = time.perf_counter()
+    avaliacao = valuation.avaliar(posicoes, precos)
+    decorrido = time.perf_counter() - inicio
+
+    print(f"\navaliação: {n:,} posições em {decorrido:.2f}s ({len(avaliacao['client_id']):,} clientes)")
+    assert avaliacao["posicoes"] == n
+    assert decorrido < 5